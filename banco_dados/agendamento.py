@@ -112,6 +112,18 @@ def inicializar_agendamento(app):
             max_instances=1,
         )
 
+    # Retenção de leituras_sensor: rollups hora/dia + limpeza das brutas (1x/dia)
+    compactacao_enabled = os.getenv('LEITURAS_COMPACTACAO_ENABLED', 'true').lower() == 'true'
+    if compactacao_enabled:
+        scheduler.add_job(
+            func=_job_compactar_leituras,
+            trigger=IntervalTrigger(hours=24),
+            id='compactar_leituras',
+            name='Retenção - Compactar leituras de sensores',
+            replace_existing=True,
+            max_instances=1,
+        )
+
     prospeccao_pipeline_enabled = os.getenv('PROSPECCAO_PIPELINE_ENABLED', 'false').lower() == 'true'
     if prospeccao_pipeline_enabled:
         prospeccao_intervalo_horas = int(os.getenv('PROSPECCAO_PIPELINE_INTERVAL_HOURS', '168'))
@@ -151,6 +163,8 @@ def inicializar_agendamento(app):
         logger.info("   ML Predição: a cada 12h")
     if ml_score_enabled:
         logger.info("   ML Score: a cada 24h")
+    if compactacao_enabled:
+        logger.info("   Compactação de leituras: a cada 24h")
     if prospeccao_pipeline_enabled:
         logger.info(f"   Prospecção pipeline: a cada {prospeccao_intervalo_horas}h")
     if nik_enabled:
@@ -259,6 +273,21 @@ def _job_ml_score():
         logger.error(f"❌ [ML] Erro no score: {e}", exc_info=True)
 
 
+def _job_compactar_leituras():
+    """Job: agrega leituras antigas em leituras_sensor_hora/_dia e aplica a retenção."""
+    try:
+        logger.info("🔄 [Leituras] Iniciando compactação...")
+        from banco_dados.services.leituras_rollup import compactar_leituras
+        db = _criar_sessao_padrao()
+        try:
+            stats = compactar_leituras(db)
+            logger.info(f"✅ [Leituras] Compactação concluída: {stats}")
+        finally:
+            db.close()
+    except Exception as e:
+        logger.error(f"❌ [Leituras] Erro na compactação: {e}", exc_info=True)
+
+
 def executar_pipeline_prospeccao_job():
     """Job: pipeline ML de prospecção REE (ingest→normalize→link-crm→train→score)."""
     try:
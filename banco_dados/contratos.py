@@ -90,6 +90,43 @@ class TelemetriaOut(BaseModel):
     notificacoes_criadas: int = 0
 
 
+MAX_LEITURAS_LOTE = 1000
+
+
+class TelemetriaLoteIn(BaseModel):
+    """Lote de leituras (gateway ou firmware que acumula leituras offline).
+
+    Cada item e validado individualmente com `TelemetriaIn` no endpoint, para
+    que uma leitura invalida seja rejeitada sem derrubar o lote inteiro.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    leituras: list[dict[str, Any]] = Field(..., min_length=1, max_length=MAX_LEITURAS_LOTE)
+
+
+class LeituraRejeitada(BaseModel):
+    indice: int
+    motivo: str
+    detalhes: Any = None
+
+
+class TelemetriaLoteOut(BaseModel):
+    """Resposta do endpoint de telemetria em lote."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    status: str = Field(default="ok")
+    mensagem: str
+    recebidas: int
+    aceitas: int
+    rejeitadas: list[LeituraRejeitada] = Field(default_factory=list)
+    coletores_atualizados: int = 0
+    sensores_atualizados: int = 0
+    notificacoes_criadas: int = 0
+    leituras_pendentes: int = 0
+
+
 # ---------------------------------------------------------------------------
 # Schemas de saida (espelham serializers.py mas tipados)
 # ---------------------------------------------------------------------------
@@ -187,6 +224,22 @@ class CriarColetaIn(BaseModel):
         return v
 
 
+# ---------------------------------------------------------------------------
+# Entrada: otimizacao de rota (POST /api/rotas/otimizar)
+# ---------------------------------------------------------------------------
+class OtimizarRotaIn(BaseModel):
+    """Sem `coletor_ids`, roteia todos os coletores com coordenadas (no escopo do usuario)."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    coletor_ids: list[int] | None = Field(default=None, max_length=500)
+    origem_lat: float | None = Field(default=None, ge=-90, le=90)
+    origem_lon: float | None = Field(default=None, ge=-180, le=180)
+    retornar_origem: bool = True
+    nivel_minimo: float | None = Field(default=None, ge=0, le=100)
+    parceiro_id: int | None = Field(default=None, ge=1)
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
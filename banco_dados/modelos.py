@@ -29,6 +29,7 @@ from sqlalchemy import (
     ForeignKey,
     Index,
     Integer,
+    LargeBinary,
     String,
     Text,
     UniqueConstraint,
@@ -37,6 +38,7 @@ from sqlalchemy.orm import declarative_base, relationship
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from banco_dados.utils import utc_now_naive
+from banco_dados.utils.feature_blobs import features_do_blob
 
 # Base do SQLAlchemy (todas as tabelas herdam dela)
 Base = declarative_base()
@@ -806,6 +808,76 @@ class LeituraSensor(Base):
         return f"<LeituraSensor(id={self.id}, coletor={self.coletor_id}, nivel={self.nivel}%, ts={self.timestamp})>"
 
 
+# ----------------------------------------------------------
+# TABELAS: Agregados de leituras (rollups hora/dia)
+# ----------------------------------------------------------
+class _AgregadoLeituras:
+    """Colunas comuns dos rollups de ``leituras_sensor`` por coletor e intervalo.
+
+    Mantidos incrementalmente por ``services.leituras_rollup`` a cada leitura
+    gravada; guardam soma/contagem (não a média) para que novas leituras do mesmo
+    intervalo possam ser somadas com um ``UPDATE`` atômico.
+    """
+
+    inicio = Column(DateTime, nullable=False)        # início do intervalo (UTC naive)
+    n_leituras = Column(Integer, nullable=False, default=0)
+    nivel_min = Column(Float)
+    nivel_max = Column(Float)
+    nivel_soma = Column(Float)
+    nivel_ultimo = Column(Float)
+    n_bateria = Column(Integer, nullable=False, default=0)
+    bateria_min = Column(Float)
+    bateria_max = Column(Float)
+    bateria_soma = Column(Float)
+    bateria_ultima = Column(Float)
+    ultima_leitura_em = Column(DateTime)             # timestamp da leitura em *_ultimo
+
+    @property
+    def nivel_medio(self):
+        return self.nivel_soma / self.n_leituras if self.n_leituras else None
+
+    @property
+    def bateria_media(self):
+        return self.bateria_soma / self.n_bateria if self.n_bateria else None
+
+    def to_dict(self):
+        return {
+            'coletor_id': self.coletor_id,
+            'timestamp': self.inicio.isoformat() if self.inicio else None,
+            'nivel': self.nivel_medio,
+            'nivel_min': self.nivel_min,
+            'nivel_max': self.nivel_max,
+            'nivel_ultimo': self.nivel_ultimo,
+            'bateria': self.bateria_media,
+            'bateria_min': self.bateria_min,
+            'bateria_max': self.bateria_max,
+            'bateria_ultima': self.bateria_ultima,
+            'n_leituras': self.n_leituras,
+        }
+
+
+class LeituraHoraria(_AgregadoLeituras, Base):
+    """Agregado por hora de ``leituras_sensor`` (gráficos de dias/semanas, previsão)."""
+    __tablename__ = "leituras_sensor_hora"
+    __table_args__ = (
+        UniqueConstraint('coletor_id', 'inicio', name='uq_leitura_hora_coletor_inicio'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    coletor_id = Column(Integer, ForeignKey("coletores.id"), nullable=False)
+
+
+class LeituraDiaria(_AgregadoLeituras, Base):
+    """Agregado por dia de ``leituras_sensor`` (histórico longo; nunca compactado)."""
+    __tablename__ = "leituras_sensor_dia"
+    __table_args__ = (
+        UniqueConstraint('coletor_id', 'inicio', name='uq_leitura_dia_coletor_inicio'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    coletor_id = Column(Integer, ForeignKey("coletores.id"), nullable=False)
+
+
 # ----------------------------------------------------------
 # TABELA: Predição de enchimento (output Módulo 1)
 # ----------------------------------------------------------
@@ -1210,14 +1282,25 @@ class FeatureSnapshotProspeccao(Base):
     pipeline_version = Column(String(80), nullable=False, index=True)
     qid = Column(String(160), nullable=False, index=True)
     label_ordinal = Column(Integer, default=0)
-    features_json = Column(Text, nullable=False)
+    features_json = Column(Text, nullable=False)  # "{}" salvo com --json-export (debug)
     feature_schema_json = Column(Text, nullable=False)
+    features_blob = Column(LargeBinary, nullable=True)  # float32 LE, ordem de FEATURE_NAMES
+    feature_schema_hash = Column(String(16), nullable=True)
+    features_hash = Column(String(16), nullable=True)  # blake2b do blob (scoring incremental)
     criado_em = Column(DateTime, default=utc_now_naive, index=True)
 
     empresa = relationship("EmpresaCandidata", back_populates="feature_snapshots")
     local = relationship("LocalCandidato", back_populates="feature_snapshots")
     scores = relationship("ScoreProspeccao", back_populates="snapshot")
 
+    def features(self) -> dict:
+        """Features do snapshot (blob binário quando presente, senão features_json)."""
+        if self.features_blob is not None:
+            features = features_do_blob(self.features_blob, self.feature_schema_json)
+            if features is not None:
+                return features
+        return json.loads(self.features_json) if self.features_json else {}
+
     def to_dict(self):
         import json
         return {
@@ -1227,7 +1310,7 @@ class FeatureSnapshotProspeccao(Base):
             'pipeline_version': self.pipeline_version,
             'qid': self.qid,
             'label_ordinal': self.label_ordinal,
-            'features': json.loads(self.features_json) if self.features_json else {},
+            'features': self.features(),
             'feature_schema': json.loads(self.feature_schema_json) if self.feature_schema_json else [],
             'criado_em': self.criado_em.isoformat() if self.criado_em else None,
         }
@@ -1281,6 +1364,8 @@ class ScoreProspeccao(Base):
         Index('idx_score_prospeccao_prioridade', 'prioridade'),
         Index('idx_score_prospeccao_modelo_pipeline', 'modelo_id', 'pipeline_version'),
         Index('idx_score_prospeccao_modelo_prio_score', 'modelo_id', 'prioridade', 'score'),
+        # Chave do upsert em lote (score_candidates): um score por snapshot e modelo.
+        Index('uq_score_prospeccao_snapshot_modelo', 'snapshot_id', 'modelo_id', unique=True),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -1295,6 +1380,7 @@ class ScoreProspeccao(Base):
     # RASTREABILIDADE: versão do pipeline que gerou as features usadas neste score
     pipeline_version = Column(String(80), nullable=True, index=True)
     motivos_json = Column(Text)
+    features_hash = Column(String(16), nullable=True)  # features_hash do snapshot pontuado
     calculado_em = Column(DateTime, default=utc_now_naive, index=True)
 
     snapshot = relationship("FeatureSnapshotProspeccao", back_populates="scores")
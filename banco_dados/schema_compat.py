@@ -27,6 +27,16 @@ _PARCEIRO_ID_TABLES = (
 
 _LIXEIRA_FK_TABLES = ("coletas", "sensores")
 
+_UQ_SCORE_PROSPECCAO = "uq_score_prospeccao_snapshot_modelo"
+_CRIAR_UQ_SCORE_PROSPECCAO = (
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {_UQ_SCORE_PROSPECCAO} ON score_prospeccao (snapshot_id, modelo_id)"
+)
+# Todas as linhas de cada par (snapshot_id, modelo_id) menos a de maior id
+_SCORES_DUPLICADOS = (
+    "FROM score_prospeccao WHERE id NOT IN ("
+    "SELECT MAX(id) FROM score_prospeccao GROUP BY snapshot_id, modelo_id)"
+)
+
 
 def _migrar_lixeira_para_coletor(engine, insp) -> None:
     """Bases legadas: tabela ``lixeiras`` + FK ``lixeira_id`` → ``coletores`` + ``coletor_id``."""
@@ -231,6 +241,19 @@ def aplicar_compat_schema(engine) -> None:
     else:
         _add_column_if_missing("pipeline", "conta_comercial_id", "INTEGER")
 
+    # Feature snapshots: vetor float32 binário + hash do schema (features_json vira export de debug)
+    # e hash do vetor (snapshot e score) para o scoring incremental
+    if is_pg:
+        _add_column_if_missing("feature_snapshot_prospeccao", "features_blob", "BYTEA NULL")
+        _add_column_if_missing("feature_snapshot_prospeccao", "feature_schema_hash", "VARCHAR(16) NULL")
+        _add_column_if_missing("feature_snapshot_prospeccao", "features_hash", "VARCHAR(16) NULL")
+        _add_column_if_missing("score_prospeccao", "features_hash", "VARCHAR(16) NULL")
+    else:
+        _add_column_if_missing("feature_snapshot_prospeccao", "features_blob", "BLOB")
+        _add_column_if_missing("feature_snapshot_prospeccao", "feature_schema_hash", "VARCHAR(16)")
+        _add_column_if_missing("feature_snapshot_prospeccao", "features_hash", "VARCHAR(16)")
+        _add_column_if_missing("score_prospeccao", "features_hash", "VARCHAR(16)")
+
     # Performance: composite index for priority-tier queries on score_prospeccao (1M+ rows)
     if "score_prospeccao" in insp.get_table_names():
         with engine.begin() as conn:
@@ -238,3 +261,37 @@ def aplicar_compat_schema(engine) -> None:
                 "CREATE INDEX IF NOT EXISTS idx_score_prospeccao_modelo_prio_score "
                 "ON score_prospeccao (modelo_id, prioridade, score DESC)"
             ))
+        # Upsert em lote (ON CONFLICT) precisa de chave única (snapshot_id, modelo_id).
+        # No boot nada é apagado: com duplicatas legadas o índice fica para o passo
+        # explícito ``deduplicar_scores_prospeccao`` (CLI ``dedupe-scores``).
+        indices = {i["name"] for i in insp.get_indexes("score_prospeccao")}
+        if _UQ_SCORE_PROSPECCAO not in indices:
+            with engine.begin() as conn:
+                duplicados = conn.execute(text(f"SELECT COUNT(*) {_SCORES_DUPLICADOS}")).scalar()
+                if not duplicados:
+                    conn.execute(text(_CRIAR_UQ_SCORE_PROSPECCAO))
+            if duplicados:
+                logger.warning(
+                    "Schema compat: score_prospeccao tem %s linhas duplicadas por (snapshot_id, modelo_id); "
+                    "índice único não criado. Rode `python -m jobs.prospeccao dedupe-scores`.",
+                    duplicados,
+                )
+            else:
+                logger.info("Schema compat: índice único score_prospeccao(snapshot_id, modelo_id) criado.")
+
+
+def deduplicar_scores_prospeccao(engine) -> int:
+    """Apaga scores duplicados por (snapshot_id, modelo_id) e cria o índice único.
+
+    Mantém o registro mais recente (maior id) de cada par. Destrutivo: passo
+    explícito de migração, nunca chamado no boot. Devolve as linhas removidas.
+    """
+    with engine.begin() as conn:
+        removidos = conn.execute(text(f"DELETE {_SCORES_DUPLICADOS}")).rowcount
+        conn.execute(text(_CRIAR_UQ_SCORE_PROSPECCAO))
+    logger.info(
+        "Schema compat: índice único score_prospeccao(snapshot_id, modelo_id) criado "
+        "(%s duplicatas removidas).",
+        removidos,
+    )
+    return removidos
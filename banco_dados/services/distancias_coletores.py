@@ -0,0 +1,216 @@
+"""Matriz de distâncias entre coletores e a sede — calculada uma vez, reutilizada.
+
+Lida por:
+- ``ml_score`` (km da sede e cluster bonus — antes O(n²) em Python por recálculo);
+- ``roteamento.otimizar_rota`` (submatriz das paradas quando a origem é a sede);
+- ``GET /api/rotas/matriz`` (o router JS deixa de recalcular pares por pedido).
+
+Índice 0 é a sede; ``ids[i]`` ocupa a linha/coluna ``i + 1``. Métrica viária quando
+há grafo (``roteamento.obter_grafo``), senão haversine vetorizado.
+
+Invalidação: a chave é um hash de ``(id, latitude, longitude)`` de todos os coletores
+com coordenadas, lido do banco a cada pedido (uma query leve). Mudar a posição de um
+coletor, criar ou apagar muda a chave em qualquer worker, sem hooks. Ao mudar, só as
+linhas/colunas dos coletores novos ou movidos são recalculadas; o resto é copiado
+da matriz anterior. A matriz é persistida em ``.npz`` para sobreviver a restarts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from banco_dados.modelos import Coletor
+from banco_dados.services import roteamento
+
+logger = logging.getLogger(__name__)
+
+MATRIZ_COLETORES_PATH = Path(
+    os.getenv(
+        "TRONIK_MATRIZ_COLETORES_PATH",
+        str(roteamento.GRAFO_VIARIO_PATH.parent / "matriz_coletores.npz"),
+    )
+)
+# Acima desta fração de coletores alterados recalcula-se a matriz inteira
+FRACAO_MAX_INCREMENTAL = 0.5
+
+
+@dataclass
+class MatrizColetores:
+    """Distâncias (km) sede + coletores; ``km[0]`` é a linha da sede e ``lat[0]``/``lon[0]`` a sua posição."""
+
+    ids: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    km: np.ndarray
+    metrica: str
+    fonte: str
+    chave: str
+
+    def __post_init__(self) -> None:
+        self._pos = {int(cid): i + 1 for i, cid in enumerate(self.ids)}
+
+    def __contains__(self, coletor_id: int) -> bool:
+        return int(coletor_id) in self._pos
+
+    def posicoes(self, coletor_ids) -> np.ndarray:
+        """Linha/coluna de cada coletor na matriz (KeyError se não estiver)."""
+        return np.array([self._pos[int(cid)] for cid in coletor_ids], dtype=np.int64)
+
+    def km_sede(self) -> dict[int, float]:
+        return {int(cid): float(km) for cid, km in zip(self.ids, self.km[0, 1:], strict=True)}
+
+    def submatriz(self, coletor_ids, *, incluir_sede: bool = True) -> np.ndarray:
+        pos = self.posicoes(coletor_ids)
+        if incluir_sede:
+            pos = np.concatenate([[0], pos])
+        return self.km[np.ix_(pos, pos)]
+
+    def vizinhos(self, raio_km: float) -> np.ndarray:
+        """Máscara (n × n, sem a sede) de pares de coletores distintos a ≤ ``raio_km``."""
+        perto = self.km[1:, 1:] <= raio_km
+        np.fill_diagonal(perto, False)
+        return perto
+
+
+def _chave(ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, fonte: str) -> str:
+    """Hash de ids + coordenadas (sede incluída em ``lat[0]``/``lon[0]``) + métrica."""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(np.column_stack([lat, lon]), dtype=np.float64).tobytes())
+    h.update(fonte.encode())
+    return h.hexdigest()
+
+
+def _fonte_metrica(grafo: roteamento.GrafoViario | None) -> str:
+    """Identifica a métrica (muda a chave quando o grafo aparece/é substituído)."""
+    if grafo is None:
+        return "haversine"
+    return f"viaria:{grafo.n_nos}:{grafo.n_arestas}:{float(grafo.pesos.sum()):.3f}"
+
+
+def _salvar(matriz: MatrizColetores, path: Path) -> None:
+    try:
+        roteamento.gravar_npz_atomico(
+            path, ids=matriz.ids, lat=matriz.lat, lon=matriz.lon, km=matriz.km,
+            metrica=np.array(matriz.metrica), fonte=np.array(matriz.fonte), chave=np.array(matriz.chave),
+        )
+    except OSError as e:
+        logger.warning(f"Não foi possível persistir matriz de coletores em {path}: {e}")
+
+
+def _carregar(path: Path) -> MatrizColetores | None:
+    try:
+        with np.load(path) as dados:
+            return MatrizColetores(
+                ids=dados["ids"], lat=dados["lat"], lon=dados["lon"], km=dados["km"],
+                metrica=str(dados["metrica"]), fonte=str(dados["fonte"]), chave=str(dados["chave"]),
+            )
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _calcular(
+    ids: np.ndarray,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    grafo: roteamento.GrafoViario | None,
+    anterior: MatrizColetores | None,
+) -> tuple[np.ndarray, str, int]:
+    """Matriz completa (sede + coletores); copia de ``anterior`` os pontos que não se moveram.
+
+    Retorna (km, métrica, pontos recalculados).
+    """
+    n = len(lat)
+    origem_anterior = np.full(n, -1, dtype=np.int64)
+    if anterior is not None:
+        if anterior.lat[0] == lat[0] and anterior.lon[0] == lon[0]:
+            origem_anterior[0] = 0
+        pos_ant = {int(cid): j for j, cid in enumerate(anterior.ids, start=1)}
+        for i, cid in enumerate(ids, start=1):
+            j = pos_ant.get(int(cid))
+            if j is not None and anterior.lat[j] == lat[i] and anterior.lon[j] == lon[i]:
+                origem_anterior[i] = j
+
+    velhos = np.flatnonzero(origem_anterior >= 0)
+    novos = np.flatnonzero(origem_anterior < 0)
+    if not len(velhos) or len(novos) > FRACAO_MAX_INCREMENTAL * n:
+        km, metrica = roteamento.matriz_distancias(lat, lon, grafo)
+        return km, metrica, n
+
+    km = np.empty((n, n))
+    km[np.ix_(velhos, velhos)] = anterior.km[np.ix_(origem_anterior[velhos], origem_anterior[velhos])]
+    metrica = anterior.metrica
+    if len(novos):
+        linhas, metrica = roteamento.matriz_distancias(lat[novos], lon[novos], grafo, lat_dest=lat, lon_dest=lon)
+        colunas, _ = roteamento.matriz_distancias(lat, lon, grafo, lat_dest=lat[novos], lon_dest=lon[novos])
+        km[novos, :] = linhas
+        km[:, novos] = colunas
+    return km, metrica, len(novos)
+
+
+_MATRIZ: MatrizColetores | None = None
+_LOCK = threading.Lock()
+
+
+def obter_matriz_coletores(
+    db: Session,
+    *,
+    grafo: roteamento.GrafoViario | None = None,
+    path: Path | None = None,
+) -> MatrizColetores:
+    """Matriz atual (memória -> disco -> recálculo incremental/completo)."""
+    global _MATRIZ
+    from banco_dados.services.ml_score import SEDE_LAT, SEDE_LNG
+
+    linhas = (
+        db.query(Coletor.id, Coletor.latitude, Coletor.longitude)
+        .filter(Coletor.latitude.isnot(None), Coletor.longitude.isnot(None))
+        .order_by(Coletor.id)
+        .all()
+    )
+    ids = np.array([r[0] for r in linhas], dtype=np.int64)
+    lat = np.array([SEDE_LAT, *(float(r[1]) for r in linhas)])
+    lon = np.array([SEDE_LNG, *(float(r[2]) for r in linhas)])
+    if grafo is None:
+        grafo = roteamento.obter_grafo()
+    fonte = _fonte_metrica(grafo)
+    chave = _chave(ids, lat, lon, fonte)
+    path = Path(path) if path else MATRIZ_COLETORES_PATH
+
+    with _LOCK:
+        if _MATRIZ is not None and _MATRIZ.chave == chave:
+            return _MATRIZ
+        em_disco = _carregar(path) if path.exists() else None
+        if em_disco is not None and em_disco.chave == chave:  # calculada por outro worker
+            _MATRIZ = em_disco
+            return _MATRIZ
+        anterior = _MATRIZ or em_disco
+        if anterior is not None and anterior.fonte != fonte:
+            anterior = None  # grafo novo/removido: nada a reaproveitar
+
+        inicio = time.perf_counter()
+        km, metrica, recalculados = _calcular(ids, lat, lon, grafo, anterior)
+        _MATRIZ = MatrizColetores(ids=ids, lat=lat, lon=lon, km=km, metrica=metrica, fonte=fonte, chave=chave)
+        _salvar(_MATRIZ, path)
+        logger.info(
+            f"Matriz de coletores: {len(ids)} coletores, {recalculados} pontos recalculados "
+            f"({metrica}, {time.perf_counter() - inicio:.3f}s)"
+        )
+        return _MATRIZ
+
+
+def invalidar_matriz_coletores() -> None:
+    """Descarta a cópia em memória (a chave no banco já invalida; útil em testes/scripts)."""
+    global _MATRIZ
+    with _LOCK:
+        _MATRIZ = None
@@ -0,0 +1,403 @@
+"""Rollups hora/dia de ``leituras_sensor``, retenção e leitura de séries históricas.
+
+Escrita (incremental):
+- ``acumular(db, linhas)`` agrega as leituras recebidas por (coletor, hora) e
+  (coletor, dia) e soma-as às linhas de ``leituras_sensor_hora``/``_dia`` com um
+  ``INSERT ... ON CONFLICT DO UPDATE`` atômico (contagem/soma somadas, min/max
+  comparados, "última" pelo timestamp). Chamado na mesma transação que grava as
+  leituras brutas (endpoint unitário e descarga do buffer write-behind).
+- ``reconstruir_rollups`` recalcula dias inteiros a partir das leituras brutas
+  (dados carregados por script, ou bases anteriores aos rollups).
+
+Retenção (``compactar_leituras``, job diário): leituras brutas com mais de
+``RETENCAO_BRUTA_DIAS`` e agregados horários com mais de ``RETENCAO_HORARIA_DIAS``
+são apagados; o agregado diário fica para sempre. Antes de apagar, dias sem
+rollup são preenchidos a partir das brutas (sem tocar nos que já existem) — na
+primeira execução, com brutas anteriores a qualquer rollup, até ontem.
+
+Leitura: ``obter_serie`` escolhe a tabela mais grossa que cobre a janela pedida
+com até ``MAX_PONTOS_SERIE`` pontos (``escolher_granularidade``) — 1 dia lê as
+brutas, 7–14 dias o agregado horário, meses o diário. ``series_niveis_lote`` faz
+o mesmo para muitos coletores de uma vez (recálculo das predições). Enquanto
+houver brutas anteriores ao primeiro intervalo agregado do coletor, janelas
+dentro da retenção bruta são servidas das brutas.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Any, NamedTuple
+
+import numpy as np
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+
+from banco_dados.modelos import LeituraDiaria, LeituraHoraria, LeituraSensor
+from banco_dados.utils import utc_now_naive
+
+logger = logging.getLogger(__name__)
+
+RETENCAO_BRUTA_DIAS = int(os.getenv("LEITURAS_RETENCAO_BRUTA_DIAS", "30"))
+RETENCAO_HORARIA_DIAS = int(os.getenv("LEITURAS_RETENCAO_HORARIA_DIAS", "400"))
+INTERVALO_LEITURA_MIN = 15   # cadência nominal do firmware
+MAX_PONTOS_SERIE = 400
+
+TABELAS = {"hora": LeituraHoraria, "dia": LeituraDiaria}
+PASSO_MIN = {"bruta": INTERVALO_LEITURA_MIN, "hora": 60, "dia": 24 * 60}
+_TRUNCAR = {
+    "hora": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "dia": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+_COLUNAS = (
+    "coletor_id", "inicio", "n_leituras", "nivel_min", "nivel_max", "nivel_soma", "nivel_ultimo",
+    "n_bateria", "bateria_min", "bateria_max", "bateria_soma", "bateria_ultima", "ultima_leitura_em",
+)
+
+
+class Ponto(NamedTuple):
+    """Ponto de série (leitura bruta ou média do intervalo), no formato esperado por ``ml_predicao``."""
+
+    timestamp: datetime
+    nivel: float
+
+
+# ---------------------------------------------------------------------------
+# Agregação
+# ---------------------------------------------------------------------------
+def _agregar(leituras: Sequence[tuple[int, datetime, float, float | None]], granularidade: str) -> list[dict[str, Any]]:
+    """Tuplas ``(coletor_id, timestamp, nivel, bateria)`` -> uma linha de rollup por (coletor, intervalo).
+
+    Python puro: no caminho quente (uma leitura por POST) é uma iteração só.
+    """
+    truncar = _TRUNCAR[granularidade]
+    grupos: dict[tuple[int, datetime], dict[str, Any]] = {}
+    for coletor_id, timestamp, nivel, bateria in sorted(leituras, key=itemgetter(1)):
+        chave = (coletor_id, truncar(timestamp))
+        g = grupos.get(chave)
+        if g is None:
+            g = grupos[chave] = {
+                "coletor_id": coletor_id, "inicio": chave[1], "n_leituras": 0,
+                "nivel_min": nivel, "nivel_max": nivel, "nivel_soma": 0.0,
+                "n_bateria": 0, "bateria_min": None, "bateria_max": None, "bateria_soma": None,
+            }
+        g["n_leituras"] += 1
+        g["nivel_min"] = min(g["nivel_min"], nivel)
+        g["nivel_max"] = max(g["nivel_max"], nivel)
+        g["nivel_soma"] += nivel
+        # "Última" = a leitura mais recente do intervalo (bateria mesmo nula)
+        g["nivel_ultimo"] = nivel
+        g["bateria_ultima"] = bateria
+        g["ultima_leitura_em"] = timestamp
+        if bateria is not None:
+            g["n_bateria"] += 1
+            g["bateria_min"] = bateria if g["bateria_min"] is None else min(g["bateria_min"], bateria)
+            g["bateria_max"] = bateria if g["bateria_max"] is None else max(g["bateria_max"], bateria)
+            g["bateria_soma"] = (g["bateria_soma"] or 0.0) + bateria
+    return list(grupos.values())
+
+
+def _tuplas(linhas) -> list[tuple[int, datetime, float, float | None]]:
+    """``(coletor_id, timestamp, nivel, bateria)`` a partir de dicts (buffer/endpoint) ou tuplas (``select``)."""
+    agora = None
+    saida = []
+    for linha in linhas:
+        if isinstance(linha, dict):
+            linha = (linha["coletor_id"], linha.get("timestamp"), linha["nivel"], linha.get("bateria"))
+        coletor_id, timestamp, nivel, bateria = linha
+        if timestamp is None:
+            # Sem timestamp vale o default da coluna (momento da gravação)
+            agora = agora or utc_now_naive()
+            timestamp = agora
+        saida.append((int(coletor_id), timestamp, float(nivel), None if bateria is None else float(bateria)))
+    return saida
+
+
+def _insert(db: Session, tabela):
+    nome = db.get_bind().dialect.name
+    if nome == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif nome == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"rollup de leituras não suportado para dialeto {nome!r}")
+    return insert(tabela.__table__)
+
+
+def _menor(atual, novo):
+    return case((or_(atual.is_(None), novo < atual), novo), else_=atual)
+
+
+def _maior(atual, novo):
+    return case((or_(atual.is_(None), novo > atual), novo), else_=atual)
+
+
+def _upsert(db: Session, tabela, linhas: list[dict[str, Any]], *, modo: str) -> None:
+    """``modo``: 'somar' (incremental), 'substituir' (reconstrução) ou 'preencher' (só intervalos sem linha)."""
+    if not linhas:
+        return
+    stmt = _insert(db, tabela)
+    if modo == "preencher":
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["coletor_id", "inicio"]), linhas)
+        return
+
+    t, novo = tabela.__table__.c, stmt.excluded
+    if modo == "substituir":
+        set_ = {col: novo[col] for col in _COLUNAS[2:]}
+    else:
+        # SET avalia tudo sobre a linha antiga, então ``mais_recente`` vale para todas as colunas
+        mais_recente = or_(t.ultima_leitura_em.is_(None), novo.ultima_leitura_em >= t.ultima_leitura_em)
+        set_ = {
+            "n_leituras": t.n_leituras + novo.n_leituras,
+            "nivel_min": _menor(t.nivel_min, novo.nivel_min),
+            "nivel_max": _maior(t.nivel_max, novo.nivel_max),
+            "nivel_soma": t.nivel_soma + novo.nivel_soma,
+            "nivel_ultimo": case((mais_recente, novo.nivel_ultimo), else_=t.nivel_ultimo),
+            "n_bateria": t.n_bateria + novo.n_bateria,
+            "bateria_min": _menor(t.bateria_min, novo.bateria_min),
+            "bateria_max": _maior(t.bateria_max, novo.bateria_max),
+            "bateria_soma": func.coalesce(t.bateria_soma, 0) + func.coalesce(novo.bateria_soma, 0),
+            "bateria_ultima": case((mais_recente, novo.bateria_ultima), else_=t.bateria_ultima),
+            "ultima_leitura_em": case((mais_recente, novo.ultima_leitura_em), else_=t.ultima_leitura_em),
+        }
+    db.execute(stmt.on_conflict_do_update(index_elements=["coletor_id", "inicio"], set_=set_), linhas)
+
+
+def acumular(db: Session, linhas: Sequence[dict[str, Any]]) -> int:
+    """Soma leituras novas (dicts com coletor_id/timestamp/nivel/bateria) aos rollups; não faz commit.
+
+    Devolve o número de intervalos horários tocados.
+    """
+    if not linhas:
+        return 0
+    leituras = _tuplas(linhas)
+    horas = _agregar(leituras, "hora")
+    _upsert(db, LeituraHoraria, horas, modo="somar")
+    _upsert(db, LeituraDiaria, _agregar(leituras, "dia"), modo="somar")
+    return len(horas)
+
+
+def reconstruir_rollups(
+    db: Session,
+    inicio: datetime | None = None,
+    fim: datetime | None = None,
+    *,
+    substituir: bool = True,
+) -> int:
+    """Recalcula os rollups dos dias inteiros em ``[inicio, fim)`` a partir de ``leituras_sensor``.
+
+    ``inicio``/``fim`` são arredondados para o início do dia (``fim`` padrão: hoje,
+    exclusivo — o dia corrente segue incremental). Com ``substituir=False`` só
+    cria intervalos que ainda não existem. Um dia por vez, para limitar memória.
+    Não faz commit; devolve o número de leituras lidas.
+    """
+    fim = (fim or utc_now_naive()).replace(hour=0, minute=0, second=0, microsecond=0)
+    if inicio is None:
+        inicio = db.query(func.min(LeituraSensor.timestamp)).filter(LeituraSensor.timestamp < fim).scalar()
+        if inicio is None:
+            return 0
+    dia = inicio.replace(hour=0, minute=0, second=0, microsecond=0)
+    modo = "substituir" if substituir else "preencher"
+    lidas = 0
+    while dia < fim:
+        proximo = dia + timedelta(days=1)
+        linhas = db.execute(
+            select(LeituraSensor.coletor_id, LeituraSensor.timestamp, LeituraSensor.nivel, LeituraSensor.bateria)
+            .where(LeituraSensor.timestamp >= dia, LeituraSensor.timestamp < proximo)
+        ).all()
+        if linhas:
+            leituras = _tuplas(linhas)
+            _upsert(db, LeituraHoraria, _agregar(leituras, "hora"), modo=modo)
+            _upsert(db, LeituraDiaria, _agregar(leituras, "dia"), modo=modo)
+            lidas += len(linhas)
+        dia = proximo
+    return lidas
+
+
+def compactar_leituras(
+    db: Session,
+    *,
+    dias_brutos: int = RETENCAO_BRUTA_DIAS,
+    dias_horarios: int = RETENCAO_HORARIA_DIAS,
+) -> dict[str, int]:
+    """Job de retenção: garante rollups dos dias antigos e apaga brutas/horárias vencidas.
+
+    Os cortes são alinhados ao início do dia, para nunca partir um intervalo ao meio.
+    """
+    hoje = utc_now_naive().replace(hour=0, minute=0, second=0, microsecond=0)
+    corte_bruto = hoje - timedelta(days=dias_brutos)
+    corte_horario = hoje - timedelta(days=dias_horarios)
+
+    # Primeira execução (brutas anteriores a qualquer rollup diário): preencher até
+    # hoje, senão as leituras dentro da retenção só entrariam no rollup ao vencer
+    primeiro_dia = db.execute(select(func.min(LeituraDiaria.inicio))).scalar()
+    antigas = select(LeituraSensor.id).limit(1)
+    if primeiro_dia is not None:
+        antigas = antigas.where(LeituraSensor.timestamp < primeiro_dia)
+    fim = hoje if db.execute(antigas).first() else corte_bruto
+    preenchidas = reconstruir_rollups(db, fim=fim, substituir=False)
+    brutas = (
+        db.query(LeituraSensor)
+        .filter(LeituraSensor.timestamp < corte_bruto)
+        .delete(synchronize_session=False)
+    )
+    horarias = (
+        db.query(LeituraHoraria)
+        .filter(LeituraHoraria.inicio < corte_horario)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    stats = {"leituras_verificadas": preenchidas, "brutas_apagadas": brutas, "horarias_apagadas": horarias}
+    logger.info(f"Compactação de leituras (corte bruto {corte_bruto:%Y-%m-%d}): {stats}")
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+def escolher_granularidade(dias: float, max_pontos: int = MAX_PONTOS_SERIE) -> str:
+    """Tabela mais grossa necessária: retenção cobre a janela e cabe em ``max_pontos``."""
+    if dias <= RETENCAO_BRUTA_DIAS and dias * 24 * 60 / INTERVALO_LEITURA_MIN <= max_pontos:
+        return "bruta"
+    if dias <= RETENCAO_HORARIA_DIAS and dias * 24 <= max_pontos:
+        return "hora"
+    return "dia"
+
+
+def _inicio_janela(desde: datetime, granularidade: str) -> datetime:
+    """Início do primeiro intervalo de rollup que toca a janela."""
+    inicio = desde.replace(minute=0, second=0, microsecond=0)
+    return inicio.replace(hour=0) if granularidade == "dia" else inicio
+
+
+def _consultar(db: Session, coletor_id: int, dias: float, granularidade: str | None):
+    """(granularidade usada, linhas) — mappings das brutas ou objetos de rollup."""
+    granularidade = granularidade or escolher_granularidade(dias)
+    agora = utc_now_naive()
+    desde = agora - timedelta(days=dias)
+    brutas = (
+        select(
+            LeituraSensor.id, LeituraSensor.sensor_id, LeituraSensor.coletor_id, LeituraSensor.nivel,
+            LeituraSensor.bateria, LeituraSensor.temperatura, LeituraSensor.timestamp,
+        )
+        .where(LeituraSensor.coletor_id == coletor_id, LeituraSensor.timestamp >= desde)
+        .order_by(LeituraSensor.timestamp.asc())
+    )
+    if granularidade == "bruta":
+        return granularidade, db.execute(brutas).mappings().all()
+
+    tabela = TABELAS[granularidade]
+    linhas = (
+        db.query(tabela)
+        .filter(tabela.coletor_id == coletor_id, tabela.inicio >= _inicio_janela(desde, granularidade))
+        .order_by(tabela.inicio.asc())
+        .all()
+    )
+    if dias <= RETENCAO_BRUTA_DIAS:
+        # Brutas anteriores ao primeiro intervalo de rollup (base antiga ainda não
+        # preenchida): o rollup não cobre a janela inteira, servir as brutas
+        primeira_bruta = db.execute(
+            select(func.min(LeituraSensor.timestamp))
+            .where(LeituraSensor.coletor_id == coletor_id, LeituraSensor.timestamp >= desde)
+        ).scalar()
+        if primeira_bruta is not None and (not linhas or primeira_bruta < linhas[0].inicio):
+            return "bruta", db.execute(brutas).mappings().all()
+    return granularidade, linhas
+
+
+def obter_serie(
+    db: Session,
+    coletor_id: int,
+    dias: float,
+    granularidade: str | None = None,
+) -> tuple[str, list[dict[str, Any]]]:
+    """Série de um coletor nos últimos ``dias``: (granularidade usada, pontos em ordem cronológica).
+
+    Pontos brutos têm o formato de ``LeituraSensor.to_dict``; os de rollup trazem
+    ``nivel``/``bateria`` = média do intervalo, mais min/max/último e ``n_leituras``.
+    Se o rollup escolhido não cobre o começo da janela (brutas anteriores ao primeiro
+    intervalo agregado) e ela cabe na retenção bruta, cai para as leituras brutas.
+    """
+    granularidade, linhas = _consultar(db, coletor_id, dias, granularidade)
+    if granularidade != "bruta":
+        return granularidade, [r.to_dict() for r in linhas]
+    return granularidade, [
+        {**r, "timestamp": r["timestamp"].isoformat() if r["timestamp"] else None} for r in linhas
+    ]
+
+
+def serie_niveis(
+    db: Session,
+    coletor_id: int,
+    dias: float,
+    granularidade: str | None = None,
+) -> tuple[str, list[Ponto]]:
+    """Como ``obter_serie``, reduzida a (timestamp, nível) para os modelos de previsão."""
+    granularidade, linhas = _consultar(db, coletor_id, dias, granularidade)
+    if granularidade != "bruta":
+        return granularidade, [Ponto(r.inicio, r.nivel_medio) for r in linhas]
+    return granularidade, [Ponto(r["timestamp"], r["nivel"]) for r in linhas]
+
+
+def series_niveis_lote(
+    db: Session,
+    coletor_ids: Sequence[int],
+    dias: float,
+) -> tuple[dict[int, str], np.ndarray, np.ndarray, np.ndarray]:
+    """``serie_niveis`` de vários coletores com uma consulta por tabela.
+
+    Devolve ``(granularidade por coletor, coletor_id, timestamp, nivel)`` — arrays
+    alinhados, ordenados por coletor e depois por timestamp (segmentos contíguos).
+    Coletores cujo rollup não cobre a janela caem para as brutas como em ``obter_serie``.
+    """
+    granularidade = escolher_granularidade(dias)
+    desde = utc_now_naive() - timedelta(days=dias)
+    ids = list(coletor_ids)
+    partes = []
+
+    if granularidade != "bruta":
+        tabela = TABELAS[granularidade]
+        linhas = db.execute(
+            select(tabela.coletor_id, tabela.inicio, tabela.nivel_soma / tabela.n_leituras)
+            .where(
+                tabela.coletor_id.in_(ids),
+                tabela.inicio >= _inicio_janela(desde, granularidade),
+                tabela.n_leituras > 0,
+            )
+        ).all()
+        primeiro_rollup: dict[int, datetime] = {}
+        for c, inicio, _ in linhas:
+            if c not in primeiro_rollup or inicio < primeiro_rollup[c]:
+                primeiro_rollup[c] = inicio
+        faltam = []
+        if dias <= RETENCAO_BRUTA_DIAS:
+            primeira_bruta = db.execute(
+                select(LeituraSensor.coletor_id, func.min(LeituraSensor.timestamp))
+                .where(LeituraSensor.coletor_id.in_(ids), LeituraSensor.timestamp >= desde)
+                .group_by(LeituraSensor.coletor_id)
+            ).all()
+            faltam = [
+                c for c, ts in primeira_bruta
+                if c not in primeiro_rollup or ts < primeiro_rollup[c]
+            ]
+        com_rollup = set(primeiro_rollup) - set(faltam)
+        partes.append([linha for linha in linhas if linha[0] in com_rollup])
+    else:
+        com_rollup, faltam = set(), ids
+
+    if faltam:
+        partes.append(db.execute(
+            select(LeituraSensor.coletor_id, LeituraSensor.timestamp, LeituraSensor.nivel)
+            .where(LeituraSensor.coletor_id.in_(faltam), LeituraSensor.timestamp >= desde)
+        ).all())
+
+    granularidades = {c: granularidade if c in com_rollup else "bruta" for c in ids}
+    linhas = [linha for parte in partes for linha in parte]
+    coletor = np.fromiter((c for c, _, _ in linhas), dtype=np.int64, count=len(linhas))
+    timestamp = np.array([t for _, t, _ in linhas], dtype="datetime64[us]")
+    nivel = np.fromiter((n for _, _, n in linhas), dtype=np.float64, count=len(linhas))
+    ordem = np.lexsort((timestamp, coletor))
+    return granularidades, coletor[ordem], timestamp[ordem], nivel[ordem]
@@ -2,21 +2,36 @@
 
 Prevê quando cada coletor atingirá nível crítico (90%).
 Algoritmo SOTA: statsforecast AutoETS (leve, sem compilação C++).
-Fallback: regressão linear na janela dos últimos 3 dias.
+Fallback: regressão linear sobre a janela de histórico.
 
-Executado via APScheduler 2x/dia.
+Executado via APScheduler 2x/dia (``recalcular_predicoes_todos``, em lote: a
+regressão de todos os coletores é vetorizada). No processo web o AutoETS roda em
+série; o pool de processos só é usado pelo CLI ``scripts/recalcular_predicoes.py``.
 """
 
 from __future__ import annotations
 
+import importlib.util
 import logging
-from datetime import timedelta
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from typing import Any
 
 import numpy as np
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import Session
 
-from banco_dados.modelos import Coletor, LeituraSensor, PredicaoEnchimento
+from banco_dados.modelos import Coletor, PredicaoEnchimento
+from banco_dados.services.leituras_rollup import (
+    INTERVALO_LEITURA_MIN,
+    PASSO_MIN,
+    Ponto,
+    obter_serie,
+    serie_niveis,
+    series_niveis_lote,
+)
 from banco_dados.utils import utc_now_naive
 
 logger = logging.getLogger(__name__)
@@ -26,41 +41,86 @@ NIVEL_ALVO = 90.0          # prever quando atinge 90%
 MIN_LEITURAS = 48          # mínimo ~12h de dados (a cada 15min)
 MIN_DIAS_AUTOETS = 3       # mínimo para AutoETS
 HORIZONTE_HORAS = 168      # prever até 7 dias à frente
-
-
-def _regressao_linear(timestamps: np.ndarray, niveis: np.ndarray) -> tuple[float, float]:
-    """Regressão linear simples: nível = a*t + b.
+JANELA_DIAS = 14           # histórico usado na previsão
+PONTOS_BACKTEST = 12       # últimas leituras usadas para o erro médio da regressão
+LOTE_COLETORES = 2000      # coletores por consulta de séries no recálculo
+AUTOETS_SERIES_POR_TAREFA = 100
+# Padrão do CLI; o agendador/API chamam com workers=1 (ver _autoets_em_paralelo)
+ML_PREDICAO_WORKERS = int(os.getenv("ML_PREDICAO_WORKERS") or 0) or min(4, os.cpu_count() or 1)
+
+_COLUNAS_PREDICAO = (
+    'predicted_full_at', 'horas_restantes', 'confianca_lower', 'confianca_upper',
+    'velocidade_enchimento', 'modelo_usado', 'erro_medio',
+)
+
+
+def _ajustar_segmentos(
+    seg: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    k: int,
+    mascara: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Regressão linear ``y = a*x + b`` de ``k`` séries de uma vez.
 
     Args:
-        timestamps: array de timestamps em horas (float) relativo ao primeiro
-        niveis: array de níveis (0-100)
+        seg: índice da série (0..k-1) de cada ponto
+        x: horas desde o primeiro ponto da série
+        y: níveis (0-100)
+        mascara: pontos a considerar (padrão: todos)
 
     Returns:
-        (slope, intercept) — slope em %/hora
+        (slopes, intercepts) — slope em %/hora; série com um ponto (ou com
+        todos no mesmo instante) tem slope 0 e intercept = média.
     """
-    if len(timestamps) < 2:
-        return 0.0, niveis[-1] if len(niveis) > 0 else 0.0
-
-    # Polyfit grau 1
-    coefs = np.polyfit(timestamps, niveis, deg=1)
-    return float(coefs[0]), float(coefs[1])
-
+    if mascara is not None:
+        seg, x, y = seg[mascara], x[mascara], y[mascara]
+    n = np.maximum(np.bincount(seg, minlength=k), 1)
+    mx = np.bincount(seg, x, k) / n
+    my = np.bincount(seg, y, k) / n
+    dx = x - mx[seg]  # centrado por série: estável mesmo com muitos pontos
+    sxx = np.bincount(seg, dx * dx, k)
+    sxy = np.bincount(seg, dx * (y - my[seg]), k)
+    slope = np.divide(sxy, sxx, out=np.zeros(k), where=sxx > 0)
+    return slope, my - slope * mx
+
+
+def _predizer_linear_lote(
+    seg: np.ndarray,
+    horas: np.ndarray,
+    niveis: np.ndarray,
+    k: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Regressão + backtest de ``k`` séries contíguas (pontos de cada série em ordem).
 
-def _predizer_linear(
-    leituras: list[LeituraSensor],
-    nivel_atual: float,
+    Returns:
+        (slope, intercept, hora_atual, mae) por série; ``mae`` é NaN com até
+        ``PONTOS_BACKTEST`` pontos.
+    """
+    slope, intercept = _ajustar_segmentos(seg, horas, niveis, k)
+    n = np.bincount(seg, minlength=k)
+    fim = np.cumsum(n)
+    hora_atual = horas[np.maximum(fim - 1, 0)] if len(horas) else np.zeros(k)
+
+    # Erro médio: ajuste sem as últimas PONTOS_BACKTEST leituras, testado nelas
+    posicao = np.arange(len(seg)) - (fim - n)[seg]
+    treino = posicao < (n - PONTOS_BACKTEST)[seg]
+    teste = ~treino & (n > PONTOS_BACKTEST)[seg]
+    s_treino, i_treino = _ajustar_segmentos(seg, horas, niveis, k, treino)
+    erro = np.abs(s_treino[seg] * horas + i_treino[seg] - niveis)
+    mae = np.bincount(seg[teste], erro[teste], k) / PONTOS_BACKTEST
+    mae[n <= PONTOS_BACKTEST] = np.nan
+    return slope, intercept, hora_atual, mae
+
+
+def _resultado_linear(
+    slope: float,
+    intercept: float,
+    hora_atual: float,
+    agora: datetime,
+    mae: float,
 ) -> dict[str, Any]:
-    """Predição via regressão linear (MVP, zero dependências extras)."""
-    if len(leituras) < 2:
-        return {'dados_suficientes': False}
-
-    # Converter timestamps para horas relativas
-    t0 = leituras[0].timestamp
-    horas = np.array([(r.timestamp - t0).total_seconds() / 3600 for r in leituras])
-    niveis = np.array([r.nivel for r in leituras])
-
-    slope, intercept = _regressao_linear(horas, niveis)
-
+    """Monta o resultado da regressão linear de uma série (``agora``: última leitura)."""
     if slope <= 0:
         # Nível está caindo ou estável — não vai encher
         return {
@@ -72,14 +132,8 @@ def _predizer_linear(
         }
 
     # Calcular quando atinge NIVEL_ALVO
-    hora_atual = horas[-1]
     nivel_predito_agora = slope * hora_atual + intercept
-    horas_para_alvo = (NIVEL_ALVO - nivel_predito_agora) / slope
-
-    if horas_para_alvo < 0:
-        horas_para_alvo = 0  # já passou do alvo
-
-    agora = leituras[-1].timestamp
+    horas_para_alvo = max(0.0, (NIVEL_ALVO - nivel_predito_agora) / slope)  # 0: já passou do alvo
     predicted_full_at = agora + timedelta(hours=horas_para_alvo)
 
     # Intervalo de confiança simples (±20% do tempo)
@@ -87,18 +141,6 @@ def _predizer_linear(
     confianca_lower = agora + timedelta(hours=max(0, horas_para_alvo - margem))
     confianca_upper = agora + timedelta(hours=horas_para_alvo + margem)
 
-    # Erro médio (MAE das últimas 12 leituras back-tested)
-    if len(leituras) > 12:
-        treino_h = horas[:-12]
-        treino_n = niveis[:-12]
-        teste_h = horas[-12:]
-        teste_n = niveis[-12:]
-        s, i = _regressao_linear(treino_h, treino_n)
-        pred = s * teste_h + i
-        mae = float(np.mean(np.abs(pred - teste_n)))
-    else:
-        mae = None
-
     return {
         'dados_suficientes': True,
         'predicted_full_at': predicted_full_at,
@@ -107,100 +149,175 @@ def _predizer_linear(
         'confianca_upper': confianca_upper,
         'velocidade_enchimento': round(slope, 4),
         'modelo_usado': 'linear',
-        'erro_medio': round(mae, 2) if mae is not None else None,
+        'erro_medio': None if np.isnan(mae) else round(mae, 2),
     }
 
 
-def _predizer_autoets(
-    leituras: list[LeituraSensor],
+def _predizer_linear(
+    leituras: list[Ponto],
     nivel_atual: float,
 ) -> dict[str, Any]:
-    """Predição SOTA via statsforecast AutoETS."""
-    try:
-        import pandas as pd
-        from statsforecast import StatsForecast
-        from statsforecast.models import AutoETS
-    except ImportError:
-        logger.warning("statsforecast não instalado, usando fallback linear")
-        return _predizer_linear(leituras, nivel_atual)
+    """Predição via regressão linear (MVP, zero dependências extras)."""
+    if len(leituras) < 2:
+        return {'dados_suficientes': False}
+
+    # Converter timestamps para horas relativas
+    t0 = leituras[0].timestamp
+    horas = np.array([(r.timestamp - t0).total_seconds() / 3600 for r in leituras])
+    niveis = np.array([r.nivel for r in leituras], dtype=float)
+    seg = np.zeros(len(leituras), dtype=np.int64)
+
+    slope, intercept, hora_atual, mae = _predizer_linear_lote(seg, horas, niveis, 1)
+    return _resultado_linear(
+        float(slope[0]), float(intercept[0]), float(hora_atual[0]), leituras[-1].timestamp, float(mae[0])
+    )
 
-    if len(leituras) < MIN_LEITURAS:
-        return _predizer_linear(leituras, nivel_atual)
 
-    # Montar DataFrame no formato do statsforecast
+def _statsforecast_disponivel() -> bool:
+    return importlib.util.find_spec("statsforecast") is not None
+
+
+def _predizer_autoets_lote(
+    series: dict[int, tuple[np.ndarray, np.ndarray]],
+    passo_min: int = INTERVALO_LEITURA_MIN,
+) -> dict[int, dict[str, Any]]:
+    """AutoETS de várias séries num só ``StatsForecast`` (unidade de trabalho do pool).
+
+    Args:
+        series: {coletor_id: (timestamps datetime64, níveis)} com o mesmo passo
+        passo_min: intervalo entre pontos das séries
+
+    Returns:
+        {coletor_id: resultado} no formato de ``_predizer_linear``
+    """
+    import pandas as pd
+    from statsforecast import StatsForecast
+    from statsforecast.models import AutoETS
+
+    ids = np.fromiter(series, dtype=np.int64, count=len(series))
     df = pd.DataFrame({
-        'unique_id': ['coletor'] * len(leituras),
-        'ds': [r.timestamp for r in leituras],
-        'y': [r.nivel for r in leituras],
+        'unique_id': np.repeat(ids, [len(y) for _, y in series.values()]),
+        'ds': np.concatenate([ts for ts, _ in series.values()]),
+        'y': np.concatenate([y for _, y in series.values()]),
     })
-    df = df.sort_values('ds').reset_index(drop=True)
+    df = df.sort_values(['unique_id', 'ds']).reset_index(drop=True)
+    ultimo_ts = df.groupby('unique_id')['ds'].max()
 
-    # Frequência: ~15min → 4 leituras/hora
-    # Horizonte: prever até 7 dias (168h × 4 = 672 pontos)
-    horizon = min(672, len(leituras))
+    # Horizonte: prever até 7 dias (15min → 672 pontos; agregado horário → 168)
+    pontos_dia = 24 * 60 // passo_min
+    horizon = HORIZONTE_HORAS * 60 // passo_min
 
+    sf = StatsForecast(
+        models=[AutoETS(season_length=pontos_dia)],  # sazonalidade diária
+        freq=f'{passo_min}min',
+        n_jobs=1,  # o paralelismo é o pool de processos de quem chama
+    )
+    sf.fit(df)
+    forecast = sf.predict(h=horizon)
+    if 'unique_id' not in forecast.columns:  # statsforecast < 1.7 devolve no índice
+        forecast = forecast.reset_index()
+    forecast = forecast.sort_values(['unique_id', 'ds'])
+    previstos = forecast['AutoETS'].to_numpy(dtype=float).reshape(-1, horizon)
+    ordem = forecast['unique_id'].to_numpy().reshape(-1, horizon)[:, 0]
+
+    # Primeiro passo em que cada série atinge NIVEL_ALVO
+    acima = previstos >= NIVEL_ALVO
+    cruza = acima.any(axis=1)
+    passos_ate_alvo = acima.argmax(axis=1) + 1
+
+    # Velocidade de enchimento (slope das primeiras 24h de forecast), em %/hora
+    velocidade = np.diff(previstos[:, :pontos_dia], axis=1).mean(axis=1) * 60 / passo_min
+
+    # Cross-validation para erro
     try:
-        sf = StatsForecast(
-            models=[AutoETS(season_length=96)],  # 96 = 24h × 4 leituras/hora
-            freq='15min',
-            n_jobs=1,
-        )
-        sf.fit(df)
-        forecast = sf.predict(h=horizon)
-
-        # Encontrar quando atinge NIVEL_ALVO
-        forecast_vals = forecast['AutoETS'].values
-        ultimo_ts = df['ds'].max()
-
-        predicted_full_at = None
-        horas_restantes = None
-
-        for i, val in enumerate(forecast_vals):
-            if val >= NIVEL_ALVO:
-                delta_minutos = (i + 1) * 15
-                predicted_full_at = ultimo_ts + timedelta(minutes=delta_minutos)
-                horas_restantes = delta_minutos / 60
-                break
-
-        # Velocidade de enchimento (slope dos últimos 24h de forecast)
-        if len(forecast_vals) >= 4:
-            slope_15min = float(np.mean(np.diff(forecast_vals[:96])))
-            velocidade = slope_15min * 4  # converter para %/hora
-        else:
-            velocidade = 0.0
-
-        # Cross-validation para erro
-        try:
-            cv_results = sf.cross_validation(df, h=48, step_size=48, n_windows=2)
-            mae = float(np.mean(np.abs(cv_results['AutoETS'] - cv_results['y'])))
-        except Exception:
-            mae = None
-
-        # Confiança
-        if horas_restantes is not None:
+        janela_cv = 12 * 60 // passo_min or 1
+        cv = sf.cross_validation(df=df, h=janela_cv, step_size=janela_cv, n_windows=2)
+        if 'unique_id' not in cv.columns:
+            cv = cv.reset_index()
+        mae = (cv['AutoETS'] - cv['y']).abs().groupby(cv['unique_id']).mean()
+    except Exception:
+        mae = pd.Series(dtype=float)
+
+    resultados = {}
+    for i, cid in enumerate(ordem):
+        ultimo = pd.Timestamp(ultimo_ts[cid]).to_pydatetime()
+        predicted_full_at = horas_restantes = confianca_lower = confianca_upper = None
+        if cruza[i]:
+            horas_restantes = float(passos_ate_alvo[i] * passo_min / 60)
+            predicted_full_at = ultimo + timedelta(hours=horas_restantes)
             margem = max(horas_restantes * 0.15, 0.5)
-            confianca_lower = ultimo_ts + timedelta(hours=max(0, horas_restantes - margem))
-            confianca_upper = ultimo_ts + timedelta(hours=horas_restantes + margem)
-        else:
-            confianca_lower = None
-            confianca_upper = None
-
-        return {
+            confianca_lower = ultimo + timedelta(hours=max(0, horas_restantes - margem))
+            confianca_upper = ultimo + timedelta(hours=horas_restantes + margem)
+        erro = mae.get(cid)
+        resultados[int(cid)] = {
             'dados_suficientes': True,
             'predicted_full_at': predicted_full_at,
             'horas_restantes': round(horas_restantes, 1) if horas_restantes else None,
             'confianca_lower': confianca_lower,
             'confianca_upper': confianca_upper,
-            'velocidade_enchimento': round(velocidade, 4),
+            'velocidade_enchimento': round(float(velocidade[i]), 4),
             'modelo_usado': 'autoets',
-            'erro_medio': round(mae, 2) if mae is not None else None,
+            'erro_medio': round(float(erro), 2) if erro is not None and np.isfinite(erro) else None,
         }
+    return resultados
+
+
+def _predizer_autoets(
+    leituras: list[Ponto],
+    nivel_atual: float,
+    passo_min: int = INTERVALO_LEITURA_MIN,
+) -> dict[str, Any]:
+    """Predição SOTA via statsforecast AutoETS (``passo_min``: intervalo entre pontos da série)."""
+    if not _statsforecast_disponivel():
+        logger.warning("statsforecast não instalado, usando fallback linear")
+        return _predizer_linear(leituras, nivel_atual)
 
+    if len(leituras) < MIN_LEITURAS:
+        return _predizer_linear(leituras, nivel_atual)
+
+    serie = (
+        np.array([r.timestamp for r in leituras], dtype='datetime64[us]'),
+        np.array([r.nivel for r in leituras], dtype=float),
+    )
+    try:
+        return _predizer_autoets_lote({0: serie}, passo_min)[0]
     except Exception as e:
         logger.warning(f"AutoETS falhou, usando fallback linear: {e}")
         return _predizer_linear(leituras, nivel_atual)
 
 
+def _autoets_em_paralelo(
+    tarefas: list[tuple[dict[int, tuple[np.ndarray, np.ndarray]], int]],
+    workers: int = 1,
+) -> dict[int, dict[str, Any]]:
+    """Executa ``_predizer_autoets_lote`` para cada tarefa, em série ou num pool de processos.
+
+    O pool (spawn) reimporta o ``__main__`` do pai em cada filho: sob ``python app.py``
+    isso subiria outro agendador por worker. Por isso só ponto de entrada protegido
+    por ``if __name__ == "__main__"`` (o CLI) deve pedir ``workers > 1``.
+    Tarefas que falham ficam de fora do resultado (o chamador mantém a linear).
+    """
+    resultados: dict[int, dict[str, Any]] = {}
+    workers = min(workers, len(tarefas))
+    if workers <= 1:
+        for series, passo_min in tarefas:
+            try:
+                resultados.update(_predizer_autoets_lote(series, passo_min))
+            except Exception as e:
+                logger.warning(f"AutoETS falhou em {len(series)} séries, usando fallback linear: {e}")
+        return resultados
+
+    # spawn: o processo pai (Flask/APScheduler) tem threads e conexões abertas
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [(pool.submit(_predizer_autoets_lote, *tarefa), len(tarefa[0])) for tarefa in tarefas]
+        for future, n in futures:
+            try:
+                resultados.update(future.result())
+            except Exception as e:
+                logger.warning(f"AutoETS falhou em {n} séries, usando fallback linear: {e}")
+    return resultados
+
+
 def predizer_enchimento_coletor(
     db: Session,
     coletor_id: int,
@@ -220,17 +337,8 @@ def predizer_enchimento_coletor(
     if not coletor:
         return {'erro': f'Coletor {coletor_id} não encontrado'}
 
-    # Buscar leituras dos últimos 14 dias (ordenadas por timestamp)
-    data_limite = utc_now_naive() - timedelta(days=14)
-    leituras = (
-        db.query(LeituraSensor)
-        .filter(
-            LeituraSensor.coletor_id == coletor_id,
-            LeituraSensor.timestamp >= data_limite,
-        )
-        .order_by(LeituraSensor.timestamp.asc())
-        .all()
-    )
+    # Últimos 14 dias, da tabela mais grossa que cobre a janela (agregado horário)
+    granularidade, leituras = serie_niveis(db, coletor_id, dias=JANELA_DIAS)
 
     if len(leituras) < 2:
         return {
@@ -243,82 +351,146 @@ def predizer_enchimento_coletor(
     nivel_atual = float(coletor.nivel_preenchimento or 0)
 
     if usar_autoets and len(leituras) >= MIN_LEITURAS:
-        resultado = _predizer_autoets(leituras, nivel_atual)
+        resultado = _predizer_autoets(leituras, nivel_atual, PASSO_MIN[granularidade])
     else:
         resultado = _predizer_linear(leituras, nivel_atual)
 
     resultado['coletor_id'] = coletor_id
     resultado['nivel_atual'] = nivel_atual
     resultado['total_leituras'] = len(leituras)
+    resultado['granularidade'] = granularidade
     return resultado
 
 
-def recalcular_predicoes_todos(db: Session) -> dict[str, Any]:
-    """Recalcula predições para todos os coletores ativos.
-
-    Chamado pelo APScheduler 2x/dia.
+def _predizer_bloco(
+    db: Session,
+    coletor_ids: list[int],
+    usar_autoets: bool,
+) -> tuple[dict[int, dict[str, Any]], list[tuple[int, int, np.ndarray, np.ndarray]]]:
+    """Predição linear de um bloco de coletores a partir de uma consulta de séries.
 
     Returns:
-        dict com estatísticas do processamento
+        ({coletor_id: resultado}, séries elegíveis ao AutoETS como
+        ``(coletor_id, passo_min, timestamps, níveis)``)
     """
-    stats = {'processados': 0, 'sucesso': 0, 'falha': 0, 'insuficientes': 0}
+    granularidades, coletor, timestamp, nivel = series_niveis_lote(db, coletor_ids, JANELA_DIAS)
+    ids, inicio, n = np.unique(coletor, return_index=True, return_counts=True)
+    k = len(ids)
+    seg = np.repeat(np.arange(k), n)
+    horas = (timestamp - timestamp[inicio][seg]) / np.timedelta64(1, 'h')
+
+    slope, intercept, hora_atual, mae = _predizer_linear_lote(seg, horas, nivel, k)
+    ultimos = timestamp[inicio + n - 1].tolist()
+
+    resultados: dict[int, dict[str, Any]] = {}
+    elegiveis = []
+    for i, cid in enumerate(ids.tolist()):
+        if n[i] < 2:
+            continue
+        resultado = _resultado_linear(
+            float(slope[i]), float(intercept[i]), float(hora_atual[i]), ultimos[i], float(mae[i])
+        )
+        resultado['total_leituras'] = int(n[i])
+        resultado['granularidade'] = granularidades[cid]
+        resultados[cid] = resultado
+        if usar_autoets and n[i] >= MIN_LEITURAS:
+            fatia = slice(inicio[i], inicio[i] + n[i])
+            elegiveis.append((cid, PASSO_MIN[granularidades[cid]], timestamp[fatia], nivel[fatia]))
+    return resultados, elegiveis
 
-    coletores = db.query(Coletor).all()
-    logger.info(f"🔄 Recalculando predições para {len(coletores)} coletores...")
 
-    for coletor in coletores:
-        stats['processados'] += 1
+def recalcular_predicoes_todos(
+    db: Session,
+    usar_autoets: bool = True,
+    workers: int = 1,
+) -> dict[str, Any]:
+    """Recalcula predições para todos os coletores ativos.
 
-        try:
-            resultado = predizer_enchimento_coletor(db, coletor.id)
-
-            if not resultado.get('dados_suficientes', False):
-                stats['insuficientes'] += 1
-                # Salvar estado "insuficiente"
-                pred = db.query(PredicaoEnchimento).filter(
-                    PredicaoEnchimento.coletor_id == coletor.id
-                ).first()
-                if not pred:
-                    pred = PredicaoEnchimento(coletor_id=coletor.id)
-                    db.add(pred)
-                pred.dados_suficientes = False
-                pred.calculado_em = utc_now_naive()
-                continue
-
-            # Upsert predição
-            pred = db.query(PredicaoEnchimento).filter(
-                PredicaoEnchimento.coletor_id == coletor.id
-            ).first()
-            if not pred:
-                pred = PredicaoEnchimento(coletor_id=coletor.id)
-                db.add(pred)
-
-            pred.predicted_full_at = resultado.get('predicted_full_at')
-            pred.horas_restantes = resultado.get('horas_restantes')
-            pred.confianca_lower = resultado.get('confianca_lower')
-            pred.confianca_upper = resultado.get('confianca_upper')
-            pred.velocidade_enchimento = resultado.get('velocidade_enchimento')
-            pred.modelo_usado = resultado.get('modelo_usado')
-            pred.erro_medio = resultado.get('erro_medio')
-            pred.dados_suficientes = True
-            pred.calculado_em = utc_now_naive()
+    Chamado pelo APScheduler 2x/dia. Em vez de consultar e ajustar coletor a
+    coletor: séries carregadas em blocos de ``LOTE_COLETORES`` (uma consulta por
+    bloco), regressão linear vetorizada por segmento, AutoETS em tarefas de
+    ``AUTOETS_SERIES_POR_TAREFA`` séries e gravação em massa de ``PredicaoEnchimento``.
 
-            stats['sucesso'] += 1
+    Args:
+        workers: processos para o AutoETS. Mantenha 1 dentro do processo web;
+            ``scripts/recalcular_predicoes.py`` usa ``ML_PREDICAO_WORKERS``.
 
+    Returns:
+        dict com estatísticas do processamento
+    """
+    coletor_ids = [cid for (cid,) in db.query(Coletor.id).order_by(Coletor.id)]
+    stats = {'processados': len(coletor_ids), 'sucesso': 0, 'falha': 0, 'insuficientes': 0, 'autoets': 0}
+    logger.info(f"🔄 Recalculando predições para {len(coletor_ids)} coletores...")
+
+    usar_autoets = usar_autoets and _statsforecast_disponivel()
+    resultados: dict[int, dict[str, Any]] = {}
+    elegiveis = []
+    falhas: set[int] = set()
+    for i in range(0, len(coletor_ids), LOTE_COLETORES):
+        bloco = coletor_ids[i:i + LOTE_COLETORES]
+        try:
+            res, eleg = _predizer_bloco(db, bloco, usar_autoets)
         except Exception as e:
-            logger.error(f"Erro ao predizer coletor {coletor.id}: {e}")
+            logger.error(f"Erro ao predizer bloco de {len(bloco)} coletores: {e}")
+            falhas.update(bloco)
+            continue
+        resultados.update(res)
+        elegiveis.extend(eleg)
+
+    if elegiveis:
+        # Tarefas homogêneas no passo (freq do StatsForecast)
+        por_passo: dict[int, list] = {}
+        for cid, passo_min, ts, y in elegiveis:
+            por_passo.setdefault(passo_min, []).append((cid, ts, y))
+        tarefas = [
+            ({cid: (ts, y) for cid, ts, y in grupo[j:j + AUTOETS_SERIES_POR_TAREFA]}, passo_min)
+            for passo_min, grupo in por_passo.items()
+            for j in range(0, len(grupo), AUTOETS_SERIES_POR_TAREFA)
+        ]
+        for cid, resultado in _autoets_em_paralelo(tarefas, workers).items():
+            resultados[cid] = {**resultados[cid], **resultado}
+            stats['autoets'] += 1
+
+    # Upsert em massa: UPDATE por chave primária das existentes, INSERT das novas
+    existentes = dict(
+        db.query(PredicaoEnchimento.coletor_id, func.min(PredicaoEnchimento.id))
+        .group_by(PredicaoEnchimento.coletor_id)
+        .all()
+    )
+    agora = utc_now_naive()
+    atualizar, inserir = [], []
+    for cid in coletor_ids:
+        if cid in falhas:
             stats['falha'] += 1
+            continue
+        resultado = resultados.get(cid)
+        if resultado is None:
+            stats['insuficientes'] += 1
+            # Salvar estado "insuficiente" (mantém a última previsão válida)
+            linha = {'dados_suficientes': False, 'calculado_em': agora}
+        else:
+            stats['sucesso'] += 1
+            linha = {col: resultado.get(col) for col in _COLUNAS_PREDICAO}
+            linha.update(dados_suficientes=True, calculado_em=agora)
+        if cid in existentes:
+            atualizar.append({'id': existentes[cid], **linha})
+        else:
+            inserir.append({'coletor_id': cid, **linha})
 
+    if atualizar:
+        db.execute(update(PredicaoEnchimento), atualizar)
+    if inserir:
+        db.execute(insert(PredicaoEnchimento), inserir)
     db.commit()
     logger.info(
-        f"✅ Predições concluídas: {stats['sucesso']} ok, "
+        f"✅ Predições concluídas: {stats['sucesso']} ok ({stats['autoets']} AutoETS), "
         f"{stats['insuficientes']} insuficientes, {stats['falha']} falhas"
     )
     return stats
 
 
 def obter_serie_historica(
-    db: Session, coletor_id: int, dias: int = 7
+    db: Session, coletor_id: int, dias: int = 7, granularidade: str | None = None
 ) -> list[dict[str, Any]]:
     """Retorna série histórica de leituras para visualização.
 
@@ -326,18 +498,10 @@ def obter_serie_historica(
         db: sessão SQLAlchemy
         coletor_id: ID do coletor
         dias: quantos dias de histórico
+        granularidade: 'bruta', 'hora' ou 'dia' (padrão: a mais grossa que cobre
+            a janela — ver ``leituras_rollup.escolher_granularidade``)
 
     Returns:
-        lista de dicts com {timestamp, nivel, bateria}
+        lista de dicts com {timestamp, nivel, bateria} (+ min/max nos agregados)
     """
-    data_limite = utc_now_naive() - timedelta(days=dias)
-    leituras = (
-        db.query(LeituraSensor)
-        .filter(
-            LeituraSensor.coletor_id == coletor_id,
-            LeituraSensor.timestamp >= data_limite,
-        )
-        .order_by(LeituraSensor.timestamp.asc())
-        .all()
-    )
-    return [r.to_dict() for r in leituras]
+    return obter_serie(db, coletor_id, dias, granularidade)[1]
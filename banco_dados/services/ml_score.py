@@ -16,7 +16,8 @@ import os
 from math import atan2, cos, radians, sin, sqrt
 from typing import Any
 
-from sqlalchemy import func
+import numpy as np
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import Session, joinedload
 
 from banco_dados.modelos import (
@@ -25,6 +26,8 @@ from banco_dados.modelos import (
     PredicaoEnchimento,
     TronikScore,
 )
+from banco_dados.services import roteamento
+from banco_dados.services.distancias_coletores import MatrizColetores, obter_matriz_coletores
 from banco_dados.utils import utc_now_naive
 
 logger = logging.getLogger(__name__)
@@ -45,6 +48,10 @@ SEDE_LNG = float(os.getenv('TRONIK_SEDE_LNG', '-47.8822'))
 
 # Limiar mínimo de coletas para usar XGBoost
 MIN_COLETAS_XGBOOST = 200
+MODELO_XGBOOST_PATH = 'banco_dados/ml_models/score_model.pkl'
+
+# Até quantos coletores as consultas de features filtram por id (acima: tabela inteira)
+MAX_IDS_FILTRO = 500
 
 # Ordem explícita de features para XGBoost (schema verificável)
 _XGBOOST_FEATURE_NAMES = [
@@ -66,90 +73,137 @@ def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return R * 2 * atan2(sqrt(a), sqrt(1 - a))
 
 
-def _normalizar_0_100(valor: float, minimo: float, maximo: float) -> float:
-    """Normaliza valor para escala 0-100."""
+def _normalizar_0_100(valor, minimo: float, maximo: float):
+    """Normaliza valor (escalar ou array) para escala 0-100."""
     if maximo <= minimo:
-        return 50.0
-    return max(0.0, min(100.0, (valor - minimo) / (maximo - minimo) * 100))
+        return np.full_like(np.asarray(valor, dtype=float), 50.0)
+    return np.clip((np.asarray(valor, dtype=float) - minimo) / (maximo - minimo) * 100, 0.0, 100.0)
+
+
+def _contar_proximos(
+    matriz: MatrizColetores,
+    niveis: dict[int, float],
+    raio_km: float = 5.0,
+    nivel_minimo: float = 60,
+) -> dict[int, int]:
+    """Cluster bonus de todos os coletores de uma vez: vizinhos a ≤ raio_km com nível ≥ nivel_minimo.
+
+    ``niveis``: nível dos coletores com coordenadas (os demais nunca contam).
+    Uma BallTree haversine sobre os coletores cheios dá os candidatos de cada
+    coletor (O(n log n), sem a máscara n × n); a distância da matriz decide, o
+    que mantém a métrica viária quando há grafo (nunca menor que a reta).
+    """
+    from sklearn.neighbors import BallTree
+
+    n = len(matriz.ids)
+    nivel = np.array([niveis.get(int(cid), -1.0) for cid in matriz.ids])
+    cheios = np.flatnonzero(nivel >= nivel_minimo)
+    contagem = np.zeros(n, dtype=np.int64)
+    if n and len(cheios):
+        pontos = np.radians(np.column_stack([matriz.lat[1:], matriz.lon[1:]]))
+        arvore = BallTree(pontos[cheios], metric='haversine')
+        # Folga no raio: o arredondamento da árvore não pode perder candidatos na borda
+        candidatos = arvore.query_radius(pontos, r=raio_km * 1.001 / roteamento.RAIO_TERRA_KM)
+        linhas = np.repeat(np.arange(n), [len(c) for c in candidatos])
+        colunas = cheios[np.concatenate(candidatos)] if len(linhas) else linhas
+        perto = (matriz.km[linhas + 1, colunas + 1] <= raio_km) & (linhas != colunas)
+        contagem = np.bincount(linhas[perto], minlength=n)
+    return dict(zip(matriz.ids.tolist(), contagem.tolist(), strict=True))
+
+
+def _niveis_com_coordenadas(coletores) -> dict[int, float]:
+    return {
+        c.id: float(c.nivel_preenchimento or 0)
+        for c in coletores
+        if c.latitude and c.longitude
+    }
 
 
-def _extrair_features(
+def _features_lote(
     db: Session,
-    coletor: Coletor,
-    todos_coletores: list[Coletor],
-) -> dict[str, float]:
-    """Extrai features para scoring de um coletor.
+    coletores,
+    *,
+    matriz: MatrizColetores,
+    proximos: dict[int, int],
+) -> dict[str, np.ndarray]:
+    """Features de scoring de vários coletores, como arrays na ordem de ``coletores``.
 
     Features:
     1. nivel_preenchimento (0-100)
     2. velocidade_enchimento (%/hora, do Módulo 1)
-    3. km_da_sede (distância haversine)
+    3. km_da_sede (matriz de distâncias: viária com grafo, senão haversine)
     4. dias_sem_coleta (diff entre agora e última coleta)
-    5. lucro_medio_por_kg (média histórica do parceiro)
+    5. lucro_medio_por_kg (média histórica do coletor)
     6. coletores_proximos_acima_60 (cluster bonus)
+
+    ``coletores``: objetos com id, nivel_preenchimento, latitude, longitude e
+    ultima_coleta (``Coletor`` ou linhas de ``select``). Predições e lucro vêm
+    de uma consulta agrupada cada, filtradas por id só para poucos coletores.
     """
+    ids = [c.id for c in coletores]
     agora = utc_now_naive()
-    features: dict[str, float] = {}
-
-    # 1. Nível de preenchimento
-    features['nivel'] = float(coletor.nivel_preenchimento or 0)
-
-    # 2. Velocidade de enchimento (do Módulo 1)
-    pred = db.query(PredicaoEnchimento).filter(
-        PredicaoEnchimento.coletor_id == coletor.id
-    ).first()
-    features['velocidade'] = float(pred.velocidade_enchimento or 0) if pred else 0.0
-
-    # 3. Distância da sede (km)
-    if coletor.latitude and coletor.longitude:
-        features['km_sede'] = haversine(
-            SEDE_LAT, SEDE_LNG,
-            float(coletor.latitude), float(coletor.longitude)
-        )
-    else:
-        features['km_sede'] = 50.0  # fallback conservador
-
-    # 4. Dias sem coleta
-    if coletor.ultima_coleta:
-        features['dias_sem_coleta'] = (agora - coletor.ultima_coleta).total_seconds() / 86400
-    else:
-        features['dias_sem_coleta'] = 30.0  # assume muito tempo
-
-    # 5. Lucro médio por kg (do parceiro)
-    lucro_medio = (
-        db.query(func.avg(Coleta.lucro_por_kg))
-        .filter(
-            Coleta.coletor_id == coletor.id,
-            Coleta.lucro_por_kg.isnot(None),
-        )
-        .scalar()
+
+    consulta_pred = db.query(PredicaoEnchimento.coletor_id, PredicaoEnchimento.velocidade_enchimento)
+    consulta_lucro = (
+        db.query(Coleta.coletor_id, func.avg(Coleta.lucro_por_kg))
+        .filter(Coleta.lucro_por_kg.isnot(None))
+        .group_by(Coleta.coletor_id)
     )
-    features['lucro_medio'] = float(lucro_medio) if lucro_medio else 2.0  # fallback R$2/kg
-
-    # 6. Cluster bonus: coletores próximos acima de 60%
-    count_proximos = 0
-    if coletor.latitude and coletor.longitude:
-        for outro in todos_coletores:
-            if outro.id == coletor.id:
-                continue
-            if outro.latitude and outro.longitude:
-                dist = haversine(
-                    float(coletor.latitude), float(coletor.longitude),
-                    float(outro.latitude), float(outro.longitude),
-                )
-                if dist <= 5.0 and float(outro.nivel_preenchimento or 0) >= 60:
-                    count_proximos += 1
-    features['coletores_proximos'] = count_proximos
-
-    return features
+    if len(ids) <= MAX_IDS_FILTRO:
+        consulta_pred = consulta_pred.filter(PredicaoEnchimento.coletor_id.in_(ids))
+        consulta_lucro = consulta_lucro.filter(Coleta.coletor_id.in_(ids))
+    # Mais de uma predição por coletor: vale a mais antiga, como o antigo .first()
+    velocidades = dict(consulta_pred.order_by(PredicaoEnchimento.id.desc()).all())
+    lucros = dict(consulta_lucro.all())
+
+    tem_coordenadas = np.array([bool(c.latitude and c.longitude) and c.id in matriz for c in coletores], dtype=bool)
+    km_sede = np.full(len(ids), 50.0)  # fallback conservador sem coordenadas
+    if tem_coordenadas.any():
+        com = [cid for cid, ok in zip(ids, tem_coordenadas, strict=True) if ok]
+        km_sede[tem_coordenadas] = matriz.km[0, matriz.posicoes(com)]
 
+    return {
+        'nivel': np.array([float(c.nivel_preenchimento or 0) for c in coletores]),
+        'velocidade': np.array([float(velocidades.get(cid) or 0) for cid in ids]),
+        'km_sede': km_sede,
+        'dias_sem_coleta': np.array([
+            (agora - c.ultima_coleta).total_seconds() / 86400 if c.ultima_coleta else 30.0  # assume muito tempo
+            for c in coletores
+        ]),
+        'lucro_medio': np.array([float(lucros.get(cid) or 2.0) for cid in ids]),  # fallback R$2/kg
+        'coletores_proximos': np.array(
+            [proximos.get(cid, 0) if ok else 0 for cid, ok in zip(ids, tem_coordenadas, strict=True)],
+            dtype=np.int64,
+        ),
+    }
 
-def _score_heuristica(features: dict[str, float]) -> float:
-    """Calcula TRONIK Score via heurística ponderada.
 
-    Score = soma ponderada de features normalizadas.
-    Quanto maior, mais prioritário para coleta.
+def _features_de(features: dict[str, np.ndarray], i: int) -> dict[str, float]:
+    """Features do i-ésimo coletor de ``_features_lote`` como dict de escalares Python."""
+    return {nome: valores[i].item() for nome, valores in features.items()}
+
+
+def _extrair_features(
+    db: Session,
+    coletor: Coletor,
+    todos_coletores: list[Coletor],
+    *,
+    matriz: MatrizColetores | None = None,
+    proximos: dict[int, int] | None = None,
+) -> dict[str, float]:
+    """Extrai features para scoring de um coletor (ver ``_features_lote``).
+
+    ``matriz``/``proximos`` são calculados uma vez por recálculo; quando
+    omitidos são obtidos aqui.
     """
+    if matriz is None:
+        matriz = obter_matriz_coletores(db)
+    if proximos is None:
+        proximos = _contar_proximos(matriz, _niveis_com_coordenadas(todos_coletores))
+    return _features_de(_features_lote(db, [coletor], matriz=matriz, proximos=proximos), 0)
+
+
+def _pesos() -> dict[str, float]:
     pesos = PESOS_DEFAULT.copy()
 
     # Ler pesos customizados (se existirem como env var)
@@ -157,11 +211,20 @@ def _score_heuristica(features: dict[str, float]) -> float:
     if pesos_env:
         with contextlib.suppress(json.JSONDecodeError, TypeError):
             pesos.update(json.loads(pesos_env))
+    return pesos
+
 
+def _score_heuristica_lote(features: dict[str, np.ndarray]) -> np.ndarray:
+    """Calcula TRONIK Score via heurística ponderada para arrays de features.
+
+    Score = soma ponderada de features normalizadas.
+    Quanto maior, mais prioritário para coleta.
+    """
+    pesos = _pesos()
     scores_parciais = {}
 
     # Nível: mais cheio = mais urgente
-    scores_parciais['nivel'] = features['nivel']
+    scores_parciais['nivel'] = np.asarray(features['nivel'], dtype=float)
 
     # Velocidade: enchendo mais rápido = mais urgente
     # Normalizar: 0-2 %/hora é o range esperado
@@ -169,13 +232,11 @@ def _score_heuristica(features: dict[str, float]) -> float:
 
     # Proximidade da sede: mais perto = mais viável (inverso do km)
     # Score = 100 se km=0, score = 0 se km >= 60
-    scores_parciais['proximidade_sede'] = max(0, 100 - (features['km_sede'] / 60) * 100)
+    scores_parciais['proximidade_sede'] = np.maximum(0, 100 - (np.asarray(features['km_sede']) / 60) * 100)
 
     # Dias sem coleta: mais dias = mais urgente
     # Normalizar: 0-30 dias
-    scores_parciais['dias_sem_coleta'] = _normalizar_0_100(
-        features['dias_sem_coleta'], 0, 30
-    )
+    scores_parciais['dias_sem_coleta'] = _normalizar_0_100(features['dias_sem_coleta'], 0, 30)
 
     # Lucro médio: mais lucrativo = mais valioso
     # Normalizar: R$0-10/kg
@@ -183,9 +244,7 @@ def _score_heuristica(features: dict[str, float]) -> float:
 
     # Cluster bonus: mais coletores próximos cheios = vale mais coletar na região
     # Normalizar: 0-5 coletores
-    scores_parciais['cluster_bonus'] = _normalizar_0_100(
-        features['coletores_proximos'], 0, 5
-    )
+    scores_parciais['cluster_bonus'] = _normalizar_0_100(features['coletores_proximos'], 0, 5)
 
     # Score final ponderado
     score = sum(
@@ -193,42 +252,65 @@ def _score_heuristica(features: dict[str, float]) -> float:
         for k in pesos
     )
 
-    return round(max(0, min(100, score)), 1)
+    return np.round(np.clip(score, 0, 100), 1)
 
 
-def _score_xgboost(
-    features: dict[str, float],
-    model_path: str = 'banco_dados/ml_models/score_model.pkl',
-) -> float | None:
-    """Calcula TRONIK Score via XGBoost (Fase 2).
+def _score_heuristica(features: dict[str, float]) -> float:
+    """Calcula TRONIK Score via heurística ponderada (um coletor)."""
+    return float(_score_heuristica_lote({k: np.array([v]) for k, v in features.items()})[0])
 
-    Retorna None se modelo não existir ou falhar.
-    """
+
+def _carregar_modelo_xgboost(model_path: str = MODELO_XGBOOST_PATH):
+    """Carrega o modelo XGBoost (Fase 2) uma vez por recálculo; None se não existir."""
     try:
         import joblib
-        import numpy as np
-
-        model = joblib.load(model_path)
-        # Build feature array using explicit schema (raises KeyError if feature missing)
-        X = np.array([[features[f] for f in _XGBOOST_FEATURE_NAMES]])
-        score = float(model.predict(X)[0])
-        return round(max(0, min(100, score)), 1)
 
+        return joblib.load(model_path)
     except FileNotFoundError:
         logger.debug("Modelo XGBoost não encontrado, usando heurística")
         return None
+    except Exception as e:
+        logger.warning(f"Erro ao carregar XGBoost: {e}, usando heurística")
+        return None
+
+
+def _score_xgboost_lote(model, features: dict[str, np.ndarray]) -> np.ndarray | None:
+    """Scores de todos os coletores numa única chamada a ``predict``; None se falhar."""
+    try:
+        # Build feature matrix using explicit schema (raises KeyError if feature missing)
+        X = np.column_stack([np.asarray(features[f], dtype=float) for f in _XGBOOST_FEATURE_NAMES])
+        score = np.asarray(model.predict(X), dtype=float)
+        return np.round(np.clip(score, 0, 100), 1)
     except Exception as e:
         logger.warning(f"Erro no XGBoost: {e}, usando heurística")
         return None
 
 
+def _score_xgboost(
+    features: dict[str, float],
+    model_path: str = MODELO_XGBOOST_PATH,
+) -> float | None:
+    """Calcula TRONIK Score via XGBoost (Fase 2).
+
+    Retorna None se modelo não existir ou falhar.
+    """
+    model = _carregar_modelo_xgboost(model_path)
+    if model is None:
+        return None
+    score = _score_xgboost_lote(model, {k: np.array([v]) for k, v in features.items()})
+    return None if score is None else float(score[0])
+
+
 def calcular_score_coletor(
     db: Session,
     coletor: Coletor,
     todos_coletores: list[Coletor],
+    *,
+    matriz: MatrizColetores | None = None,
+    proximos: dict[int, int] | None = None,
 ) -> dict[str, Any]:
     """Calcula TRONIK Score para um coletor."""
-    features = _extrair_features(db, coletor, todos_coletores)
+    features = _extrair_features(db, coletor, todos_coletores, matriz=matriz, proximos=proximos)
 
     # Tentar XGBoost se houver dados suficientes
     total_coletas = db.query(func.count(Coleta.id)).scalar() or 0
@@ -255,40 +337,69 @@ def calcular_score_coletor(
 def recalcular_scores_todos(db: Session) -> dict[str, Any]:
     """Recalcula TRONIK Score para todos os coletores.
 
-    Chamado pelo APScheduler 1x/dia.
+    Chamado pelo APScheduler 1x/dia. Em lote: coletores, predições, lucro médio
+    e total de coletas em consultas agrupadas; features e heurística como arrays;
+    modelo XGBoost carregado e aplicado uma vez; gravação em massa de ``TronikScore``.
 
     Returns:
         dict com estatísticas
     """
-    stats = {'processados': 0, 'sucesso': 0, 'falha': 0}
-
-    coletores = db.query(Coletor).all()
+    coletores = db.execute(
+        select(
+            Coletor.id, Coletor.nivel_preenchimento, Coletor.latitude,
+            Coletor.longitude, Coletor.ultima_coleta,
+        ).order_by(Coletor.id)
+    ).all()
+    stats = {'processados': len(coletores), 'sucesso': 0, 'falha': 0}
     logger.info(f"🔄 Recalculando TRONIK Score para {len(coletores)} coletores...")
+    if not coletores:
+        return stats
 
-    for coletor in coletores:
-        stats['processados'] += 1
-        try:
-            resultado = calcular_score_coletor(db, coletor, coletores)
-
-            # Upsert
-            ts = db.query(TronikScore).filter(
-                TronikScore.coletor_id == coletor.id
-            ).first()
-            if not ts:
-                ts = TronikScore(coletor_id=coletor.id)
-                db.add(ts)
+    matriz = obter_matriz_coletores(db)
+    proximos = _contar_proximos(matriz, _niveis_com_coordenadas(coletores))
+    features = _features_lote(db, coletores, matriz=matriz, proximos=proximos)
 
-            ts.score = resultado['score']
-            ts.features_json = json.dumps(resultado['features'], default=str)
-            ts.modelo_usado = resultado['modelo_usado']
-            ts.calculado_em = utc_now_naive()
-
-            stats['sucesso'] += 1
+    # Tentar XGBoost se houver dados suficientes
+    total_coletas = db.query(func.count(Coleta.id)).scalar() or 0
+    scores, modelo_usado = None, 'heuristica'
+    if total_coletas >= MIN_COLETAS_XGBOOST:
+        model = _carregar_modelo_xgboost()
+        if model is not None:
+            scores = _score_xgboost_lote(model, features)
+            modelo_usado = 'xgboost'
+    if scores is None:
+        scores, modelo_usado = _score_heuristica_lote(features), 'heuristica'
 
-        except Exception as e:
-            logger.error(f"Erro ao calcular score coletor {coletor.id}: {e}")
+    # Upsert em massa: UPDATE por chave primária dos existentes, INSERT dos novos
+    existentes = dict(
+        db.query(TronikScore.coletor_id, func.min(TronikScore.id))
+        .group_by(TronikScore.coletor_id)
+        .all()
+    )
+    agora = utc_now_naive()
+    atualizar, inserir = [], []
+    for i, coletor in enumerate(coletores):
+        score = float(scores[i])
+        if not np.isfinite(score):
+            logger.error(f"Erro ao calcular score coletor {coletor.id}: score inválido ({score})")
             stats['falha'] += 1
-
+            continue
+        linha = {
+            'score': score,
+            'features_json': json.dumps(_features_de(features, i), default=str),
+            'modelo_usado': modelo_usado,
+            'calculado_em': agora,
+        }
+        if coletor.id in existentes:
+            atualizar.append({'id': existentes[coletor.id], **linha})
+        else:
+            inserir.append({'coletor_id': coletor.id, **linha})
+        stats['sucesso'] += 1
+
+    if atualizar:
+        db.execute(update(TronikScore), atualizar)
+    if inserir:
+        db.execute(insert(TronikScore), inserir)
     db.commit()
     logger.info(
         f"✅ Scores concluídos: {stats['sucesso']} ok, {stats['falha']} falhas"
@@ -0,0 +1,531 @@
+"""Roteamento de coleta no servidor — grafo viário CSR + ordem multi-parada.
+
+Substitui o cálculo par-a-par feito no navegador (``estatico/js/routing``):
+
+1. Grafo viário do DF pré-processado a partir do PBF Geofabrik
+   (``python -m jobs.prospeccao geofabrik-graph``) e guardado em ``.npz`` como
+   arrays CSR compactos (``indptr``/``indices``/``pesos`` em km + lat/lon dos nós).
+   Carregado uma vez por processo e recarregado quando o ficheiro muda.
+2. Matriz de distâncias entre paradas: Dijkstra multi-origem
+   (``scipy.sparse.csgraph``) sobre o CSR, com as paradas ligadas ao nó mais
+   próximo (KD-tree em coordenadas projetadas). Sem grafo, haversine vetorizado.
+   ``otimizar_rota`` lê a submatriz das paradas da matriz sede + coletores em
+   cache (``distancias_coletores``); só uma origem própria é calculada na hora.
+3. Ordem das paradas: vizinho mais próximo + 2-opt + Or-opt, com deltas
+   vetorizados em NumPy (exatos também para matrizes assimétricas — mãos únicas).
+
+A geometria de cada trecho continua a ser desenhada no cliente.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from banco_dados.modelos import Coletor
+from banco_dados.utils.erros import ErroValidacao
+
+logger = logging.getLogger(__name__)
+
+RAIO_TERRA_KM = 6371.0
+
+GRAFO_VIARIO_PATH = Path(
+    os.getenv(
+        "TRONIK_GRAFO_VIARIO_PATH",
+        str(Path(__file__).resolve().parents[2] / "data" / "ml" / "roteamento" / "grafo_viario.npz"),
+    )
+)
+# Estimativa viária para pontos fora da malha: distância em linha reta × fator de desvio
+FATOR_DESVIO = float(os.getenv("TRONIK_ROTA_FATOR_DESVIO", "1.3"))
+VELOCIDADE_MEDIA_KMH = float(os.getenv("TRONIK_ROTA_VELOCIDADE_KMH", "30"))
+# Paradas a mais de X km do nó viário mais próximo caem no fallback haversine
+MAX_SNAP_KM = 2.0
+MAX_PARADAS = 500
+
+
+def haversine_matriz(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray | None = None,
+    lon2: np.ndarray | None = None,
+) -> np.ndarray:
+    """Distâncias haversine (km) entre todos os pares — shape (len(lat1), len(lat2))."""
+    lat1 = np.radians(np.asarray(lat1, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lon1, dtype=float))[:, None]
+    lat2 = lat1.T if lat2 is None else np.radians(np.asarray(lat2, dtype=float))[None, :]
+    lon2 = lon1.T if lon2 is None else np.radians(np.asarray(lon2, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _projetar(lat: np.ndarray, lon: np.ndarray, lat0: float) -> np.ndarray:
+    """Equiretangular em km — suficiente para vizinho mais próximo numa região do tamanho do DF."""
+    k = np.pi / 180 * RAIO_TERRA_KM
+    return np.column_stack([np.asarray(lon) * k * np.cos(np.radians(lat0)), np.asarray(lat) * k])
+
+
+# ==============================================================
+# GRAFO VIÁRIO (CSR)
+# ==============================================================
+
+@dataclass
+class GrafoViario:
+    """Grafo dirigido em CSR: arestas do nó ``i`` em ``indices[indptr[i]:indptr[i+1]]``."""
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    pesos: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    _arvore: Any = field(default=None, init=False, repr=False)
+    _csr: Any = field(default=None, init=False, repr=False)
+
+    @property
+    def n_nos(self) -> int:
+        return len(self.lat)
+
+    @property
+    def n_arestas(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def de_arestas(
+        cls,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        origem: np.ndarray,
+        destino: np.ndarray,
+        pesos: np.ndarray | None = None,
+    ) -> GrafoViario:
+        """Monta o CSR a partir de arestas dirigidas (pesos em km; haversine se omitidos).
+
+        Arestas repetidas ficam com o menor peso; mantém-se só a maior componente
+        (fracamente) conexa, para que nenhuma parada fique presa numa ilha do grafo.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        origem = np.asarray(origem, dtype=np.int64)
+        destino = np.asarray(destino, dtype=np.int64)
+        if pesos is None:
+            pesos = _haversine_pares(lat[origem], lon[origem], lat[destino], lon[destino])
+        pesos = np.asarray(pesos, dtype=np.float64)
+        validas = origem != destino
+        origem, destino, pesos = origem[validas], destino[validas], pesos[validas]
+
+        # Menor peso por par (origem, destino)
+        ordem = np.lexsort((pesos, destino, origem))
+        origem, destino, pesos = origem[ordem], destino[ordem], pesos[ordem]
+        primeira = np.ones(len(origem), dtype=bool)
+        primeira[1:] = (origem[1:] != origem[:-1]) | (destino[1:] != destino[:-1])
+        origem, destino, pesos = origem[primeira], destino[primeira], pesos[primeira]
+
+        n = len(lat)
+        matriz = csr_matrix((pesos, (origem, destino)), shape=(n, n))
+        _, rotulos = connected_components(matriz, directed=True, connection="weak")
+        maior = np.bincount(rotulos).argmax() if n else 0
+        manter = rotulos == maior
+        novo_id = np.cumsum(manter) - 1
+        arestas = manter[origem] & manter[destino]
+        origem, destino, pesos = novo_id[origem[arestas]], novo_id[destino[arestas]], pesos[arestas]
+        n = int(manter.sum())
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origem, minlength=n), out=indptr[1:])
+        return cls(
+            indptr=indptr,
+            indices=destino.astype(np.int32),
+            pesos=pesos.astype(np.float32),
+            lat=lat[manter],
+            lon=lon[manter],
+        )
+
+    def salvar(self, path: Path) -> Path:
+        path = Path(path)
+        gravar_npz_atomico(
+            path, indptr=self.indptr, indices=self.indices, pesos=self.pesos, lat=self.lat, lon=self.lon
+        )
+        return path
+
+    @classmethod
+    def carregar(cls, path: Path) -> GrafoViario:
+        with np.load(path) as dados:
+            return cls(
+                indptr=dados["indptr"],
+                indices=dados["indices"],
+                pesos=dados["pesos"],
+                lat=dados["lat"],
+                lon=dados["lon"],
+            )
+
+    def _matriz(self):
+        if self._csr is None:
+            from scipy.sparse import csr_matrix
+
+            self._csr = csr_matrix((self.pesos, self.indices, self.indptr), shape=(self.n_nos, self.n_nos))
+        return self._csr
+
+    def no_mais_proximo(self, lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Índice do nó mais próximo de cada ponto e a distância (km) até ele."""
+        from scipy.spatial import cKDTree
+
+        lat0 = float(np.mean(self.lat))
+        if self._arvore is None:
+            self._arvore = cKDTree(_projetar(self.lat, self.lon, lat0))
+        dist, idx = self._arvore.query(_projetar(lat, lon, lat0))
+        return np.asarray(idx, dtype=np.int64), np.asarray(dist, dtype=float)
+
+    def distancias(self, origens: np.ndarray, destinos: np.ndarray | None = None) -> np.ndarray:
+        """Menores caminhos em km, shape (len(origens), len(destinos)).
+
+        Dijkstra multi-origem a partir do lado menor: com poucas origens corre no
+        grafo direto; com poucos destinos, no transposto (caminhos "até" eles).
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        origens = np.asarray(origens, dtype=np.int64)
+        destinos = origens if destinos is None else np.asarray(destinos, dtype=np.int64)
+        if len(origens) == 0 or len(destinos) == 0:
+            return np.zeros((len(origens), len(destinos)))
+        if len(np.unique(origens)) <= len(np.unique(destinos)):
+            unicos, inverso = np.unique(origens, return_inverse=True)
+            d = dijkstra(self._matriz(), directed=True, indices=unicos)
+            return d[inverso][:, destinos]
+        unicos, inverso = np.unique(destinos, return_inverse=True)
+        d = dijkstra(self._matriz().T.tocsr(), directed=True, indices=unicos)
+        return d[inverso][:, origens].T
+
+
+def gravar_npz_atomico(path: Path, **arrays: Any) -> None:
+    """Grava ``.npz`` num temporário deste processo/thread e troca com ``replace``.
+
+    Nome fixo no temporário deixaria dois workers gravando ao mesmo tempo
+    intercalarem o arquivo e publicarem um ``.npz`` corrompido.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}-{threading.get_ident()}.tmp.npz")
+    try:
+        np.savez_compressed(tmp, **arrays)
+        tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _haversine_pares(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+_GRAFO: GrafoViario | None = None
+_GRAFO_MTIME: int | None = None
+_GRAFO_LOCK = threading.Lock()
+
+
+def obter_grafo(path: Path | None = None) -> GrafoViario | None:
+    """Grafo viário em memória (recarregado se o ``.npz`` mudar); None se não existir."""
+    global _GRAFO, _GRAFO_MTIME
+
+    path = Path(path) if path else GRAFO_VIARIO_PATH
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    with _GRAFO_LOCK:
+        if _GRAFO is None or mtime != _GRAFO_MTIME:
+            inicio = time.perf_counter()
+            _GRAFO = GrafoViario.carregar(path)
+            _GRAFO_MTIME = mtime
+            logger.info(
+                "Grafo viário carregado: %d nós, %d arestas (%.2fs)",
+                _GRAFO.n_nos, _GRAFO.n_arestas, time.perf_counter() - inicio,
+            )
+        return _GRAFO
+
+
+def matriz_distancias(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    grafo: GrafoViario | None = None,
+    *,
+    lat_dest: np.ndarray | None = None,
+    lon_dest: np.ndarray | None = None,
+) -> tuple[np.ndarray, str]:
+    """Distâncias (km) dos pontos para os destinos (default: os mesmos) e a métrica usada.
+
+    Sem grafo: haversine (``metrica="haversine"``). Com grafo (``"viaria"``): caminho
+    mínimo entre os nós mais próximos + acesso até eles; pares com um ponto longe
+    da malha (> ``MAX_SNAP_KM``) ou sem caminho usam haversine × ``FATOR_DESVIO``.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    lat_d = lat if lat_dest is None else np.asarray(lat_dest, dtype=float)
+    lon_d = lon if lon_dest is None else np.asarray(lon_dest, dtype=float)
+    reta = haversine_matriz(lat, lon, lat_d, lon_d)
+    if grafo is None or grafo.n_nos == 0:
+        return reta, "haversine"
+
+    nos_o, acesso_o = grafo.no_mais_proximo(lat, lon)
+    nos_d, acesso_d = (nos_o, acesso_o) if lat_dest is None else grafo.no_mais_proximo(lat_d, lon_d)
+    viaria = grafo.distancias(nos_o, nos_d) + acesso_o[:, None] + acesso_d[None, :]
+    usar_estimada = (
+        ~np.isfinite(viaria) | (acesso_o > MAX_SNAP_KM)[:, None] | (acesso_d > MAX_SNAP_KM)[None, :]
+    )
+    d = np.where(usar_estimada, reta * FATOR_DESVIO, viaria)
+    d[reta == 0] = 0.0
+    return d, "viaria"
+
+
+# ==============================================================
+# ORDEM DAS PARADAS (TSP heurístico)
+# ==============================================================
+
+def _custo(rota: np.ndarray, d: np.ndarray) -> float:
+    return float(d[rota, np.roll(rota, -1)].sum())
+
+
+def _vizinho_mais_proximo(d: np.ndarray, inicio: int = 0) -> np.ndarray:
+    n = len(d)
+    visitado = np.zeros(n, dtype=bool)
+    rota = np.empty(n, dtype=np.int64)
+    atual = inicio
+    for k in range(n):
+        rota[k] = atual
+        visitado[atual] = True
+        if k == n - 1:
+            break
+        linha = np.where(visitado, np.inf, d[atual])
+        atual = int(np.argmin(linha))
+    return rota
+
+
+def _dois_opt(rota: np.ndarray, d: np.ndarray) -> tuple[np.ndarray, bool]:
+    """Uma passagem de 2-opt (melhor ``j`` para cada ``i``); posição 0 fica fixa.
+
+    Inverter ``rota[i+1..j]`` troca o sentido do trecho, por isso o delta soma a
+    diferença entre percorrê-lo ao contrário e no sentido atual (prefixos).
+    """
+    n = len(rota)
+    melhorou = False
+    if n < 4:
+        return rota, melhorou
+    i = 0
+    while i < n - 2:
+        fechada = np.append(rota, rota[0])
+        frente = np.concatenate([[0.0], np.cumsum(d[fechada[:-1], fechada[1:]])])
+        tras = np.concatenate([[0.0], np.cumsum(d[fechada[1:], fechada[:-1]])])
+        j = np.arange(i + 2, n)
+        a, b = fechada[i], fechada[i + 1]
+        c, e = fechada[j], fechada[j + 1]
+        trecho = (tras[j] - tras[i + 1]) - (frente[j] - frente[i + 1])
+        delta = d[a, c] + d[b, e] - d[a, b] - d[c, e] + trecho
+        k = int(np.argmin(delta))
+        if delta[k] < -1e-9:
+            jj = int(j[k])
+            rota = np.concatenate([rota[: i + 1], rota[i + 1 : jj + 1][::-1], rota[jj + 1 :]])
+            melhorou = True
+        else:
+            i += 1
+    return rota, melhorou
+
+
+def _or_opt(rota: np.ndarray, d: np.ndarray, max_segmento: int = 3) -> tuple[np.ndarray, bool]:
+    """Move trechos de 1..``max_segmento`` paradas para a melhor posição (sem inverter)."""
+    n = len(rota)
+    melhorou = False
+    for tamanho in range(1, max_segmento + 1):
+        i = 1
+        while i + tamanho <= n and n - tamanho >= 2:
+            seg = rota[i : i + tamanho]
+            anterior, seguinte = rota[i - 1], rota[(i + tamanho) % n]
+            ganho = d[anterior, seg[0]] + d[seg[-1], seguinte] - d[anterior, seguinte]
+            resto = np.concatenate([rota[:i], rota[i + tamanho :]])
+            a, b = resto, np.roll(resto, -1)
+            custo = d[a, seg[0]] + d[seg[-1], b] - d[a, b]
+            custo[i - 1] = np.inf  # reinserir no mesmo lugar
+            k = int(np.argmin(custo))
+            if custo[k] - ganho < -1e-9:
+                rota = np.concatenate([resto[: k + 1], seg, resto[k + 1 :]])
+                melhorou = True
+            else:
+                i += 1
+    return rota, melhorou
+
+
+def ordenar_paradas(
+    d: np.ndarray,
+    *,
+    retornar: bool = True,
+    max_passagens: int = 50,
+) -> tuple[np.ndarray, dict[str, float]]:
+    """Ordem de visita começando no índice 0 (origem) para a matriz ``d``.
+
+    Com ``retornar=False`` a rota termina na última parada: um nó fictício a
+    custo zero de todas as paradas para a origem fecha o ciclo e é removido no fim.
+    """
+    d = np.asarray(d, dtype=float)
+    n = len(d)
+    if n <= 2:
+        rota = np.arange(n)
+        custo = _custo(rota, d) if retornar else float(d[0, 1]) if n == 2 else 0.0
+        return rota, {"inicial_km": custo, "final_km": custo, "passagens": 0}
+
+    trabalho = d
+    if not retornar:
+        grande = float(d[np.isfinite(d)].max() or 1.0) * n * 10
+        trabalho = np.full((n + 1, n + 1), grande)
+        trabalho[:n, :n] = d
+        trabalho[1:n, n] = 0.0  # qualquer parada -> fim fictício
+        trabalho[n, 0] = 0.0  # fim fictício -> origem
+        trabalho[n, n] = 0.0
+
+    rota = _vizinho_mais_proximo(d)
+    if not retornar:
+        rota = np.append(rota, n)
+    inicial = _custo(rota, trabalho)
+    passagens = 0
+    while passagens < max_passagens:
+        passagens += 1
+        rota, m1 = _dois_opt(rota, trabalho)
+        rota, m2 = _or_opt(rota, trabalho)
+        if not (m1 or m2):
+            break
+    final = _custo(rota, trabalho)
+    if not retornar:
+        # A origem fica na posição 0; o fictício, caro fora do fim, fecha o ciclo
+        rota = rota[rota != n]
+    return rota, {"inicial_km": inicial, "final_km": final, "passagens": passagens}
+
+
+# ==============================================================
+# API DE SERVIÇO
+# ==============================================================
+
+def _matriz_paradas(
+    db: Session,
+    paradas: list[Coletor],
+    origem: tuple[float, float] | None,
+    grafo: GrafoViario | None,
+) -> tuple[np.ndarray, str]:
+    """Matriz (origem + paradas) lida da matriz de coletores em cache.
+
+    Com origem própria só a linha/coluna da origem é calculada. Se alguma parada
+    não estiver na cache (coordenada mudou entre as queries) calcula tudo direto.
+    """
+    from banco_dados.services.distancias_coletores import obter_matriz_coletores
+
+    lat = np.array([float(c.latitude) for c in paradas])
+    lon = np.array([float(c.longitude) for c in paradas])
+    cache = obter_matriz_coletores(db, grafo=grafo)
+    try:
+        pos = cache.posicoes([c.id for c in paradas])
+    except KeyError:
+        cache = None
+    if cache is None or not (np.array_equal(cache.lat[pos], lat) and np.array_equal(cache.lon[pos], lon)):
+        o_lat, o_lon = origem or _sede()
+        return matriz_distancias(np.append(o_lat, lat), np.append(o_lon, lon), grafo)
+    if origem is None:
+        todos = np.concatenate([[0], pos])
+        return cache.km[np.ix_(todos, todos)], cache.metrica
+
+    d = np.zeros((len(paradas) + 1, len(paradas) + 1))
+    d[1:, 1:] = cache.km[np.ix_(pos, pos)]
+    ida, metrica = matriz_distancias([origem[0]], [origem[1]], grafo, lat_dest=lat, lon_dest=lon)
+    volta, _ = matriz_distancias(lat, lon, grafo, lat_dest=[origem[0]], lon_dest=[origem[1]])
+    d[0, 1:] = ida[0]
+    d[1:, 0] = volta[:, 0]
+    return d, metrica
+
+
+def _sede() -> tuple[float, float]:
+    from banco_dados.services.ml_score import SEDE_LAT, SEDE_LNG
+
+    return SEDE_LAT, SEDE_LNG
+
+
+def otimizar_rota(
+    db: Session,
+    *,
+    coletor_ids: list[int] | None = None,
+    origem: tuple[float, float] | None = None,
+    retornar: bool = True,
+    nivel_minimo: float | None = None,
+    parceiro_id: int | None = None,
+    grafo: GrafoViario | None = None,
+) -> dict[str, Any]:
+    """Ordem ótima (heurística) de visita aos coletores a partir da origem (sede por omissão).
+
+    Coletores sem coordenadas são listados em ``ignorados``.
+    """
+    inicio = time.perf_counter()
+    q = db.query(Coletor)
+    if coletor_ids:
+        q = q.filter(Coletor.id.in_(coletor_ids))
+    if parceiro_id is not None:
+        q = q.filter(Coletor.parceiro_id == parceiro_id)
+    if nivel_minimo is not None:
+        q = q.filter(Coletor.nivel_preenchimento >= nivel_minimo)
+    coletores = q.order_by(Coletor.id).all()
+
+    paradas = [c for c in coletores if c.latitude is not None and c.longitude is not None]
+    ignorados = [c.id for c in coletores if c.latitude is None or c.longitude is None]
+    if coletor_ids:
+        encontrados = {c.id for c in coletores}
+        ignorados.extend(cid for cid in dict.fromkeys(coletor_ids) if cid not in encontrados)
+    if len(paradas) > MAX_PARADAS:
+        raise ErroValidacao(f"Máximo de {MAX_PARADAS} paradas por rota (recebidas {len(paradas)})")
+
+    origem_lat, origem_lon = origem if origem else _sede()
+    if grafo is None:
+        grafo = obter_grafo()
+    t_matriz = time.perf_counter()
+    d, metrica = _matriz_paradas(db, paradas, origem, grafo)
+    t_matriz = time.perf_counter() - t_matriz
+
+    rota, stats = ordenar_paradas(d, retornar=retornar)
+    pernas = d[rota[:-1], rota[1:]]
+    if retornar and len(rota) > 1:
+        pernas = np.append(pernas, d[rota[-1], rota[0]])
+    acumulado = np.cumsum(pernas)
+
+    saida = []
+    for pos, idx in enumerate(rota[1:], start=1):
+        c = paradas[idx - 1]
+        saida.append({
+            "ordem": pos,
+            "coletor_id": c.id,
+            "localizacao": c.localizacao,
+            "latitude": float(c.latitude),
+            "longitude": float(c.longitude),
+            "nivel_preenchimento": float(c.nivel_preenchimento or 0),
+            "distancia_trecho_km": round(float(pernas[pos - 1]), 3),
+            "distancia_acumulada_km": round(float(acumulado[pos - 1]), 3),
+        })
+
+    total = float(pernas.sum()) if len(pernas) else 0.0
+    return {
+        "origem": {"latitude": origem_lat, "longitude": origem_lon},
+        "retorna_origem": retornar,
+        "paradas": saida,
+        "ordem_coletor_ids": [p["coletor_id"] for p in saida],
+        "ignorados": ignorados,
+        "distancia_total_km": round(total, 3),
+        "distancia_vizinho_mais_proximo_km": round(float(stats["inicial_km"]), 3),
+        "tempo_estimado_min": round(total / VELOCIDADE_MEDIA_KMH * 60, 1) if VELOCIDADE_MEDIA_KMH > 0 else None,
+        "metrica": metrica,
+        "passagens_melhoria": int(stats["passagens"]),
+        "tempo_calculo_ms": {
+            "matriz": round(t_matriz * 1000, 1),
+            "total": round((time.perf_counter() - inicio) * 1000, 1),
+        },
+    }
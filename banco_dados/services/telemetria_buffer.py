@@ -0,0 +1,175 @@
+"""Buffer write-behind das leituras de telemetria (``leituras_sensor``).
+
+``POST /api/sensor/telemetria/lote`` não grava cada leitura na transação do
+pedido: enfileira dicionários prontos para ``INSERT`` e devolve. O buffer é
+descarregado num único ``executemany`` (mais o ``leituras_rollup.acumular`` dos
+agregados hora/dia, na mesma transação) quando:
+
+- atinge ``TELEMETRIA_BUFFER_MAX_LEITURAS`` leituras (no próprio pedido que encheu);
+- a leitura mais antiga pendente fica ``TELEMETRIA_BUFFER_MAX_IDADE_S`` segundos
+  à espera (timer daemon, agendado quando o buffer deixa de estar vazio);
+- o processo termina (``atexit``) ou alguém chama ``descarregar()``.
+
+O estado atual (``Coletor.nivel_preenchimento``, ``Sensor.bateria``...) continua
+a ser gravado de forma síncrona pelo endpoint; só o histórico é diferido. Se o
+``INSERT`` do lote falhar, as leituras são regravadas uma a uma: a que o banco
+recusa (FK, tipo, NOT NULL...) é descartada com log, para não travar a fila; num
+erro de conexão (``OperationalError``) as restantes voltam para a fila (até
+``MAX_PENDENTES``; acima disso as mais antigas são descartadas com aviso) — o
+histórico é por processo e pode perder no máximo uma janela de buffer num crash.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from banco_dados.modelos import LeituraSensor
+from banco_dados.services.leituras_rollup import acumular
+
+logger = logging.getLogger(__name__)
+
+MAX_LEITURAS = int(os.getenv("TELEMETRIA_BUFFER_MAX_LEITURAS", "2000"))
+MAX_IDADE_S = float(os.getenv("TELEMETRIA_BUFFER_MAX_IDADE_S", "5"))
+# Teto de leituras retidas quando o banco está indisponível
+MAX_PENDENTES = 20 * MAX_LEITURAS
+# Falhas transitórias (banco fora do ar): reenfileirar em vez de descartar a leitura
+_ERROS_TRANSITORIOS = (OperationalError, InterfaceError)
+
+
+class BufferLeituras:
+    """Fila thread-safe de linhas de ``leituras_sensor`` com descarga por tamanho/idade."""
+
+    def __init__(self, max_leituras: int = MAX_LEITURAS, max_idade_s: float = MAX_IDADE_S):
+        self.max_leituras = max_leituras
+        self.max_idade_s = max_idade_s
+        self._linhas: list[dict[str, Any]] = []
+        self._sessao_factory: Callable[[], Session] | None = None
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+        self._descarga = threading.Lock()  # um INSERT de cada vez, por ordem de chegada
+        self.gravadas = 0
+        self.descartadas = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._linhas)
+
+    def adicionar(self, linhas: Iterable[dict[str, Any]], sessao_factory: Callable[[], Session]) -> int:
+        """Enfileira ``linhas`` (colunas de ``LeituraSensor``); devolve quantas ficaram pendentes."""
+        with self._lock:
+            self._sessao_factory = sessao_factory
+            self._linhas.extend(linhas)
+            if self._linhas:
+                self._agendar()
+            cheio = len(self._linhas) >= self.max_leituras
+        if cheio:
+            self.descarregar()
+        return len(self)
+
+    def _agendar(self) -> None:
+        """Timer da idade máxima a partir da primeira leitura pendente (chamado com ``_lock``)."""
+        if self.max_idade_s <= 0 or (self._timer is not None and self._timer.is_alive()):
+            return
+        self._timer = threading.Timer(self.max_idade_s, self._expirou)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expirou(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            self.descarregar()
+        except Exception as e:  # o timer não pode morrer calado com leituras na fila
+            logger.error(f"Erro ao descarregar buffer de telemetria: {e}")
+
+    def descarregar(self) -> int:
+        """Grava tudo o que está pendente; devolve o número de leituras inseridas."""
+        with self._descarga:
+            with self._lock:
+                linhas, self._linhas = self._linhas, []
+                factory = self._sessao_factory
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not linhas:
+                return 0
+            if factory is None:
+                raise RuntimeError("Buffer de telemetria sem fábrica de sessões")
+
+            db = factory()
+            try:
+                gravadas = self._gravar(db, linhas)
+            finally:
+                db.close()
+
+        with self._lock:
+            self.gravadas += gravadas
+        logger.debug(f"Buffer de telemetria: {gravadas} leituras gravadas")
+        return gravadas
+
+    def _gravar(self, db: Session, linhas: list[dict[str, Any]]) -> int:
+        """Um ``executemany``; se falhar, leitura a leitura (descarta as recusadas)."""
+        try:
+            self._gravar_lote(db, linhas)
+            return len(linhas)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Falha ao gravar lote de {len(linhas)} leituras, gravando uma a uma: {e}")
+
+        gravadas = 0
+        for i, linha in enumerate(linhas):
+            try:
+                self._gravar_lote(db, [linha])
+                gravadas += 1
+            except _ERROS_TRANSITORIOS as e:
+                db.rollback()
+                self._devolver(linhas[i:])
+                logger.error(f"Falha ao gravar {len(linhas) - i} leituras de telemetria (reenfileiradas): {e}")
+                break
+            except Exception as e:
+                db.rollback()
+                with self._lock:
+                    self.descartadas += 1
+                logger.error(f"Leitura de telemetria recusada pelo banco, descartada: {linha!r} ({e})")
+        return gravadas
+
+    @staticmethod
+    def _gravar_lote(db: Session, linhas: list[dict[str, Any]]) -> None:
+        db.execute(insert(LeituraSensor), linhas)
+        acumular(db, linhas)
+        db.commit()
+
+    def _devolver(self, linhas: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self._linhas[:0] = linhas
+            excesso = len(self._linhas) - MAX_PENDENTES
+            if excesso > 0:
+                del self._linhas[:excesso]
+                self.descartadas += excesso
+                logger.warning(f"Buffer de telemetria cheio: {excesso} leituras antigas descartadas")
+            if self._linhas:
+                self._agendar()
+
+
+_BUFFER = BufferLeituras()
+
+
+def obter_buffer() -> BufferLeituras:
+    return _BUFFER
+
+
+@atexit.register
+def _descarregar_ao_sair() -> None:
+    try:
+        _BUFFER.descarregar()
+    except Exception as e:
+        logger.error(f"Leituras de telemetria perdidas ao encerrar: {e}")
@@ -7,16 +7,31 @@ Ordem de verificação:
 2. ``Sensor.api_token`` no banco: comparação em tempo constante com ``api_key``.
 3. Modo relaxado só em desenvolvimento: ``TELEMETRIA_ALLOW_NO_TOKEN=true`` e
    sensor sem token configurado (não aplicável em produção).
+
+Cache de credenciais: ``CredencialSensor`` guarda, por ``sensor_id``, o hash do
+token, o coletor dono e o parceiro. Com ela a telemetria rejeita token/coletor
+errado sem ir ao banco; o estado do coletor não é guardado (cada worker tem o
+seu cache). O cache é limitado (LRU) e expira por TTL; os endpoints CRUD de
+sensores e coletores invalidam as entradas afetadas, e o TTL limita o atraso de
+alterações feitas noutro worker.
 """
 
 from __future__ import annotations
 
+import hashlib
 import os
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 
 from banco_dados.modelos import Sensor
 from banco_dados.utils.erros import ErroNaoAutorizado
 
+CREDENCIAIS_MAX = int(os.getenv("TELEMETRIA_CREDENCIAIS_MAX", "10000"))
+CREDENCIAIS_TTL_S = float(os.getenv("TELEMETRIA_CREDENCIAIS_TTL_S", "300"))
+
 
 def _ambiente_producao() -> bool:
     return os.getenv("FLASK_ENV", "development").strip().lower() == "production"
@@ -42,6 +57,15 @@ def validar_telemetria(sensor: Sensor, api_key_payload: str | None) -> None:
     Raises:
         ErroNaoAutorizado: se a autenticação falhar.
     """
+    _validar(hash_token(sensor.api_token), api_key_payload)
+
+
+def validar_credencial(credencial: CredencialSensor, api_key_payload: str | None) -> None:
+    """Mesmo que ``validar_telemetria``, a partir da credencial em cache."""
+    _validar(credencial.token_hash, api_key_payload)
+
+
+def _validar(token_hash: str | None, api_key_payload: str | None) -> None:
     shared = _shared_secret()
     if shared is not None:
         if not api_key_payload:
@@ -52,12 +76,12 @@ def validar_telemetria(sensor: Sensor, api_key_payload: str | None) -> None:
             raise ErroNaoAutorizado("api_key invalida.")
         return
 
-    if sensor.api_token:
+    if token_hash:
         if not api_key_payload:
             raise ErroNaoAutorizado(
                 "api_key obrigatoria para este sensor. Configure no firmware."
             )
-        if not _compare_token(api_key_payload, sensor.api_token):
+        if not _compare_token(hash_token(api_key_payload), token_hash):
             raise ErroNaoAutorizado("api_key invalida para este sensor.")
         return
 
@@ -77,6 +101,13 @@ def validar_telemetria(sensor: Sensor, api_key_payload: str | None) -> None:
     )
 
 
+def hash_token(token: str | None) -> str | None:
+    """SHA-256 do token (o cache nunca guarda o token em claro)."""
+    if not token:
+        return None
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
 def _compare_token(provided: str, stored: str) -> bool:
     """Comparação resistente a timing (exige mesmo comprimento)."""
     if not provided or not stored:
@@ -89,3 +120,81 @@ def _compare_token(provided: str, stored: str) -> bool:
     if len(a) != len(b):
         return False
     return secrets.compare_digest(a, b)
+
+
+# ---------------------------------------------------------------------------
+# Cache de credenciais por sensor_id
+# ---------------------------------------------------------------------------
+@dataclass(frozen=True)
+class CredencialSensor:
+    """O que a telemetria precisa saber de um sensor sem consultar o banco."""
+
+    sensor_id: int
+    coletor_id: int
+    parceiro_id: int | None
+    token_hash: str | None
+
+    @classmethod
+    def de_sensor(cls, sensor: Sensor, parceiro_id: int | None) -> CredencialSensor:
+        return cls(
+            sensor_id=sensor.id,
+            coletor_id=sensor.coletor_id,
+            parceiro_id=parceiro_id,
+            token_hash=hash_token(sensor.api_token),
+        )
+
+
+class CacheCredenciais:
+    """LRU limitado a ``max_itens`` com expiração por ``ttl_s`` (thread-safe)."""
+
+    def __init__(self, max_itens: int = CREDENCIAIS_MAX, ttl_s: float = CREDENCIAIS_TTL_S):
+        self.max_itens = max_itens
+        self.ttl_s = ttl_s
+        self._itens: OrderedDict[int, tuple[float, CredencialSensor]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._itens)
+
+    def obter(self, sensor_id: int) -> CredencialSensor | None:
+        with self._lock:
+            entrada = self._itens.get(sensor_id)
+            if entrada is None:
+                return None
+            if time.monotonic() - entrada[0] > self.ttl_s:
+                del self._itens[sensor_id]
+                return None
+            self._itens.move_to_end(sensor_id)
+            return entrada[1]
+
+    def definir(self, credencial: CredencialSensor) -> None:
+        """Guarda (ou substitui) a credencial; chamar só com dados recém-lidos do banco."""
+        with self._lock:
+            self._itens.pop(credencial.sensor_id, None)
+            self._itens[credencial.sensor_id] = (time.monotonic(), credencial)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, sensor_id: int | None = None) -> None:
+        """Remove a credencial de ``sensor_id`` (ou todas, sem argumento)."""
+        with self._lock:
+            if sensor_id is None:
+                self._itens.clear()
+            else:
+                self._itens.pop(sensor_id, None)
+
+    def invalidar_coletor(self, coletor_id: int) -> int:
+        """Remove as credenciais dos sensores de ``coletor_id`` (coletor alterado ou apagado)."""
+        with self._lock:
+            sensores = [sid for sid, (_, cred) in self._itens.items() if cred.coletor_id == coletor_id]
+            for sid in sensores:
+                del self._itens[sid]
+        return len(sensores)
+
+
+_CREDENCIAIS = CacheCredenciais()
+
+
+def obter_cache_credenciais() -> CacheCredenciais:
+    return _CREDENCIAIS
@@ -0,0 +1,47 @@
+"""
+Blobs de Features - Dashboard-TRONIK
+====================================
+Formato binário das features dos snapshots de prospecção (``features_blob``):
+float32 little-endian, um valor por feature, na ordem do schema gravado junto.
+
+Fica em ``banco_dados`` para a camada de dados decodificar snapshots sem depender
+do pacote de jobs; ``jobs.prospeccao.ranker_contract`` reexporta daqui.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Sequence
+
+import numpy as np
+
+FEATURE_BLOB_DTYPE = np.dtype("<f4")
+
+
+def codificar_features(valores: Sequence[float] | np.ndarray) -> bytes:
+    """Serializa um vetor de features (já na ordem do schema) em bytes."""
+    return np.asarray(valores, dtype=FEATURE_BLOB_DTYPE).tobytes()
+
+
+def decodificar_features(blobs: Iterable[bytes], largura: int) -> np.ndarray:
+    """Concatena blobs numa matriz ``(n, largura)`` float32."""
+    buf = bytearray().join(blobs)  # gravável: frombuffer não precisa de cópia extra
+    if len(buf) % (largura * FEATURE_BLOB_DTYPE.itemsize):
+        raise ValueError(f"Feature blob size {len(buf)} is not a multiple of {largura} float32 values")
+    return np.frombuffer(buf, dtype=FEATURE_BLOB_DTYPE).reshape(-1, largura).astype(np.float32, copy=False)
+
+
+def nomes_do_schema(feature_schema_json: str | None) -> list[str]:
+    """Nomes das features, na ordem do blob, a partir do ``feature_schema_json`` do snapshot."""
+    if not feature_schema_json:
+        return []
+    return [item["name"] for item in json.loads(feature_schema_json)]
+
+
+def features_do_blob(blob: bytes, feature_schema_json: str | None) -> dict[str, float] | None:
+    """Dict nome -> valor (chaves ordenadas) ou None se o blob não bate com o schema."""
+    nomes = nomes_do_schema(feature_schema_json)
+    if not nomes or len(blob) != len(nomes) * FEATURE_BLOB_DTYPE.itemsize:
+        return None
+    valores = decodificar_features([blob], len(nomes))[0].tolist()
+    return dict(sorted(zip(nomes, valores, strict=True)))
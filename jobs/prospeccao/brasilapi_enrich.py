@@ -1,31 +1,144 @@
 """Enrich empresa_candidata via Brasil API (free, no auth required).
 
 Fills phone, email and secondary CNAE gaps for companies that Receita Federal
-or Casa dos Dados did not provide contact data for. Rate-limited to ~2.5 req/s
-by default to stay well within the free tier.
+or Casa dos Dados did not provide contact data for.
+
+Requests run on a small thread pool sharing one token bucket (default 2.5 req/s,
+burst 3). A 429 halves the bucket rate and pauses every worker for Retry-After;
+successes raise it back towards the configured rate. Responses (including 404s)
+are cached on disk per CNPJ with a TTL, so re-runs skip companies already seen.
 
 Docs: https://brasilapi.com.br/docs#tag/CNPJ
 """
 
 from __future__ import annotations
 
+import contextlib
 import json
 import logging
+import os
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from typing import Any
 
+import requests
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
 from banco_dados.modelos import EmpresaCandidata
 from jobs.prospeccao import config
-from jobs.prospeccao.http_util import session as http_session
+from jobs.prospeccao.http_util import build_session
 
 logger = logging.getLogger(__name__)
 
-_BRASILAPI_CNPJ_URL = "https://brasilapi.com.br/api/cnpj/v1/{cnpj}"
-_DEFAULT_SLEEP_S = 0.4   # ~2.5 req/s — safe for free tier
 _MAX_RATE_LIMIT_RETRIES = 3
+_REQUEST_TIMEOUT = (10, 30)
+# AIMD: 429 divide a taxa por 2 (piso = taxa/_MIN_RATE_DIVISOR); cada sucesso soma 5% da taxa alvo.
+_MIN_RATE_DIVISOR = 8
+_RATE_RECOVERY_STEP = 0.05
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting and response cache
+# ---------------------------------------------------------------------------
+
+class _TokenBucket:
+    """Thread-safe token bucket with multiplicative decrease on 429.
+
+    ``rate_per_s <= 0`` disables limiting (local stubs / tests).
+    """
+
+    def __init__(self, rate_per_s: float, burst: int = 1) -> None:
+        self.target_rate = float(rate_per_s)
+        self.rate = float(rate_per_s)
+        self.min_rate = self.target_rate / _MIN_RATE_DIVISOR
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled_count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.target_rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    elapsed = max(0.0, now - self.updated)
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        return
+                    wait = (1.0 - self.tokens) / self.rate
+                else:
+                    wait = self.blocked_until - now
+            time.sleep(wait)
+
+    def throttled(self, wait_s: float) -> None:
+        """429: halve the rate, drain tokens and block all workers for ``wait_s``."""
+        with self._lock:
+            self.throttled_count += 1
+            if self.target_rate <= 0:
+                return
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + wait_s)
+            self.updated = self.blocked_until
+
+    def succeeded(self) -> None:
+        if self.target_rate <= 0:
+            return
+        with self._lock:
+            self.rate = min(self.target_rate, self.rate + self.target_rate * _RATE_RECOVERY_STEP)
+
+
+class _ResponseCache:
+    """One JSON file per CNPJ: ``{"fetched_at", "status", "data"}``; 404s are cached too."""
+
+    def __init__(self, root: Path, ttl_days: float) -> None:
+        self.root = Path(root)
+        self.ttl_s = ttl_days * 86400 if ttl_days > 0 else None
+
+    def _path(self, cnpj: str) -> Path:
+        return self.root / cnpj[:3] / f"{cnpj}.json"
+
+    def get(self, cnpj: str) -> tuple[bool, dict[str, Any] | None]:
+        """Return ``(hit, data)``; ``data`` is None for a cached 404."""
+        path = self._path(cnpj)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False, None
+        fetched_at = entry.get("fetched_at")
+        if not isinstance(fetched_at, (int, float)):
+            return False, None
+        if self.ttl_s is not None and time.time() - fetched_at > self.ttl_s:
+            return False, None
+        return True, entry.get("data")
+
+    def put(self, cnpj: str, status: int, data: dict[str, Any] | None) -> None:
+        path = self._path(cnpj)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps(
+            {"cnpj": cnpj, "fetched_at": time.time(), "status": status, "data": data},
+            ensure_ascii=False,
+        )
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(payload)
+            os.replace(tmp, path)
+        except OSError:
+            logger.debug("Brasil API cache: falha ao gravar %s", path, exc_info=True)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
 
 
 # ---------------------------------------------------------------------------
@@ -36,30 +149,59 @@ def _clean_cnpj(raw: str) -> str:
     return "".join(c for c in raw if c.isdigit())
 
 
-def _fetch_cnpj(cnpj: str) -> dict[str, Any] | None:
-    """Query Brasil API for one CNPJ. Returns dict or None on miss/error."""
-    url = _BRASILAPI_CNPJ_URL.format(cnpj=cnpj)
+def _retry_after_s(resp: requests.Response, attempt: int) -> float:
+    raw = (resp.headers.get("Retry-After") or "").strip()
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return float(2 ** attempt * 3)
+
+
+def _fetch_cnpj(
+    http: requests.Session,
+    cnpj: str,
+    limiter: _TokenBucket,
+    cache: _ResponseCache | None = None,
+) -> tuple[str, dict[str, Any] | None]:
+    """Query Brasil API for one CNPJ.
+
+    Returns ``(outcome, data)`` with outcome ``ok``, ``not_found`` or ``error``;
+    ``ok`` and ``not_found`` are written to the cache.
+    """
+    url = f"{config.BRASILAPI_BASE.rstrip('/')}/{cnpj}"
     for attempt in range(_MAX_RATE_LIMIT_RETRIES):
+        limiter.acquire()
         try:
-            resp = http_session().get(url, timeout=(10, 30))
-            if resp.status_code == 200:
-                return resp.json()
-            if resp.status_code == 429:
-                wait = 2 ** attempt * 3
-                logger.warning(
-                    "Brasil API rate-limited — aguardando %ds (tentativa %d/%d)",
-                    wait, attempt + 1, _MAX_RATE_LIMIT_RETRIES,
-                )
-                time.sleep(wait)
-                continue
-            if resp.status_code == 404:
-                return None  # CNPJ not in Brasil API — normal for very old CNPJs
-            logger.debug("Brasil API HTTP %s para CNPJ %s", resp.status_code, cnpj)
-            return None
-        except Exception as exc:
+            resp = http.get(url, timeout=_REQUEST_TIMEOUT)
+        except requests.RequestException as exc:
             logger.debug("Brasil API request failed para %s: %s", cnpj, exc)
-            return None
-    return None
+            return "error", None
+        if resp.status_code == 429:
+            wait = _retry_after_s(resp, attempt)
+            logger.warning(
+                "Brasil API rate-limited — aguardando %.1fs, taxa %.2f req/s (tentativa %d/%d)",
+                wait, limiter.rate / 2, attempt + 1, _MAX_RATE_LIMIT_RETRIES,
+            )
+            limiter.throttled(wait)
+            continue
+        limiter.succeeded()
+        if resp.status_code == 200:
+            try:
+                data = resp.json()
+            except ValueError:
+                logger.debug("Brasil API JSON inválido para CNPJ %s", cnpj)
+                return "error", None
+            if cache is not None:
+                cache.put(cnpj, 200, data)
+            return "ok", data
+        if resp.status_code == 404:
+            # CNPJ not in Brasil API — normal for very old CNPJs
+            if cache is not None:
+                cache.put(cnpj, 404, None)
+            return "not_found", None
+        logger.debug("Brasil API HTTP %s para CNPJ %s", resp.status_code, cnpj)
+        return "error", None
+    return "error", None
 
 
 def _extract_email(data: dict[str, Any]) -> str | None:
@@ -95,6 +237,29 @@ def _extract_natureza_juridica(data: dict[str, Any]) -> str | None:
     return (data.get("descricao_natureza_juridica") or "").strip() or None
 
 
+def _merge(empresa: EmpresaCandidata, data: dict[str, Any], stats: dict[str, Any]) -> None:
+    """Merge inteligente: nunca sobrescreve dado existente com None/vazio."""
+    novo_email = _extract_email(data)
+    if novo_email and not empresa.email:
+        empresa.email = novo_email
+        stats["enriquecidas_email"] += 1
+
+    novo_tel = _extract_telefone(data)
+    if novo_tel and not empresa.telefone:
+        empresa.telefone = novo_tel
+        stats["enriquecidas_telefone"] += 1
+
+    novo_cnae_sec = _extract_cnae_secundarios(data)
+    if novo_cnae_sec and not empresa.cnae_secundarios_json:
+        empresa.cnae_secundarios_json = novo_cnae_sec
+        stats["enriquecidas_cnae_sec"] += 1
+
+    nova_natureza = _extract_natureza_juridica(data)
+    if nova_natureza and not empresa.natureza_juridica:
+        empresa.natureza_juridica = nova_natureza
+        stats["enriquecidas_natureza_juridica"] += 1
+
+
 # ---------------------------------------------------------------------------
 # Main enrichment function
 # ---------------------------------------------------------------------------
@@ -105,22 +270,44 @@ def enrich_via_brasilapi(
     batch_size: int = 500,
     sleep_s: float | None = None,
     only_missing_contact: bool = True,
+    rate_per_s: float | None = None,
+    burst: int | None = None,
+    workers: int | None = None,
+    cache_dir: str | Path | None = None,
+    cache_ttl_days: float | None = None,
+    use_cache: bool = True,
 ) -> dict[str, Any]:
     """Enrich EmpresaCandidata records with Brasil API data.
 
     Args:
         batch_size: Max CNPJs to query per run (keeps runtime predictable).
-        sleep_s: Pause between requests. Defaults to BRASILAPI_SLEEP_S env var
-                 or 0.4s (~2.5 req/s, safe for free tier).
+        sleep_s: Legacy pacing; when given without ``rate_per_s`` the bucket
+                 rate becomes ``1 / sleep_s``.
         only_missing_contact: When True, only queries companies that are
                               missing email OR phone — skips already-rich records.
+        rate_per_s: Token-bucket rate shared by all workers (default
+                    BRASILAPI_RATE_PER_S, 2.5 req/s). ``<= 0`` disables limiting.
+        burst: Bucket capacity (default BRASILAPI_BURST).
+        workers: Concurrent requests in flight (default BRASILAPI_WORKERS).
+        cache_dir / cache_ttl_days: On-disk response cache (defaults
+                    BRASILAPI_CACHE_DIR / BRASILAPI_CACHE_TTL_DAYS).
+        use_cache: False bypasses the cache entirely (no reads, no writes).
 
     Returns:
         Stats dict with counts of enriched fields and API outcomes.
+        ``consultadas`` counts CNPJs fetched over HTTP; ``cache_hits`` the ones
+        answered from disk.
     """
-    pause = sleep_s if sleep_s is not None else float(
-        getattr(config, "BRASILAPI_SLEEP_S", _DEFAULT_SLEEP_S)
-    )
+    if rate_per_s is None:
+        rate_per_s = 1.0 / sleep_s if sleep_s else config.BRASILAPI_RATE_PER_S
+    burst = burst if burst is not None else config.BRASILAPI_BURST
+    workers = max(1, workers if workers is not None else config.BRASILAPI_WORKERS)
+    cache = None
+    if use_cache:
+        cache = _ResponseCache(
+            Path(cache_dir) if cache_dir is not None else config.BRASILAPI_CACHE_DIR,
+            cache_ttl_days if cache_ttl_days is not None else config.BRASILAPI_CACHE_TTL_DAYS,
+        )
 
     query = db.query(EmpresaCandidata)
     if only_missing_contact:
@@ -135,55 +322,71 @@ def enrich_via_brasilapi(
     stats: dict[str, Any] = {
         "candidatas": len(empresas),
         "consultadas": 0,
+        "cache_hits": 0,
         "enriquecidas_email": 0,
         "enriquecidas_telefone": 0,
         "enriquecidas_cnae_sec": 0,
         "enriquecidas_natureza_juridica": 0,
         "nao_encontradas": 0,
         "cnpj_invalido": 0,
+        "erros": 0,
+        "rate_limited": 0,
     }
 
     logger.info(
-        "Brasil API enrich: %d empresas candidatas (batch=%d sleep=%.2fs)",
-        len(empresas), batch_size, pause,
+        "Brasil API enrich: %d empresas candidatas (batch=%d rate=%.2f req/s burst=%d workers=%d cache=%s)",
+        len(empresas), batch_size, rate_per_s, burst, workers, cache.root if cache else None,
     )
 
+    by_cnpj: dict[str, list[EmpresaCandidata]] = {}
     for empresa in empresas:
         cnpj = _clean_cnpj(empresa.cnpj or "")
         if len(cnpj) != 14:
             stats["cnpj_invalido"] += 1
             continue
+        by_cnpj.setdefault(cnpj, []).append(empresa)
 
-        data = _fetch_cnpj(cnpj)
-        stats["consultadas"] += 1
-
+    def _apply(cnpj: str, data: dict[str, Any] | None) -> None:
         if data is None:
             stats["nao_encontradas"] += 1
-            time.sleep(pause)
-            continue
-
-        # Merge inteligente: nunca sobrescreve dado existente com None/vazio
-        novo_email = _extract_email(data)
-        if novo_email and not empresa.email:
-            empresa.email = novo_email
-            stats["enriquecidas_email"] += 1
-
-        novo_tel = _extract_telefone(data)
-        if novo_tel and not empresa.telefone:
-            empresa.telefone = novo_tel
-            stats["enriquecidas_telefone"] += 1
-
-        novo_cnae_sec = _extract_cnae_secundarios(data)
-        if novo_cnae_sec and not empresa.cnae_secundarios_json:
-            empresa.cnae_secundarios_json = novo_cnae_sec
-            stats["enriquecidas_cnae_sec"] += 1
-
-        nova_natureza = _extract_natureza_juridica(data)
-        if nova_natureza and not empresa.natureza_juridica:
-            empresa.natureza_juridica = nova_natureza
-            stats["enriquecidas_natureza_juridica"] += 1
-
-        time.sleep(pause)
+            return
+        for empresa in by_cnpj[cnpj]:
+            _merge(empresa, data, stats)
+
+    to_fetch: list[str] = []
+    for cnpj in by_cnpj:
+        hit, data = cache.get(cnpj) if cache is not None else (False, None)
+        if hit:
+            stats["cache_hits"] += 1
+            _apply(cnpj, data)
+        else:
+            to_fetch.append(cnpj)
+
+    limiter = _TokenBucket(rate_per_s, burst)
+    started = time.monotonic()
+    if to_fetch:
+        http = build_session(retry_statuses=(500, 502, 503, 504), pool_maxsize=workers)
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="brasilapi") as pool:
+                futures = {
+                    pool.submit(_fetch_cnpj, http, cnpj, limiter, cache): cnpj for cnpj in to_fetch
+                }
+                # DB merge stays on this thread; workers only do HTTP + cache writes.
+                for future in as_completed(futures):
+                    outcome, data = future.result()
+                    stats["consultadas"] += 1
+                    if outcome == "error":
+                        stats["erros"] += 1
+                        continue
+                    _apply(futures[future], data)
+        finally:
+            http.close()
+    elapsed = time.monotonic() - started
+
+    stats["rate_limited"] = limiter.throttled_count
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["req_por_s"] = round(stats["consultadas"] / elapsed, 2) if elapsed > 0 else None
+    stats["taxa_final_req_s"] = round(limiter.rate, 3)
 
     db.flush()
     logger.info("Brasil API enrich concluído: %s", stats)
@@ -457,6 +457,28 @@ def build_cnes_mun_parquet(*, output_path: Path | None = None) -> dict[str, Any]
     return result
 
 
+def enrichment_inputs() -> list[Path]:
+    """Source files the three builders read (input digest for the harvest stage cache)."""
+    files: set[Path] = set()
+    for base in (*_osm_source_dirs(), *_inep_source_dirs(), *_cnes_source_dirs()):
+        files.update(p for p in base.rglob("*") if p.is_file())
+    return sorted(files)
+
+
+def enrichment_params() -> dict[str, Any]:
+    """Settings besides the source files that change what the builders write."""
+    outputs = (
+        _output_path(_ENV_OSM_OUT, DEFAULT_OSM_OUT),
+        _output_path(_ENV_INEP_OUT, DEFAULT_INEP_OUT),
+        _output_path(_ENV_CNES_OUT, DEFAULT_CNES_OUT),
+    )
+    return {
+        "inep_enabled": bool((os.getenv("TRONIK_INEP_CENSO_ESCOLAR_CSV_URL") or "").strip()),
+        # A deleted staging parquet changes the digest, forcing a rebuild.
+        "outputs_present": [str(p) for p in outputs if p.exists()],
+    }
+
+
 def build_all_enrichment() -> dict[str, Any]:
     """Run all three staging builders (graceful skip per source)."""
     return {
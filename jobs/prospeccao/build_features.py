@@ -5,21 +5,33 @@ from __future__ import annotations
 import json
 import logging
 import time
+from array import array
 from collections import Counter, defaultdict
+from collections.abc import Iterator
 from datetime import UTC, datetime
 from statistics import median
+from types import SimpleNamespace
 from typing import Any
 
-from sqlalchemy.orm import Session, joinedload
+import numpy as np
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from banco_dados.modelos import EmpresaCandidata, FeatureSnapshotProspeccao, LocalCandidato
-from jobs.prospeccao.enrichment_proxies import lookup_proxies
+from banco_dados.utils import utc_now_naive
+from jobs.prospeccao.bulk_db import insert_rows
+from jobs.prospeccao.enrichment_proxies import PROXY_KEYS, lookup_proxies_batch
 from jobs.prospeccao.ranker_contract import (
     FEATURE_NAMES,
+    FEATURE_SCHEMA_HASH,
     FEATURE_SCHEMA_VERSION,
-    build_feature_vector,
+    build_feature_matrix,
     cnae_ree_fit,
+    collect_feature_columns,
+    encode_feature_blob,
+    feature_dicts,
     feature_schema,
+    feature_vector_hash,
     heuristic_relevance_continuous,
     listwise_training_qid,
 )
@@ -134,18 +146,34 @@ def _equal_frequency_ordinal_labels(scores: list[float], n_bins: int = 8) -> lis
     return out
 
 
+FEATURE_STATS_SAMPLE = 10_000
+# Empresas per keyset page in streaming mode (also bounds the IN (...) lists).
+STREAM_CHUNK_SIZE = 2_000
+LABEL_UPDATE_BATCH = 50_000
+
+
+def _feature_sample_stride(n_rows: int) -> int:
+    sample_size = min(FEATURE_STATS_SAMPLE, n_rows)
+    return max(1, n_rows // sample_size) if sample_size else 1
+
+
 def _compute_feature_statistics(
     bucket: list[tuple],
     feature_names: list[str],
 ) -> dict[str, dict[str, float]]:
     """Compute mean, nonzero_pct, and max for each feature from sample (single-pass)."""
-    sample_size = min(10_000, len(bucket))
-    sample_idxs = list(range(0, len(bucket), max(1, len(bucket) // sample_size)))[:sample_size]
+    sample_size = min(FEATURE_STATS_SAMPLE, len(bucket))
+    sample_idxs = list(range(0, len(bucket), _feature_sample_stride(len(bucket))))[:sample_size]
+    return _feature_statistics_from_sample([bucket[idx][3] for idx in sample_idxs], feature_names)
 
+
+def _feature_statistics_from_sample(
+    sample: list[dict[str, float]],
+    feature_names: list[str],
+) -> dict[str, dict[str, float]]:
     # Single-pass: accumulate all features in one loop
     acc: dict[str, list[float]] = {f: [] for f in feature_names}
-    for idx in sample_idxs:
-        _, _, _, features, _, _ = bucket[idx]
+    for features in sample:
         for f in feature_names:
             acc[f].append(features.get(f, 0.0))
 
@@ -192,6 +220,61 @@ def _check_feature_quality_alerts(
     return warnings
 
 
+def _equal_frequency_ordinal_labels_grouped(
+    group_codes: np.ndarray,
+    scores: np.ndarray,
+    n_bins: int = 8,
+) -> np.ndarray:
+    """``_equal_frequency_ordinal_labels`` applied per group in one vectorized pass.
+
+    Rows are ranked inside their group by (score, row index), the same tie-break as
+    the list version, so labels are identical to grouping and calling it per qid.
+    """
+    n = len(scores)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((np.arange(n), scores, group_codes))
+    sorted_groups = group_codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    group_size = np.repeat(sizes, sizes)
+    rank = np.arange(n) - np.repeat(starts, sizes)
+    labels = np.minimum(n_bins - 1, (rank * n_bins) // group_size)
+    labels[group_size < n_bins] = 0
+    out = np.empty(n, dtype=np.int64)
+    out[order] = labels
+    return out
+
+
+def _batch_proxies(pairs: list[tuple[EmpresaCandidata, LocalCandidato | None]]) -> list[dict[str, float]]:
+    """Enrichment proxies for (empresa, local) rows via one ``lookup_proxies_batch`` call."""
+    batch = lookup_proxies_batch(
+        [getattr(local, "latitude", None) if local else None for _, local in pairs],
+        [getattr(local, "longitude", None) if local else None for _, local in pairs],
+        [getattr(local, "ra", None) if local else None for _, local in pairs],
+        [getattr(empresa, "municipio", None) for empresa, _ in pairs],
+    )
+    columns = [batch[key].tolist() for key in PROXY_KEYS]
+    return [dict(zip(PROXY_KEYS, values, strict=True)) for values in zip(*columns, strict=True)]
+
+
+def _feature_rows(
+    pairs: list[tuple[EmpresaCandidata, LocalCandidato | None]],
+    neighborhoods: list[dict[str, int]],
+    proxy_rows: list[dict[str, float]],
+    now: datetime,
+) -> tuple[np.ndarray, list[dict[str, float]]]:
+    """``build_feature_matrix`` for (empresa, local) rows, plus the row dicts used for labels/stats."""
+    matrix = build_feature_matrix(
+        collect_feature_columns(
+            (empresa, local, neighborhood, proxies)
+            for (empresa, local), neighborhood, proxies in zip(pairs, neighborhoods, proxy_rows, strict=True)
+        ),
+        now=now,
+    )
+    return matrix, feature_dicts(matrix)
+
+
 def build_feature_snapshots(
     db: Session,
     *,
@@ -199,9 +282,28 @@ def build_feature_snapshots(
     seed_demo: bool = False,
     limit: int | None = None,
     use_internal_labels: bool = False,
+    streaming: bool = False,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    json_export: bool = False,
 ) -> dict[str, Any]:
+    """Build listwise feature snapshots for every empresa/local.
+
+    Features are stored as a float32 blob (``features_blob``) stamped with
+    ``FEATURE_SCHEMA_HASH``; ``features_json`` is only filled with ``json_export=True``
+    (debug/inspection) and is ``"{}"`` otherwise.
+    """
     if seed_demo:
         seed_demo_candidates(db)
+    if streaming:
+        return _build_feature_snapshots_streaming(
+            db,
+            pipeline_version=pipeline_version,
+            seed_demo=seed_demo,
+            limit=limit,
+            use_internal_labels=use_internal_labels,
+            chunk_size=chunk_size,
+            json_export=json_export,
+        )
 
     q = (
         db.query(EmpresaCandidata)
@@ -225,6 +327,8 @@ def build_feature_snapshots(
         "seed_demo": seed_demo,
         "limit": limit,
         "use_internal_labels": use_internal_labels,
+        "feature_schema_hash": FEATURE_SCHEMA_HASH,
+        "json_export": json_export,
     }
 
     # Import fora do loop  --  lookup em sys.modules por iteraÃ§Ã£o Ã© desnecessÃ¡rio
@@ -280,6 +384,15 @@ def build_feature_snapshots(
 
     logger.info("build-features: [4/5] feature loop  --  %s empresas--¦", total)
     _t = time.perf_counter()
+    pairs = [(empresa, local) for empresa in empresas for local in (empresa.locais or [None])]
+    qids = [
+        qid_cache.get((empresa.id, local.id if local else None)) or listwise_training_qid(empresa, local)
+        for empresa, local in pairs
+    ]
+    empty_neighborhood = {"qid_total": 0, "qid_ree_compatible": 0}
+    _, feature_rows = _feature_rows(
+        pairs, [qid_stats.get(qid, empty_neighborhood) for qid in qids], _batch_proxies(pairs), utc_now_naive()
+    )
     n_label_bins = 8
     bucket: list[
         tuple[EmpresaCandidata, LocalCandidato | None, str, dict[str, float], float, int | None]
@@ -289,18 +402,8 @@ def build_feature_snapshots(
         locais = empresa.locais or [None]
         for local in locais:
             local_id = local.id if local else None
-            qid = qid_cache.get((empresa.id, local_id)) or listwise_training_qid(empresa, local)
-            lat = getattr(local, "latitude", None) if local else None
-            lon = getattr(local, "longitude", None) if local else None
-            ra = getattr(local, "ra", None) if local else None
-            municipio = getattr(empresa, "municipio", None)
-            proxies = lookup_proxies(lat, lon, ra, municipio)
-            features = build_feature_vector(
-                empresa,
-                local,
-                neighborhood=qid_stats[qid],
-                enrichment_proxies=proxies,
-            )
+            qid = qids[processed_rows]
+            features = feature_rows[processed_rows]
             raw = heuristic_relevance_continuous(features)
             if internal_index is not None:
                 internal_raw, meta = lookup_internal_score(empresa, local, internal_index)
@@ -433,7 +536,10 @@ def build_feature_snapshots(
             snapshot = snapshot_by_key[key]
             snapshot.qid = qid
             snapshot.label_ordinal = ordinals[idx]
-            snapshot.features_json = _json(features)
+            snapshot.features_blob = encode_feature_blob(features)
+            snapshot.feature_schema_hash = FEATURE_SCHEMA_HASH
+            snapshot.features_hash = feature_vector_hash(snapshot.features_blob)
+            snapshot.features_json = _json(features) if json_export else "{}"
             snapshot.feature_schema_json = schema_json
             snapshot.criado_em = datetime.now(UTC)
 
@@ -448,3 +554,322 @@ def build_feature_snapshots(
 
     logger.info("Feature snapshots concluÃ­do: %s", stats)
     return stats
+
+
+# ---------------------------------------------------------------------------
+# Streaming mode: keyset pages, bulk writes, compact per-row arrays
+# ---------------------------------------------------------------------------
+
+
+def _empresa_id_cutoff(db: Session, limit: int | None) -> int | None:
+    """Id of the ``limit``-th empresa (ordered by id) so every pass sees the same slice."""
+    if limit is None or limit <= 0:
+        return None
+    return db.execute(
+        select(EmpresaCandidata.id).order_by(EmpresaCandidata.id.asc()).offset(limit - 1).limit(1)
+    ).scalar()
+
+
+def _count_feature_rows(db: Session, max_id: int | None) -> tuple[int, int]:
+    """(empresas, snapshot rows) — one row per local, or one per empresa without locais."""
+    emp_q = select(func.count(EmpresaCandidata.id))
+    loc_q = select(func.count(LocalCandidato.id), func.count(func.distinct(LocalCandidato.empresa_id))).join(
+        EmpresaCandidata, EmpresaCandidata.id == LocalCandidato.empresa_id
+    )
+    if max_id is not None:
+        emp_q = emp_q.where(EmpresaCandidata.id <= max_id)
+        loc_q = loc_q.where(EmpresaCandidata.id <= max_id)
+    n_empresas = db.execute(emp_q).scalar() or 0
+    n_locais, n_with_locais = db.execute(loc_q).one()
+    return n_empresas, n_empresas - (n_with_locais or 0) + (n_locais or 0)
+
+
+def _iter_empresa_chunks(
+    db: Session,
+    *,
+    chunk_size: int,
+    max_id: int | None,
+) -> Iterator[list[EmpresaCandidata]]:
+    """Keyset-paginated empresas (``id > last_id``) with locais; each page is expunged after use.
+
+    Only the page's own empresas/locais are expunged, so other objects the caller
+    holds in ``db`` stay attached.
+    """
+    last_id = 0
+    while True:
+        q = (
+            db.query(EmpresaCandidata)
+            .options(selectinload(EmpresaCandidata.locais))
+            .filter(EmpresaCandidata.id > last_id)
+        )
+        if max_id is not None:
+            q = q.filter(EmpresaCandidata.id <= max_id)
+        chunk = q.order_by(EmpresaCandidata.id.asc()).limit(chunk_size).all()
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        yield chunk
+        for empresa in chunk:
+            for local in empresa.locais:
+                db.expunge(local)
+            db.expunge(empresa)
+
+
+# Every column listwise_training_qid (and the REE check) reads, per side of the join.
+_QID_EMPRESA_COLS = ("uf", "municipio", "bairro", "cep", "cnae_principal")
+_QID_LOCAL_COLS = ("latitude", "longitude", "ra", "qid", "bairro", "cep")
+
+
+def _stream_qid_stats(
+    db: Session,
+    *,
+    chunk_size: int,
+    max_id: int | None,
+) -> dict[str, dict[str, int]]:
+    """Neighborhood counts per qid over ATIVA empresas.
+
+    SQL does the counting: ``COUNT(*)`` of ATIVA (empresa, local) rows grouped by
+    the columns the qid is derived from, streamed without ORM objects. The
+    qid itself is only mapped in Python, once per distinct group:
+    ``listwise_training_qid`` is a fallback chain (Python ``round`` on
+    coordinates, digit filtering, strip/lower) that SQLite and PostgreSQL
+    expressions would not reproduce bit for bit. Memory is O(#qids).
+    """
+    empresa_cols = [getattr(EmpresaCandidata, c) for c in _QID_EMPRESA_COLS]
+    local_cols = [getattr(LocalCandidato, c) for c in _QID_LOCAL_COLS]
+    stmt = (
+        select(*empresa_cols, *local_cols, func.count())
+        .select_from(EmpresaCandidata)
+        .outerjoin(LocalCandidato, LocalCandidato.empresa_id == EmpresaCandidata.id)
+        .where(EmpresaCandidata.situacao_cadastral == "ATIVA")
+        .group_by(*empresa_cols, *local_cols)
+    )
+    if max_id is not None:
+        stmt = stmt.where(EmpresaCandidata.id <= max_id)
+
+    n_empresa = len(_QID_EMPRESA_COLS)
+    qid_stats: dict[str, dict[str, int]] = defaultdict(
+        lambda: {"qid_total": 0, "qid_ree_compatible": 0},
+    )
+    ree_by_cnae: dict[str | None, bool] = {}
+    for row in db.execute(stmt.execution_options(yield_per=chunk_size)):
+        empresa = SimpleNamespace(**dict(zip(_QID_EMPRESA_COLS, row[:n_empresa], strict=True)))
+        # A local with only NULL qid columns maps like no local at all
+        local = SimpleNamespace(**dict(zip(_QID_LOCAL_COLS, row[n_empresa:-1], strict=True)))
+        count = row[-1]
+        entry = qid_stats[listwise_training_qid(empresa, local)]
+        entry["qid_total"] += count
+        if empresa.cnae_principal not in ree_by_cnae:
+            ree_by_cnae[empresa.cnae_principal] = cnae_ree_fit(empresa.cnae_principal) > 0
+        if ree_by_cnae[empresa.cnae_principal]:
+            entry["qid_ree_compatible"] += count
+    return dict(qid_stats)
+
+
+_SNAPSHOT_KEY_COLS = ("empresa_id", "local_id", "pipeline_version")
+
+
+def _write_snapshot_chunk(
+    db: Session,
+    pipeline_version: str,
+    records: list[dict[str, Any]],
+) -> tuple[list[int], int]:
+    """Upsert one page of snapshots; returns (snapshot ids aligned with ``records``, created).
+
+    Existing rows are matched in one SELECT and updated by primary key; new rows go
+    through a multi-row INSERT. ``ON CONFLICT`` is not used because ``local_id`` is
+    NULL for empresas without locais and NULLs never conflict on the unique key.
+    """
+    snap = FeatureSnapshotProspeccao
+    empresa_ids = sorted({r["empresa_id"] for r in records})
+
+    def _existing() -> dict[tuple[int, int | None], int]:
+        rows = db.execute(
+            select(snap.id, snap.empresa_id, snap.local_id).where(
+                snap.pipeline_version == pipeline_version,
+                snap.empresa_id.in_(empresa_ids),
+            )
+        ).all()
+        return {(emp_id, loc_id): sid for sid, emp_id, loc_id in rows}
+
+    ids_by_key = _existing()
+    new_rows: list[dict[str, Any]] = []
+    updates: list[dict[str, Any]] = []
+    for r in records:
+        sid = ids_by_key.get((r["empresa_id"], r["local_id"]))
+        if sid is None:
+            new_rows.append(r)
+        else:
+            updates.append({"id": sid, **{k: v for k, v in r.items() if k not in _SNAPSHOT_KEY_COLS}})
+    if updates:
+        db.execute(update(snap), updates)
+    if new_rows:
+        insert_rows(db, snap.__table__, new_rows)
+        ids_by_key = _existing()
+    return [ids_by_key[(r["empresa_id"], r["local_id"])] for r in records], len(new_rows)
+
+
+def _build_feature_snapshots_streaming(
+    db: Session,
+    *,
+    pipeline_version: str,
+    seed_demo: bool,
+    limit: int | None,
+    use_internal_labels: bool,
+    chunk_size: int,
+    json_export: bool,
+) -> dict[str, Any]:
+    """Same snapshots/labels as ``build_feature_snapshots`` with bounded memory.
+
+    Empresas are read in keyset pages and expunged after each page; features are
+    written per page (float32 blobs, bulk INSERT/UPDATE) and committed. Only three compact
+    arrays per row survive the loop (snapshot id, qid code, raw score) for the
+    listwise label pass, which is then applied with bulk UPDATEs.
+    """
+    max_id = _empresa_id_cutoff(db, limit)
+    total, n_rows = _count_feature_rows(db, max_id)
+    schema_json = _json(feature_schema())
+    stats: dict[str, Any] = {
+        "pipeline_version": pipeline_version,
+        "empresas": total,
+        "snapshots_criados": 0,
+        "seed_demo": seed_demo,
+        "limit": limit,
+        "use_internal_labels": use_internal_labels,
+        "feature_schema_hash": FEATURE_SCHEMA_HASH,
+        "json_export": json_export,
+        "streaming": True,
+        "chunk_size": chunk_size,
+    }
+    logger.info("build-features[stream]: %s empresas, %s linhas (limit=%s)", total, n_rows, limit)
+
+    from jobs.prospeccao.labels_internal import build_internal_label_index, lookup_internal_score
+
+    internal_index = None
+    internal_matched = 0
+    internal_match_by_source: Counter[str] = Counter()
+    if use_internal_labels:
+        internal_index = build_internal_label_index(db)
+        stats["internal_label_index"] = internal_index.stats
+
+    _t = time.perf_counter()
+    qid_stats = _stream_qid_stats(db, chunk_size=chunk_size, max_id=max_id)
+    logger.info("build-features[stream]: qid_stats %s qids (%.1fs)", len(qid_stats), time.perf_counter() - _t)
+    empty_neighborhood = {"qid_total": 0, "qid_ree_compatible": 0}
+
+    snapshot_ids = array("q")
+    qid_codes = array("q")
+    raw_scores = array("d")
+    qid_code_by_name: dict[str, int] = {}
+    stride = _feature_sample_stride(n_rows)
+    sample_limit = min(FEATURE_STATS_SAMPLE, n_rows) * stride
+    sample: list[dict[str, float]] = []
+
+    _t = time.perf_counter()
+    now = utc_now_naive()
+    done = 0
+    for chunk in _iter_empresa_chunks(db, chunk_size=chunk_size, max_id=max_id):
+        records: list[dict[str, Any]] = []
+        criado_em = datetime.now(UTC)
+        pairs = [(empresa, local) for empresa in chunk for local in (empresa.locais or [None])]
+        qids = [listwise_training_qid(empresa, local) for empresa, local in pairs]
+        matrix, feature_rows = _feature_rows(
+            pairs, [qid_stats.get(qid, empty_neighborhood) for qid in qids], _batch_proxies(pairs), now
+        )
+        for (empresa, local), qid, features, vector in zip(pairs, qids, feature_rows, matrix, strict=True):
+            raw = heuristic_relevance_continuous(features)
+            if internal_index is not None:
+                internal_raw, meta = lookup_internal_score(empresa, local, internal_index)
+                if internal_raw is not None:
+                    raw = internal_raw
+                    internal_matched += 1
+                    internal_match_by_source[meta.get("match_source") or "unknown"] += 1
+
+            row_idx = len(raw_scores)
+            if row_idx < sample_limit and row_idx % stride == 0:
+                sample.append(features)
+            raw_scores.append(raw)
+            qid_codes.append(qid_code_by_name.setdefault(qid, len(qid_code_by_name)))
+            blob = encode_feature_blob(vector)
+            records.append({
+                "empresa_id": empresa.id,
+                "local_id": local.id if local else None,
+                "pipeline_version": pipeline_version,
+                "qid": qid,
+                "label_ordinal": 0,
+                "features_json": _json(features) if json_export else "{}",
+                "feature_schema_json": schema_json,
+                "features_blob": blob,
+                "feature_schema_hash": FEATURE_SCHEMA_HASH,
+                "features_hash": feature_vector_hash(blob),
+                "criado_em": criado_em,
+            })
+        ids, created = _write_snapshot_chunk(db, pipeline_version, records)
+        snapshot_ids.extend(ids)
+        stats["snapshots_criados"] += created
+        db.commit()
+        done += len(chunk)
+        elapsed = time.perf_counter() - _t
+        logger.info(
+            "build-features[stream]: %s/%s empresas | %s linhas | %.0f emp/s",
+            done, total, len(raw_scores), done / elapsed if elapsed > 0 else 0,
+        )
+
+    row_count = len(raw_scores)
+    if use_internal_labels and internal_index is not None:
+        stats["internal_labels_matched"] = internal_matched
+        stats["internal_labels_coverage_pct"] = round(
+            internal_matched / row_count * 100 if row_count else 0.0,
+            1,
+        )
+        stats["internal_match_by_source"] = dict(sorted(internal_match_by_source.items()))
+        stats["label_source"] = "internal_ops_with_heuristic_fallback"
+
+    codes = np.frombuffer(qid_codes, dtype=np.int64)
+    if row_count:
+        sizes = np.bincount(codes).tolist()
+        stats["qid_distribution"] = {
+            "unique_qids": len(sizes),
+            "median_group_size": median(sizes),
+            "min_group_size": min(sizes),
+            "max_group_size": max(sizes),
+            "singleton_qids_pct": round(sum(1 for n in sizes if n == 1) / len(sizes) * 100, 1),
+        }
+
+    n_label_bins = 8
+    ordinals = _equal_frequency_ordinal_labels_grouped(
+        codes, np.frombuffer(raw_scores, dtype=np.float64), n_bins=n_label_bins
+    )
+    ids = np.frombuffer(snapshot_ids, dtype=np.int64)
+    for start in range(0, row_count, LABEL_UPDATE_BATCH):
+        end = min(start + LABEL_UPDATE_BATCH, row_count)
+        db.execute(
+            update(FeatureSnapshotProspeccao),
+            [
+                {"id": sid, "label_ordinal": label}
+                for sid, label in zip(ids[start:end].tolist(), ordinals[start:end].tolist(), strict=True)
+            ],
+        )
+        db.commit()
+
+    stats["label_binning"] = (
+        "equal_frequency_rank_per_qid"
+        if not use_internal_labels
+        else "equal_frequency_rank_per_qid_on_internal_or_heuristic_raw"
+    )
+    stats["label_bins"] = n_label_bins
+    stats["unique_qids"] = len(qid_stats)
+
+    feature_stats = _feature_statistics_from_sample(sample, FEATURE_NAMES)
+    stats["feature_stats"] = feature_stats
+    quality_warnings = _check_feature_quality_alerts(feature_stats, stats["unique_qids"])
+    if quality_warnings:
+        logger.warning(
+            "build-features[stream]: %d quality alerts detected:\n%s",
+            len(quality_warnings),
+            "\n".join(f"  - {w}" for w in quality_warnings),
+        )
+        stats["quality_warnings"] = quality_warnings
+
+    logger.info("Feature snapshots (stream) concluído: %s", stats)
+    return stats
@@ -0,0 +1,158 @@
+"""Batched upserts for the prospection jobs (SQLite / PostgreSQL).
+
+The ORM path (``db.query(...).first()`` + attribute writes + ``flush`` per row) is
+fine for a few thousand rows but becomes millions of round trips on the Receita
+dump. These helpers take plain row dicts and write them in chunks:
+
+- ``upsert_rows``: ``INSERT ... ON CONFLICT DO UPDATE`` via executemany
+  (SQLite >= 3.24 and PostgreSQL share the same statement shape).
+- ``copy_upsert_postgres``: ``COPY`` into a temporary staging table followed by a
+  single ``INSERT ... SELECT ... ON CONFLICT`` merge (psycopg 3 only).
+
+Both return the number of rows sent; callers keep their own created/updated stats.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from sqlalchemy import Table, func, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def dialect_name(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def supports_copy(db: Session) -> bool:
+    """True when the session is bound to PostgreSQL through a driver exposing ``cursor.copy``."""
+    if dialect_name(db) != "postgresql":
+        return False
+    raw = db.connection().connection.driver_connection
+    with raw.cursor() as cur:
+        return hasattr(cur, "copy")
+
+
+def _chunks(rows: Sequence[dict[str, Any]], size: int) -> Iterable[Sequence[dict[str, Any]]]:
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def _dialect_insert(db: Session, table: Table):
+    name = dialect_name(db)
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"upsert não suportado para dialeto {name!r}")
+    return insert(table)
+
+
+def upsert_rows(
+    db: Session,
+    table: Table,
+    rows: Sequence[dict[str, Any]],
+    *,
+    conflict_cols: Sequence[str],
+    update_cols: Sequence[str],
+    coalesce_cols: Sequence[str] = (),
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Executemany ``INSERT ... ON CONFLICT (conflict_cols) DO UPDATE``.
+
+    ``coalesce_cols`` keep the stored value when the incoming one is NULL
+    (``COALESCE(excluded.col, table.col)``), mirroring ``new or old`` in ORM code.
+    Rows must share the same keys and must not repeat a conflict key within a chunk.
+    """
+    if not rows:
+        return 0
+    stmt = _dialect_insert(db, table)
+    set_ = {
+        col: (
+            func.coalesce(stmt.excluded[col], table.c[col])
+            if col in coalesce_cols
+            else stmt.excluded[col]
+        )
+        for col in update_cols
+    }
+    if set_:
+        stmt = stmt.on_conflict_do_update(index_elements=list(conflict_cols), set_=set_)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_cols))
+    for chunk in _chunks(rows, chunk_size):
+        db.execute(stmt, list(chunk))
+    return len(rows)
+
+
+def copy_upsert_postgres(
+    db: Session,
+    table: Table,
+    rows: Sequence[dict[str, Any]],
+    *,
+    conflict_cols: Sequence[str],
+    update_cols: Sequence[str],
+    coalesce_cols: Sequence[str] = (),
+) -> int:
+    """``COPY`` rows into a temp staging table, then merge with one ``INSERT ... SELECT``.
+
+    The staging table is created with ``CREATE TEMP TABLE ... AS SELECT ... WITH NO DATA``
+    so it carries column types but no NOT NULL/serial defaults from the target.
+    """
+    if not rows:
+        return 0
+    columns = list(rows[0].keys())
+    col_list = ", ".join(columns)
+    staging = f"_stg_{table.name}"
+
+    db.execute(
+        text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS "
+            f"SELECT {col_list} FROM {table.name} WITH NO DATA"
+        )
+    )
+    db.execute(text(f"TRUNCATE {staging}"))
+
+    raw = db.connection().connection.driver_connection
+    with raw.cursor() as cur, cur.copy(f"COPY {staging} ({col_list}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(tuple(row[c] for c in columns))
+
+    assignments = ", ".join(
+        f"{col} = COALESCE(EXCLUDED.{col}, {table.name}.{col})"
+        if col in coalesce_cols
+        else f"{col} = EXCLUDED.{col}"
+        for col in update_cols
+    )
+    conflict = ", ".join(conflict_cols)
+    action = f"DO UPDATE SET {assignments}" if assignments else "DO NOTHING"
+    db.execute(
+        text(
+            f"INSERT INTO {table.name} ({col_list}) "
+            f"SELECT {col_list} FROM {staging} "
+            f"ON CONFLICT ({conflict}) {action}"
+        )
+    )
+    return len(rows)
+
+
+def insert_rows(
+    db: Session,
+    table: Table,
+    rows: Sequence[dict[str, Any]],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Plain executemany INSERT (no conflict handling) in chunks."""
+    if not rows:
+        return 0
+    stmt = table.insert()
+    for chunk in _chunks(rows, chunk_size):
+        db.execute(stmt, list(chunk))
+    return len(rows)
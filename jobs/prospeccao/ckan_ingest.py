@@ -31,13 +31,17 @@ def _action_url() -> str:
     return f"{config.CKAN_BASE_URL}/api/3/action/"
 
 
-def ckan_call(action: str, payload: dict[str, Any] | None = None) -> Any:
+def ckan_call(action: str, payload: dict[str, Any] | None = None, *, cache: Any | None = None) -> Any:
+    """POST na action API; com ``cache`` (HarvestCache) usa GET condicional (só ações de leitura)."""
     url = _action_url() + action
     throttle()
     logger.debug("CKAN action: %s payload=%s", action, payload or {})
-    r = session().post(url, json=payload or {}, timeout=request_timeout())
-    r.raise_for_status()
-    body = r.json()
+    if cache is not None:
+        body = cache.get_json(url, params=payload or None)
+    else:
+        r = session().post(url, json=payload or {}, timeout=request_timeout())
+        r.raise_for_status()
+        body = r.json()
     if not body.get("success"):
         raise RuntimeError(f"CKAN error ({action}): {body}")
     return body["result"]
@@ -54,6 +58,7 @@ def fetch_package_search(
     start: int = 0,
     fq: str | None = None,
     q: str = "",
+    cache: Any | None = None,
 ) -> dict[str, Any]:
     rows = min(rows, config.CKAN_ROWS_PER_PAGE)
     return ckan_call(
@@ -64,6 +69,7 @@ def fetch_package_search(
             "start": start,
             **({"fq": fq} if fq else {}),
         },
+        cache=cache,
     )
 
 
@@ -76,8 +82,9 @@ def sync_catalog_metadata(
     max_packages: int = 500,
     fq_org: str | None = None,
     out_name: str = "package_search_summary.jsonl",
+    cache: Any | None = None,
 ) -> Path:
-    """Pagina package_search e grava JSONL resumido."""
+    """Pagina package_search e grava JSONL resumido (``cache``: GET condicional por página)."""
     dirs = pathutil.ensure_raw_layout()
     out = dirs["ckan"] / out_name
     fq = f"organization:{fq_org}" if fq_org else None
@@ -88,7 +95,7 @@ def sync_catalog_metadata(
     with out.open("w", encoding="utf-8") as fp:
         while count < max_packages:
             batch_rows = min(rows, max_packages - count)
-            res = fetch_package_search(rows=batch_rows, start=start, fq=fq)
+            res = fetch_package_search(rows=batch_rows, start=start, fq=fq, cache=cache)
             results = res.get("results") or []
             if not results:
                 break
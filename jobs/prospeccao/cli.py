@@ -67,6 +67,10 @@ def main(argv: list[str] | None = None) -> int:
     s_gf.add_argument("--max-mb", type=int, default=None)
     s_gf.add_argument("--url", type=str, default=None)
 
+    s_gg = sub.add_parser("geofabrik-graph", help="Grafo viário CSR do DF (.npz) a partir do PBF, para /api/rotas/otimizar")
+    s_gg.add_argument("--pbf", type=str, default=None)
+    s_gg.add_argument("--out", type=str, default=None)
+
     sub.add_parser("inep", help="CSV via TRONIK_INEP_CENSO_ESCOLAR_CSV_URL")
 
     s_inep_z = sub.add_parser("inep-microdados", help="ZIP microdados INEP")
@@ -82,13 +86,18 @@ def main(argv: list[str] | None = None) -> int:
         "--steps",
         type=str,
         default="ibge,geoportal,ckan_meta,ckan_links,pncp,ckan_orgs",
-        help="Separados por vírgula: ibge,geoportal,ckan_meta,ckan_links,ckan_show,pncp,ckan_orgs,receita_probe,inep_probe,aneel,ibram,ibama_ctf",
+        help="Separados por vírgula: ibge,geoportal,ckan_meta,ckan_links,ckan_show,pncp,ckan_orgs,receita_probe,inep_probe,cnefe,receita_parse,build_enrichment,aneel,ibram,ibama_ctf",
     )
     s_h.add_argument("--dry-run", action="store_true")
     s_h.add_argument("--ckan-max", type=int, default=250)
     s_h.add_argument("--ckan-link-max", type=int, default=300)
     s_h.add_argument("--pncp-dias", type=int, default=14)
     s_h.add_argument("--pncp-max-pages", type=int, default=80)
+    s_h.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Sem GET condicional nem skip por digest das entradas (força todos os passos)",
+    )
 
     s_build = sub.add_parser("build-features", help="Monta feature_snapshot_prospeccao")
     s_build.add_argument("--version", type=str, default="prospeccao-ree-v3.3")
@@ -105,15 +114,51 @@ def main(argv: list[str] | None = None) -> int:
         action="store_true",
         help="Labels a partir do DB operacional (parceiro/coleta/contrato); fallback heurístico sem match",
     )
+    s_build.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Lê empresas em páginas por id e grava em lote (memória limitada; mesmos snapshots/labels)",
+    )
+    s_build.add_argument("--chunk-size", type=int, default=2000, help="Empresas por página no modo --streaming")
+    s_build.add_argument(
+        "--json-export",
+        action="store_true",
+        help="Também grava features_json legível (debug); o treino/scoring usa o blob float32",
+    )
 
     s_train = sub.add_parser("train-ranker", help="Treina XGBRanker ou baseline heuristico")
     s_train.add_argument("--pipeline-version", type=str, default="prospeccao-ree-v3.3")
     s_train.add_argument("--model-version", type=str, default=None)
     s_train.add_argument("--no-baseline", action="store_true")
+    s_train.add_argument(
+        "--search-workers",
+        type=int,
+        default=1,
+        help="Processos para a busca de hiperparâmetros (DMatrix construída uma vez por worker)",
+    )
+    s_train.add_argument("--threads-per-worker", type=int, default=None, help="Limite de threads XGBoost por worker")
+    s_train.add_argument(
+        "--successive-halving",
+        action="store_true",
+        help="Poda candidatos fracos com orçamento parcial de árvores antes do treino completo",
+    )
 
     s_score = sub.add_parser("score-candidates", help="Pontua snapshots com modelo ativo")
     s_score.add_argument("--model-version", type=str, default=None)
     s_score.add_argument("--pipeline-version", type=str, default=None)
+    s_score.add_argument("--shap-batch-size", type=int, default=20_000, help="Linhas por chamada do SHAP TreeExplainer")
+    s_score.add_argument(
+        "--shap-top-n",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Calcula SHAP só para os N melhores de cada qid (demais usam motivos heurísticos)",
+    )
+    s_score.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Repontua só qids com snapshots novos/alterados (features_hash); demais scores ficam intactos",
+    )
 
     s_pub = sub.add_parser("published-scores", help="Lista ranking publicado para dashboard/Nik")
     s_pub.add_argument("--limit", type=int, default=20)
@@ -124,9 +169,15 @@ def main(argv: list[str] | None = None) -> int:
     sub.add_parser("monitor", help="Relatório JSON de saúde do ranker (cron/ops)")
 
     sub.add_parser(
+        "dedupe-scores",
+        help="Remove scores duplicados por (snapshot_id, modelo_id) e cria o índice único (migração)",
+    )
+
+    s_be = sub.add_parser(
         "build-enrichment",
         help="Materializa parquets OSM/INEP/CNES em data/ml/staging (Sócrates)",
     )
+    s_be.add_argument("--if-changed", action="store_true", help="Salta se as fontes OSM/INEP/CNES não mudaram desde o último build")
 
     sub.add_parser(
         "enrichment-probe",
@@ -151,9 +202,16 @@ def main(argv: list[str] | None = None) -> int:
 
     s_rp = sub.add_parser("receita-parse", help="Parseia ZIPs Receita baixados -> empresa_candidata + local_candidato")
     s_rp.add_argument("--no-two-pass", action="store_true", help="Carrega TODOS Empresas*.zip na memória (rápido, ~12 GB RAM)")
+    s_rp.add_argument("--no-bulk", action="store_true", help="Grava linha a linha via ORM (caminho legado, lento)")
+    s_rp.add_argument("--batch-size", type=int, default=5000, help="Linhas por upsert em lote (default 5000)")
+    s_rp.add_argument("--no-copy", action="store_true", help="PostgreSQL: usa INSERT ... ON CONFLICT em vez de COPY+staging")
+    s_rp.add_argument("--workers", type=int, default=1, help="Processos de leitura, um por ZIP (default 1 = serial)")
+    s_rp.add_argument("--no-cache", action="store_true", help="Ignora o cache Parquet DF+RIDE e re-escaneia todos os ZIPs")
+    s_rp.add_argument("--if-changed", action="store_true", help="Salta se os ZIPs da Receita não mudaram desde o último parse")
 
     s_cnefe = sub.add_parser("cnefe", help="Baixa + parseia CNEFE 2022 coordenadas (DF + GO)")
     s_cnefe.add_argument("--no-download", action="store_true", help="Pula download, só parseia ZIPs existentes")
+    s_cnefe.add_argument("--if-changed", action="store_true", help="Download condicional; salta o parse se os ZIPs não mudaram")
 
     s_norm = sub.add_parser("normalize", help="Dedup + geocode CNEFE + RA + qid")
     s_norm.add_argument("--skip-geocode", action="store_true", help="Pula geocodificação CNEFE")
@@ -179,7 +237,12 @@ def main(argv: list[str] | None = None) -> int:
 
     s_ba = sub.add_parser("brasilapi-enrich", help="Enriquece email/telefone/CNAE via Brasil API (free, sem auth)")
     s_ba.add_argument("--batch", type=int, default=500, help="Max CNPJs por execução (default 500)")
-    s_ba.add_argument("--sleep", type=float, default=None, help="Pausa entre requests em segundos (default 0.4)")
+    s_ba.add_argument("--sleep", type=float, default=None, help="Legado: pausa entre requests (equivale a --rate 1/sleep)")
+    s_ba.add_argument("--rate", type=float, default=None, help="Req/s do token bucket (default TRONIK_BRASILAPI_RATE ou 2.5)")
+    s_ba.add_argument("--burst", type=int, default=None, help="Capacidade do token bucket (default 3)")
+    s_ba.add_argument("--workers", type=int, default=None, help="Requests concorrentes (default 4)")
+    s_ba.add_argument("--cache-ttl-days", type=float, default=None, help="TTL do cache em disco por CNPJ (default 30; 0 = sem expiração)")
+    s_ba.add_argument("--no-cache", action="store_true", help="Ignora o cache em disco (não lê nem grava)")
     s_ba.add_argument("--all", dest="all_records", action="store_true", help="Consulta todos, não só os sem contato")
 
     s_cdd = sub.add_parser("fetch-targeted", help="Busca DF+Entorno via Casa dos Dados API (sem download pesado)")
@@ -190,7 +253,13 @@ def main(argv: list[str] | None = None) -> int:
     s_cdd.add_argument("--max-pages", type=int, default=None, help="Max pages per query (default 200)")
 
     s_rfb = sub.add_parser("rfb-enrich", help="Enriquece EmpresaCandidata com CNAE+endereço do dump Estabelecimentos da Receita Federal")
-    s_rfb.add_argument("--dump-dir", type=str, required=True, help="Diretório com arquivos Estabelecimentos*.csv")
+    s_rfb_src = s_rfb.add_mutually_exclusive_group(required=True)
+    s_rfb_src.add_argument("--dump-dir", type=str, help="Diretório com arquivos Estabelecimentos*.csv")
+    s_rfb_src.add_argument(
+        "--from-receita-cache",
+        action="store_true",
+        help="Lê o cache Parquet DF+RIDE gravado por receita-parse (sem re-escanear o dump)",
+    )
     s_rfb.add_argument("--uf", type=str, default="DF", help="UF para filtrar (padrão: DF)")
     s_rfb.add_argument("--batch-size", type=int, default=5000)
     s_rfb.add_argument("--dry-run", action="store_true")
@@ -297,6 +366,18 @@ def main(argv: list[str] | None = None) -> int:
         download_pbf(url=args.url, max_mb=args.max_mb)
         return 0
 
+    if args.cmd == "geofabrik-graph":
+        from pathlib import Path
+
+        from jobs.prospeccao.geofabrik_ingest import build_road_graph
+
+        out = build_road_graph(
+            Path(args.pbf) if args.pbf else None,
+            Path(args.out) if args.out else None,
+        )
+        print(json.dumps({"path": str(out)}, ensure_ascii=False))
+        return 0
+
     if args.cmd == "inep":
         from jobs.prospeccao.inep_ingest import download_censo_escolar_csv
 
@@ -333,6 +414,7 @@ def main(argv: list[str] | None = None) -> int:
             ckan_link_max=args.ckan_link_max,
             pncp_dias=args.pncp_dias,
             pncp_max_pages=args.pncp_max_pages,
+            use_cache=not args.no_cache,
         )
         print(json.dumps(rep, ensure_ascii=False, indent=2, default=str))
         return 0 if not rep.get("errors") else 1
@@ -398,6 +480,11 @@ def main(argv: list[str] | None = None) -> int:
                 batch_size=args.batch,
                 sleep_s=args.sleep,
                 only_missing_contact=not args.all_records,
+                rate_per_s=args.rate,
+                burst=args.burst,
+                workers=args.workers,
+                cache_ttl_days=args.cache_ttl_days,
+                use_cache=not args.no_cache,
             )
             db.commit()
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
@@ -415,13 +502,17 @@ def main(argv: list[str] | None = None) -> int:
     if args.cmd == "rfb-enrich":
         from pathlib import Path
 
+        from jobs.prospeccao import paths as pathutil
         from jobs.prospeccao.db import session_scope
+        from jobs.prospeccao.receita_cache import default_cache_dir
         from jobs.prospeccao.rfb_estabelecimentos_enrich import enrich_from_rfb_dump
 
+        cache_dir = default_cache_dir(pathutil.ensure_raw_layout()["receita"]) if args.from_receita_cache else None
         with session_scope() as db:
             stats = enrich_from_rfb_dump(
                 db,
-                dump_dir=Path(args.dump_dir),
+                dump_dir=Path(args.dump_dir) if args.dump_dir else None,
+                receita_cache_dir=cache_dir,
                 uf_filter=args.uf,
                 batch_size=args.batch_size,
                 dry_run=args.dry_run,
@@ -435,16 +526,46 @@ def main(argv: list[str] | None = None) -> int:
         from jobs.prospeccao.db import session_scope
         from jobs.prospeccao.receita_parse import parse_estabelecimentos_to_db
         dirs = pathutil.ensure_raw_layout()
-        with session_scope() as db:
-            result = parse_estabelecimentos_to_db(db, dirs["receita"], two_pass=not args.no_two_pass)
-            db.commit()
+
+        def _parse():
+            with session_scope() as db:
+                parsed = parse_estabelecimentos_to_db(
+                    db,
+                    dirs["receita"],
+                    two_pass=not args.no_two_pass,
+                    bulk=not args.no_bulk,
+                    batch_size=args.batch_size,
+                    use_copy=False if args.no_copy else None,
+                    workers=args.workers,
+                    cache=not args.no_cache,
+                )
+                db.commit()
+            return parsed
+
+        if args.if_changed:
+            from jobs.prospeccao.harvest import run_stage_if_changed
+
+            result = run_stage_if_changed("receita_parse", _parse)
+        else:
+            result = _parse()
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
         return 0
 
     if args.cmd == "cnefe":
         from jobs.prospeccao.cnefe_ingest import sync_cnefe
 
-        result = sync_cnefe(download=not args.no_download)
+        if args.if_changed:
+            from jobs.prospeccao.cnefe_ingest import download_cnefe_zips
+            from jobs.prospeccao.harvest import run_stage_if_changed
+            from jobs.prospeccao.harvest_cache import HarvestCache
+
+            cache = HarvestCache()
+            downloaded = [] if args.no_download else download_cnefe_zips(cache=cache)
+            result = run_stage_if_changed("cnefe", lambda: sync_cnefe(download=False), cache=cache)
+            result = {**result, "downloaded": [str(p) for p in downloaded]}
+            cache.save()
+        else:
+            result = sync_cnefe(download=not args.no_download)
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
         return 0
 
@@ -468,6 +589,9 @@ def main(argv: list[str] | None = None) -> int:
                 seed_demo=args.seed_demo,
                 limit=args.limit,
                 use_internal_labels=args.use_internal_labels,
+                streaming=args.streaming,
+                chunk_size=args.chunk_size,
+                json_export=args.json_export,
             )
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
         return 0
@@ -482,6 +606,9 @@ def main(argv: list[str] | None = None) -> int:
                 pipeline_version=args.pipeline_version,
                 model_version=args.model_version,
                 allow_baseline=not args.no_baseline,
+                search_workers=args.search_workers,
+                threads_per_worker=args.threads_per_worker,
+                successive_halving=args.successive_halving,
             )
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
         return 0
@@ -495,6 +622,9 @@ def main(argv: list[str] | None = None) -> int:
                 db,
                 model_version=args.model_version,
                 pipeline_version=args.pipeline_version,
+                shap_batch_size=args.shap_batch_size,
+                shap_top_n=args.shap_top_n,
+                incremental=args.incremental,
             )
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
         return 0
@@ -514,6 +644,15 @@ def main(argv: list[str] | None = None) -> int:
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
         return 0
 
+    if args.cmd == "dedupe-scores":
+        from banco_dados.schema_compat import deduplicar_scores_prospeccao
+        from jobs.prospeccao.db import session_scope
+
+        with session_scope() as db:
+            removidos = deduplicar_scores_prospeccao(db.get_bind())
+        print(json.dumps({"duplicatas_removidas": removidos}, ensure_ascii=False, indent=2))
+        return 0
+
     if args.cmd == "monitor":
         from jobs.prospeccao.monitor_ranker import run_monitor
 
@@ -523,7 +662,12 @@ def main(argv: list[str] | None = None) -> int:
         from jobs.prospeccao.build_enrichment_staging import build_all_enrichment
         from jobs.prospeccao.enrichment_proxies import probe_enrichment_files
 
-        built = build_all_enrichment()
+        if args.if_changed:
+            from jobs.prospeccao.harvest import run_stage_if_changed
+
+            built = run_stage_if_changed("build_enrichment", build_all_enrichment)
+        else:
+            built = build_all_enrichment()
         probe = probe_enrichment_files()
         print(json.dumps({"built": built, "probe": probe}, ensure_ascii=False, indent=2, default=str))
         return 0
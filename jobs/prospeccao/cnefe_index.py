@@ -0,0 +1,249 @@
+"""Persisted, memory-mapped CNEFE geocode index.
+
+``build_cnefe_lookup`` keeps ``dict[(cep, logradouro, numero)] -> (lat, lon, quality)``
+with up to three tuple keys per address: gigabytes of RAM for DF + GO, rebuilt on
+every ``geocode_candidates`` run. This index is built once per CNEFE release and
+stored as flat NumPy arrays, opened with ``mmap_mode="r"``:
+
+    keys.npy     uint64, sorted — 64-bit BLAKE2b hash of "cep\\x1flogradouro\\x1fnumero"
+    lat.npy      float32
+    lon.npy      float32
+    quality.npy  uint8 — quality * 100 (100 exact, 80 street, 50 CEP centroid)
+    meta.json    release key, source files, entry count
+
+``CnefeIndex.get(key)`` has the same contract as ``dict.get`` on the legacy lookup, so
+``cnefe_ingest.geocode_address`` keeps its three-level fallback unchanged. Hash
+collisions are possible in principle (~1e-6 for a few million keys) and ignored.
+float32 coordinates keep ~0.5 m precision.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import shutil
+from array import array
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from jobs.prospeccao import config, paths as pathutil
+from jobs.prospeccao.cnefe_ingest import iter_cnefe_ops
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIRNAME = "_index"
+# Bump when the hashing or array layout changes.
+INDEX_FORMAT_VERSION = 1
+_KEY_SEP = "\x1f"
+
+
+def hash_key(key: tuple[str, str, str]) -> int:
+    """64-bit key hash used by the index (stable across processes, unlike ``hash()``)."""
+    digest = hashlib.blake2b(_KEY_SEP.join(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class CnefeIndex:
+    """Read-only view over the index arrays (memory-mapped or in memory)."""
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        quality: np.ndarray,
+        *,
+        meta: dict[str, Any] | None = None,
+    ):
+        self.keys = keys
+        self.lat = lat
+        self.lon = lon
+        self.quality = quality
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return int(self.keys.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.keys.nbytes + self.lat.nbytes + self.lon.nbytes + self.quality.nbytes)
+
+    def get(self, key: tuple[str, str, str]) -> tuple[float, float, float] | None:
+        n = self.keys.shape[0]
+        if not n:
+            return None
+        h = np.uint64(hash_key(key))
+        pos = int(np.searchsorted(self.keys, h))
+        if pos >= n or self.keys[pos] != h:
+            return None
+        return float(self.lat[pos]), float(self.lon[pos]), int(self.quality[pos]) / 100.0
+
+    @classmethod
+    def open(cls, path: Path) -> CnefeIndex:
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        meta["path"] = str(path)
+        return cls(
+            np.load(path / "keys.npy", mmap_mode="r"),
+            np.load(path / "lat.npy", mmap_mode="r"),
+            np.load(path / "lon.npy", mmap_mode="r"),
+            np.load(path / "quality.npy", mmap_mode="r"),
+            meta=meta,
+        )
+
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        np.save(tmp / "keys.npy", np.ascontiguousarray(self.keys, dtype=np.uint64))
+        np.save(tmp / "lat.npy", np.ascontiguousarray(self.lat, dtype=np.float32))
+        np.save(tmp / "lon.npy", np.ascontiguousarray(self.lon, dtype=np.float32))
+        np.save(tmp / "quality.npy", np.ascontiguousarray(self.quality, dtype=np.uint8))
+        meta = {k: v for k, v in self.meta.items() if k != "path"}
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        if path.exists():
+            for child in path.iterdir():
+                child.unlink()
+            path.rmdir()
+        tmp.replace(path)
+        self.meta["path"] = str(path)
+        return path
+
+
+class _HashedStore:
+    """dict-like builder keyed by hash with compact column storage (no tuple keys kept)."""
+
+    def __init__(self) -> None:
+        self.pos: dict[int, int] = {}
+        self.keys = array("Q")
+        self.lat = array("f")
+        self.lon = array("f")
+        self.quality = array("B")
+
+    def apply(self, overwrite: bool, key: tuple[str, str, str], lat: float, lon: float, quality: float) -> None:
+        h = hash_key(key)
+        q = round(quality * 100)
+        idx = self.pos.get(h)
+        if idx is None:
+            self.pos[h] = len(self.keys)
+            self.keys.append(h)
+            self.lat.append(lat)
+            self.lon.append(lon)
+            self.quality.append(q)
+        elif overwrite:
+            self.lat[idx] = lat
+            self.lon[idx] = lon
+            self.quality[idx] = q
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        return (
+            np.frombuffer(self.keys, dtype=np.uint64).copy(),
+            np.frombuffer(self.lat, dtype=np.float32).copy(),
+            np.frombuffer(self.lon, dtype=np.float32).copy(),
+            np.frombuffer(self.quality, dtype=np.uint8).copy(),
+        )
+
+
+def _merge_keep_last(parts: list[tuple[np.ndarray, ...]]) -> tuple[np.ndarray, ...]:
+    """Concatenate per-UF arrays; on duplicate keys the later part wins (``dict.update``)."""
+    if not parts:
+        empty = np.empty(0)
+        return (
+            empty.astype(np.uint64), empty.astype(np.float32),
+            empty.astype(np.float32), empty.astype(np.uint8),
+        )
+    keys, lat, lon, quality = (np.concatenate(cols) for cols in zip(*parts, strict=True))
+    rev = slice(None, None, -1)
+    _, first_in_rev = np.unique(keys[rev], return_index=True)
+    keep = (len(keys) - 1 - first_in_rev)
+    order = keep[np.argsort(keys[keep], kind="stable")]
+    return keys[order], lat[order], lon[order], quality[order]
+
+
+def release_key(cnefe_dir: Path) -> str:
+    """Identity of the CNEFE release on disk: file names, sizes and mtimes + format."""
+    parts: list[Any] = [INDEX_FORMAT_VERSION]
+    for filename in config.CNEFE_FILES.values():
+        path = cnefe_dir / filename
+        if path.exists():
+            st = path.stat()
+            parts.append((filename, st.st_size, st.st_mtime_ns))
+    blob = json.dumps(parts).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+def build_cnefe_index(cnefe_dir: Path) -> CnefeIndex:
+    """Parse all CNEFE ZIPs into an in-memory index (same precedence as ``build_cnefe_lookup``)."""
+    parts: list[tuple[np.ndarray, ...]] = []
+    counts: dict[str, int] = {}
+    for uf, filename in config.CNEFE_FILES.items():
+        path = cnefe_dir / filename
+        if not path.exists():
+            logger.warning("CNEFE %s not found at %s", filename, cnefe_dir)
+            continue
+        store = _HashedStore()
+        for op in iter_cnefe_ops(path, filter_ride=(uf == "GO")):
+            store.apply(*op)
+        counts[uf] = len(store.keys)
+        parts.append(store.arrays())
+        del store
+
+    keys, lat, lon, quality = _merge_keep_last(parts)
+    meta = {
+        "format": INDEX_FORMAT_VERSION,
+        "release_key": release_key(cnefe_dir),
+        "entries": int(keys.shape[0]),
+        "entries_by_uf": counts,
+        "built_at": datetime.now(UTC).isoformat(),
+    }
+    logger.info("CNEFE index built: %d entries (%s)", meta["entries"], counts)
+    return CnefeIndex(keys, lat, lon, quality, meta=meta)
+
+
+def cnefe_params(cnefe_dir: Path | None = None) -> dict[str, Any]:
+    """Outputs besides the source ZIPs: a deleted index forces ``sync_cnefe`` to rebuild it."""
+    if cnefe_dir is None:
+        cnefe_dir = pathutil.ensure_raw_layout()["cnefe"]
+    index_path = Path(cnefe_dir) / INDEX_DIRNAME / release_key(Path(cnefe_dir))
+    return {"outputs_present": [str(index_path)] if (index_path / "meta.json").exists() else []}
+
+
+def load_cnefe_index(
+    cnefe_dir: Path | None = None,
+    *,
+    rebuild: bool = False,
+) -> CnefeIndex:
+    """Open the persisted index for the current CNEFE release, building it on first use."""
+    if cnefe_dir is None:
+        cnefe_dir = pathutil.ensure_raw_layout()["cnefe"]
+    cnefe_dir = Path(cnefe_dir)
+    index_path = cnefe_dir / INDEX_DIRNAME / release_key(cnefe_dir)
+
+    if not rebuild and (index_path / "meta.json").exists():
+        index = CnefeIndex.open(index_path)
+        logger.info("CNEFE index aberto (mmap): %s — %d entradas", index_path, len(index))
+        return index
+
+    index = build_cnefe_index(cnefe_dir)
+    if len(index):
+        index.save(index_path)
+        logger.info("CNEFE index gravado em %s", index_path)
+        _prune_old_releases(index_path)
+    return index
+
+
+def _prune_old_releases(index_path: Path) -> None:
+    """Delete the index directories of previous releases (one per weekly harvest otherwise).
+
+    Readers that still map old arrays keep working: on POSIX the unlinked files stay
+    readable until they are closed.
+    """
+    for sibling in index_path.parent.iterdir():
+        if sibling == index_path or not sibling.is_dir():
+            continue
+        shutil.rmtree(sibling, ignore_errors=True)
+        logger.info("CNEFE index antigo removido: %s", sibling)
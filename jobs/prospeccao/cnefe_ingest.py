@@ -4,7 +4,8 @@ Builds an in-memory and DB-persisted lookup table:
   (cep, logradouro_normalized, numero) -> (lat, lon, quality)
 
 Used by normalize_candidates.py to geocode Receita Federal addresses without
-depending on external geocoding APIs.
+depending on external geocoding APIs. The production path reads the same entries
+from the memory-mapped index in cnefe_index.py (built once per CNEFE release).
 """
 
 from __future__ import annotations
@@ -15,11 +16,15 @@ import logging
 import re
 import unicodedata
 import zipfile
+from collections.abc import Iterator
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from jobs.prospeccao import config, paths as pathutil
-from jobs.prospeccao.http_util import download_url_to_path
+from jobs.prospeccao.http_util import download_many
+
+if TYPE_CHECKING:
+    from jobs.prospeccao.cnefe_index import CnefeIndex
 
 logger = logging.getLogger(__name__)
 
@@ -75,22 +80,22 @@ def _find_col(headers_lower: list[str], candidates: set[str]) -> int | None:
 # Download
 # ---------------------------------------------------------------------------
 
-def download_cnefe_zips() -> list[Path]:
-    """Download CNEFE coordinate ZIPs for DF and GO into data/raw/prospeccao/cnefe/."""
+def download_cnefe_zips(*, cache: Any | None = None) -> list[Path]:
+    """Download CNEFE coordinate ZIPs for DF and GO into data/raw/prospeccao/cnefe/.
+
+    ``cache`` (HarvestCache) skips ZIPs whose ETag / Last-Modified did not change.
+    """
     dirs = pathutil.ensure_raw_layout()
     out_dir = dirs["cnefe"]
     base = config.CNEFE_BASE.rstrip("/") + "/"
-    downloaded: list[Path] = []
-    for uf, filename in config.CNEFE_FILES.items():
+    jobs: list[tuple[str, Path]] = []
+    for filename in config.CNEFE_FILES.values():
         url = f"{base}{filename}"
         dest = out_dir / filename
         logger.info("CNEFE download: %s -> %s", url, dest)
-        try:
-            download_url_to_path(url, dest, resume=True, skip_if_same_size=True)
-            downloaded.append(dest)
-        except Exception:
-            logger.exception("Failed to download CNEFE %s", uf)
-    return downloaded
+        jobs.append((url, dest))
+    results = download_many(jobs, resume=True, skip_if_same_size=True, cache=cache)
+    return [Path(r.path) for r in results if r.error is None]
 
 
 # ---------------------------------------------------------------------------
@@ -122,18 +127,21 @@ def _iter_csv_in_zip(zip_path: Path):
                 yield headers, reader
 
 
-def parse_cnefe_zip(
+# One write into the lookup: (overwrite, key, lat, lon, quality).
+# overwrite=True is ``lookup[key] = ...``; False is ``lookup.setdefault(key, ...)``.
+LookupOp = tuple[bool, tuple[str, str, str], float, float, float]
+
+
+def iter_cnefe_ops(
     zip_path: Path,
     *,
     filter_ride: bool = True,
-) -> GeocodeLookup:
-    """Parse a CNEFE coordinate ZIP and return a geocode lookup dict.
+) -> Iterator[LookupOp]:
+    """Stream the lookup writes of a CNEFE coordinate ZIP, in file order.
 
-    Keys: (cep, logradouro_normalized, numero)
-    Values: (latitude, longitude, quality)
-    Quality is 1.0 for CNEFE (high confidence census data).
+    Shared by the in-memory dict (``parse_cnefe_zip``) and the persisted
+    index (``cnefe_index``) so both resolve keys with the same precedence.
     """
-    lookup: GeocodeLookup = {}
     for headers, rows in _iter_csv_in_zip(zip_path):
         headers_lower = [h.strip().lower() for h in headers]
         lat_i = _find_col(headers_lower, _LAT_CANDIDATES)
@@ -184,16 +192,33 @@ def parse_cnefe_zip(
             if not cep and not logr:
                 continue
 
-            key = (cep, logr, num)
-            lookup[key] = (lat, lon, 1.0)
+            yield True, (cep, logr, num), lat, lon, 1.0
             if cep and logr:
-                lookup.setdefault((cep, logr, ""), (lat, lon, 0.8))
+                yield False, (cep, logr, ""), lat, lon, 0.8
             if cep:
-                lookup.setdefault((cep, "", ""), (lat, lon, 0.5))
+                yield False, (cep, "", ""), lat, lon, 0.5
             kept += 1
 
         logger.info("CNEFE %s: %d rows scanned, %d kept", zip_path.name, total, kept)
 
+
+def parse_cnefe_zip(
+    zip_path: Path,
+    *,
+    filter_ride: bool = True,
+) -> GeocodeLookup:
+    """Parse a CNEFE coordinate ZIP and return a geocode lookup dict.
+
+    Keys: (cep, logradouro_normalized, numero)
+    Values: (latitude, longitude, quality)
+    Quality is 1.0 for CNEFE (high confidence census data).
+    """
+    lookup: GeocodeLookup = {}
+    for overwrite, key, lat, lon, quality in iter_cnefe_ops(zip_path, filter_ride=filter_ride):
+        if overwrite:
+            lookup[key] = (lat, lon, quality)
+        else:
+            lookup.setdefault(key, (lat, lon, quality))
     return lookup
 
 
@@ -225,12 +250,12 @@ def build_cnefe_lookup(cnefe_dir: Path | None = None) -> GeocodeLookup:
 
 
 def geocode_address(
-    lookup: GeocodeLookup,
+    lookup: GeocodeLookup | CnefeIndex,
     cep: str | None,
     logradouro: str | None,
     numero: str | None,
 ) -> tuple[float, float, float] | None:
-    """Try to geocode an address using the CNEFE lookup.
+    """Try to geocode an address using the CNEFE lookup (dict or ``CnefeIndex``).
 
     Attempts progressively looser matching:
       1. (cep, logradouro_norm, numero)
@@ -261,11 +286,15 @@ def geocode_address(
 
 
 def sync_cnefe(download: bool = True) -> dict[str, Any]:
-    """Download + parse CNEFE files and return stats."""
+    """Download CNEFE files, build (or reuse) the persisted index and return stats."""
+    from jobs.prospeccao.cnefe_index import load_cnefe_index
+
     stats: dict[str, Any] = {"downloaded": [], "lookup_size": 0}
     if download:
         downloaded = download_cnefe_zips()
         stats["downloaded"] = [str(p) for p in downloaded]
-    lookup = build_cnefe_lookup()
-    stats["lookup_size"] = len(lookup)
+    index = load_cnefe_index()
+    stats["lookup_size"] = len(index)
+    stats["index_path"] = index.meta.get("path")
+    stats["index_bytes"] = index.nbytes
     return stats
@@ -28,6 +28,10 @@ HTTP_BACKOFF_FACTOR = float(os.environ.get("TRONIK_HTTP_BACKOFF_FACTOR", "0.6"))
 LINK_CHECK_TIMEOUT_S = int(os.environ.get("TRONIK_LINK_CHECK_TIMEOUT", "25"))
 DOWNLOAD_PROGRESS_EVERY_MB = int(os.environ.get("TRONIK_DOWNLOAD_PROGRESS_EVERY_MB", "25"))
 DOWNLOAD_MAX_SECONDS = int(os.environ.get("TRONIK_DOWNLOAD_MAX_SECONDS", "0"))
+# Gestor de downloads: URLs em paralelo e segmentos Range por ficheiro (quando Accept-Ranges: bytes)
+DOWNLOAD_WORKERS = int(os.environ.get("TRONIK_DOWNLOAD_WORKERS", "3"))
+DOWNLOAD_SEGMENTS = int(os.environ.get("TRONIK_DOWNLOAD_SEGMENTS", "4"))
+DOWNLOAD_SEGMENT_MIN_MB = int(os.environ.get("TRONIK_DOWNLOAD_SEGMENT_MIN_MB", "64"))
 
 # --- Geofabrik OSM ---
 GEOFABRIK_DEFAULT_PBF = os.environ.get(
@@ -159,6 +163,15 @@ BRASILAPI_BASE = os.environ.get(
 )
 BRASILAPI_SLEEP_S = float(os.environ.get("TRONIK_BRASILAPI_SLEEP_S", "0.4"))
 BRASILAPI_BATCH_SIZE = int(os.environ.get("TRONIK_BRASILAPI_BATCH", "500"))
+# Engine concorrente: token bucket (req/s + burst) partilhado entre workers; 429 reduz a taxa.
+BRASILAPI_RATE_PER_S = float(os.environ.get("TRONIK_BRASILAPI_RATE", "2.5"))
+BRASILAPI_BURST = int(os.environ.get("TRONIK_BRASILAPI_BURST", "3"))
+BRASILAPI_WORKERS = int(os.environ.get("TRONIK_BRASILAPI_WORKERS", "4"))
+# Cache em disco das respostas (uma por CNPJ, inclui 404); 0 desativa o TTL (nunca expira).
+BRASILAPI_CACHE_DIR = Path(
+    os.environ.get("TRONIK_BRASILAPI_CACHE_DIR", str(RAW_DIR / "brasilapi_cache"))
+).resolve()
+BRASILAPI_CACHE_TTL_DAYS = float(os.environ.get("TRONIK_BRASILAPI_CACHE_TTL_DAYS", "30"))
 
 # --- Casa dos Dados API v5 (targeted CNPJ search, requires API key) ---
 # Get your key at https://portal.casadosdados.com.br/plataforma/api/chave
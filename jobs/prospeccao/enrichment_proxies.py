@@ -6,6 +6,10 @@ Reads precomputed parquet or CSV paths from environment:
   TRONIK_CNES_PARQUET
 
 When files are missing or unreadable, ``lookup_proxies`` returns 0.0 for all signals.
+
+``lookup_proxies_batch`` resolves whole coordinate arrays with one BallTree
+``query_radius(count_only=True)`` per source (optionally split across threads; the
+tree query releases the GIL). ``lookup_proxies`` is the single-row wrapper.
 """
 
 from __future__ import annotations
@@ -15,6 +19,8 @@ import logging
 import math
 import os
 import threading
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
@@ -84,7 +90,7 @@ _cache: dict[str, Any] = {
     "inep": None,
     "cnes": None,
     "loaded": False,
-    "ball_trees": {},  # Cache for BallTree per points hash
+    "ball_trees": {},  # id(points) -> (points, BallTree); holding points keeps the id valid
 }
 
 _LOAD_LOCK = threading.Lock()
@@ -257,42 +263,111 @@ def _ensure_loaded() -> None:
                 logger.info("CNES enrichment: nenhuma linha utilizável em %s", cnes_path)
 
 
-def _count_within_radius(
-    lat: float,
-    lon: float,
-    points: list[tuple[float, float]],
-    radius_km: float,
-) -> int:
-    """Count POIs within radius_km using BallTree spatial index."""
-    if not points:
-        return 0
-
-    # Compute hash for caching BallTree
-    points_hash = hash(tuple(points))
-
-    # Lazy-build BallTree on first use with double-checked locking
-    ball_trees = _cache.get("ball_trees", {})
-    if points_hash not in ball_trees:
+def _ball_tree(points: list[tuple[float, float]]) -> BallTree:
+    """Haversine BallTree over ``points``, built once per points list."""
+    key = id(points)
+    cached = _cache.get("ball_trees", {}).get(key)
+    if cached is None or cached[0] is not points:
+        # Double-checked locking: build outside of the hot path only once
         with _LOAD_LOCK:
-            # Re-read from cache after acquiring lock (double-checked locking correct)
             ball_trees = _cache.get("ball_trees", {})
-            if points_hash not in ball_trees:
+            cached = ball_trees.get(key)
+            if cached is None or cached[0] is not points:
                 # Convert lat/lon to radians for Haversine metric
                 pts_rad = np.radians(np.asarray(points, dtype=float))
                 ball_trees = dict(ball_trees)  # Do not mutate cache dict directly
-                ball_trees[points_hash] = BallTree(pts_rad, metric="haversine")
+                cached = (points, BallTree(pts_rad, metric="haversine"))
+                ball_trees[key] = cached
                 _cache["ball_trees"] = ball_trees
+    return cached[1]
+
 
-    tree = _cache.get("ball_trees", {})[points_hash]
+BATCH_CHUNK_SIZE = 50_000
+
+
+def _count_within_radius_batch(
+    lats: np.ndarray,
+    lons: np.ndarray,
+    points: list[tuple[float, float]],
+    radius_km: float,
+    *,
+    workers: int = 1,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> np.ndarray:
+    """POI counts within radius_km for every (lat, lon) — one ``count_only`` query per chunk."""
+    n = len(lats)
+    if not points or n == 0:
+        return np.zeros(n, dtype=np.int64)
+    tree = _ball_tree(points)
     # Query radius in radians: radius_km / Earth radius (6371 km)
     radius_rad = radius_km / 6371.0
-    query_pt = np.radians(np.array([[lat, lon]], dtype=float))
+    query = np.radians(np.column_stack([lats, lons]).astype(float))
+
+    def _count(start: int) -> np.ndarray:
+        return tree.query_radius(query[start : start + chunk_size], r=radius_rad, count_only=True)
+
+    starts = range(0, n, chunk_size)
+    if workers <= 1 or n <= chunk_size:
+        parts = [_count(start) for start in starts]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_count, starts))
+    return np.concatenate(parts).astype(np.int64)
 
-    # count_only=True returns array of counts
-    counts = tree.query_radius(query_pt, r=radius_rad, count_only=True)
+
+def _count_within_radius(
+    lat: float,
+    lon: float,
+    points: list[tuple[float, float]],
+    radius_km: float,
+) -> int:
+    """Count POIs within radius_km using BallTree spatial index."""
+    counts = _count_within_radius_batch(np.array([lat]), np.array([lon]), points, radius_km)
     return int(counts[0])
 
 
+def _norm_density_array(counts: np.ndarray, cap: float) -> np.ndarray:
+    """Vectorized ``_norm_density``."""
+    counts = np.asarray(counts, dtype=float)
+    safe = np.where(counts > 0, counts, 0.0)
+    return np.where(counts > 0, np.minimum(1.0, np.log1p(safe) / math.log1p(cap)), 0.0)
+
+
+def _aggregate_lookup_batch(
+    index: _AggregateIndex | None,
+    *,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    has_coords: np.ndarray,
+    ra_keys: list[str],
+    mun_keys: list[str],
+    cap: float,
+    workers: int,
+    chunk_size: int,
+) -> np.ndarray:
+    """Vectorized ``_aggregate_lookup``: RA value, else município value, else radius density."""
+    n = len(ra_keys)
+    out = np.zeros(n, dtype=float)
+    if index is None:
+        return out
+    fallthrough = np.zeros(n, dtype=bool)
+    for i, (ra_key, mun_key) in enumerate(zip(ra_keys, mun_keys, strict=True)):
+        if ra_key and ra_key in index.by_ra:
+            out[i] = _clamp_proxy(float(index.by_ra[ra_key]), cap)
+        elif mun_key and mun_key in index.by_municipio:
+            out[i] = _clamp_proxy(float(index.by_municipio[mun_key]), cap)
+        else:
+            fallthrough[i] = True
+    radius_rows = np.flatnonzero(fallthrough & has_coords)
+    if len(radius_rows) and index.points:
+        counts = _count_within_radius_batch(
+            lats[radius_rows], lons[radius_rows], index.points, _RADIUS_KM,
+            workers=workers, chunk_size=chunk_size,
+        )
+        out[radius_rows] = _norm_density_array(counts, cap)
+    return out
+
+
 def _aggregate_lookup(
     index: _AggregateIndex | None,
     *,
@@ -316,6 +391,64 @@ def _aggregate_lookup(
     return 0.0
 
 
+def _coord_array(values: Sequence[float | None]) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+
+def lookup_proxies_batch(
+    lats: Sequence[float | None],
+    lons: Sequence[float | None],
+    ras: Sequence[str | None],
+    municipios: Sequence[str | None],
+    *,
+    workers: int = 1,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> dict[str, np.ndarray]:
+    """``lookup_proxies`` for n rows at once: ``{proxy_key: float array of length n}``.
+
+    Radius counts for OSM and the INEP/CNES coordinate fallback are one BallTree
+    ``query_radius(count_only=True)`` per source over all rows (chunked across
+    ``workers`` threads when > 1). Missing or NaN coordinates count as absent.
+    """
+    _ensure_loaded()
+    lat_arr = _coord_array(lats)
+    lon_arr = _coord_array(lons)
+    n = len(lat_arr)
+    has_coords = ~np.isnan(lat_arr) & ~np.isnan(lon_arr)
+    out = {key: np.zeros(n, dtype=float) for key in PROXY_KEYS}
+
+    osm_index: _OsmIndex | None = _cache.get("osm")
+    if osm_index and osm_index.points:
+        rows = np.flatnonzero(has_coords)
+        counts = _count_within_radius_batch(
+            lat_arr[rows], lon_arr[rows], osm_index.points, _RADIUS_KM, workers=workers, chunk_size=chunk_size
+        )
+        out["osm_poi_ree_density"][rows] = _norm_density_array(counts, _OSM_CAP)
+
+    inep_index: _AggregateIndex | None = _cache.get("inep")
+    cnes_index: _AggregateIndex | None = _cache.get("cnes")
+    if inep_index is None and cnes_index is None:
+        return out
+    ra_keys = [_norm_key(ra) for ra in ras]
+    mun_keys = [_norm_key(mun) for mun in municipios]
+    for key, index, cap in (
+        ("inep_institution_proxy", inep_index, _INEP_CAP),
+        ("cnes_health_proxy", cnes_index, _CNES_CAP),
+    ):
+        out[key] = _aggregate_lookup_batch(
+            index,
+            lats=lat_arr,
+            lons=lon_arr,
+            has_coords=has_coords,
+            ra_keys=ra_keys,
+            mun_keys=mun_keys,
+            cap=cap,
+            workers=workers,
+            chunk_size=chunk_size,
+        )
+    return out
+
+
 def lookup_proxies(
     lat: float | None,
     lon: float | None,
@@ -323,36 +456,8 @@ def lookup_proxies(
     municipio: str | None,
 ) -> dict[str, float]:
     """Return OSM/INEP/CNES proxy floats in [0, 1]; defaults to 0.0 when staging is absent."""
-    _ensure_loaded()
-    out = dict.fromkeys(PROXY_KEYS, 0.0)
-
-    if lat is not None and lon is not None:
-        osm_index: _OsmIndex | None = _cache.get("osm")
-        if osm_index and osm_index.points:
-            count = _count_within_radius(lat, lon, osm_index.points, _RADIUS_KM)
-            out["osm_poi_ree_density"] = _norm_density(float(count), _OSM_CAP)
-
-    inep_index: _AggregateIndex | None = _cache.get("inep")
-    out["inep_institution_proxy"] = _aggregate_lookup(
-        inep_index,
-        lat=lat,
-        lon=lon,
-        ra=ra,
-        municipio=municipio,
-        cap=_INEP_CAP,
-    )
-
-    cnes_index: _AggregateIndex | None = _cache.get("cnes")
-    out["cnes_health_proxy"] = _aggregate_lookup(
-        cnes_index,
-        lat=lat,
-        lon=lon,
-        ra=ra,
-        municipio=municipio,
-        cap=_CNES_CAP,
-    )
-
-    return out
+    batch = lookup_proxies_batch([lat], [lon], [ra], [municipio])
+    return {key: float(batch[key][0]) for key in PROXY_KEYS}
 
 
 def probe_enrichment_files() -> dict[str, Any]:
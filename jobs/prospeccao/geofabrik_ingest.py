@@ -28,3 +28,93 @@ def download_pbf(
         {"url": u, "path": str(dest), "truncated": max_bytes is not None},
     )
     return dest
+
+
+# highway=* values a collection truck can drive on
+ROAD_HIGHWAYS = frozenset({
+    "motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link",
+    "secondary", "secondary_link", "tertiary", "tertiary_link", "unclassified",
+    "residential", "living_street", "service", "road",
+})
+# DF + immediate surroundings (lat_min, lon_min, lat_max, lon_max)
+DF_BBOX = (-16.30, -48.35, -15.45, -47.25)
+
+
+def build_road_graph(
+    pbf_path: Path | None = None,
+    dest: Path | None = None,
+    *,
+    bbox: tuple[float, float, float, float] = DF_BBOX,
+) -> Path:
+    """Geofabrik PBF -> CSR road graph (.npz) read by ``banco_dados.services.roteamento``.
+
+    Keeps drivable ``highway`` ways inside ``bbox``; ``oneway`` ways only get the
+    edge in their direction (``-1`` reverses it).
+    """
+    try:
+        import osmium
+    except ImportError as exc:
+        raise RuntimeError("pyosmium necessário para montar o grafo viário (pip install osmium)") from exc
+    import numpy as np
+
+    from banco_dados.services.roteamento import GRAFO_VIARIO_PATH, GrafoViario
+
+    src = Path(pbf_path) if pbf_path else pathutil.ensure_raw_layout()["osm"] / "extract.osm.pbf"
+    if not src.is_file():
+        raise FileNotFoundError(f"PBF não encontrado: {src} (rode `geofabrik` antes)")
+    out = Path(dest) if dest else GRAFO_VIARIO_PATH
+    lat_min, lon_min, lat_max, lon_max = bbox
+
+    class _Ways(osmium.SimpleHandler):
+        def __init__(self) -> None:
+            super().__init__()
+            self.refs: list[int] = []
+            self.lats: list[float] = []
+            self.lons: list[float] = []
+            self.origem: list[int] = []
+            self.destino: list[int] = []
+
+        def way(self, w: osmium.osm.Way) -> None:
+            if w.tags.get("highway") not in ROAD_HIGHWAYS:
+                return
+            oneway = w.tags.get("oneway", "no")
+            pts = []
+            for n in w.nodes:
+                loc = n.location
+                if not loc.valid() or not (lat_min <= loc.lat <= lat_max and lon_min <= loc.lon <= lon_max):
+                    pts.append(None)
+                    continue
+                pts.append(len(self.refs))
+                self.refs.append(n.ref)
+                self.lats.append(loc.lat)
+                self.lons.append(loc.lon)
+            for a, b in zip(pts, pts[1:], strict=False):
+                if a is None or b is None:
+                    continue
+                if oneway == "-1":
+                    a, b = b, a
+                self.origem.append(a)
+                self.destino.append(b)
+                if oneway not in ("yes", "true", "1", "-1"):
+                    self.origem.append(b)
+                    self.destino.append(a)
+
+    logger.info("Grafo viário: a ler vias de %s (bbox=%s)", src, bbox)
+    handler = _Ways()
+    handler.apply_file(str(src), locations=True)
+
+    # One node per OSM id (shared nodes appear once per way that uses them)
+    refs = np.asarray(handler.refs, dtype=np.int64)
+    unicos, primeira, inverso = np.unique(refs, return_index=True, return_inverse=True)
+    lats = np.asarray(handler.lats)[primeira]
+    lons = np.asarray(handler.lons)[primeira]
+    origem = inverso[np.asarray(handler.origem, dtype=np.int64)]
+    destino = inverso[np.asarray(handler.destino, dtype=np.int64)]
+    grafo = GrafoViario.de_arestas(lats, lons, origem, destino)
+    grafo.salvar(out)
+    logger.info("Grafo viário: %d nós, %d arestas -> %s", grafo.n_nos, grafo.n_arestas, out)
+    pathutil.write_manifest(
+        "road_graph",
+        {"pbf": str(src), "path": str(out), "nodes": grafo.n_nos, "edges": grafo.n_arestas, "bbox": list(bbox)},
+    )
+    return out
@@ -28,10 +28,12 @@ def query_layer_geojson_page(
     page_size: int = 2000,
     where: str = "1=1",
     out_fields: str = "*",
+    cache: Any | None = None,
 ) -> dict[str, Any]:
     """
     ArcGIS Feature Layer query com f=geojson.
     base_feature_url exemplo: .../FeatureServer/0
+    ``cache`` (HarvestCache) faz GET condicional (ETag / Last-Modified).
     """
     base = base_feature_url.rstrip("/")
     params = {
@@ -45,6 +47,8 @@ def query_layer_geojson_page(
     }
     url = f"{base}/query?{urlencode(params)}"
     throttle()
+    if cache is not None:
+        return cache.get_json(url, timeout=_ARCGIS_TIMEOUT)
     return get_json(url, timeout=_ARCGIS_TIMEOUT)
 
 
@@ -53,6 +57,7 @@ def sync_ra_geojson(
     feature_url: str | None = None,
     page_size: int = 2000,
     max_features: int | None = None,
+    cache: Any | None = None,
 ) -> Path:
     """Concatena features num único FeatureCollection (respeitando limite)."""
     url_base = feature_url or config.GEOPORTAL_RA_FEATURE_URL
@@ -63,7 +68,7 @@ def sync_ra_geojson(
     offset = 0
     total = 0
     while True:
-        chunk = query_layer_geojson_page(url_base, offset=offset, page_size=page_size)
+        chunk = query_layer_geojson_page(url_base, offset=offset, page_size=page_size, cache=cache)
         feats = (chunk.get("features") or []) if isinstance(chunk, dict) else []
         if not feats:
             break
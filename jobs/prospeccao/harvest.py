@@ -2,6 +2,15 @@
 Orquestra várias fontes numa única execução (relatório JSON em _reports).
 
 steps (lista): ckan_meta, ckan_links, ckan_show, ibge, geoportal, pncp, ckan_orgs, receita_probe, inep_probe
+
+Passos que devolvem ``{"cache": {...}}`` (ex.: receita_parse com cache Parquet) têm
+hits/misses copiados para ``report["cache"][passo]``.
+
+Com ``use_cache`` (default) um :class:`~jobs.prospeccao.harvest_cache.HarvestCache`
+faz GET condicional (ETag / Last-Modified) em geoportal, ckan_meta e pncp, salta
+downloads CNEFE inalterados e salta receita_parse / cnefe / build_enrichment quando o
+digest das entradas não mudou. ``report["cache"][passo]`` recebe reused/fetched por
+passo e ``report["reused"]`` lista os passos que não tiveram nada de novo.
 """
 
 from __future__ import annotations
@@ -10,12 +19,46 @@ import logging
 import time
 import traceback
 from datetime import UTC, datetime
+from pathlib import Path
 from typing import Any
 
 from jobs.prospeccao import paths as pathutil
 
 logger = logging.getLogger(__name__)
 
+CACHED_STAGES = ("receita_parse", "cnefe", "build_enrichment")
+
+
+def stage_inputs(stage: str) -> tuple[list[Path], Any]:
+    """(input files, params) whose digest decides whether a downstream stage can be skipped.
+
+    ``params`` also covers what the stage writes (target database, output files), so a
+    reset database or a deleted output reruns the stage even with unchanged inputs.
+    """
+    dirs = pathutil.ensure_raw_layout()
+    if stage == "receita_parse":
+        from jobs.prospeccao.receita_parse import receita_parse_params
+
+        return sorted(dirs["receita"].glob("*.zip")), receita_parse_params
+    if stage == "cnefe":
+        from jobs.prospeccao.cnefe_index import cnefe_params
+
+        return sorted(dirs["cnefe"].glob("*.zip")), cnefe_params
+    if stage == "build_enrichment":
+        from jobs.prospeccao.build_enrichment_staging import enrichment_inputs, enrichment_params
+
+        return enrichment_inputs(), enrichment_params
+    raise ValueError(f"Stage sem cache: {stage} (suportados: {', '.join(CACHED_STAGES)})")
+
+
+def run_stage_if_changed(stage: str, fn: Any, *, cache: Any | None = None) -> Any:
+    """Run ``fn`` only when the inputs of ``stage`` changed since its last successful run."""
+    from jobs.prospeccao.harvest_cache import HarvestCache
+
+    cache = cache if cache is not None else HarvestCache()
+    inputs, params = stage_inputs(stage)
+    return cache.run_stage(stage, inputs, fn, params=params)
+
 
 def run_harvest(
     steps: list[str] | None = None,
@@ -28,9 +71,11 @@ def run_harvest(
     pncp_max_pages: int = 80,
     ckan_org_max_pkg: int = 8,
     ckan_org_max_mb: int = 25,
+    use_cache: bool = True,
 ) -> dict[str, Any]:
     """
     Executa passos na ordem; erros num passo não cancelam os seguintes (acumulam em errors).
+    ``use_cache=False`` força todos os passos (sem GET condicional nem skip por digest).
     """
     steps = steps or [
         "ibge",
@@ -49,9 +94,17 @@ def run_harvest(
         "errors": {},
         "durations_s": {},
     }
+    cache = None
+    if use_cache and not dry_run:
+        from jobs.prospeccao.harvest_cache import HarvestCache
+
+        cache = HarvestCache()
+        report["cache"] = {}
+        report["reused"] = []
 
     def run(name: str, fn: Any) -> None:
         started = time.perf_counter()
+        before = dict(cache.counters) if cache is not None else None
         logger.info("Harvest step start: %s", name)
         if dry_run:
             report["ok"][name] = "skipped_dry_run"
@@ -72,6 +125,14 @@ def run_harvest(
                     report["ok"][name] = out
             else:
                 report["ok"][name] = out
+            if isinstance(out, dict) and isinstance(out.get("cache"), dict):
+                report.setdefault("cache", {})[name] = out["cache"]
+            if cache is not None:
+                delta = {k: v - before[k] for k, v in cache.counters.items() if v != before[k]}
+                if delta:
+                    report["cache"].setdefault(name, {}).update(delta)
+                    if delta.get("stages_skipped") or (delta.get("reused") and not delta.get("fetched")):
+                        report["reused"].append(name)
             elapsed = time.perf_counter() - started
             report["durations_s"][name] = round(elapsed, 3)
             logger.info("Harvest step ok: %s duration=%.3fs", name, elapsed)
@@ -91,12 +152,12 @@ def run_harvest(
     if "geoportal" in steps:
         from jobs.prospeccao.geoportal_ingest import sync_ra_geojson
 
-        run("geoportal_ra", lambda: sync_ra_geojson(max_features=5000))
+        run("geoportal_ra", lambda: sync_ra_geojson(max_features=5000, cache=cache))
 
     if "ckan_meta" in steps:
         from jobs.prospeccao.ckan_ingest import sync_catalog_metadata
 
-        run("ckan_meta", lambda: sync_catalog_metadata(max_packages=ckan_max))
+        run("ckan_meta", lambda: sync_catalog_metadata(max_packages=ckan_max, cache=cache))
 
     if "ckan_links" in steps:
         from jobs.prospeccao.ckan_ingest import validate_ckan_resource_links
@@ -119,7 +180,7 @@ def run_harvest(
 
         run(
             "pncp_contratacoes",
-            lambda: sync_contratacoes_df_periodo(dias=pncp_dias, max_pages=pncp_max_pages),
+            lambda: sync_contratacoes_df_periodo(dias=pncp_dias, max_pages=pncp_max_pages, cache=cache),
         )
 
     if "ckan_orgs" in steps:
@@ -143,10 +204,18 @@ def run_harvest(
 
         run("inep_probe", lambda: probe_censo_escolar_years() or "none")
 
+    def _cached(stage: str, fn: Any) -> Any:
+        return run_stage_if_changed(stage, fn, cache=cache) if cache is not None else fn()
+
     if "cnefe" in steps:
-        from jobs.prospeccao.cnefe_ingest import sync_cnefe
+        from jobs.prospeccao.cnefe_ingest import download_cnefe_zips, sync_cnefe
+
+        def _cnefe():
+            downloaded = download_cnefe_zips(cache=cache)
+            result = _cached("cnefe", lambda: sync_cnefe(download=False))
+            return {**result, "downloaded": [str(p) for p in downloaded]}
 
-        run("cnefe", lambda: sync_cnefe(download=True))
+        run("cnefe", _cnefe)
 
     if "receita_parse" in steps:
         from jobs.prospeccao import paths as _pathutil
@@ -160,7 +229,12 @@ def run_harvest(
                 db.commit()
             return result
 
-        run("receita_parse", _receita_parse)
+        run("receita_parse", lambda: _cached("receita_parse", _receita_parse))
+
+    if "build_enrichment" in steps:
+        from jobs.prospeccao.build_enrichment_staging import build_all_enrichment
+
+        run("build_enrichment", lambda: _cached("build_enrichment", build_all_enrichment))
 
     if "normalize" in steps:
         from jobs.prospeccao.db import session_scope
@@ -236,13 +310,16 @@ def run_harvest(
                 result = enrich_via_brasilapi(
                     db,
                     batch_size=_config.BRASILAPI_BATCH_SIZE,
-                    sleep_s=_config.BRASILAPI_SLEEP_S,
+                    rate_per_s=_config.BRASILAPI_RATE_PER_S,
                 )
                 db.commit()
             return result
 
         run("brasilapi_enrich", _brasilapi)
 
+    if cache is not None:
+        cache.save()
+        report["cache"]["_total"] = cache.report()
     report["finished_at"] = datetime.now(UTC).isoformat()
     logger.info(
         "Harvest complete: ok=%s errors=%s report=%s",
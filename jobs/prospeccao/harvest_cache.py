@@ -0,0 +1,236 @@
+"""Conditional-GET and content-hash cache shared by the harvest steps.
+
+Stored in ``<RAW_DIR>/_manifest/harvest_cache.json`` (bodies of cached JSON
+responses under ``_manifest/http_bodies/``)::
+
+    urls     {key: {etag, last_modified, sha256, size, checked_at, path?}}
+    files    {path: {size, mtime_ns, sha256}}        input fingerprints (hash reuse)
+    stages   {stage: {inputs, finished_at, duration_s}}  digest of the inputs of the last run
+
+- :meth:`HarvestCache.get_json` sends ``If-None-Match`` / ``If-Modified-Since``;
+  a 304 (or a 200 with the same SHA-256) counts as *reused*.
+- :func:`jobs.prospeccao.http_util.download_url_to_path` accepts ``cache=`` and
+  skips a file when the server validators still match what was downloaded.
+- :meth:`HarvestCache.run_stage` skips a downstream stage (receita_parse, cnefe,
+  build_enrichment) when the digest of its input files and params is unchanged.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
+
+from jobs.prospeccao import paths as pathutil
+from jobs.prospeccao.http_util import request_timeout, session
+from jobs.prospeccao.receita_cache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "harvest_cache.json"
+BODY_DIRNAME = "http_bodies"
+
+
+def _url_key(url: str, params: dict[str, Any] | None = None) -> str:
+    if not params:
+        return url
+    return f"{url}?{urlencode(sorted((k, str(v)) for k, v in params.items()))}"
+
+
+def _digest(payload: Any) -> str:
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class HarvestCache:
+    """Validators, content hashes and stage input digests for one RAW_DIR."""
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = Path(path) if path else pathutil.ensure_raw_layout()["meta"] / CACHE_NAME
+        self.body_dir = self.path.parent / BODY_DIRNAME
+        self.data = self._load()
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {"reused": 0, "fetched": 0, "stages_skipped": 0, "stages_run": 0}
+        self.reused: list[str] = []
+        self.stages_skipped: list[str] = []
+
+    def _load(self) -> dict[str, Any]:
+        data: dict[str, Any] = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                logger.warning("Harvest cache ilegível em %s — ignorado", self.path)
+        for section in ("urls", "files", "stages"):
+            data.setdefault(section, {})
+        return data
+
+    def save(self) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+            tmp.replace(self.path)
+
+    def _mark(self, key: str, reused: bool) -> None:
+        with self._lock:
+            if reused:
+                self.counters["reused"] += 1
+                self.reused.append(key)
+            else:
+                self.counters["fetched"] += 1
+
+    # -- HTTP --------------------------------------------------------------
+
+    def conditional_headers(self, key: str) -> dict[str, str]:
+        entry = self.data["urls"].get(key) or {}
+        headers: dict[str, str] = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _body_path(self, key: str) -> Path:
+        return self.body_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json"
+
+    def _record(self, key: str, headers: Any, sha256: str | None, size: int, **extra: Any) -> None:
+        with self._lock:
+            self.data["urls"][key] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "sha256": sha256,
+                "size": size,
+                "checked_at": datetime.now(UTC).isoformat(),
+                **extra,
+            }
+
+    def get_json(
+        self,
+        url: str,
+        *,
+        params: dict[str, Any] | None = None,
+        timeout: float | None = None,
+    ) -> Any:
+        """GET JSON with stored validators; a 304 returns the cached body."""
+        key = _url_key(url, params)
+        body_path = self._body_path(key)
+        headers = self.conditional_headers(key) if body_path.exists() else {}
+        r = session().get(url, params=params, headers=headers, timeout=request_timeout(timeout))
+        if r.status_code == 304 and body_path.exists():
+            logger.debug("Harvest cache: 304 %s", key[:160])
+            self._mark(key, True)
+            with self._lock:
+                self.data["urls"][key]["checked_at"] = datetime.now(UTC).isoformat()
+            return json.loads(body_path.read_text(encoding="utf-8"))
+        r.raise_for_status()
+        content = r.content
+        sha = hashlib.sha256(content).hexdigest()
+        previous = self.data["urls"].get(key) or {}
+        self._mark(key, previous.get("sha256") == sha)
+        data = r.json()
+        self.body_dir.mkdir(parents=True, exist_ok=True)
+        body_path.write_bytes(content)
+        self._record(key, r.headers, sha, len(content))
+        return data
+
+    # -- Downloads (called from http_util.download_url_to_path) -------------
+
+    def file_unchanged(self, url: str, dest_path: Path, head_status: int | None, head_headers: Any) -> str | None:
+        """SHA-256 of ``dest_path`` when the server says it did not change since it was downloaded."""
+        entry = self.data["urls"].get(url)
+        if not entry or entry.get("path") != str(dest_path) or not dest_path.exists():
+            return None
+        st = dest_path.stat()
+        if st.st_size != entry.get("size") or st.st_mtime_ns != entry.get("mtime_ns"):
+            return None
+        if head_status != 304:
+            etag = head_headers.get("ETag") if head_headers is not None else None
+            modified = head_headers.get("Last-Modified") if head_headers is not None else None
+            if not (etag and etag == entry.get("etag")) and not (modified and modified == entry.get("last_modified")):
+                return None
+        self._mark(url, True)
+        return entry.get("sha256")
+
+    def record_file(
+        self, url: str, dest_path: Path, head_headers: Any, sha256: str | None, *, reused: bool = False
+    ) -> None:
+        st = dest_path.stat()
+        self._mark(url, reused)
+        self._record(
+            url, head_headers if head_headers is not None else {}, sha256, st.st_size,
+            path=str(dest_path), mtime_ns=st.st_mtime_ns,
+        )
+        if sha256:
+            # Downstream stages read this fingerprint instead of re-hashing the download.
+            with self._lock:
+                self.data["files"][str(dest_path)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256}
+
+    # -- Downstream stages --------------------------------------------------
+
+    def inputs_digest(self, paths: Iterable[Path], params: dict[str, Any] | None = None) -> str:
+        """Digest of input file contents (hash reused while size + mtime are unchanged) and params."""
+        fingerprints = []
+        for path in sorted({Path(p) for p in paths if Path(p).is_file()}):
+            fp = file_fingerprint(path, self.data["files"].get(str(path)))
+            with self._lock:
+                self.data["files"][str(path)] = fp
+            fingerprints.append((str(path), fp["sha256"]))
+        return _digest({"files": fingerprints, "params": params or {}})
+
+    def run_stage(
+        self,
+        stage: str,
+        inputs: Iterable[Path],
+        fn: Callable[[], Any],
+        *,
+        params: dict[str, Any] | Callable[[], dict[str, Any]] | None = None,
+    ) -> Any:
+        """Run ``fn`` unless the inputs digest matches the last successful run.
+
+        ``params`` may be a callable when it depends on what ``fn`` writes (e.g. which
+        outputs exist); it is then re-evaluated after the run before recording.
+        """
+        inputs = list(inputs)
+        resolve = params if callable(params) else (lambda: params)
+        digest = self.inputs_digest(inputs, resolve())
+        previous = self.data["stages"].get(stage) or {}
+        if inputs and previous.get("inputs") == digest:
+            logger.info("Harvest cache: %s sem mudanças nas entradas — a saltar", stage)
+            with self._lock:
+                self.counters["stages_skipped"] += 1
+                self.stages_skipped.append(stage)
+            return {
+                "skipped": "inputs_unchanged",
+                "inputs": len(inputs),
+                "last_run": previous.get("finished_at"),
+                "cache": {"stage": "skipped", "inputs_digest": digest},
+            }
+        started = time.perf_counter()
+        result = fn()
+        if callable(params):
+            digest = self.inputs_digest(inputs, resolve())
+        with self._lock:
+            self.counters["stages_run"] += 1
+            self.data["stages"][stage] = {
+                "inputs": digest,
+                "finished_at": datetime.now(UTC).isoformat(),
+                "duration_s": round(time.perf_counter() - started, 3),
+            }
+        self.save()
+        return result
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "path": str(self.path),
+            **self.counters,
+            "reused_urls": list(self.reused),
+            "stages_skipped_list": list(self.stages_skipped),
+        }
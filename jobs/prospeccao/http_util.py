@@ -3,9 +3,15 @@
 from __future__ import annotations
 
 import hashlib
+import json
 import logging
+import os
+import threading
 import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Any, BinaryIO
 
 import requests
@@ -26,18 +32,25 @@ def request_timeout(timeout: float | None = None) -> float | tuple[float, float]
     return (config.HTTP_CONNECT_TIMEOUT_S, config.HTTP_READ_TIMEOUT_S)
 
 
-def build_session() -> requests.Session:
+def build_session(
+    *,
+    retry_statuses: tuple[int, ...] = (429, 500, 502, 503, 504),
+    pool_maxsize: int = 10,
+) -> requests.Session:
+    """Session com Retry; ``retry_statuses`` sem 429 deixa o rate limit para o chamador."""
     s = requests.Session()
     retries = Retry(
         total=config.HTTP_MAX_RETRIES,
         connect=config.HTTP_MAX_RETRIES,
         read=config.HTTP_MAX_RETRIES,
         backoff_factor=config.HTTP_BACKOFF_FACTOR,
-        status_forcelist=(429, 500, 502, 503, 504),
+        status_forcelist=retry_statuses,
         allowed_methods=("GET", "POST", "HEAD"),
         raise_on_status=False,
+        # urllib3 retries 429/503 with Retry-After even outside status_forcelist.
+        respect_retry_after_header=429 in retry_statuses,
     )
-    adapter = HTTPAdapter(max_retries=retries, pool_maxsize=10)
+    adapter = HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize)
     s.mount("https://", adapter)
     s.mount("http://", adapter)
     s.headers.update(
@@ -53,7 +66,8 @@ def build_session() -> requests.Session:
 def session() -> requests.Session:
     global _SESSION
     if _SESSION is None:
-        _SESSION = build_session()
+        # Downloads concorrentes (URLs x segmentos) partilham esta Session.
+        _SESSION = build_session(pool_maxsize=max(10, config.DOWNLOAD_WORKERS * config.DOWNLOAD_SEGMENTS))
     return _SESSION
 
 
@@ -83,6 +97,8 @@ class DownloadResult:
     skipped: bool
     truncated: bool
     sha256: str | None = None
+    segments: int = 1
+    error: str | None = None
 
 
 @dataclass
@@ -97,16 +113,23 @@ class LinkCheckResult:
     error: str | None = None
 
 
-def _sha256_stream(fp: BinaryIO, chunk: int = 1 << 20) -> str:
-    h = hashlib.sha256()
-    while True:
-        b = fp.read(chunk)
+def _sha256_stream(fp: BinaryIO, chunk: int = 1 << 20, *, hasher: Any | None = None, limit: int | None = None) -> str:
+    h = hasher if hasher is not None else hashlib.sha256()
+    remaining = limit
+    while remaining is None or remaining > 0:
+        b = fp.read(chunk if remaining is None else min(chunk, remaining))
         if not b:
             break
         h.update(b)
+        if remaining is not None:
+            remaining -= len(b)
     return h.hexdigest()
 
 
+def _deadline() -> float | None:
+    return time.monotonic() + config.DOWNLOAD_MAX_SECONDS if config.DOWNLOAD_MAX_SECONDS > 0 else None
+
+
 def stream_download(
     url: str,
     dest: BinaryIO,
@@ -115,8 +138,12 @@ def stream_download(
     chunk_size: int = 1 << 20,
     pause_s: float = 0.0,
     resume_offset: int = 0,
+    hasher: Any | None = None,
 ) -> int:
-    """Grava corpo; resume_offset usa header Range (servidor deve suportar)."""
+    """Grava corpo; resume_offset usa header Range (servidor deve suportar).
+
+    ``hasher`` (ex.: ``hashlib.sha256()``) é alimentado com cada chunk gravado.
+    """
     headers: dict[str, str] = {}
     if resume_offset > 0:
         headers["Range"] = f"bytes={resume_offset}-"
@@ -141,10 +168,15 @@ def stream_download(
             if not chunk:
                 continue
             if max_bytes is not None and written - mode_start + len(chunk) > max_bytes:
-                dest.write(chunk[: max_bytes - (written - mode_start)])
+                chunk = chunk[: max_bytes - (written - mode_start)]
+                dest.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
                 written = mode_start + max_bytes
                 break
             dest.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
             written += len(chunk)
             if written >= next_progress:
                 logger.info("Download progress: %.1f MB url=%s", written / (1024 * 1024), url[:120])
@@ -159,6 +191,210 @@ def stream_download(
     return written
 
 
+# ---------------------------------------------------------------------------
+# Segmented (Range) downloads with a resumable manifest
+# ---------------------------------------------------------------------------
+
+_MANIFEST_SUFFIX = ".part.json"
+_MANIFEST_SAVE_EVERY_S = 1.0
+
+
+def _manifest_path(dest_path: Path) -> Path:
+    return dest_path.with_name(dest_path.name + _MANIFEST_SUFFIX)
+
+
+class _SegmentManifest:
+    """``<dest>.part.json``: url, size and per-segment ``[start, end, written]``.
+
+    ``written`` is only advanced after the bytes hit the file, so a crash can
+    re-download part of a segment but never skip one.
+    """
+
+    def __init__(self, path: Path, url: str, size: int, segments: list[list[int]]) -> None:
+        self.path = path
+        self.url = url
+        self.size = size
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, path: Path, url: str, size: int) -> _SegmentManifest | None:
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if raw.get("url") != url or raw.get("size") != size:
+            return None
+        return cls(path, url, size, [list(seg) for seg in raw.get("segments") or []])
+
+    @classmethod
+    def plan(cls, path: Path, url: str, size: int, n_segments: int) -> _SegmentManifest:
+        bounds = [size * i // n_segments for i in range(n_segments + 1)]
+        segments = [[bounds[i], bounds[i + 1] - 1, 0] for i in range(n_segments) if bounds[i + 1] > bounds[i]]
+        return cls(path, url, size, segments)
+
+    def done(self, index: int) -> bool:
+        start, end, written = self.segments[index]
+        return written >= end - start + 1
+
+    def advance(self, index: int, n_bytes: int, *, force: bool = False) -> None:
+        with self._lock:
+            self.segments[index][2] += n_bytes
+            if force or time.monotonic() - self._saved_at >= _MANIFEST_SAVE_EVERY_S:
+                self._save_locked()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(
+            json.dumps({"url": self.url, "size": self.size, "segments": self.segments}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+        self._saved_at = time.monotonic()
+
+
+def _fetch_segment(
+    url: str,
+    dest_path: Path,
+    manifest: _SegmentManifest,
+    index: int,
+    *,
+    chunk_size: int,
+    deadline: float | None,
+) -> None:
+    start, end, written = manifest.segments[index]
+    offset = start + written
+    if offset > end:
+        return
+    with session().get(
+        url,
+        stream=True,
+        timeout=request_timeout(),
+        headers={"Range": f"bytes={offset}-{end}"},
+    ) as resp:
+        if resp.status_code != 206:
+            msg = f"Range ignored: status={resp.status_code} segment={index} url={url[:160]}"
+            raise requests.HTTPError(msg, response=resp)
+        with dest_path.open("r+b") as fp:
+            fp.seek(offset)
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                chunk = chunk[: end + 1 - offset]
+                fp.write(chunk)
+                fp.flush()
+                offset += len(chunk)
+                manifest.advance(index, len(chunk))
+                if offset > end:
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(
+                        f"Download exceeded TRONIK_DOWNLOAD_MAX_SECONDS={config.DOWNLOAD_MAX_SECONDS}: {url}"
+                    )
+    if offset <= end:
+        raise requests.ConnectionError(f"Segment {index} truncated at byte {offset} (expected {end + 1}): {url[:160]}")
+    manifest.advance(index, 0, force=True)
+
+
+def download_segmented(
+    url: str,
+    dest_path: Path,
+    *,
+    size: int,
+    segments: int,
+    chunk_size: int = 1 << 20,
+    compute_hash: bool = True,
+) -> DownloadResult:
+    """
+    Descarrega ``size`` bytes em ``segments`` pedidos Range concorrentes para um
+    ficheiro pré-alocado. O progresso fica em ``<dest>.part.json``; uma nova
+    chamada retoma só os bytes em falta de cada segmento.
+
+    O SHA-256 do ficheiro é acumulado em ordem à medida que cada segmento
+    contíguo termina (lido da page cache logo após ser gravado), em vez de um
+    passe extra no fim.
+    """
+    manifest_path = _manifest_path(dest_path)
+    manifest = None
+    if dest_path.exists() and dest_path.stat().st_size == size:
+        manifest = _SegmentManifest.load(manifest_path, url, size)
+    if manifest is None:
+        manifest = _SegmentManifest.plan(manifest_path, url, size, max(1, segments))
+        with dest_path.open("wb") as fp:
+            fp.truncate(size)
+        manifest.save()
+    else:
+        logger.info(
+            "Retomando download segmentado (%d/%d segmentos completos): %s",
+            sum(manifest.done(i) for i in range(len(manifest.segments))), len(manifest.segments), dest_path.name,
+        )
+
+    logger.info("Download segmentado start: %s size=%s segments=%d", url[:160], size, len(manifest.segments))
+    deadline = _deadline()
+    hasher = hashlib.sha256() if compute_hash else None
+    hashed = 0  # segmentos já incluídos no hash
+    pending = [i for i in range(len(manifest.segments)) if not manifest.done(i)]
+    with dest_path.open("rb") as reader, ThreadPoolExecutor(
+        max_workers=max(1, len(pending)), thread_name_prefix="segment"
+    ) as pool:
+        futures = {
+            pool.submit(
+                _fetch_segment, url, dest_path, manifest, i, chunk_size=chunk_size, deadline=deadline
+            ): i
+            for i in pending
+        }
+        try:
+            for future in as_completed(futures):
+                future.result()
+                while hasher is not None and hashed < len(manifest.segments) and manifest.done(hashed):
+                    start, end, _ = manifest.segments[hashed]
+                    reader.seek(start)
+                    _sha256_stream(reader, chunk_size, hasher=hasher, limit=end - start + 1)
+                    hashed += 1
+        finally:
+            manifest.save()
+    if hasher is not None:
+        while hashed < len(manifest.segments):  # nada pendente (retoma de download já completo)
+            start, end, _ = manifest.segments[hashed]
+            with dest_path.open("rb") as reader:
+                reader.seek(start)
+                _sha256_stream(reader, chunk_size, hasher=hasher, limit=end - start + 1)
+            hashed += 1
+    manifest_path.unlink(missing_ok=True)
+    logger.info("Download segmentado complete: %.1f MB url=%s", size / (1024 * 1024), url[:120])
+    return DownloadResult(
+        str(dest_path), size, False, False, hasher.hexdigest() if hasher else None, len(manifest.segments)
+    )
+
+
+def _head(url: str, headers: dict[str, str] | None) -> tuple[int | None, Any, str | None, bool]:
+    """HEAD -> (status, headers, Content-Length, Accept-Ranges: bytes); falhas viram (None, None, None, False)."""
+    try:
+        head = session().head(url, allow_redirects=True, timeout=request_timeout(), headers=headers or {})
+    except requests.RequestException:
+        return None, None, None, False
+    cl: str | None = None
+    ar = False
+    if head.ok and head.status_code != 304:
+        cl = head.headers.get("Content-Length")
+        ar = (head.headers.get("Accept-Ranges") or "").lower() == "bytes"
+    head.close()
+    return head.status_code, head.headers, cl, ar
+
+
+def _verify_sha256(result: DownloadResult, expected_sha256: str | None) -> DownloadResult:
+    if expected_sha256 and result.sha256 and result.sha256.lower() != expected_sha256.lower():
+        raise ValueError(
+            f"SHA-256 divergente para {result.path}: esperado {expected_sha256}, obtido {result.sha256}"
+        )
+    return result
+
+
 def download_url_to_path(
     url: str,
     dest_path: Any,
@@ -167,25 +403,60 @@ def download_url_to_path(
     resume: bool = True,
     skip_if_same_size: bool = True,
     compute_hash: bool = False,
+    segments: int | None = None,
+    expected_sha256: str | None = None,
+    cache: Any | None = None,
 ) -> DownloadResult:
     """
     Descarrega URL para ficheiro. Se resume=True e o servidor anunciar Content-Length
     igual ao ficheiro existente, não rebaixa. Se Range suportado e ficheiro parcial,
     tenta continuar.
+
+    Com ``Accept-Ranges: bytes`` e ficheiro >= TRONIK_DOWNLOAD_SEGMENT_MIN_MB, divide
+    em ``segments`` (default TRONIK_DOWNLOAD_SEGMENTS) pedidos Range concorrentes.
+    O hash é calculado durante o streaming; ``expected_sha256`` valida o resultado.
+
+    ``cache`` (:class:`jobs.prospeccao.harvest_cache.HarvestCache`) envia o HEAD com
+    ``If-None-Match``/``If-Modified-Since`` e salta o ficheiro se o servidor
+    confirmar que não mudou desde o último download.
     """
     dest_path.parent.mkdir(parents=True, exist_ok=True)
-    cl: str | None = None
-    ar = False
-    try:
-        head = session().head(url, allow_redirects=True, timeout=request_timeout())
-        if head.ok:
-            cl = head.headers.get("Content-Length")
-            ar = (head.headers.get("Accept-Ranges") or "").lower() == "bytes"
-        head.close()
-    except requests.RequestException:
-        pass
+    compute_hash = compute_hash or bool(expected_sha256) or (cache is not None and max_bytes is None)
+    n_segments = config.DOWNLOAD_SEGMENTS if segments is None else segments
+    head_status, head_headers, cl, ar = _head(
+        url, cache.conditional_headers(url) if cache is not None and dest_path.exists() else None
+    )
+
+    def _finish(result: DownloadResult) -> DownloadResult:
+        _verify_sha256(result, expected_sha256)
+        if cache is not None and not result.truncated:
+            cache.record_file(url, dest_path, head_headers, result.sha256, reused=result.skipped)
+        return result
+
+    if cache is not None and max_bytes is None and not _manifest_path(dest_path).exists():
+        cached_sha = cache.file_unchanged(url, dest_path, head_status, head_headers)
+        if cached_sha is not None:
+            logger.info("Inalterado no servidor (validadores HTTP), a saltar: %s", dest_path.name)
+            return _verify_sha256(
+                DownloadResult(str(dest_path), dest_path.stat().st_size, True, False, cached_sha),
+                expected_sha256,
+            )
+    if head_status == 304:
+        # 304 mas o ficheiro local já não é o registado: repete o HEAD sem validadores.
+        head_status, head_headers, cl, ar = _head(url, None)
 
     expected = int(cl) if cl and cl.isdigit() else None
+    manifest_path = _manifest_path(dest_path)
+    # Ficheiro pré-alocado de um download segmentado interrompido: tamanho final, conteúdo parcial.
+    if manifest_path.exists():
+        if resume and ar and expected is not None and max_bytes is None:
+            result = download_segmented(
+                url, dest_path, size=expected, segments=n_segments, compute_hash=compute_hash
+            )
+            return _finish(result)
+        manifest_path.unlink(missing_ok=True)
+        dest_path.unlink(missing_ok=True)
+
     if skip_if_same_size and expected is not None and dest_path.exists():
         cur = dest_path.stat().st_size
         if cur == expected and max_bytes is None:
@@ -194,7 +465,12 @@ def download_url_to_path(
             if compute_hash:
                 with dest_path.open("rb") as fp:
                     h = _sha256_stream(fp)
-            return DownloadResult(str(dest_path), cur, True, False, h)
+            return _finish(DownloadResult(str(dest_path), cur, True, False, h))
+
+    min_segment_bytes = config.DOWNLOAD_SEGMENT_MIN_MB * 1024 * 1024
+    if ar and expected is not None and max_bytes is None and n_segments > 1 and expected >= min_segment_bytes:
+        result = download_segmented(url, dest_path, size=expected, segments=n_segments, compute_hash=compute_hash)
+        return _finish(result)
 
     offset = 0
     if resume and dest_path.exists() and expected is not None and ar:
@@ -203,17 +479,50 @@ def download_url_to_path(
             offset = cur
             logger.info("Retomando download a partir de byte %s: %s", offset, dest_path.name)
 
+    hasher = None
+    if compute_hash and max_bytes is None:
+        hasher = hashlib.sha256()
+        if offset:
+            with dest_path.open("rb") as fp:
+                _sha256_stream(fp, hasher=hasher, limit=offset)
+
     mode = "ab" if offset else "wb"
     truncated = max_bytes is not None
     with dest_path.open(mode) as fp:
-        n = stream_download(url, fp, max_bytes=max_bytes, resume_offset=offset)
+        n = stream_download(url, fp, max_bytes=max_bytes, resume_offset=offset, hasher=hasher)
+
+    sha = hasher.hexdigest() if hasher is not None else None
+    return _finish(DownloadResult(str(dest_path), n, False, truncated, sha))
+
 
-    sha = None
-    if compute_hash and (max_bytes is None):
-        with dest_path.open("rb") as fp:
-            sha = _sha256_stream(fp)
+def download_many(
+    items: Iterable[tuple[str, Path]],
+    *,
+    workers: int | None = None,
+    **kwargs: Any,
+) -> list[DownloadResult]:
+    """
+    Descarrega vários ``(url, dest)`` em paralelo (default TRONIK_DOWNLOAD_WORKERS).
 
-    return DownloadResult(str(dest_path), n, False, truncated, sha)
+    ``kwargs`` seguem para :func:`download_url_to_path`. Resultados na ordem de
+    entrada; uma falha não cancela os restantes e fica em ``DownloadResult.error``.
+    """
+    jobs = list(items)
+    n_workers = max(1, min(len(jobs) or 1, workers if workers is not None else config.DOWNLOAD_WORKERS))
+    results: list[DownloadResult | None] = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="download") as pool:
+        futures = {
+            pool.submit(download_url_to_path, url, dest, **kwargs): i for i, (url, dest) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            url, dest = jobs[i]
+            try:
+                results[i] = future.result()
+            except Exception as exc:
+                logger.exception("Download falhou: %s -> %s", url[:160], dest)
+                results[i] = DownloadResult(str(dest), 0, False, False, error=str(exc))
+    return [r for r in results if r is not None]
 
 
 def check_url(
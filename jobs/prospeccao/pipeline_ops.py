@@ -151,7 +151,7 @@ def run_scheduled_pipeline() -> dict[str, Any]:
 
     if (
         os.getenv("PROSPECCAO_BUILD_ENRICHMENT", "false").lower() == "true"
-        and not _step(["build-enrichment"])
+        and not _step(["build-enrichment", "--if-changed"])
     ):
         return {
             "ok": False,
@@ -33,11 +33,14 @@ def fetch_contratacoes_publicacao(
     codigo_modalidade_contratacao: int | None = None,
     codigo_municipio_ibge: str | None = None,
     tamanho_pagina: int = 20,
+    cache: Any | None = None,
 ) -> dict[str, Any]:
     """
     data_inicial / data_final: AAAAMMDD (manual PNCP consultas).
     Alguns ambientes exigem ``codigoModalidadeContratacao`` ou ``tamanhoPagina``.
+    ``cache`` (HarvestCache) faz GET condicional (ETag / Last-Modified).
     """
+    get = cache.get_json if cache is not None else get_json
     params: dict[str, Any] = {
         "dataInicial": data_inicial,
         "dataFinal": data_final,
@@ -54,19 +57,19 @@ def fetch_contratacoes_publicacao(
     throttle()
     url = _consulta_url("contratacoes/publicacao")
     try:
-        return get_json(url, params=params)
+        return get(url, params=params)
     except Exception as first:
         # Fallbacks comuns (documentação / versões de gateway)
         if codigo_modalidade_contratacao is None:
             params2 = dict(params)
             params2["codigoModalidadeContratacao"] = 8
             try:
-                return get_json(url, params=params2)
+                return get(url, params=params2)
             except Exception:
                 pass
         params3 = {k: v for k, v in params.items() if k != "uf"}
         try:
-            return get_json(url, params=params3)
+            return get(url, params=params3)
         except Exception:
             raise first from None
 
@@ -101,6 +104,7 @@ def sync_contratacoes_df_periodo(
     max_pages: int = 500,
     uf: str = "DF",
     tamanho_pagina: int = 20,
+    cache: Any | None = None,
 ) -> Path:
     """Últimos ``dias`` no DF; grava JSONL. Usa ``totalPaginas`` da API quando disponível."""
     end = date.today()
@@ -124,6 +128,7 @@ def sync_contratacoes_df_periodo(
                     uf=uf,
                     pagina=p,
                     tamanho_pagina=tamanho_pagina,
+                    cache=cache,
                 )
             except Exception as e:
                 logger.error("PNCP página %s: %s", p, e)
@@ -21,13 +21,22 @@ exponential distance decay, monotonic constraint map for XGBRanker.
 
 from __future__ import annotations
 
+import hashlib
 import json
 import math
 import os
+from collections.abc import Callable, Iterable, Mapping
 from datetime import datetime
 from typing import Any
 
+import numpy as np
+
 from banco_dados.utils.datetime_utils import coerce_naive_utc, utc_now_naive
+from banco_dados.utils.feature_blobs import (
+    FEATURE_BLOB_DTYPE,
+    codificar_features,
+    decodificar_features,
+)
 
 FEATURE_NAMES = [
     "cnae_ree_fit",
@@ -447,6 +456,356 @@ def build_feature_vector(
     return vector
 
 
+# ---------------------------------------------------------------------------
+# Columnar assembly (NumPy) — same values as build_feature_vector, n rows at once
+# ---------------------------------------------------------------------------
+
+# Input columns of build_feature_matrix. Missing columns are treated as all-None
+# (or 0 for the neighborhood counts / proxies). ``has_local`` marks rows that
+# have a LocalCandidato; ``local_*`` columns are ignored where it is False.
+FEATURE_INPUT_COLUMNS: tuple[str, ...] = (
+    "cnae_principal",
+    "cnae_secundarios_json",
+    "porte",
+    "situacao_cadastral",
+    "email",
+    "telefone",
+    "bairro",
+    "cep",
+    "endereco_normalizado",
+    "natureza_juridica",
+    "uf",
+    "municipio_ibge",
+    "data_abertura",
+    "has_local",
+    "latitude",
+    "longitude",
+    "ra",
+    "local_cep",
+    "local_bairro",
+    "endereco",
+    "geocode_quality",
+    "categoria_operacional",
+    "local_municipio_ibge",
+    "qid_total",
+    "qid_ree_compatible",
+    "osm_poi_ree_density",
+    "inep_institution_proxy",
+    "cnes_health_proxy",
+)
+
+_EMPRESA_ATTRS = (
+    "cnae_principal", "cnae_secundarios_json", "porte", "situacao_cadastral", "email", "telefone",
+    "bairro", "cep", "endereco_normalizado", "natureza_juridica", "uf", "municipio_ibge", "data_abertura",
+)
+_LOCAL_ATTRS = {
+    "latitude": "latitude",
+    "longitude": "longitude",
+    "ra": "ra",
+    "local_cep": "cep",
+    "local_bairro": "bairro",
+    "endereco": "endereco",
+    "geocode_quality": "geocode_quality",
+    "categoria_operacional": "categoria_operacional",
+    "local_municipio_ibge": "municipio_ibge",
+}
+
+
+def collect_feature_columns(
+    rows: Iterable[tuple[Any, Any | None, NeighborhoodContext | None, dict[str, float] | None]],
+) -> dict[str, list[Any]]:
+    """Gather ``build_feature_matrix`` input columns from (empresa, local, neighborhood, proxies)."""
+    cols: dict[str, list[Any]] = {name: [] for name in FEATURE_INPUT_COLUMNS}
+    for empresa, local, neighborhood, proxies in rows:
+        for attr in _EMPRESA_ATTRS:
+            cols[attr].append(getattr(empresa, attr, None))
+        cols["has_local"].append(bool(local))
+        for col, attr in _LOCAL_ATTRS.items():
+            cols[col].append(getattr(local, attr, None) if local is not None else None)
+        neighborhood = neighborhood or {}
+        cols["qid_total"].append(neighborhood.get("qid_total", 0))
+        cols["qid_ree_compatible"].append(neighborhood.get("qid_ree_compatible", 0))
+        proxies = proxies or {}
+        for key in ("osm_poi_ree_density", "inep_institution_proxy", "cnes_health_proxy"):
+            cols[key].append(proxies.get(key, 0.0))
+    return cols
+
+
+def _object_col(columns: Mapping[str, Any], name: str, n: int) -> np.ndarray:
+    values = columns.get(name)
+    if values is None:
+        return np.full(n, None, dtype=object)
+    arr = np.empty(n, dtype=object)
+    arr[:] = list(values)
+    return arr
+
+
+def _str_col(columns: Mapping[str, Any], name: str, n: int) -> np.ndarray:
+    """Unicode array with None -> "" (truthiness == non-empty, as in the scalar helpers)."""
+    values = columns.get(name)
+    if values is None:
+        return np.full(n, "", dtype=str)
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _float_col(columns: Mapping[str, Any], name: str, n: int, *, missing: float = np.nan) -> np.ndarray:
+    values = columns.get(name)
+    if values is None:
+        return np.full(n, missing, dtype=np.float64)
+    return np.array([missing if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def _int_col(columns: Mapping[str, Any], name: str, n: int) -> np.ndarray:
+    values = columns.get(name)
+    if values is None:
+        return np.zeros(n, dtype=np.int64)
+    return np.array([int(v) if v else 0 for v in values], dtype=np.int64)
+
+
+def _map_unique(values: np.ndarray, fn: Callable[[str], float]) -> np.ndarray:
+    """Apply a scalar helper once per distinct value (CNAE, porte, ... are low-cardinality)."""
+    if not len(values):
+        return np.zeros(0, dtype=np.float64)
+    uniq, inverse = np.unique(values, return_inverse=True)
+    mapped = np.array([fn(v) for v in uniq.tolist()], dtype=np.float64)
+    return mapped[inverse.reshape(-1)]
+
+
+def _public_proxy_category(category: str) -> float:
+    """``public_proxy_fit`` category branch; NaN means "fall back to the RA rule"."""
+    category = category.strip().lower()
+    if any(tok in category for tok in ("ti", "eletron", "eletro", "assistencia", "shopping")):
+        return 0.85
+    if any(tok in category for tok in ("escola", "saude", "saúde", "orgao", "órgão")):
+        return 0.45
+    return float("nan")
+
+
+def _age_days(values: np.ndarray, now: datetime) -> np.ndarray:
+    """Whole days since each date (NaN when missing), like ``(now - abertura).days``."""
+    stamps = np.array(
+        [
+            np.datetime64(coerce_naive_utc(v), "us") if v else np.datetime64("NaT")
+            for v in values.tolist()
+        ],
+        dtype="datetime64[us]",
+    )
+    valid = ~np.isnat(stamps)
+    days = np.full(len(stamps), np.nan)
+    delta = np.datetime64(now, "us") - stamps[valid]
+    days[valid] = np.floor_divide(delta, np.timedelta64(1, "D"))
+    return days
+
+
+def build_feature_matrix(
+    columns: Mapping[str, Any],
+    *,
+    now: datetime | None = None,
+) -> np.ndarray:
+    """``(n, len(FEATURE_NAMES))`` float32 matrix from column arrays (see FEATURE_INPUT_COLUMNS).
+
+    Row ``i`` equals ``build_feature_vector`` for the same empresa/local/neighborhood/
+    proxies, in ``FEATURE_NAMES`` order (up to float32 rounding). String features are
+    evaluated once per distinct value; numeric ones are plain array expressions.
+    ``now`` pins the reference date of ``age_years_log`` (default: utc_now_naive()).
+    """
+    from jobs.prospeccao import config
+
+    n = len(next(iter(columns.values()))) if columns else 0
+    out = np.zeros((n, len(FEATURE_NAMES)), dtype=np.float32)
+    if n == 0:
+        return out
+    col = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+    has_local = np.array(columns["has_local"], dtype=bool) if "has_local" in columns else np.zeros(n, bool)
+    cnae = _str_col(columns, "cnae_principal", n)
+    email = _str_col(columns, "email", n)
+    telefone = _str_col(columns, "telefone", n)
+    ra = _str_col(columns, "ra", n)
+    local_cep = _str_col(columns, "local_cep", n)
+    local_bairro = _str_col(columns, "local_bairro", n)
+    endereco = _str_col(columns, "endereco", n)
+    lat = _float_col(columns, "latitude", n)
+    lon = _float_col(columns, "longitude", n)
+    # local_* only exist when there is a local (scalar path reads getattr(None, ...) -> None).
+    for arr in (ra, local_cep, local_bairro, endereco):
+        arr[~has_local] = ""
+    lat[~has_local] = np.nan
+    lon[~has_local] = np.nan
+    present = {
+        name: np.char.str_len(_str_col(columns, name, n)) > 0
+        for name in ("porte", "bairro", "cep", "endereco_normalizado", "situacao_cadastral", "natureza_juridica")
+    }
+    has_cnae = np.char.str_len(cnae) > 0
+    has_email_field = np.char.str_len(email) > 0
+    has_phone_field = np.char.str_len(telefone) > 0
+    has_ra = np.char.str_len(ra) > 0
+    has_local_cep = np.char.str_len(local_cep) > 0
+    has_endereco = np.char.str_len(endereco) > 0
+    coords = ~np.isnan(lat) & ~np.isnan(lon)
+
+    # CNAE fit (primary + secondary)
+    out[:, col["cnae_ree_fit"]] = _map_unique(cnae, cnae_ree_fit)
+    sec_uniq, sec_inverse = np.unique(_str_col(columns, "cnae_secundarios_json", n), return_inverse=True)
+    sec_scores = np.array(
+        [cnae_secondary_scores(v or None) for v in sec_uniq.tolist()], dtype=np.float64
+    ).reshape(-1, 2)[sec_inverse.reshape(-1)]
+    out[:, col["cnae_secondary_max_fit"]] = sec_scores[:, 0]
+    out[:, col["cnae_secondary_hit_count"]] = sec_scores[:, 1]
+
+    out[:, col["porte_ordinal"]] = _map_unique(_str_col(columns, "porte", n), lambda v: porte_ordinal(v or None))
+    out[:, col["active_status"]] = _map_unique(
+        _str_col(columns, "situacao_cadastral", n), lambda v: active_status(v or None)
+    )
+
+    # Contact richness
+    has_email = np.char.find(email, "@") >= 0
+    has_phone = np.char.str_len(np.char.strip(telefone)) >= 8
+    domain = np.char.lower(np.char.strip(np.char.rpartition(email, "@")[:, 2]))
+    is_business = (np.char.str_len(domain) > 0) & ~np.isin(domain, list(_GENERIC_EMAIL_DOMAINS))
+    contact = np.where(is_business, 1.0, 0.85)
+    contact = np.where(has_email & ~has_phone, np.where(is_business, 0.60, 0.45), contact)
+    contact = np.where(has_phone & ~has_email, 0.30, contact)
+    contact = np.where(~has_email & ~has_phone, 0.0, contact)
+    out[:, col["contact_richness"]] = contact
+
+    # Data completeness: 9 empresa checks (+4 local checks when there is a local)
+    empresa_hits = (
+        has_cnae.astype(int) + present["porte"] + has_email_field + has_phone_field + present["bairro"]
+        + present["cep"] + present["endereco_normalizado"] + present["situacao_cadastral"]
+        + present["natureza_juridica"]
+    )
+    local_hits = (~np.isnan(lat)).astype(int) + ~np.isnan(lon) + has_ra + has_local_cep
+    out[:, col["data_completeness"]] = np.where(
+        has_local, (empresa_hits + local_hits) / 13.0, empresa_hits / 9.0
+    )
+
+    geocode_quality = np.nan_to_num(_float_col(columns, "geocode_quality", n, missing=0.0))
+    address_local = geocode_quality + has_local_cep + has_ra + has_endereco
+    address_empresa = present["cep"].astype(float) + present["bairro"] + present["endereco_normalizado"]
+    out[:, col["address_quality"]] = np.where(has_local, address_local, address_empresa) / 4.0
+
+    # Distance decay to the logistics base (NaN without coordinates)
+    lat1, lon1 = math.radians(SEDE_LAT), math.radians(SEDE_LNG)
+    lat2, lon2 = np.radians(lat), np.radians(lon)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    km = 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    out[:, col["logistics_proximity_exp"]] = np.exp(-km / 25.0)
+
+    days = _age_days(_object_col(columns, "data_abertura", n), now or utc_now_naive())
+    age = np.round(np.log1p(np.maximum(0.0, days / 365.25)), 4)
+    out[:, col["age_years_log"]] = np.nan_to_num(age, nan=0.0)
+
+    category = _map_unique(_str_col(columns, "categoria_operacional", n), _public_proxy_category)
+    category[~has_local] = np.nan
+    out[:, col["public_proxy_fit"]] = np.where(np.isnan(category), np.where(has_ra, 0.30, 0.15), category)
+
+    uf = np.char.upper(np.char.strip(_str_col(columns, "uf", n)))
+    municipio_ibge = _int_col(columns, "municipio_ibge", n)
+    local_municipio = _int_col(columns, "local_municipio_ibge", n)
+    local_municipio[~has_local] = 0
+    municipio_ibge = np.where(municipio_ibge != 0, municipio_ibge, local_municipio)
+    inner = np.isin(municipio_ibge, list(config.ENTORNO_INNER_RING))
+    ride = np.isin(municipio_ibge, list(config.RIDE_ENTORNO_MUNICIPIOS))
+    out[:, col["is_df_proper"]] = uf == "DF"
+    out[:, col["is_entorno_inner"]] = np.where(inner, 1.0, np.where(ride, 0.5, 0.0))
+
+    qid_total = _float_col(columns, "qid_total", n, missing=0.0)
+    qid_ree = _float_col(columns, "qid_ree_compatible", n, missing=0.0)
+    positive = qid_total > 0
+    safe_total = np.where(positive, qid_total, 1.0)
+    out[:, col["neighborhood_candidate_density"]] = np.where(
+        positive, np.minimum(np.log1p(safe_total) / math.log1p(500), 1.0), 0.0
+    )
+    out[:, col["neighborhood_ree_ratio"]] = np.where(positive, qid_ree / safe_total, 0.0)
+
+    out[:, col["has_geocode"]] = coords
+
+    # data_tier uses truthiness of lat/lon (0.0 counts as missing there)
+    tier_coords = has_local & coords & (lat != 0) & (lon != 0)
+    tier_ra = has_local & (has_ra | (np.char.str_len(local_bairro) > 0))
+    tier_address = (has_local & has_endereco) | present["endereco_normalizado"]
+    out[:, col["data_tier"]] = np.where(
+        tier_coords & has_cnae & tier_ra,
+        1.0,
+        np.where(tier_coords | (has_cnae & tier_ra) | (tier_address & tier_ra), 0.5, 0.1),
+    )
+
+    for key in ("osm_poi_ree_density", "inep_institution_proxy", "cnes_health_proxy"):
+        out[:, col[key]] = _float_col(columns, key, n, missing=0.0)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Binary feature storage (snapshot features_blob)
+# ---------------------------------------------------------------------------
+
+# Little-endian float32, one value per FEATURE_NAMES entry, in that order
+# (format owned by banco_dados.utils.feature_blobs, shared with the ORM model).
+
+
+def feature_schema_hash(names: Iterable[str] = FEATURE_NAMES) -> str:
+    """Short digest of (schema version, feature order, dtype) stamped on every blob."""
+    payload = json.dumps([FEATURE_SCHEMA_VERSION, list(names), FEATURE_BLOB_DTYPE.str])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+FEATURE_SCHEMA_HASH = feature_schema_hash()
+
+
+def encode_feature_blob(features: Mapping[str, float] | np.ndarray) -> bytes:
+    """Serialize one feature vector (dict or FEATURE_NAMES-aligned row) to bytes."""
+    if isinstance(features, Mapping):
+        return codificar_features([float(features.get(name, 0.0)) for name in FEATURE_NAMES])
+    return codificar_features(features)
+
+
+def feature_vector_hash(blob: bytes) -> str:
+    """Content hash of one encoded feature vector (change detection for incremental scoring)."""
+    return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+
+def decode_feature_blobs(blobs: Iterable[bytes]) -> np.ndarray:
+    """Concatenate blobs into one ``(n, len(FEATURE_NAMES))`` float32 matrix."""
+    return decodificar_features(blobs, len(FEATURE_NAMES))
+
+
+def snapshot_feature_matrix(snapshots: Iterable[Any]) -> np.ndarray:
+    """Feature matrix for snapshot rows, read from ``features_blob``.
+
+    Rows without a blob (or stamped with another schema hash) fall back to
+    ``features_json``, so snapshots built before the binary format still load.
+    """
+    snapshots = list(snapshots)
+    blobs = [getattr(s, "features_blob", None) for s in snapshots]
+    current = [
+        blob is not None and getattr(s, "feature_schema_hash", None) == FEATURE_SCHEMA_HASH
+        for s, blob in zip(snapshots, blobs, strict=True)
+    ]
+    if all(current):
+        return decode_feature_blobs(blobs)
+    out = np.empty((len(snapshots), len(FEATURE_NAMES)), dtype=np.float32)
+    idx = [i for i, ok in enumerate(current) if ok]
+    if idx:
+        out[idx] = decode_feature_blobs(blobs[i] for i in idx)
+    for i, ok in enumerate(current):
+        if not ok:
+            features = json.loads(snapshots[i].features_json or "{}")
+            out[i] = [float(features.get(name, 0.0)) for name in FEATURE_NAMES]
+    return out
+
+
+def feature_dicts(matrix: np.ndarray) -> list[dict[str, float]]:
+    """Row dicts for heuristic scoring / ``top_reasons``.
+
+    Keys are in sorted order, like the ``sort_keys`` JSON they replace, so ties in
+    ``top_reasons`` fallback ranking resolve the same way.
+    """
+    order = sorted(range(len(FEATURE_NAMES)), key=FEATURE_NAMES.__getitem__)
+    names = [FEATURE_NAMES[j] for j in order]
+    return [dict(zip(names, row, strict=True)) for row in matrix[:, order].tolist()]
+
+
 # ---------------------------------------------------------------------------
 # Listwise query id (LTR groups) — geography-first to avoid monolithic "df"
 # ---------------------------------------------------------------------------
@@ -0,0 +1,274 @@
+"""Columnar (Parquet) cache of the DF+RIDE-filtered Receita dump.
+
+``receita_parse`` spends most of its time decompressing and re-parsing ~50M
+Estabelecimentos rows to keep <2% of them. This module stores, per
+``Estabelecimentos{i}.zip``, one Parquet partition with the filtered rows already
+joined with their Empresas fields, so later runs (and ``rfb_estabelecimentos_enrich``)
+read a few MB of columns instead of the raw ZIPs.
+
+Layout (``<receita_dir>/_parquet_dfride/``)::
+
+    manifest.json                       fingerprints + partition keys + scan stats
+    Estabelecimentos0.parquet ... 9     one partition per source ZIP
+
+A partition is valid while its key matches: SHA-256 of the source ZIP, of every
+Empresas*.zip, of the Municipios lookup and of the filter definition. ZIP hashes are
+only recomputed when size or mtime change. pyarrow is optional: without it the cache
+is disabled and ``receita_parse`` scans the ZIPs as before.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any
+
+from jobs.prospeccao import config
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = "_parquet_dfride"
+MANIFEST_NAME = "manifest.json"
+# Bump when the partition schema or the DF+RIDE filter semantics change.
+CACHE_FORMAT_VERSION = 1
+
+# First 28 Estabelecimentos columns (same names as rfb_estabelecimentos_enrich.RFB_COLS).
+EST_COLUMNS: tuple[str, ...] = (
+    "cnpj_basico",
+    "cnpj_ordem",
+    "cnpj_dv",
+    "identificador_matriz_filial",
+    "nome_fantasia",
+    "situacao_cadastral",
+    "data_situacao_cadastral",
+    "motivo_situacao_cadastral",
+    "nome_cidade_exterior",
+    "pais",
+    "data_inicio_atividade",
+    "cnae_fiscal_principal",
+    "cnae_fiscal_secundaria",
+    "tipo_logradouro",
+    "logradouro",
+    "numero",
+    "complemento",
+    "bairro",
+    "cep",
+    "uf",
+    "municipio",
+    "ddd_1",
+    "telefone_1",
+    "ddd_2",
+    "telefone_2",
+    "ddd_fax",
+    "fax",
+    "correio_eletronico",
+)
+EMP_COLUMNS: tuple[str, ...] = ("razao_social", "natureza_juridica", "porte", "capital_social")
+
+# Scan counters replayed from the manifest on a cache hit (writer counters are not cached).
+SCAN_STAT_KEYS: tuple[str, ...] = (
+    "total_rows_scanned",
+    "rows_filtered_in",
+    "rows_skipped_uf",
+    "rows_skipped_go_not_ride",
+    "rows_skipped_invalid_cnpj",
+    "rows_df",
+    "rows_go_ride",
+    "files_processed",
+)
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_cache_dir(receita_dir: Path) -> Path:
+    return Path(receita_dir) / CACHE_DIRNAME
+
+
+def _sha256_file(path: Path, chunk_size: int = 8 * 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        while chunk := fh.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_fingerprint(path: Path, previous: dict[str, Any] | None = None) -> dict[str, Any]:
+    """{size, mtime_ns, sha256}; reuses ``previous['sha256']`` when size and mtime are unchanged."""
+    st = path.stat()
+    if (
+        previous
+        and previous.get("size") == st.st_size
+        and previous.get("mtime_ns") == st.st_mtime_ns
+        and previous.get("sha256")
+    ):
+        sha = previous["sha256"]
+    else:
+        sha = _sha256_file(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+
+
+def _digest(payload: Any) -> str:
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ReceitaParquetCache:
+    """Manifest + partition I/O for one Receita directory."""
+
+    def __init__(self, receita_dir: Path, muni: dict[str, str], *, cache_dir: Path | None = None):
+        self.receita_dir = Path(receita_dir)
+        self.dir = Path(cache_dir) if cache_dir else default_cache_dir(self.receita_dir)
+        self.manifest_path = self.dir / MANIFEST_NAME
+        self.manifest = self._load_manifest()
+        self.hits: list[str] = []
+        self.misses: list[str] = []
+
+        old_fps = self.manifest.get("fingerprints", {})
+        self.fingerprints: dict[str, dict[str, Any]] = {}
+        for prefix in ("Empresas", "Estabelecimentos"):
+            for i in range(10):
+                path = self.receita_dir / f"{prefix}{i}.zip"
+                if path.exists():
+                    self.fingerprints[path.name] = file_fingerprint(path, old_fps.get(path.name))
+
+        self._shared_key = _digest({
+            "format": CACHE_FORMAT_VERSION,
+            "empresas": sorted(
+                (name, fp["sha256"]) for name, fp in self.fingerprints.items()
+                if name.startswith("Empresas")
+            ),
+            "municipios": _digest(sorted(muni.items())),
+            "ride": sorted(config.RIDE_ENTORNO_MUNICIPIOS.values()),
+        })
+
+    def _load_manifest(self) -> dict[str, Any]:
+        if not self.manifest_path.exists():
+            return {"partitions": {}, "fingerprints": {}}
+        try:
+            data = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            logger.warning("Receita cache: manifest ilegível em %s — ignorado", self.manifest_path)
+            return {"partitions": {}, "fingerprints": {}}
+        data.setdefault("partitions", {})
+        data.setdefault("fingerprints", {})
+        return data
+
+    def partition_key(self, zip_path: Path) -> str:
+        return _digest({"shared": self._shared_key, "zip": self.fingerprints[zip_path.name]["sha256"]})
+
+    def partition_path(self, zip_path: Path) -> Path:
+        return self.dir / f"{zip_path.stem}.parquet"
+
+    def is_hit(self, zip_path: Path) -> bool:
+        entry = self.manifest["partitions"].get(zip_path.name)
+        return bool(
+            entry
+            and entry.get("key") == self.partition_key(zip_path)
+            and self.partition_path(zip_path).exists()
+        )
+
+    def write_partition(
+        self,
+        zip_path: Path,
+        rows: list[tuple[list[str], str, str, str, str]],
+        empresas: dict[str, dict[str, str]],
+        scan_stats: dict[str, int],
+    ) -> Path:
+        """Persist filtered target rows of one ZIP joined with their Empresas fields."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        n_est = len(EST_COLUMNS)
+        columns: dict[str, list[Any]] = {name: [] for name in EST_COLUMNS}
+        columns.update({"municipio_nome": [], "cnpj": [], "empresa_encontrada": []})
+        columns.update({name: [] for name in EMP_COLUMNS})
+        for row, _uf, muni_name, basico, cnpj in rows:
+            padded = list(row[:n_est]) + [""] * (n_est - len(row))
+            for name, value in zip(EST_COLUMNS, padded, strict=True):
+                columns[name].append(value)
+            columns["municipio_nome"].append(muni_name)
+            columns["cnpj"].append(cnpj)
+            emp = empresas.get(basico)
+            columns["empresa_encontrada"].append(emp is not None)
+            for name in EMP_COLUMNS:
+                columns[name].append(emp.get(name) if emp is not None else None)
+
+        schema = pa.schema(
+            [(name, pa.string()) for name in EST_COLUMNS]
+            + [("municipio_nome", pa.string()), ("cnpj", pa.string()), ("empresa_encontrada", pa.bool_())]
+            + [(name, pa.string()) for name in EMP_COLUMNS]
+        )
+        table = pa.Table.from_pydict(columns, schema=schema)
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        out = self.partition_path(zip_path)
+        tmp = out.with_suffix(".tmp.parquet")
+        pq.write_table(table, tmp, compression="zstd")
+        tmp.replace(out)
+
+        self.manifest["partitions"][zip_path.name] = {
+            "key": self.partition_key(zip_path),
+            "rows": len(rows),
+            "stats": {k: int(scan_stats.get(k, 0)) for k in SCAN_STAT_KEYS},
+        }
+        self.misses.append(zip_path.name)
+        logger.info("Receita cache: %s gravado (%d linhas)", out.name, len(rows))
+        return out
+
+    def read_partition(
+        self,
+        zip_path: Path,
+    ) -> tuple[list[tuple[list[str], str, str, str, str]], dict[str, dict[str, str]], dict[str, int]]:
+        """(target rows, empresas entries, scan stats) from a valid partition."""
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(self.partition_path(zip_path))
+        cols = {name: table.column(name).to_pylist() for name in table.column_names}
+        est = [cols[name] for name in EST_COLUMNS]
+        rows: list[tuple[list[str], str, str, str, str]] = []
+        empresas: dict[str, dict[str, str]] = {}
+        for idx, values in enumerate(zip(*est, strict=True)):
+            row = list(values)
+            basico = row[0].strip()
+            uf = row[EST_COLUMNS.index("uf")].strip().upper()
+            rows.append((row, uf, cols["municipio_nome"][idx], basico, cols["cnpj"][idx]))
+            if cols["empresa_encontrada"][idx]:
+                empresas[basico] = {name: cols[name][idx] for name in EMP_COLUMNS}
+        self.hits.append(zip_path.name)
+        stats = self.manifest["partitions"][zip_path.name].get("stats", {})
+        return rows, empresas, stats
+
+    def save(self) -> None:
+        self.manifest["format"] = CACHE_FORMAT_VERSION
+        self.manifest["fingerprints"] = self.fingerprints
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.manifest_path)
+
+    def report(self) -> dict[str, Any]:
+        return {"dir": str(self.dir), "hits": list(self.hits), "misses": list(self.misses)}
+
+
+def read_cached_frame(cache_dir: Path, columns: list[str] | None = None):
+    """All valid-looking partitions in ``cache_dir`` as one pandas DataFrame (or None)."""
+    if not pyarrow_available():
+        return None
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cache_dir = Path(cache_dir)
+    files = sorted(p for p in cache_dir.glob("Estabelecimentos*.parquet") if ".tmp" not in p.suffixes)
+    if not files:
+        return None
+    tables = [pq.read_table(p, columns=columns) for p in files]
+    return pa.concat_tables(tables).to_pandas()
@@ -4,9 +4,10 @@ from __future__ import annotations
 
 import logging
 from pathlib import Path
+from typing import Any
 
 from jobs.prospeccao import config, paths as pathutil
-from jobs.prospeccao.http_util import download_url_to_path, request_timeout, session
+from jobs.prospeccao.http_util import download_many, request_timeout, session
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +40,7 @@ def discover_working_base(
     return None
 
 
-def download_receita_zips_from_env() -> list[Path]:
+def download_receita_zips_from_env(*, cache: Any | None = None) -> list[Path]:
     """TRONIK_RECEITA_CNPJ_ZIP_URLS — lista separada por vírgulas."""
     raw = (config.RECEITA_CNPJ_ZIP_URLS or "").strip()
     if not raw:
@@ -49,22 +50,39 @@ def download_receita_zips_from_env() -> list[Path]:
         )
     dirs = pathutil.ensure_raw_layout()
     out_dir = dirs["receita"]
-    saved: list[Path] = []
+    jobs: list[tuple[str, Path]] = []
     for i, url in enumerate(u.strip() for u in raw.split(",") if u.strip()):
         name = url.rstrip("/").split("/")[-1] or f"receita_{i}.zip"
         dest = out_dir / name
         logger.info("Receita: %s -> %s", url[:120], dest)
-        download_url_to_path(url, dest, resume=True, skip_if_same_size=True)
-        saved.append(dest)
-    pathutil.write_manifest("receita_cnpj", {"urls": raw, "files": [str(p) for p in saved]})
+        jobs.append((url, dest))
+    results = _download_all(jobs, cache=cache)
+    saved = [dest for _, dest in jobs]
+    pathutil.write_manifest(
+        "receita_cnpj",
+        {"urls": raw, "files": [str(p) for p in saved], "sha256": {r.path: r.sha256 for r in results}},
+    )
     return saved
 
 
+def _download_all(jobs: list[tuple[str, Path]], *, cache: Any | None = None):
+    """Downloads em paralelo (segmentados quando o servidor aceita Range); falha se algum falhar.
+
+    ``cache`` (HarvestCache) salta ZIPs cujo ETag / Last-Modified não mudou.
+    """
+    results = download_many(jobs, resume=True, skip_if_same_size=True, compute_hash=True, cache=cache)
+    failed = [r for r in results if r.error]
+    if failed:
+        raise RuntimeError("Receita: downloads falharam: " + "; ".join(f"{r.path}: {r.error}" for r in failed))
+    return results
+
+
 def download_receita_auto(
     *,
     tipo: str = "estabelecimentos",
     max_files: int = 2,
     probe_only: bool = False,
+    cache: Any | None = None,
 ) -> list[Path]:
     """
     Descobre base oficial e descarrega os primeiros N ZIPs do tipo.
@@ -88,15 +106,18 @@ def download_receita_auto(
         names = DEFAULT_ZIP_NAMES_ESTABELECIMENTOS
     dirs = pathutil.ensure_raw_layout()
     out_dir = dirs["receita"]
-    saved: list[Path] = []
-    for name in names[:max_files]:
-        url = base + name
-        dest = out_dir / name
+    jobs = [(base + name, out_dir / name) for name in names[:max_files]]
+    for url, _ in jobs:
         logger.info("Receita auto: %s", url[:160])
-        download_url_to_path(url, dest, resume=True, skip_if_same_size=True)
-        saved.append(dest)
+    results = _download_all(jobs, cache=cache)
+    saved = [dest for _, dest in jobs]
     pathutil.write_manifest(
         "receita_auto",
-        {"base": base, "tipo": tipo, "files": [str(p) for p in saved]},
+        {
+            "base": base,
+            "tipo": tipo,
+            "files": [str(p) for p in saved],
+            "sha256": {r.path: r.sha256 for r in results},
+        },
     )
     return saved
@@ -16,16 +16,22 @@ import io
 import json
 import logging
 import zipfile
-from collections.abc import Iterator
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+from sqlalchemy import func, make_url, select
 from sqlalchemy.orm import Session
 
 from banco_dados.modelos import EmpresaCandidata, LocalCandidato
+from banco_dados.utils import utc_now_naive
 from jobs.prospeccao import config
+from jobs.prospeccao.bulk_db import copy_upsert_postgres, insert_rows, supports_copy, upsert_rows
+from jobs.prospeccao.db import database_url, session_scope
 from jobs.prospeccao.ranker_contract import normalize_cep8, sanitize_cnae
+from jobs.prospeccao.receita_cache import SCAN_STAT_KEYS, ReceitaParquetCache, pyarrow_available
 
 logger = logging.getLogger(__name__)
 
@@ -179,31 +185,69 @@ def load_empresas_dict(receita_dir: Path) -> dict[str, dict[str, str]]:
     return empresas
 
 
+def _load_empresas_zip_filtered(
+    path: Path,
+    needed_basicos: set[str],
+) -> dict[str, dict[str, str]]:
+    """Empresas rows of one ZIP whose cnpj_basico is in needed_basicos (process-pool worker)."""
+    empresas: dict[str, dict[str, str]] = {}
+    for row in _iter_csv_in_zip(path):
+        if len(row) < 6:
+            continue
+        basico = row[_Emp.CNPJ_BASICO].strip()
+        if basico in needed_basicos:
+            empresas[basico] = {
+                "razao_social": row[_Emp.RAZAO_SOCIAL].strip(),
+                "natureza_juridica": row[_Emp.NATUREZA_JURIDICA].strip(),
+                "porte": row[_Emp.PORTE].strip(),
+                "capital_social": row[_Emp.CAPITAL_SOCIAL].strip(),
+            }
+    return empresas
+
+
 def load_empresas_dict_filtered(
     receita_dir: Path,
     needed_basicos: set[str],
+    *,
+    workers: int = 1,
 ) -> dict[str, dict[str, str]]:
-    """Memory-efficient: only load empresa rows whose cnpj_basico is in needed_basicos."""
+    """Memory-efficient: only load empresa rows whose cnpj_basico is in needed_basicos.
+
+    With ``workers > 1`` each Empresas*.zip is scanned in its own process.
+    """
+    paths = _existing_zips(receita_dir, "Empresas")
     empresas: dict[str, dict[str, str]] = {}
-    for i in range(10):
-        path = receita_dir / f"Empresas{i}.zip"
-        if not path.exists():
-            continue
-        for row in _iter_csv_in_zip(path):
-            if len(row) < 6:
-                continue
-            basico = row[_Emp.CNPJ_BASICO].strip()
-            if basico in needed_basicos:
-                empresas[basico] = {
-                    "razao_social": row[_Emp.RAZAO_SOCIAL].strip(),
-                    "natureza_juridica": row[_Emp.NATUREZA_JURIDICA].strip(),
-                    "porte": row[_Emp.PORTE].strip(),
-                    "capital_social": row[_Emp.CAPITAL_SOCIAL].strip(),
-                }
+    for part in _map_zips(_load_empresas_zip_filtered, paths, workers, needed_basicos):
+        empresas.update(part)
     logger.info("Filtered empresas loaded: %d of %d needed", len(empresas), len(needed_basicos))
     return empresas
 
 
+# ---------------------------------------------------------------------------
+# Per-ZIP process pool
+# ---------------------------------------------------------------------------
+
+def _existing_zips(receita_dir: Path, prefix: str) -> list[Path]:
+    return [p for i in range(10) if (p := receita_dir / f"{prefix}{i}.zip").exists()]
+
+
+def _map_zips(fn: Callable[..., Any], paths: list[Path], workers: int, *args: Any) -> Iterator[Any]:
+    """Yield ``fn(path, *args)`` for each ZIP, in path order.
+
+    ``workers <= 1`` runs inline; otherwise one process per ZIP (capped at ``workers``).
+    Results are consumed in submission order so the single writer sees the same
+    sequence as a serial scan.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield fn(path, *args)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        futures = [pool.submit(fn, path, *args) for path in paths]
+        for fut in futures:
+            yield fut.result()
+
+
 # ---------------------------------------------------------------------------
 # UF/RIDE filter
 # ---------------------------------------------------------------------------
@@ -293,26 +337,10 @@ def _build_address(row: list[str]) -> str:
     return addr or None
 
 
-def parse_estabelecimentos_to_db(
-    db: Session,
-    receita_dir: Path,
-    *,
-    municipios_lookup: dict[str, str] | None = None,
-    naturezas_lookup: dict[str, str] | None = None,
-    two_pass: bool = True,
-) -> dict[str, Any]:
-    """Parse Estabelecimentos ZIPs, filter DF+RIDE, join Empresas, write DB rows.
 
-    Two-pass approach (default, memory-efficient):
-      Pass 1: scan Estabelecimentos to collect cnpj_basicos for DF+RIDE rows
-      Pass 2: load only needed Empresas, then re-scan Estabelecimentos and write DB rows
-
-    Set two_pass=False to load ALL Empresas into memory first (faster but ~12 GB RAM).
-    """
-    muni = municipios_lookup or parse_municipios_lookup(receita_dir)
-    natj = naturezas_lookup or parse_naturezas_lookup(receita_dir)
 
-    stats: dict[str, Any] = {
+def _empty_stats() -> dict[str, Any]:
+    return {
         "empresas_created": 0,
         "empresas_updated": 0,
         "locais_created": 0,
@@ -326,124 +354,222 @@ def parse_estabelecimentos_to_db(
         "files_processed": 0,
     }
 
-    # --- Pass 1: collect needed cnpj_basicos ---
-    needed_basicos: set[str] = set()
-    if two_pass:
-        logger.info("Pass 1: scanning Estabelecimentos for DF+RIDE rows")
-        for i in range(10):
-            path = receita_dir / f"Estabelecimentos{i}.zip"
-            if not path.exists():
-                continue
-            for row in _iter_csv_in_zip(path):
-                if len(row) <= _Est.EMAIL:
-                    continue
-                uf = row[_Est.UF].strip().upper()
-                if not _is_target_uf(uf):
-                    continue
-                if uf == "GO":
-                    muni_code = row[_Est.CODIGO_MUNICIPIO].strip()
-                    muni_name = muni.get(muni_code, "")
-                    if not _is_ride_municipio(muni_name):
-                        continue
-                basico = row[_Est.CNPJ_BASICO].strip()
-                ordem = row[_Est.CNPJ_ORDEM].strip()
-                dv = row[_Est.CNPJ_DV].strip()
-                if not _compose_cnpj(basico, ordem, dv):
-                    continue
-                needed_basicos.add(basico)
-        logger.info("Pass 1 done: %d unique cnpj_basicos in DF+RIDE", len(needed_basicos))
 
-    # --- Load Empresas ---
-    if two_pass and needed_basicos:
-        empresas = load_empresas_dict_filtered(receita_dir, needed_basicos)
-    elif not two_pass:
-        empresas = load_empresas_dict(receita_dir)
-    else:
-        empresas = {}
+def _iter_target_rows(
+    path: Path,
+    muni: dict[str, str],
+    stats: dict[str, Any],
+) -> Iterator[tuple[list[str], str, str, str, str]]:
+    """Yield (row, uf, municipio, cnpj_basico, cnpj) for DF+RIDE rows of one ZIP, counting skips."""
+    for row in _iter_csv_in_zip(path):
+        stats["total_rows_scanned"] += 1
+        if len(row) <= _Est.EMAIL:
+            cnpj_temp = row[_Est.CNPJ_BASICO].strip() if row and len(row) > _Est.CNPJ_BASICO else "unknown"
+            logger.debug(
+                "Row too short (%d fields, need %d), skipping CNPJ=%s",
+                len(row), _Est.EMAIL + 1, cnpj_temp,
+            )
+            continue
 
-    # --- Pass 2: parse + write ---
-    logger.info("Pass 2: parsing Estabelecimentos and writing to DB")
-    batch_size = 500
-    pending = 0
+        uf = row[_Est.UF].strip().upper()
+        if not _is_target_uf(uf):
+            stats["rows_skipped_uf"] += 1
+            continue
 
-    for i in range(10):
-        path = receita_dir / f"Estabelecimentos{i}.zip"
-        if not path.exists():
+        muni_code = row[_Est.CODIGO_MUNICIPIO].strip()
+        muni_name = muni.get(muni_code, "")
+
+        if uf == "GO" and not _is_ride_municipio(muni_name):
+            stats["rows_skipped_go_not_ride"] += 1
             continue
-        stats["files_processed"] += 1
-        for row in _iter_csv_in_zip(path):
-            stats["total_rows_scanned"] += 1
-            if len(row) <= _Est.EMAIL:
-                cnpj_temp = row[_Est.CNPJ_BASICO].strip() if row and len(row) > _Est.CNPJ_BASICO else "unknown"
-                logger.debug(
-                    "Row too short (%d fields, need %d), skipping CNPJ=%s",
-                    len(row), _Est.EMAIL + 1, cnpj_temp,
-                )
-                continue
 
-            uf = row[_Est.UF].strip().upper()
-            if not _is_target_uf(uf):
-                stats["rows_skipped_uf"] += 1
-                continue
+        if uf == "GO":
+            stats["rows_go_ride"] += 1
+        else:
+            stats["rows_df"] += 1
+        stats["rows_filtered_in"] += 1
+
+        basico = row[_Est.CNPJ_BASICO].strip()
+        ordem = row[_Est.CNPJ_ORDEM].strip()
+        dv = row[_Est.CNPJ_DV].strip()
+        cnpj = _compose_cnpj(basico, ordem, dv)
+        if not cnpj:
+            stats["rows_skipped_invalid_cnpj"] += 1
+            continue
 
+        yield row, uf, muni_name, basico, cnpj
+
+
+_TargetRow = tuple[list[str], str, str, str, str]
+
+
+def _scan_target_zip(path: Path, muni: dict[str, str]) -> tuple[list[_TargetRow], dict[str, Any]]:
+    """Process-pool worker: DF+RIDE rows of one ZIP (trimmed to the used columns) + its stats."""
+    stats = _empty_stats()
+    rows = [
+        (row[: _Est.EMAIL + 1], uf, muni_name, basico, cnpj)
+        for row, uf, muni_name, basico, cnpj in _iter_target_rows(path, muni, stats)
+    ]
+    return rows, stats
+
+
+def _iter_target_zips(
+    paths: list[Path],
+    muni: dict[str, str],
+    stats: dict[str, Any],
+    workers: int,
+) -> Iterator[tuple[Path, Iterable[_TargetRow]]]:
+    """Yield (zip_path, target rows) per Estabelecimentos ZIP, serial or one process per ZIP."""
+    if workers <= 1:
+        for path in paths:
+            stats["files_processed"] += 1
+            yield path, _iter_target_rows(path, muni, stats)
+        return
+    for path, (rows, part) in zip(paths, _map_zips(_scan_target_zip, paths, workers, muni), strict=True):
+        stats["files_processed"] += 1
+        for key, value in part.items():
+            stats[key] += value
+        yield path, rows
+
+
+def _iter_zips_with_cache(
+    paths: list[Path],
+    cache: ReceitaParquetCache,
+    muni: dict[str, str],
+    empresas: dict[str, dict[str, str]],
+    stats: dict[str, Any],
+    workers: int,
+) -> Iterator[tuple[Path, Iterable[_TargetRow]]]:
+    """Same contract as ``_iter_target_zips``, reading valid Parquet partitions instead of ZIPs.
+
+    Misses are scanned (serial or pool), materialized and written back as partitions.
+    Hits replay their stored scan counters and add their Empresas fields to ``empresas``.
+    """
+    miss_paths = [p for p in paths if not cache.is_hit(p)]
+    scanned = _iter_target_zips(miss_paths, muni, stats, workers)
+    for path in paths:
+        if path not in miss_paths:
+            rows, emp_part, part_stats = cache.read_partition(path)
+            empresas.update(emp_part)
+            for key, value in part_stats.items():
+                stats[key] += value
+            yield path, rows
+            continue
+        before = {k: stats[k] for k in SCAN_STAT_KEYS}
+        _, target_rows = next(scanned)
+        rows = list(target_rows)
+        delta = {k: stats[k] - before[k] for k in SCAN_STAT_KEYS}
+        cache.write_partition(path, rows, empresas, delta)
+        yield path, rows
+    cache.save()
+
+
+def _collect_needed_basicos_zip(path: Path, muni: dict[str, str]) -> set[str]:
+    """Pass 1 worker: cnpj_basicos of DF+RIDE rows with a valid 14-digit CNPJ in one ZIP."""
+    needed: set[str] = set()
+    for row in _iter_csv_in_zip(path):
+        if len(row) <= _Est.EMAIL:
+            continue
+        uf = row[_Est.UF].strip().upper()
+        if not _is_target_uf(uf):
+            continue
+        if uf == "GO":
             muni_code = row[_Est.CODIGO_MUNICIPIO].strip()
             muni_name = muni.get(muni_code, "")
-
-            if uf == "GO" and not _is_ride_municipio(muni_name):
-                stats["rows_skipped_go_not_ride"] += 1
+            if not _is_ride_municipio(muni_name):
                 continue
+        basico = row[_Est.CNPJ_BASICO].strip()
+        ordem = row[_Est.CNPJ_ORDEM].strip()
+        dv = row[_Est.CNPJ_DV].strip()
+        if not _compose_cnpj(basico, ordem, dv):
+            continue
+        needed.add(basico)
+    return needed
 
-            if uf == "GO":
-                stats["rows_go_ride"] += 1
-            else:
-                stats["rows_df"] += 1
-            stats["rows_filtered_in"] += 1
-
-            basico = row[_Est.CNPJ_BASICO].strip()
-            ordem = row[_Est.CNPJ_ORDEM].strip()
-            dv = row[_Est.CNPJ_DV].strip()
-            cnpj = _compose_cnpj(basico, ordem, dv)
-            if not cnpj:
-                stats["rows_skipped_invalid_cnpj"] += 1
-                continue
 
-            emp = empresas.get(basico, {})
-            situacao_code = row[_Est.SITUACAO_CADASTRAL].strip()
-            porte_code = emp.get("porte", "00")
-            nat_code = emp.get("natureza_juridica", "")
+def _empresa_record(
+    row: list[str],
+    emp: dict[str, str],
+    *,
+    cnpj: str,
+    uf: str,
+    muni_name: str,
+    natj: dict[str, str],
+) -> dict[str, Any]:
+    """Column values for empresa_candidata from one Estabelecimentos row + its Empresas entry."""
+    situacao_code = row[_Est.SITUACAO_CADASTRAL].strip()
+    porte_code = emp.get("porte", "00")
+    nat_code = emp.get("natureza_juridica", "")
+
+    secondary_raw = row[_Est.CNAE_SECUNDARIA].strip() if len(row) > _Est.CNAE_SECUNDARIA else ""
+    secondary_cnaes = _parse_secondary_cnaes(secondary_raw)
+
+    razao_social = emp.get("razao_social", "").strip()
+    if not razao_social:
+        razao_social = cnpj
+        logger.debug("Empresa %s has no razao_social — using CNPJ as fallback", cnpj)
+
+    cnae_pri_raw = row[_Est.CNAE_PRINCIPAL].strip() or None
+    return {
+        "cnpj": cnpj,
+        "razao_social": razao_social,
+        "nome_fantasia": row[_Est.NOME_FANTASIA].strip() or None,
+        "cnae_principal": sanitize_cnae(cnae_pri_raw) or None,
+        "cnae_secundarios_json": json.dumps(secondary_cnaes) if secondary_cnaes else None,
+        "porte": config.RECEITA_PORTE_MAP.get(porte_code, porte_code),
+        "natureza_juridica": natj.get(nat_code, nat_code) if nat_code else None,
+        "situacao_cadastral": config.RECEITA_SITUACAO_MAP.get(situacao_code, situacao_code),
+        "data_abertura": _parse_date(row[_Est.DATA_INICIO]),
+        "bairro": row[_Est.BAIRRO].strip() or None,
+        "cep": normalize_cep8(row[_Est.CEP].strip() or None),
+        "uf": uf,
+        "municipio": muni_name or None,
+        "telefone": _format_phone(row[_Est.DDD1], row[_Est.TELEFONE1]),
+        "email": row[_Est.EMAIL].strip().lower() or None,
+        "endereco_normalizado": _build_address(row),
+        "origem": "receita",
+    }
+
+
+def _local_record(row: list[str]) -> dict[str, Any]:
+    return {
+        "endereco": _build_address(row),
+        "bairro": row[_Est.BAIRRO].strip() or None,
+        "cep": normalize_cep8(row[_Est.CEP].strip() or None),
+        "origem": "receita",
+    }
 
-            secondary_raw = row[_Est.CNAE_SECUNDARIA].strip() if len(row) > _Est.CNAE_SECUNDARIA else ""
-            secondary_cnaes = _parse_secondary_cnaes(secondary_raw)
+
+# ---------------------------------------------------------------------------
+# Writers: per-row ORM (legacy) and batched upsert
+# ---------------------------------------------------------------------------
+
+def _write_orm(
+    db: Session,
+    zips: Iterator[tuple[Path, Iterable[_TargetRow]]],
+    natj: dict[str, str],
+    empresas: dict[str, dict[str, str]],
+    stats: dict[str, Any],
+) -> None:
+    batch_size = 500
+    pending = 0
+
+    for path, target_rows in zips:
+        for row, uf, muni_name, basico, cnpj in target_rows:
+            rec = _empresa_record(
+                row, empresas.get(basico, {}), cnpj=cnpj, uf=uf, muni_name=muni_name, natj=natj,
+            )
 
             # Upsert empresa_candidata
             empresa = db.query(EmpresaCandidata).filter_by(cnpj=cnpj).first()
             is_new_empresa = empresa is None
-            razao_social = emp.get("razao_social", "").strip()
-            if not razao_social:
-                razao_social = cnpj
-                logger.debug("Empresa %s has no razao_social — using CNPJ as fallback", cnpj)
             if is_new_empresa:
-                empresa = EmpresaCandidata(cnpj=cnpj, razao_social=razao_social)
+                empresa = EmpresaCandidata(cnpj=cnpj, razao_social=rec["razao_social"])
                 db.add(empresa)
-
-            empresa.razao_social = razao_social or empresa.razao_social
-            empresa.nome_fantasia = row[_Est.NOME_FANTASIA].strip() or empresa.nome_fantasia
-            cnae_pri_raw = row[_Est.CNAE_PRINCIPAL].strip() or None
-            cnae_pri = sanitize_cnae(cnae_pri_raw) or None
-            empresa.cnae_principal = cnae_pri
-            empresa.cnae_secundarios_json = json.dumps(secondary_cnaes) if secondary_cnaes else None
-            empresa.porte = config.RECEITA_PORTE_MAP.get(porte_code, porte_code)
-            empresa.natureza_juridica = natj.get(nat_code, nat_code) if nat_code else None
-            empresa.situacao_cadastral = config.RECEITA_SITUACAO_MAP.get(situacao_code, situacao_code)
-            empresa.data_abertura = _parse_date(row[_Est.DATA_INICIO])
-            empresa.bairro = row[_Est.BAIRRO].strip() or None
-            empresa.cep = normalize_cep8(row[_Est.CEP].strip() or None)
-            empresa.uf = uf
-            empresa.municipio = muni_name or None
-            empresa.telefone = _format_phone(row[_Est.DDD1], row[_Est.TELEFONE1])
-            empresa.email = row[_Est.EMAIL].strip().lower() or None
-            empresa.endereco_normalizado = _build_address(row)
-            empresa.origem = "receita"
+            for key, value in rec.items():
+                if key == "nome_fantasia" and not value:
+                    continue
+                setattr(empresa, key, value)
 
             if is_new_empresa:
                 stats["empresas_created"] += 1
@@ -459,14 +585,7 @@ def parse_estabelecimentos_to_db(
                 .first()
             )
             if not existing_local:
-                local = LocalCandidato(
-                    empresa_id=empresa.id,
-                    endereco=_build_address(row),
-                    bairro=row[_Est.BAIRRO].strip() or None,
-                    cep=normalize_cep8(row[_Est.CEP].strip() or None),
-                    origem="receita",
-                )
-                db.add(local)
+                db.add(LocalCandidato(empresa_id=empresa.id, **_local_record(row)))
                 stats["locais_created"] += 1
 
             pending += 1
@@ -475,12 +594,228 @@ def parse_estabelecimentos_to_db(
                 pending = 0
 
         logger.info(
-            "Estabelecimentos%d.zip done: %d filtered in so far",
-            i, stats["rows_filtered_in"],
+            "%s done: %d filtered in so far",
+            path.name, stats["rows_filtered_in"],
         )
 
     if pending:
         db.flush()
 
+
+_EMPRESA_UPDATE_COLS = (
+    "razao_social", "nome_fantasia", "cnae_principal", "cnae_secundarios_json", "porte",
+    "natureza_juridica", "situacao_cadastral", "data_abertura", "bairro", "cep", "uf",
+    "municipio", "telefone", "email", "endereco_normalizado", "origem", "atualizado_em",
+)
+
+
+def _flush_bulk_batch(
+    db: Session,
+    empresa_batch: dict[str, dict[str, Any]],
+    local_batch: dict[str, dict[str, Any]],
+    known_ids: dict[str, int],
+    receita_local_empresas: set[int],
+    *,
+    use_copy: bool,
+    stats: dict[str, Any],
+) -> None:
+    """Upsert one batch of empresas, resolve new ids, insert missing receita locals."""
+    table = EmpresaCandidata.__table__
+    records = list(empresa_batch.values())
+    upsert = copy_upsert_postgres if use_copy else upsert_rows
+    upsert(
+        db,
+        table,
+        records,
+        conflict_cols=("cnpj",),
+        update_cols=_EMPRESA_UPDATE_COLS,
+        coalesce_cols=("nome_fantasia",),
+    )
+
+    missing = [cnpj for cnpj in empresa_batch if cnpj not in known_ids]
+    if missing:
+        rows = db.execute(
+            select(table.c.cnpj, table.c.id).where(table.c.cnpj.in_(missing))
+        ).all()
+        known_ids.update(dict(rows))
+
+    locais: list[dict[str, Any]] = []
+    for cnpj, local in local_batch.items():
+        empresa_id = known_ids.get(cnpj)
+        if empresa_id is None or empresa_id in receita_local_empresas:
+            continue
+        locais.append({"empresa_id": empresa_id, **local})
+        receita_local_empresas.add(empresa_id)
+    insert_rows(db, LocalCandidato.__table__, locais)
+    stats["locais_created"] += len(locais)
+
+
+def _write_bulk(
+    db: Session,
+    zips: Iterator[tuple[Path, Iterable[_TargetRow]]],
+    natj: dict[str, str],
+    empresas: dict[str, dict[str, str]],
+    stats: dict[str, Any],
+    *,
+    batch_size: int,
+    use_copy: bool,
+) -> None:
+    """Batched writer: one preload of CNPJ→id, then upserts of ``batch_size`` rows."""
+    emp_table = EmpresaCandidata.__table__
+    loc_table = LocalCandidato.__table__
+    known_ids: dict[str, int] = dict(db.execute(select(emp_table.c.cnpj, emp_table.c.id)).all())
+    receita_local_empresas: set[int] = set(
+        db.execute(
+            select(loc_table.c.empresa_id).where(loc_table.c.origem == "receita").distinct()
+        ).scalars()
+    )
+    logger.info(
+        "Bulk writer: %d empresas already in DB, %d with receita local",
+        len(known_ids), len(receita_local_empresas),
+    )
+
+    empresa_batch: dict[str, dict[str, Any]] = {}
+    local_batch: dict[str, dict[str, Any]] = {}
+
+    def _flush() -> None:
+        _flush_bulk_batch(
+            db, empresa_batch, local_batch, known_ids, receita_local_empresas,
+            use_copy=use_copy, stats=stats,
+        )
+        empresa_batch.clear()
+        local_batch.clear()
+
+    for path, target_rows in zips:
+        for row, uf, muni_name, basico, cnpj in target_rows:
+            rec = _empresa_record(
+                row, empresas.get(basico, {}), cnpj=cnpj, uf=uf, muni_name=muni_name, natj=natj,
+            )
+            now = utc_now_naive()
+            rec["atualizado_em"] = now
+            rec["criado_em"] = now
+
+            if cnpj in known_ids or cnpj in empresa_batch:
+                stats["empresas_updated"] += 1
+                previous = empresa_batch.get(cnpj)
+                if previous is not None and rec["nome_fantasia"] is None:
+                    rec["nome_fantasia"] = previous["nome_fantasia"]
+            else:
+                stats["empresas_created"] += 1
+            empresa_batch[cnpj] = rec
+            local_batch.setdefault(cnpj, _local_record(row))
+
+            if len(empresa_batch) >= batch_size:
+                _flush()
+
+        logger.info(
+            "%s done: %d filtered in so far",
+            path.name, stats["rows_filtered_in"],
+        )
+
+    if empresa_batch:
+        _flush()
+    db.flush()
+
+
+def receita_parse_params() -> dict[str, Any]:
+    """Target database identity besides the ZIPs: a new or reset database forces a re-parse."""
+    with session_scope() as db:
+        empresas = db.scalar(select(func.count()).select_from(EmpresaCandidata))
+    return {
+        "database": make_url(database_url()).render_as_string(hide_password=True),
+        "empresas": empresas,
+    }
+
+
+def parse_estabelecimentos_to_db(
+    db: Session,
+    receita_dir: Path,
+    *,
+    municipios_lookup: dict[str, str] | None = None,
+    naturezas_lookup: dict[str, str] | None = None,
+    two_pass: bool = True,
+    bulk: bool = True,
+    batch_size: int = 5000,
+    use_copy: bool | None = None,
+    workers: int = 1,
+    cache: bool = True,
+    cache_dir: Path | None = None,
+) -> dict[str, Any]:
+    """Parse Estabelecimentos ZIPs, filter DF+RIDE, join Empresas, write DB rows.
+
+    Two-pass approach (default, memory-efficient):
+      Pass 1: scan Estabelecimentos to collect cnpj_basicos for DF+RIDE rows
+      Pass 2: load only needed Empresas, then re-scan Estabelecimentos and write DB rows
+
+    Set two_pass=False to load ALL Empresas into memory first (faster but ~12 GB RAM).
+
+    ``bulk=True`` (default) writes through batched ``INSERT ... ON CONFLICT`` upserts of
+    ``batch_size`` rows; on PostgreSQL with psycopg 3 the batch goes through COPY into a
+    staging table (``use_copy=None`` auto-detects). ``bulk=False`` keeps the per-row ORM
+    path. Both produce the same stats dict.
+
+    ``workers > 1`` scans each Estabelecimentos/Empresas ZIP in its own process (UF/RIDE
+    filter + CNPJ composition); the DB writer stays in the calling process and
+    consumes the filtered rows in ZIP order.
+
+    ``cache=True`` keeps a Parquet partition of the filtered+joined rows per ZIP (see
+    ``receita_cache``); ZIPs whose inputs are unchanged are read from it instead of being
+    re-scanned, and ``stats["cache"]`` lists hits and misses. Needs pyarrow.
+    """
+    muni = municipios_lookup or parse_municipios_lookup(receita_dir)
+    natj = naturezas_lookup or parse_naturezas_lookup(receita_dir)
+
+    stats = _empty_stats()
+
+    est_paths = _existing_zips(receita_dir, "Estabelecimentos")
+    parquet_cache: ReceitaParquetCache | None = None
+    if cache:
+        if pyarrow_available():
+            parquet_cache = ReceitaParquetCache(receita_dir, muni, cache_dir=cache_dir)
+        else:
+            logger.warning("pyarrow ausente — cache Parquet da Receita desativado")
+    scan_paths = (
+        [p for p in est_paths if not parquet_cache.is_hit(p)] if parquet_cache else est_paths
+    )
+    if parquet_cache:
+        logger.info(
+            "Receita cache: %d/%d ZIPs reaproveitados de %s",
+            len(est_paths) - len(scan_paths), len(est_paths), parquet_cache.dir,
+        )
+
+    # --- Pass 1: collect needed cnpj_basicos ---
+    needed_basicos: set[str] = set()
+    if two_pass and scan_paths:
+        logger.info("Pass 1: scanning Estabelecimentos for DF+RIDE rows (workers=%d)", workers)
+        for part in _map_zips(_collect_needed_basicos_zip, scan_paths, workers, muni):
+            needed_basicos |= part
+        logger.info("Pass 1 done: %d unique cnpj_basicos in DF+RIDE", len(needed_basicos))
+
+    # --- Load Empresas ---
+    if two_pass and needed_basicos:
+        empresas = load_empresas_dict_filtered(receita_dir, needed_basicos, workers=workers)
+    elif not two_pass and scan_paths:
+        empresas = load_empresas_dict(receita_dir)
+    else:
+        empresas = {}
+
+    # --- Pass 2: parse + write ---
+    logger.info("Pass 2: parsing Estabelecimentos and writing to DB (bulk=%s, workers=%d)", bulk, workers)
+    if parquet_cache:
+        zips = _iter_zips_with_cache(est_paths, parquet_cache, muni, empresas, stats, workers)
+    else:
+        zips = _iter_target_zips(est_paths, muni, stats, workers)
+    if bulk:
+        if use_copy is None:
+            use_copy = supports_copy(db)
+        _write_bulk(
+            db, zips, natj, empresas, stats,
+            batch_size=batch_size, use_copy=use_copy,
+        )
+    else:
+        _write_orm(db, zips, natj, empresas, stats)
+
+    if parquet_cache:
+        stats["cache"] = parquet_cache.report()
     logger.info("Receita parse complete: %s", stats)
     return stats
@@ -4,6 +4,10 @@ Reads pipe-delimited Estabelecimentos*.csv files from Receita Federal and update
 EmpresaCandidata and LocalCandidato records with CNAE, address, CEP, and contact info
 that were missing from previous enrichment stages.
 
+Columnar end to end: each CSV chunk is filtered and normalized with vectorized
+pandas string ops, merged against the ``empresa_candidata`` keys, and written with
+executemany ``UPDATE ... SET col = COALESCE(col, :new)`` so only NULL fields are filled.
+
 The RFB files are typically sourced from:
 https://www.gov.br/receitafederal/pt-br/assuntos/orientacao-tributaria/cadastros/consultas/dados-publicos-cnpj
 """
@@ -15,9 +19,11 @@ from pathlib import Path
 from typing import Any
 
 import pandas as pd
+from sqlalchemy import bindparam, func, select
 from sqlalchemy.orm import Session
 
 from banco_dados.modelos import EmpresaCandidata, LocalCandidato
+from jobs.prospeccao.receita_cache import EST_COLUMNS, read_cached_frame
 
 logger = logging.getLogger(__name__)
 
@@ -58,53 +64,37 @@ RFB_COLS = [
 # Active company status code in RFB
 _ATIVA = "02"
 
+# Only the columns the enrichment uses are parsed from the (6 GB) CSVs.
+_READ_COLS = [
+    "cnpj_basico",
+    "cnpj_ordem",
+    "cnpj_dv",
+    "nome_fantasia",
+    "situacao_cadastral",
+    "cnae_fiscal_principal",
+    "tipo_logradouro",
+    "logradouro",
+    "numero",
+    "bairro",
+    "cep",
+    "uf",
+    "correio_eletronico",
+]
+_CSV_CHUNK_ROWS = 500_000
+
+# Normalized enrichment frame: EmpresaCandidata column -> filled only when NULL.
+EMPRESA_FIELDS = ("cnae_principal", "bairro", "cep", "endereco_normalizado", "nome_fantasia", "email")
+# LocalCandidato column -> source field in the enrichment frame.
+LOCAL_FIELDS = {"bairro": "bairro", "cep": "cep", "endereco": "endereco_normalizado"}
+_UPDATE_CHUNK = 1000
+_LOCAL_QUERY_CHUNK = 10_000
+
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
 
-def _clean_cnpj(cnpj_basico: str, cnpj_ordem: str, cnpj_dv: str) -> str:
-    """Assemble 14-digit CNPJ from RFB components (no punctuation)."""
-    try:
-        b = str(cnpj_basico or "").strip().zfill(8)
-        o = str(cnpj_ordem or "").strip().zfill(4)
-        d = str(cnpj_dv or "").strip().zfill(2)
-        return b + o + d
-    except Exception:
-        return ""
-
-
-def _clean_cep(cep: str) -> str | None:
-    """Extract digits from CEP; return None if not exactly 8 digits."""
-    if not cep:
-        return None
-    digits = "".join(c for c in str(cep).strip() if c.isdigit())
-    return digits if len(digits) == 8 else None
-
-
-def _clean_bairro(bairro: str) -> str | None:
-    """Normalize bairro: strip, lowercase, return None if empty."""
-    if not bairro:
-        return None
-    result = str(bairro).strip().lower()
-    return result if result else None
-
-
-def _build_endereco(tipo_logradouro: str, logradouro: str, numero: str) -> str | None:
-    """Build normalized address from address components."""
-    parts = []
-    if tipo_logradouro:
-        parts.append(str(tipo_logradouro).strip())
-    if logradouro:
-        parts.append(str(logradouro).strip())
-    if numero:
-        parts.append(str(numero).strip())
-
-    result = " ".join(parts)
-    return result.strip() if result else None
-
-
 def _parse_cnae_secundarios(raw: str) -> list[str]:
     """Parse RFB secondary CNAEs (7 digits each) into list of 4-digit codes.
 
@@ -131,19 +121,103 @@ def _parse_cnae_secundarios(raw: str) -> list[str]:
     return codes
 
 
+# ---------------------------------------------------------------------------
+# Vectorized normalization
+# ---------------------------------------------------------------------------
+
+
+def _stripped(df: pd.DataFrame, col: str) -> pd.Series:
+    return df[col].fillna("").astype(str).str.strip()
+
+
+def _none_if_empty(s: pd.Series) -> pd.Series:
+    return s.where(s != "", None)
+
+
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Filtered Estabelecimentos rows (RFB_COLS names) -> ``cnpj`` + EMPRESA_FIELDS.
+
+    Same rules the per-row helpers applied: 14-digit CNPJ from zero-padded parts,
+    CEP with exactly 8 digits, lowercase bairro, "tipo logradouro numero" address
+    (empty parts dropped), lowercase e-mail with ``@`` and a dotted domain. Later
+    rows win on duplicate CNPJs. Empty strings become None.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["cnpj", *EMPRESA_FIELDS])
+    cnpj = (
+        _stripped(df, "cnpj_basico").str.zfill(8)
+        + _stripped(df, "cnpj_ordem").str.zfill(4)
+        + _stripped(df, "cnpj_dv").str.zfill(2)
+    )
+    cep = df["cep"].fillna("").astype(str).str.replace(r"\D", "", regex=True)
+    endereco = (
+        _stripped(df, "tipo_logradouro") + "\x00" + _stripped(df, "logradouro") + "\x00" + _stripped(df, "numero")
+    ).str.replace(r"\x00+", " ", regex=True).str.strip()
+    email = _stripped(df, "correio_eletronico").str.lower()
+    domain = email.str.rsplit("@", n=1).str[-1]
+    email_ok = email.str.contains("@", regex=False) & domain.str.contains(".", regex=False)
+
+    out = pd.DataFrame(
+        {
+            "cnpj": cnpj,
+            "cnae_principal": _none_if_empty(_stripped(df, "cnae_fiscal_principal")),
+            "bairro": _none_if_empty(_stripped(df, "bairro").str.lower()),
+            "cep": cep.where(cep.str.len() == 8, None),
+            "endereco_normalizado": _none_if_empty(endereco),
+            "nome_fantasia": _none_if_empty(_stripped(df, "nome_fantasia")),
+            "email": email.where(email_ok, None),
+        }
+    )
+    out = out[out["cnpj"].str.len() == 14]
+    return out.drop_duplicates("cnpj", keep="last").reset_index(drop=True)
+
+
+def _active_in_uf(df: pd.DataFrame, uf_filter: str) -> pd.DataFrame:
+    return df[
+        (df["uf"].fillna("").str.strip().str.upper() == uf_filter.upper())
+        & (df["situacao_cadastral"] == _ATIVA)
+    ]
+
+
+def _concat_normalized(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    if not parts:
+        return _normalize_frame(pd.DataFrame())
+    df = pd.concat(parts, ignore_index=True)
+    return df.drop_duplicates("cnpj", keep="last").reset_index(drop=True)
+
+
+def _load_rfb_cache(
+    cache_dir: Path,
+    uf_filter: str = "DF",
+) -> pd.DataFrame:
+    """Same output as ``_load_rfb_files``, read from the receita_parse Parquet cache.
+
+    The cache only holds DF + RIDE (GO) rows; other UFs come back empty.
+    """
+    df = read_cached_frame(cache_dir, columns=[c for c in _READ_COLS if c in EST_COLUMNS])
+    if df is None:
+        raise ValueError(
+            f"Cache Parquet da Receita não encontrado em {cache_dir} "
+            "(rode receita-parse com pyarrow instalado)"
+        )
+    df = _active_in_uf(df, uf_filter)
+    logger.info("rfb-enrich: %d linhas ativas UF=%s no cache %s", len(df), uf_filter, cache_dir)
+    return _normalize_frame(df)
+
+
 def _load_rfb_files(
     dump_dir: Path,
     uf_filter: str = "DF",
-) -> dict[str, dict[str, Any]]:
-    """Load all Estabelecimentos*.csv files and build dict: CNPJ -> data.
+) -> pd.DataFrame:
+    """Load all Estabelecimentos*.csv files into one normalized frame.
 
     Args:
         dump_dir: Directory containing Estabelecimentos*.csv files
         uf_filter: Filter by UF (default "DF")
 
     Returns:
-        Dict mapping 14-digit CNPJ -> enrichment dict with keys:
-        cnae_principal, bairro, cep, endereco_normalizado, nome_fantasia, email
+        DataFrame with one row per 14-digit CNPJ and columns
+        cnpj, cnae_principal, bairro, cep, endereco_normalizado, nome_fantasia, email
 
     Raises:
         ValueError: If no CSV files found
@@ -166,90 +240,85 @@ def _load_rfb_files(
             f"Formatos aceitos: Estabelecimentos*.csv, *.ESTABE"
         )
 
-    rfb: dict[str, dict[str, Any]] = {}
+    parts: list[pd.DataFrame] = []
 
     for csv_file in csv_files:
         logger.info("rfb-enrich: lendo arquivo %s", csv_file.name)
 
-        # Lê em chunks para suportar arquivos grandes (Y0 tem ~6GB)
+        # Lê em chunks só as colunas usadas (Y0 tem ~6GB); filtra e normaliza cada chunk.
+        n_before = len(parts)
         try:
             chunks = pd.read_csv(
                 csv_file,
                 sep=";",
                 header=None,
                 names=RFB_COLS,
+                usecols=_READ_COLS,
                 encoding="latin-1",
                 dtype=str,
-                low_memory=False,
-                chunksize=200_000,
+                chunksize=_CSV_CHUNK_ROWS,
             )
-            df_parts = []
             for chunk in chunks:
-                filtered = chunk[
-                    (chunk["uf"].fillna("").str.upper() == uf_filter.upper())
-                    & (chunk["situacao_cadastral"] == _ATIVA)
-                ]
+                filtered = _active_in_uf(chunk, uf_filter)
                 if not filtered.empty:
-                    df_parts.append(filtered)
-            df = pd.concat(df_parts, ignore_index=True) if df_parts else pd.DataFrame()
+                    parts.append(_normalize_frame(filtered))
         except Exception as exc:
             logger.error("rfb-enrich: erro ao ler %s: %s", csv_file.name, exc)
+            del parts[n_before:]
             continue
 
-        if df.empty:
+        if len(parts) == n_before:
             logger.debug("rfb-enrich: nenhuma linha ativa para UF=%s em %s", uf_filter, csv_file.name)
-            continue
 
-        # Build CNPJ and extract data
-        for _, row in df.iterrows():
-            try:
-                cnpj_14 = _clean_cnpj(
-                    row.get("cnpj_basico", ""),
-                    row.get("cnpj_ordem", ""),
-                    row.get("cnpj_dv", ""),
-                )
-
-                if not cnpj_14 or len(cnpj_14) != 14:
-                    continue
-
-                # Extract and normalize fields
-                cnae_principal = (
-                    str(row.get("cnae_fiscal_principal") or "").strip()
-                    or None
-                )
-                bairro = _clean_bairro(row.get("bairro", ""))
-                cep = _clean_cep(row.get("cep", ""))
-                endereco = _build_endereco(
-                    row.get("tipo_logradouro", ""),
-                    row.get("logradouro", ""),
-                    row.get("numero", ""),
-                )
-                nome_fantasia = (
-                    str(row.get("nome_fantasia") or "").strip()
-                    or None
-                )
-                email = (
-                    str(row.get("correio_eletronico") or "").strip().lower()
-                    or None
-                )
-
-                # Validate email basic format
-                if email and ("@" not in email or "." not in email.rsplit("@", 1)[-1]):
-                    email = None
-
-                rfb[cnpj_14] = {
-                    "cnae_principal": cnae_principal,
-                    "bairro": bairro,
-                    "cep": cep,
-                    "endereco_normalizado": endereco,
-                    "nome_fantasia": nome_fantasia,
-                    "email": email,
-                }
-            except Exception as exc:
-                logger.debug("rfb-enrich: erro ao processar linha: %s", exc)
-                continue
-
-    return rfb
+    return _concat_normalized(parts)
+
+
+# ---------------------------------------------------------------------------
+# Bulk writes
+# ---------------------------------------------------------------------------
+
+
+def _db_frame(db: Session, stmt) -> pd.DataFrame:
+    result = db.execute(stmt)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def _fill_nulls_update(table, key_col: str, fields: dict[str, str]):
+    """``UPDATE table SET col = COALESCE(col, :new_col) WHERE key = :_key`` (executemany)."""
+    return (
+        table.update()
+        .where(table.c[key_col] == bindparam("_key"))
+        .values({col: func.coalesce(table.c[col], bindparam(f"new_{col}")) for col in fields})
+    )
+
+
+def _records(df: pd.DataFrame, key_col: str, fields: dict[str, str]) -> list[dict[str, Any]]:
+    cols = {"_key": df[key_col].astype(int).tolist()}
+    for col, src in fields.items():
+        values = df[src].astype(object)
+        cols[f"new_{col}"] = values.where(values.notna(), None).tolist()
+    return [dict(zip(cols, row, strict=True)) for row in zip(*cols.values(), strict=True)]
+
+
+def _count_local_fills(db: Session, updates: pd.DataFrame) -> int:
+    """Fields of LocalCandidato that the COALESCE update will fill (NULL now, value incoming)."""
+    t = LocalCandidato.__table__
+    ids = updates["id"].astype(int).tolist()
+    incoming = updates[["id", *LOCAL_FIELDS.values()]].set_axis(
+        ["empresa_id", *(f"rfb_{col}" for col in LOCAL_FIELDS)], axis=1
+    )
+    total = 0
+    for start in range(0, len(ids), _LOCAL_QUERY_CHUNK):
+        chunk_ids = ids[start : start + _LOCAL_QUERY_CHUNK]
+        locais = _db_frame(
+            db, select(t.c.empresa_id, *(t.c[c] for c in LOCAL_FIELDS)).where(t.c.empresa_id.in_(chunk_ids))
+        )
+        if locais.empty:
+            continue
+        merged = locais.merge(incoming, on="empresa_id")
+        for col in LOCAL_FIELDS:
+            total += int((merged[col].isna() & merged[f"rfb_{col}"].notna()).sum())
+    return total
 
 
 # ---------------------------------------------------------------------------
@@ -260,150 +329,97 @@ def _load_rfb_files(
 def enrich_from_rfb_dump(
     db: Session,
     *,
-    dump_dir: Path,
+    dump_dir: Path | None = None,
     uf_filter: str = "DF",
     batch_size: int = 5_000,
     dry_run: bool = False,
+    receita_cache_dir: Path | None = None,
 ) -> dict[str, int]:
     """Enrich EmpresaCandidata and LocalCandidato from RFB Estabelecimentos dump.
 
     Reads pipe-delimited CSV files from Receita Federal and updates company and
     location records with CNAE, address, CEP, and contact info, but only for
-    fields that are currently None.
+    fields that are currently None (``COALESCE`` in the UPDATE).
 
     Args:
         db: SQLAlchemy session
         dump_dir: Directory containing Estabelecimentos*.csv files
         uf_filter: Filter by UF (default "DF" for Brasília)
-        batch_size: Commit every N updates (default 5000)
-        dry_run: If True, don't commit changes (default False)
+        batch_size: Empresas updated per commit (default 5000)
+        dry_run: If True, compute stats without writing (default False)
+        receita_cache_dir: Read the receita_parse Parquet cache instead of CSVs
+            (used when dump_dir is None)
 
     Returns:
         Stats dict:
         - rfb_rows_loaded: Number of RFB records loaded
         - empresas_matched: Number of EmpresaCandidata found in RFB
         - empresas_updated: Number of EmpresaCandidata records modified
-        - locais_updated: Number of LocalCandidato records modified
+        - locais_updated: Number of LocalCandidato fields filled
         - batches: Number of commit batches
 
     Raises:
-        ValueError: If dump_dir does not exist or no CSV files found
+        ValueError: If dump_dir does not exist, no CSV files found, or the cache is missing
     """
-    dump_dir = Path(dump_dir)
+    if dump_dir is None and receita_cache_dir is None:
+        raise ValueError("Informe dump_dir (CSVs) ou receita_cache_dir (cache Parquet)")
 
     # Load RFB data
-    logger.info(
-        "rfb-enrich: carregando arquivos de %s (UF=%s)",
-        dump_dir, uf_filter
-    )
-    rfb = _load_rfb_files(dump_dir, uf_filter=uf_filter)
+    if dump_dir is not None:
+        dump_dir = Path(dump_dir)
+        logger.info(
+            "rfb-enrich: carregando arquivos de %s (UF=%s)",
+            dump_dir, uf_filter
+        )
+        rfb = _load_rfb_files(dump_dir, uf_filter=uf_filter)
+    else:
+        rfb = _load_rfb_cache(Path(receita_cache_dir), uf_filter=uf_filter)
     logger.info("rfb-enrich: %d registros RFB carregados para UF=%s", len(rfb), uf_filter)
 
-    if not rfb:
-        logger.warning("rfb-enrich: nenhum registro RFB carregado")
-        return {
-            "rfb_rows_loaded": 0,
-            "empresas_matched": 0,
-            "empresas_updated": 0,
-            "locais_updated": 0,
-            "batches": 0,
-        }
-
-    # Query in batches to avoid huge IN() lists
-    rfb_cnpjs = list(rfb.keys())
-    batch_size_query = 10_000
-
-    empresas_matched = 0
-    empresas_updated = 0
-    locais_updated = 0
-    batches = 0
-
-    total_batches_query = (len(rfb_cnpjs) + batch_size_query - 1) // batch_size_query
-
-    for batch_i in range(0, len(rfb_cnpjs), batch_size_query):
-        cnpj_batch = rfb_cnpjs[batch_i : batch_i + batch_size_query]
-        batch_n = batch_i // batch_size_query + 1
-
-        # Query companies for this batch
-        empresas = db.query(EmpresaCandidata).filter(
-            EmpresaCandidata.cnpj.in_(cnpj_batch)
-        ).all()
-
-        empresas_matched += len(empresas)
-
-        updates_in_batch = 0
-
-        for empresa in empresas:
-            data = rfb.get(empresa.cnpj)
-            if not data:
-                continue
-
-            updated = False
-
-            # Update empresa fields (only if None)
-            if empresa.cnae_principal is None and data["cnae_principal"]:
-                empresa.cnae_principal = data["cnae_principal"]
-                updated = True
-
-            if empresa.bairro is None and data["bairro"]:
-                empresa.bairro = data["bairro"]
-                updated = True
-
-            if empresa.cep is None and data["cep"]:
-                empresa.cep = data["cep"]
-                updated = True
-
-            if empresa.endereco_normalizado is None and data["endereco_normalizado"]:
-                empresa.endereco_normalizado = data["endereco_normalizado"]
-                updated = True
-
-            if empresa.nome_fantasia is None and data["nome_fantasia"]:
-                empresa.nome_fantasia = data["nome_fantasia"]
-                updated = True
-
-            if empresa.email is None and data["email"]:
-                empresa.email = data["email"]
-                updated = True
-
-            if updated:
-                empresas_updated += 1
-                updates_in_batch += 1
-
-                # Update associated LocalCandidato records
-                locais = db.query(LocalCandidato).filter(
-                    LocalCandidato.empresa_id == empresa.id
-                ).all()
-
-                for local in locais:
-                    if local.bairro is None and data["bairro"]:
-                        local.bairro = data["bairro"]
-                        locais_updated += 1
-
-                    if local.cep is None and data["cep"]:
-                        local.cep = data["cep"]
-                        locais_updated += 1
-
-                    if local.endereco is None and data["endereco_normalizado"]:
-                        local.endereco = data["endereco_normalizado"]
-                        locais_updated += 1
-
-        # Commit batch
-        if updates_in_batch > 0:
-            if not dry_run:
-                db.commit()
-            batches += 1
-            logger.info(
-                "rfb-enrich: processado batch %d/%d — %d atualizacoes",
-                batch_n, total_batches_query, updates_in_batch,
-            )
-
     stats = {
         "rfb_rows_loaded": len(rfb),
-        "empresas_matched": empresas_matched,
-        "empresas_updated": empresas_updated,
-        "locais_updated": locais_updated,
-        "batches": batches,
+        "empresas_matched": 0,
+        "empresas_updated": 0,
+        "locais_updated": 0,
+        "batches": 0,
     }
+    if rfb.empty:
+        logger.warning("rfb-enrich: nenhum registro RFB carregado")
+        return stats
+
+    # Merge against the current keys (+ fields, to know which NULLs get filled)
+    emp = EmpresaCandidata.__table__
+    existing = _db_frame(db, select(emp.c.id, emp.c.cnpj, *(emp.c[f] for f in EMPRESA_FIELDS)))
+    merged = existing.merge(rfb, on="cnpj", how="inner", suffixes=("_db", ""))
+    stats["empresas_matched"] = len(merged)
+
+    fills = pd.DataFrame({f: merged[f"{f}_db"].isna() & merged[f].notna() for f in EMPRESA_FIELDS})
+    updates = merged[fills.any(axis=1)].reset_index(drop=True)
+    stats["empresas_updated"] = len(updates)
+    if updates.empty:
+        logger.info("rfb-enrich: concluído — %s", stats)
+        return stats
+
+    stats["locais_updated"] = _count_local_fills(db, updates)
+
+    empresa_stmt = _fill_nulls_update(emp, "id", {f: f for f in EMPRESA_FIELDS})
+    local_stmt = _fill_nulls_update(LocalCandidato.__table__, "empresa_id", LOCAL_FIELDS)
+    total_batches = (len(updates) + batch_size - 1) // batch_size
+    for batch_n, start in enumerate(range(0, len(updates), batch_size), start=1):
+        batch = updates.iloc[start : start + batch_size]
+        stats["batches"] += 1
+        if dry_run:
+            continue
+        empresa_rows = _records(batch, "id", {f: f for f in EMPRESA_FIELDS})
+        local_rows = _records(batch, "id", LOCAL_FIELDS)
+        for i in range(0, len(batch), _UPDATE_CHUNK):
+            db.execute(empresa_stmt, empresa_rows[i : i + _UPDATE_CHUNK])
+            db.execute(local_stmt, local_rows[i : i + _UPDATE_CHUNK])
+        db.commit()
+        logger.info(
+            "rfb-enrich: processado batch %d/%d — %d atualizacoes",
+            batch_n, total_batches, len(batch),
+        )
 
     logger.info("rfb-enrich: concluído — %s", stats)
     return stats
@@ -4,17 +4,27 @@ from __future__ import annotations
 
 import json
 import logging
-from collections import Counter, defaultdict
-from datetime import UTC, datetime
+import time
+from collections import Counter
 from pathlib import Path
 from statistics import mean
 from typing import Any
 
+import numpy as np
+from sqlalchemy import func, inspect, select
 from sqlalchemy.orm import Session
 
 from banco_dados.modelos import FeatureSnapshotProspeccao, ModeloProspeccao, ScoreProspeccao
+from banco_dados.utils import utc_now_naive
 from jobs.prospeccao import config
-from jobs.prospeccao.ranker_contract import FEATURE_NAMES, heuristic_score, top_reasons
+from jobs.prospeccao.bulk_db import copy_upsert_postgres, supports_copy, upsert_rows
+from jobs.prospeccao.ranker_contract import (
+    FEATURE_NAMES,
+    feature_dicts,
+    heuristic_score,
+    snapshot_feature_matrix,
+    top_reasons,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,40 +44,79 @@ def _active_model(db: Session, model_version: str | None = None) -> ModeloProspe
     return model
 
 
-def _predict_and_explain(
-    model: ModeloProspeccao,
-    feature_rows: list[dict[str, float]],
-) -> tuple[list[float], list[dict[str, float]] | None]:
-    """Return (predictions, per-row SHAP value dicts or None)."""
-    if model.algoritmo == "xgboost_ranker" and model.artefato_path:
-        import joblib
-        import numpy as np
-
-        artifact = joblib.load(Path(config.REPO_ROOT) / model.artefato_path)
-        ranker = artifact["model"]
-        features = artifact.get("features", FEATURE_NAMES)
-        x = np.asarray(
-            [[float(row.get(name, 0.0)) for name in features] for row in feature_rows],
-            dtype=float,
-        )
-        predictions = [float(v) for v in ranker.predict(x)]
-
-        shap_maps: list[dict[str, float]] | None = None
+# SHAP rows per TreeExplainer call (bounds the (rows, features) float64 buffer).
+SHAP_BATCH_SIZE = 20_000
+
+
+class _ScoringEngine:
+    """Ranker artifact + SHAP explainer, loaded once per scoring run.
+
+    Heuristic models (no artifact) score with ``heuristic_score`` and never explain.
+    """
+
+    def __init__(self, model: ModeloProspeccao):
+        self.ranker: Any = None
+        self.features: list[str] = list(FEATURE_NAMES)
+        self._explainer: Any = None
+        self._shap_failed = False
+        if model.algoritmo == "xgboost_ranker" and model.artefato_path:
+            import joblib
+
+            artifact = joblib.load(Path(config.REPO_ROOT) / model.artefato_path)
+            self.ranker = artifact["model"]
+            self.features = list(artifact.get("features", FEATURE_NAMES))
+        position = {name: j for j, name in enumerate(FEATURE_NAMES)}
+        self._source_cols = [position.get(name) for name in self.features]
+
+    def model_input(self, matrix: np.ndarray) -> np.ndarray:
+        """Reorder FEATURE_NAMES columns to the artifact's feature list (missing -> 0)."""
+        x = np.zeros((matrix.shape[0], len(self.features)), dtype=float)
+        for j, src in enumerate(self._source_cols):
+            if src is not None:
+                x[:, j] = matrix[:, src]
+        return x
+
+    def predict(self, matrix: np.ndarray) -> np.ndarray:
+        if self.ranker is None:
+            return np.asarray([heuristic_score(row) for row in feature_dicts(matrix)], dtype=float)
+        if not matrix.shape[0]:
+            return np.empty(0, dtype=float)
+        return np.asarray(self.ranker.predict(self.model_input(matrix)), dtype=float)
+
+    def explain(self, matrix: np.ndarray, *, batch_size: int = SHAP_BATCH_SIZE) -> np.ndarray | None:
+        """SHAP values ``(n, len(self.features))`` computed in batches, or None if unavailable."""
+        if self.ranker is None or self._shap_failed or not matrix.shape[0]:
+            return None
         try:
-            import shap
-
-            explainer = shap.TreeExplainer(ranker)
-            shap_values = explainer.shap_values(x)
-            shap_maps = [
-                dict(zip(features, (float(v) for v in row_shap), strict=False))
-                for row_shap in shap_values
-            ]
+            if self._explainer is None:
+                import shap
+
+                self._explainer = shap.TreeExplainer(self.ranker)
+            x = self.model_input(matrix)
+            step = max(1, batch_size)
+            return np.concatenate([
+                np.asarray(self._explainer.shap_values(x[start:start + step]), dtype=float)
+                for start in range(0, x.shape[0], step)
+            ])
         except Exception as exc:
             logger.warning("SHAP calculation failed: %s", exc)
+            self._shap_failed = True
+            return None
+
 
-        return predictions, shap_maps
+def _group_ranks(qids: list[str], scores: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Rank rows within contiguous qid runs by descending score (stable on ties).
 
-    return [heuristic_score(row) for row in feature_rows], None
+    Returns (order, group_starts, ranks): ``order`` lists row indices group by group,
+    best first; ``ranks`` is 1-based per row.
+    """
+    n = len(qids)
+    starts = np.asarray([i for i in range(n) if i == 0 or qids[i] != qids[i - 1]], dtype=np.int64)
+    group_code = np.repeat(np.arange(starts.size), np.diff(np.append(starts, n)))
+    order = np.lexsort((-scores, group_code))
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = np.arange(n) - starts[group_code[order]] + 1
+    return order, starts, ranks
 
 
 def _summarize_distribution(values: list[float]) -> dict[str, float]:
@@ -121,12 +170,153 @@ def _priority(rank: int, group_size: int, score: float, *, uses_absolute_scale:
     return "baixa"
 
 
+# Keys per ``IN (...)`` when loading only the groups that changed.
+INCREMENTAL_QID_CHUNK = 500
+
+
+def _dirty_qids(db: Session, model_id: int, pipeline_version: str) -> tuple[set[str], dict[str, int]]:
+    """qids that need rescoring: new/changed snapshots, qid moves, or no stored hash.
+
+    Compares ``FeatureSnapshotProspeccao.features_hash`` with the hash recorded on the
+    model's ``ScoreProspeccao`` rows (two narrow column scans, no ORM objects).
+    """
+    snap = FeatureSnapshotProspeccao
+    scored = {
+        sid: (qid, features_hash)
+        for sid, qid, features_hash in db.execute(
+            select(ScoreProspeccao.snapshot_id, ScoreProspeccao.qid, ScoreProspeccao.features_hash).where(
+                ScoreProspeccao.modelo_id == model_id,
+            )
+        )
+    }
+    dirty: set[str] = set()
+    rows_by_qid: Counter[str] = Counter()
+    for sid, qid, features_hash in db.execute(
+        select(snap.id, snap.qid, snap.features_hash).where(snap.pipeline_version == pipeline_version)
+    ):
+        rows_by_qid[qid] += 1
+        prev = scored.get(sid)
+        if prev is None or features_hash is None or prev != (qid, features_hash):
+            dirty.add(qid)
+            if prev is not None and prev[0] != qid:
+                dirty.add(prev[0])  # the group it left must be re-ranked too
+    dirty &= rows_by_qid.keys()
+    skipped = {
+        "qids_skipped": len(rows_by_qid) - len(dirty),
+        "rows_skipped": sum(n for qid, n in rows_by_qid.items() if qid not in dirty),
+    }
+    return dirty, skipped
+
+
+def _load_snapshots(
+    db: Session,
+    pipeline_version: str,
+    qids: set[str] | None = None,
+) -> list[FeatureSnapshotProspeccao]:
+    """Snapshots ordered by (qid, id); restricted to ``qids`` when given."""
+    query = db.query(FeatureSnapshotProspeccao).filter(FeatureSnapshotProspeccao.pipeline_version == pipeline_version)
+    order = (FeatureSnapshotProspeccao.qid.asc(), FeatureSnapshotProspeccao.id.asc())
+    if qids is None:
+        return query.order_by(*order).all()
+    ordered = sorted(qids)
+    snapshots: list[FeatureSnapshotProspeccao] = []
+    for start in range(0, len(ordered), INCREMENTAL_QID_CHUNK):
+        chunk = ordered[start:start + INCREMENTAL_QID_CHUNK]
+        snapshots.extend(query.filter(FeatureSnapshotProspeccao.qid.in_(chunk)).order_by(*order).all())
+    return snapshots
+
+
+# Score rows per bulk upsert + commit.
+SCORE_WRITE_BATCH = 10_000
+_SCORE_KEY_COLS = ("snapshot_id", "modelo_id")
+_SCORE_UPDATE_COLS = (
+    "empresa_id",
+    "local_id",
+    "qid",
+    "score",
+    "ranking_contexto",
+    "prioridade",
+    "pipeline_version",
+    "motivos_json",
+    "features_hash",
+    "calculado_em",
+)
+
+
+def _existing_scores(
+    db: Session,
+    model_id: int,
+    snapshot_ids: list[int],
+    *,
+    full: bool,
+) -> dict[int, tuple[str | None, str | None]]:
+    """snapshot_id -> (prioridade, pipeline_version) of this model's stored scores.
+
+    ``full`` reads every score of the model in one pass; otherwise only ``snapshot_ids``.
+    """
+    cols = select(ScoreProspeccao.snapshot_id, ScoreProspeccao.prioridade, ScoreProspeccao.pipeline_version).where(
+        ScoreProspeccao.modelo_id == model_id
+    )
+    wanted = set(snapshot_ids)
+    if full:
+        return {sid: (prio, pv) for sid, prio, pv in db.execute(cols) if sid in wanted}
+    out: dict[int, tuple[str | None, str | None]] = {}
+    for start in range(0, len(snapshot_ids), INCREMENTAL_QID_CHUNK):
+        chunk = snapshot_ids[start:start + INCREMENTAL_QID_CHUNK]
+        for sid, prio, pv in db.execute(cols.where(ScoreProspeccao.snapshot_id.in_(chunk))):
+            out[sid] = (prio, pv)
+    return out
+
+
+def _require_score_unique_key(db: Session) -> None:
+    """Fail fast unless ``score_prospeccao`` has the unique key the upsert conflicts on.
+
+    Legacy databases with duplicate scores boot without it (schema_compat only warns);
+    the upsert would otherwise die after the whole predict/SHAP pass with an opaque
+    ON CONFLICT error.
+    """
+    insp = inspect(db.connection())
+    keys = [i["column_names"] for i in insp.get_indexes(ScoreProspeccao.__tablename__) if i["unique"]]
+    keys += [c["column_names"] for c in insp.get_unique_constraints(ScoreProspeccao.__tablename__)]
+    if not any(tuple(cols) == _SCORE_KEY_COLS for cols in keys):
+        raise ValueError(
+            "score_prospeccao has no unique key on (snapshot_id, modelo_id), most likely because of "
+            "duplicate legacy scores. Run `python -m jobs.prospeccao dedupe-scores` before scoring."
+        )
+
+
+def _upsert_scores(db: Session, rows: list[dict[str, Any]], *, use_copy: bool) -> None:
+    """Upsert on ``(snapshot_id, modelo_id)``: COPY + merge on PostgreSQL, executemany otherwise."""
+    upsert = copy_upsert_postgres if use_copy else upsert_rows
+    upsert(
+        db,
+        ScoreProspeccao.__table__,
+        rows,
+        conflict_cols=_SCORE_KEY_COLS,
+        update_cols=_SCORE_UPDATE_COLS,
+    )
+
+
 def score_candidates(
     db: Session,
     *,
     model_version: str | None = None,
     pipeline_version: str | None = None,
+    shap_batch_size: int = SHAP_BATCH_SIZE,
+    shap_top_n: int | None = None,
+    incremental: bool = False,
 ) -> dict[str, Any]:
+    """Score every snapshot of ``pipeline_version`` and upsert ``ScoreProspeccao`` rows.
+
+    The model is loaded once and predicts over the full feature matrix; rows are
+    then ranked per qid. ``shap_top_n`` restricts SHAP explanations to the best N
+    rows of each qid (the rest get heuristic ``top_reasons``).
+
+    ``incremental`` rescores only qids containing new or changed snapshots (by
+    ``features_hash``); ScoreProspeccao rows of the other qids are left untouched.
+    """
+    timings: dict[str, float] = {}
+    _t = time.perf_counter()
     model = _active_model(db, model_version)
     pipeline_version = pipeline_version or model.pipeline_version
 
@@ -137,70 +327,97 @@ def score_candidates(
             f"but requested pipeline is '{pipeline_version}'. "
             f"Use --pipeline-version {model.pipeline_version} or retrain the model."
         )
-
-    snapshots = (
-        db.query(FeatureSnapshotProspeccao)
-        .filter(FeatureSnapshotProspeccao.pipeline_version == pipeline_version)
-        .order_by(FeatureSnapshotProspeccao.qid.asc(), FeatureSnapshotProspeccao.id.asc())
-        .all()
-    )
-    grouped: dict[str, list[FeatureSnapshotProspeccao]] = defaultdict(list)
-    for snapshot in snapshots:
-        grouped[snapshot.qid].append(snapshot)
-
-    created = 0
-    updated = 0
-    processed = 0
+    _require_score_unique_key(db)
+    engine = _ScoringEngine(model)
+    timings["load_model"] = time.perf_counter() - _t
+
+    _t = time.perf_counter()
+    skipped = {"qids_skipped": 0, "rows_skipped": 0}
+    dirty: set[str] | None = None
+    if incremental:
+        dirty, skipped = _dirty_qids(db, model.id, pipeline_version)
+        logger.info(
+            "Incremental scoring: %s qids to rescore, %s qids / %s rows unchanged",
+            len(dirty), skipped["qids_skipped"], skipped["rows_skipped"],
+        )
+    snapshots = _load_snapshots(db, pipeline_version, dirty)
+    timings["load_snapshots"] = time.perf_counter() - _t
+
+    _t = time.perf_counter()
+    matrix = snapshot_feature_matrix(snapshots)
+    timings["decode_features"] = time.perf_counter() - _t
+
+    _t = time.perf_counter()
+    predictions = engine.predict(matrix)
+    qids = [snapshot.qid for snapshot in snapshots]
+    order, starts, ranks = _group_ranks(qids, predictions)
+    timings["predict"] = time.perf_counter() - _t
+
+    _t = time.perf_counter()
+    explain_rows = np.arange(len(snapshots)) if shap_top_n is None else np.flatnonzero(ranks <= shap_top_n)
+    shap_values = engine.explain(matrix[explain_rows], batch_size=shap_batch_size)
+    shap_pos = np.full(len(snapshots), -1, dtype=np.int64)
+    if shap_values is not None:
+        shap_pos[explain_rows] = np.arange(explain_rows.size)
+    timings["shap"] = time.perf_counter() - _t
+
+    _t = time.perf_counter()
     scores_by_prioridade: Counter[str] = Counter()
-    raw_scores_all: list[float] = []
     relative_scores_all: list[float] = []
-    batch_size = 2000
-
-    # Pre-load all existing ScoreProspeccao records for this model to avoid N+1 queries
-    existing_scores = {
-        (r.snapshot_id, r.modelo_id): r
-        for r in db.query(ScoreProspeccao)
-        .filter(ScoreProspeccao.modelo_id == model.id)
-        .all()
-    }
 
-    for qid, rows in grouped.items():
-        feature_rows = [json.loads(row.features_json) for row in rows]
-        predictions, shap_maps = _predict_and_explain(model, feature_rows)
-        raw_scores_all.extend(float(v) for v in predictions)
-        explanations = shap_maps or [None] * len(rows)
-        ranked = sorted(
-            zip(rows, feature_rows, predictions, explanations, strict=False),
-            key=lambda item: item[2],
-            reverse=True,
+    # Priority counts before this run (one aggregate) + what we are about to overwrite:
+    # the final distribution is derived in memory instead of re-reading every score.
+    prior_counts = db.execute(
+        select(ScoreProspeccao.prioridade, func.count())
+        .where(
+            ScoreProspeccao.modelo_id == model.id,
+            ScoreProspeccao.pipeline_version == pipeline_version,
         )
-        group_size = len(ranked)
-        uses_absolute_scale = model.algoritmo != "xgboost_ranker"
-
-        for rank, (snapshot, features, score, shap_vals) in enumerate(ranked, start=1):
+        .group_by(ScoreProspeccao.prioridade)
+    ).all()
+    prioridade_dist: Counter[str] = Counter(dict(prior_counts))
+    existing = _existing_scores(db, model.id, [snapshot.id for snapshot in snapshots], full=dirty is None)
+    for prev_prioridade, prev_pipeline in existing.values():
+        if prev_pipeline == pipeline_version:
+            prioridade_dist[prev_prioridade] -= 1
+
+    uses_absolute_scale = model.algoritmo != "xgboost_ranker"
+    bounds = np.append(starts, len(snapshots)).tolist()
+    use_copy = supports_copy(db)
+    calculado_em = utc_now_naive()
+    pending: list[dict[str, Any]] = []
+    written = 0
+
+    def _flush() -> None:
+        nonlocal written
+        _upsert_scores(db, pending, use_copy=use_copy)
+        db.commit()
+        written += len(pending)
+        logger.info("Scores gravados: %s/%s", written, len(snapshots))
+        pending.clear()
+
+    for start, end in zip(bounds[:-1], bounds[1:], strict=True):
+        group_size = end - start
+        group_order = order[start:end]
+        group_features = feature_dicts(matrix[group_order])
+        for offset, (row_idx, features) in enumerate(zip(group_order.tolist(), group_features, strict=True)):
+            snapshot = snapshots[row_idx]
+            rank = offset + 1
+            score = float(predictions[row_idx])
+            shap_vals = (
+                dict(zip(engine.features, shap_values[shap_pos[row_idx]].tolist(), strict=False))
+                if shap_pos[row_idx] >= 0
+                else None
+            )
             percentile_top = 1.0 if group_size <= 1 else 1.0 - ((rank - 1) / (group_size - 1))
             relative_scores_all.append(percentile_top * 100.0)
-            score_row = existing_scores.get((snapshot.id, model.id))
-            if not score_row:
-                score_row = ScoreProspeccao(snapshot_id=snapshot.id, modelo_id=model.id)
-                db.add(score_row)
-                created += 1
-            else:
-                updated += 1
-
-            score_row.empresa_id = snapshot.empresa_id
-            score_row.local_id = snapshot.local_id
-            score_row.qid = qid
-            score_row.score = round(float(score), 6)
-            score_row.ranking_contexto = rank
-            score_row.prioridade = _priority(
+            prioridade = _priority(
                 rank,
                 group_size,
-                float(score),
+                score,
                 uses_absolute_scale=uses_absolute_scale,
             )
-            scores_by_prioridade[score_row.prioridade] += 1
-            score_row.pipeline_version = pipeline_version
+            scores_by_prioridade[prioridade] += 1
             # Build enriched motivos with SHAP context and human-readable labels
             enriched_motivos = top_reasons(
                 features,
@@ -208,31 +425,40 @@ def score_candidates(
                 limit=5,
                 min_fallback_value=None if shap_vals else 0.1,
             )
-            score_row.motivos_json = _json(enriched_motivos)
-            score_row.calculado_em = datetime.now(UTC)
-
-            processed += 1
-            if processed % batch_size == 0:
-                db.commit()
-                logger.info(f"Committed batch of {batch_size}. Progress: {processed}/{len(snapshots)} scores processed.")
-
-    # Final commit for remaining records
-    db.commit()
-
-    # Log distribution of priorities
-    all_scores = db.query(ScoreProspeccao).filter(
-        ScoreProspeccao.modelo_id == model.id,
-        ScoreProspeccao.pipeline_version == pipeline_version,
-    ).all()
-    prioridade_dist = Counter(s.prioridade for s in all_scores)
+            pending.append({
+                "snapshot_id": snapshot.id,
+                "modelo_id": model.id,
+                "empresa_id": snapshot.empresa_id,
+                "local_id": snapshot.local_id,
+                "qid": snapshot.qid,
+                "score": round(score, 6),
+                "ranking_contexto": rank,
+                "prioridade": prioridade,
+                "pipeline_version": pipeline_version,
+                "motivos_json": _json(enriched_motivos),
+                "features_hash": snapshot.features_hash,
+                "calculado_em": calculado_em,
+            })
+            if len(pending) >= SCORE_WRITE_BATCH:
+                _flush()
+    if pending:
+        _flush()
+    timings["write"] = time.perf_counter() - _t
+
+    updated = len(existing)
+    created = len(snapshots) - updated
+    prioridade_dist.update(scores_by_prioridade)
+    prioridade_dist = +prioridade_dist  # drop zero counts
     logger.info("Distribuicao de prioridades: %s", dict(prioridade_dist))
     logger.info(
         "Score telemetry | modelo=%s algoritmo=%s raw=%s relative_0_100=%s",
         model.versao,
         model.algoritmo,
-        _json(_summarize_distribution(raw_scores_all)),
+        _json(_summarize_distribution(predictions.tolist())),
         _json(_summarize_distribution(relative_scores_all)),
     )
+    timings_s = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    logger.info("Score timings (s): %s", timings_s)
 
     return {
         "modelo": model.versao,
@@ -242,8 +468,12 @@ def score_candidates(
         "snapshots": len(snapshots),
         "scores_criados": created,
         "scores_atualizados": updated,
-        "grupos": len(grouped),
-        "qids_processed": len(grouped),
+        "grupos": int(starts.size),
+        "qids_processed": int(starts.size),
         "scores_by_prioridade": dict(scores_by_prioridade),
         "prioridade_distribuicao": dict(prioridade_dist),
+        "shap_rows": int(explain_rows.size) if shap_values is not None else 0,
+        "incremental": incremental,
+        **skipped,
+        "timings_s": timings_s,
     }
@@ -10,11 +10,19 @@ from __future__ import annotations
 
 import json
 import logging
+import math
+import multiprocessing
+import os
 import sys
+import tempfile
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import UTC, datetime
+from pathlib import Path
 from typing import Any
 
+import numpy as np
 from sqlalchemy.orm import Session
 
 from banco_dados.modelos import FeatureSnapshotProspeccao, ModeloProspeccao
@@ -23,6 +31,7 @@ from jobs.prospeccao.ranker_contract import (
     FEATURE_NAMES,
     FEATURE_SCHEMA_VERSION,
     MONOTONIC_CONSTRAINTS,
+    snapshot_feature_matrix,
 )
 
 logger = logging.getLogger(__name__)
@@ -31,6 +40,8 @@ MODEL_DIR = config.REPO_ROOT / "data" / "ml" / "prospeccao"
 
 MIN_ACTIVATION_NDCG = 0.30
 EARLY_STOPPING_ROUNDS = 35
+# Successive halving keeps the best 1/eta candidates per rung (rounds grow by eta).
+SEARCH_HALVING_ETA = 3
 
 
 def _artifact_stem(model_version: str) -> str:
@@ -80,10 +91,10 @@ def _fit_xgb_ranker(
     ranker: Any,
     x: Any,
     y: Any,
-    group: list[int],
+    group: Any,
     *,
     eval_set: list[tuple[Any, Any]] | None = None,
-    eval_group: list[list[int]] | None = None,
+    eval_group: list[Any] | None = None,
     early_stopping_rounds: int | None = None,
     early_stop_mode: str | None = None,
 ) -> None:
@@ -134,65 +145,77 @@ def _group_rows(rows: list[FeatureSnapshotProspeccao]) -> dict[str, list[Feature
     return grouped
 
 
-def _matrix(grouped: dict[str, list[FeatureSnapshotProspeccao]]) -> tuple[list[list[float]], list[int], list[int]]:
-    x: list[list[float]] = []
-    y: list[int] = []
-    group_sizes: list[int] = []
-    for qid in sorted(grouped):
-        items = grouped[qid]
-        group_sizes.append(len(items))
-        for item in items:
-            features = json.loads(item.features_json)
-            x.append([float(features.get(name, 0.0)) for name in FEATURE_NAMES])
-            y.append(int(item.label_ordinal or 0))
+def _matrix(grouped: dict[str, list[FeatureSnapshotProspeccao]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(X float32 C-contiguous, y int32, group sizes int32), groups in sorted qid order."""
+    items: list[FeatureSnapshotProspeccao] = []
+    qids = sorted(grouped)
+    for qid in qids:
+        items.extend(grouped[qid])
+    x = np.ascontiguousarray(snapshot_feature_matrix(items), dtype=np.float32)
+    y = np.fromiter((item.label_ordinal or 0 for item in items), dtype=np.int32, count=len(items))
+    group_sizes = np.fromiter((len(grouped[qid]) for qid in qids), dtype=np.int32, count=len(qids))
     return x, y, group_sizes
 
 
+def _rows_of_groups(group_sizes: np.ndarray, group_mask: np.ndarray) -> np.ndarray:
+    """Row-level boolean mask selecting every row of the groups in ``group_mask``."""
+    return np.repeat(np.asarray(group_mask, dtype=bool), np.asarray(group_sizes, dtype=np.int64))
+
+
 # ---------------------------------------------------------------------------
 # Evaluation
 # ---------------------------------------------------------------------------
 
-def _mean_ndcg_by_group(y_true: list[int], y_score: list[float], group_sizes: list[int]) -> float | None:
-    try:
-        from sklearn.metrics import ndcg_score
-    except Exception:
-        return None
+def _ndcg_per_group(y_true: Any, y_score: Any, group_sizes: Any, k: int) -> np.ndarray:
+    """NDCG@k of every group with size >= 2, in one vectorized pass.
 
-    scores = []
-    cursor = 0
-    for size in group_sizes:
-        if size < 2:
-            cursor += size
-            continue
-        yt = [y_true[cursor : cursor + size]]
-        ys = [y_score[cursor : cursor + size]]
-        scores.append(float(ndcg_score(yt, ys, k=min(20, size))))
-        cursor += size
-    if not scores:
-        return None
-    return round(sum(scores) / len(scores), 4)
-
-
-def _ndcg_at_k(y_true: list[int], y_score: list[float], group_sizes: list[int], k: int) -> float | None:
+    Same definition as ``sklearn.metrics.ndcg_score`` (linear gains, log2 discount,
+    tied scores share the average gain of their tie block; all-zero relevance -> 0).
+    """
+    sizes = np.asarray(group_sizes, dtype=np.int64)
+    y_true = np.asarray(y_true, dtype=float)
+    y_score = np.asarray(y_score, dtype=float)
+    n_groups = sizes.size
+    if not n_groups:
+        return np.empty(0)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    group = np.repeat(np.arange(n_groups), sizes)
+    n = group.size
+
+    def _discounts(order: np.ndarray) -> np.ndarray:
+        pos = np.arange(n) - starts[group[order]]
+        return np.where(pos < k, 1.0 / np.log2(pos + 2.0), 0.0)
+
+    # Ideal DCG: relevance sorted descending inside each group.
+    ideal_order = np.lexsort((-y_true, group))
+    idcg = np.bincount(group, weights=y_true[ideal_order] * _discounts(ideal_order), minlength=n_groups)
+
+    # DCG with tie averaging: consecutive equal scores within a group form one block.
+    order = np.lexsort((-y_score, group))
+    g_sorted = group[order]
+    s_sorted = y_score[order]
+    new_block = np.ones(n, dtype=bool)
+    new_block[1:] = (g_sorted[1:] != g_sorted[:-1]) | (s_sorted[1:] != s_sorted[:-1])
+    block = np.cumsum(new_block) - 1
+    block_gain = np.bincount(block, weights=y_true[order]) / np.bincount(block)
+    block_discount = np.bincount(block, weights=_discounts(order))
+    block_group = g_sorted[new_block]
+    dcg = np.bincount(block_group, weights=block_gain * block_discount, minlength=n_groups)
+
+    ndcg = np.divide(dcg, idcg, out=np.zeros(n_groups), where=idcg > 0)
+    return ndcg[sizes >= 2]
+
+
+def _mean_ndcg_by_group(y_true: Any, y_score: Any, group_sizes: Any) -> float | None:
+    return _ndcg_at_k(y_true, y_score, group_sizes, 20)
+
+
+def _ndcg_at_k(y_true: Any, y_score: Any, group_sizes: Any, k: int) -> float | None:
     """Compute mean NDCG@K across groups; skip groups with size < 2."""
-    try:
-        from sklearn.metrics import ndcg_score
-    except Exception:
-        return None
-
-    scores = []
-    cursor = 0
-    for size in group_sizes:
-        if size < 2:
-            cursor += size
-            continue
-        yt = [y_true[cursor : cursor + size]]
-        ys = [y_score[cursor : cursor + size]]
-        scores.append(float(ndcg_score(yt, ys, k=min(k, size))))
-        cursor += size
-    if not scores:
+    scores = _ndcg_per_group(y_true, y_score, group_sizes, k)
+    if not scores.size:
         return None
-    return round(sum(scores) / len(scores), 4)
+    return round(float(scores.mean()), 4)
 
 
 # ---------------------------------------------------------------------------
@@ -327,6 +350,217 @@ def _ranker_param_candidates() -> list[dict[str, Any]]:
     ]
 
 
+def _process_peak_rss_mb() -> float | None:
+    """Peak resident memory of the current process over its whole life (MB); None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS counter (``VmHWM``) so the next read covers only what follows.
+
+    ``ru_maxrss`` never goes down, so later candidates would inherit the peak of earlier
+    ones. Linux >= 4.0 only; returns False elsewhere (the candidate then reports None).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_mb() -> float | None:
+    """Peak resident memory (MB) since the last ``_reset_peak_rss``; None where unsupported."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _native_params(candidate: dict[str, Any], nthread: int) -> tuple[dict[str, Any], int]:
+    """Translate an XGBRanker candidate into ``xgb.train`` params + boosting rounds."""
+    skip = {"n_estimators", "n_jobs", "random_state", "monotone_constraints"}
+    params = {k: v for k, v in candidate.items() if k not in skip}
+    params["seed"] = candidate.get("random_state", 0)
+    params["nthread"] = nthread
+    constraints = candidate.get("monotone_constraints")
+    if constraints is not None:
+        params["monotone_constraints"] = "(" + ",".join(str(int(c)) for c in constraints) + ")"
+    return params, int(candidate.get("n_estimators", 100))
+
+
+def _halving_fractions(n_candidates: int, eta: int = SEARCH_HALVING_ETA) -> list[float]:
+    """Round budget per rung, e.g. 8 candidates, eta=3 -> [1/3, 1]."""
+    rungs = int(math.floor(math.log(max(n_candidates, 1)) / math.log(eta) + 1e-9))
+    return [eta ** -(rungs - r) for r in range(rungs + 1)]
+
+
+# Per-process search state: training/validation DMatrix built once by the pool initializer.
+_SEARCH_DATA: dict[str, Any] = {}
+
+
+def _quantile_dmatrix(x: np.ndarray, y: np.ndarray, group: np.ndarray, *, ref: Any = None, nthread: int) -> Any:
+    import xgboost as xgb
+
+    try:
+        return xgb.QuantileDMatrix(x, label=y, group=group, ref=ref, nthread=nthread)
+    except (AttributeError, TypeError):
+        return xgb.DMatrix(x, label=y, group=group, nthread=nthread)
+
+
+def _search_worker_init(data_dir: str, nthread: int) -> None:
+    """Pool initializer: memory-map the search arrays and build the DMatrix pair once."""
+    arrays = {
+        path.stem: np.load(path, mmap_mode="r")
+        for path in Path(data_dir).glob("*.npy")
+    }
+    dtrain = _quantile_dmatrix(arrays["x_train"], arrays["y_train"], arrays["group_train"], nthread=nthread)
+    dval = None
+    if "x_val" in arrays:
+        dval = _quantile_dmatrix(arrays["x_val"], arrays["y_val"], arrays["group_val"], ref=dtrain, nthread=nthread)
+    _SEARCH_DATA.clear()
+    _SEARCH_DATA.update(arrays, dtrain=dtrain, dval=dval, nthread=nthread)
+
+
+def _search_candidate_task(candidate: dict[str, Any], rounds: int) -> dict[str, Any]:
+    """Fit one candidate on the worker's shared DMatrix; returns NDCG + cost metrics."""
+    import xgboost as xgb
+
+    t0 = time.perf_counter()
+    rss_measured = _reset_peak_rss()
+    data = _SEARCH_DATA
+    params, _ = _native_params(candidate, data["nthread"])
+    dtrain, dval = data["dtrain"], data["dval"]
+    evals = [(dtrain, "train")] + ([(dval, "val")] if dval is not None else [])
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round=rounds,
+        evals=evals,
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS if dval is not None else None,
+        verbose_eval=False,
+    )
+    try:
+        best_iteration = int(booster.best_iteration)
+    except (AttributeError, TypeError, ValueError):
+        best_iteration = rounds - 1
+    iteration_range = (0, best_iteration + 1)
+
+    def _ndcg(dmatrix: Any, suffix: str) -> float | None:
+        pred = booster.predict(dmatrix, iteration_range=iteration_range)
+        return _mean_ndcg_by_group(data[f"y_{suffix}"], pred, data[f"group_{suffix}"])
+
+    return {
+        "rounds": rounds,
+        "best_iteration": best_iteration,
+        "train_ndcg_mean": _ndcg(dtrain, "train"),
+        "val_ndcg_mean": _ndcg(dval, "val") if dval is not None else None,
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "peak_rss_mb": _peak_rss_mb() if rss_measured else None,
+        "pid": os.getpid(),
+    }
+
+
+def _selection_metric(entry: dict[str, Any]) -> float:
+    if entry.get("val_ndcg_mean") is not None:
+        return entry["val_ndcg_mean"]
+    return entry.get("train_ndcg_mean") or float("-inf")
+
+
+def _parallel_search(
+    x_train: np.ndarray,
+    y_train: np.ndarray,
+    train_groups: np.ndarray,
+    x_val: np.ndarray | None,
+    y_val: np.ndarray | None,
+    val_groups: np.ndarray,
+    candidates: list[dict[str, Any]],
+    *,
+    workers: int,
+    threads_per_worker: int | None = None,
+    successive_halving: bool = False,
+) -> list[dict[str, Any]]:
+    """Evaluate ``candidates`` on a process pool; one result entry per candidate.
+
+    Training/validation arrays are written once as ``.npy`` and memory-mapped by every
+    worker, which builds its (Quantile)DMatrix once and reuses it for all candidates
+    it receives. ``threads_per_worker`` caps XGBoost threads so workers don't
+    oversubscribe cores. With ``successive_halving`` candidates first run with a
+    fraction of their rounds and only the best 1/eta advance to the next rung.
+    """
+    workers = max(1, min(workers, len(candidates)))
+    nthread = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    fractions = _halving_fractions(len(candidates)) if successive_halving else [1.0]
+    entries: list[dict[str, Any]] = [
+        {
+            "params": {k: v for k, v in c.items() if k != "monotone_constraints"},
+            "rungs": [],
+            "wall_s": 0.0,
+            "peak_rss_mb": None,
+        }
+        for c in candidates
+    ]
+
+    with tempfile.TemporaryDirectory(prefix="ranker-search-") as data_dir:
+        np.save(Path(data_dir) / "x_train.npy", np.ascontiguousarray(x_train, dtype=np.float32))
+        np.save(Path(data_dir) / "y_train.npy", np.asarray(y_train, dtype=np.float32))
+        np.save(Path(data_dir) / "group_train.npy", np.asarray(train_groups, dtype=np.int32))
+        if x_val is not None and len(val_groups):
+            np.save(Path(data_dir) / "x_val.npy", np.ascontiguousarray(x_val, dtype=np.float32))
+            np.save(Path(data_dir) / "y_val.npy", np.asarray(y_val, dtype=np.float32))
+            np.save(Path(data_dir) / "group_val.npy", np.asarray(val_groups, dtype=np.int32))
+
+        # spawn: forking a parent that already ran OpenMP can deadlock XGBoost workers.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_search_worker_init,
+            initargs=(data_dir, nthread),
+        ) as pool:
+            alive = list(range(len(candidates)))
+            for rung, fraction in enumerate(fractions):
+                futures = {
+                    i: pool.submit(
+                        _search_candidate_task,
+                        candidates[i],
+                        max(1, math.ceil(int(candidates[i].get("n_estimators", 100)) * fraction)),
+                    )
+                    for i in alive
+                }
+                for i, future in futures.items():
+                    res = future.result()
+                    entry = entries[i]
+                    entry["rungs"].append({"rung": rung, **res})
+                    entry.update(
+                        train_ndcg_mean=res["train_ndcg_mean"],
+                        val_ndcg_mean=res["val_ndcg_mean"],
+                        best_iteration=res["best_iteration"],
+                        rounds=res["rounds"],
+                    )
+                    entry["wall_s"] = round(entry["wall_s"] + res["wall_s"], 3)
+                    if res["peak_rss_mb"] is not None:
+                        entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0.0, res["peak_rss_mb"])
+                if rung < len(fractions) - 1:
+                    keep = max(1, len(alive) // SEARCH_HALVING_ETA)
+                    ranked = sorted(alive, key=lambda i: _selection_metric(entries[i]), reverse=True)
+                    for i in ranked[keep:]:
+                        entries[i]["pruned_at_rung"] = rung
+                    alive = sorted(ranked[:keep])
+                    logger.info("Successive halving rung %d: %d candidates advance", rung, len(alive))
+    for entry in entries:
+        entry.setdefault("pruned_at_rung", None)
+    return entries
+
+
 def _feature_importance(ranker: Any) -> dict[str, dict[str, float]]:
     """Extract feature importance (gain, weight, cover) for all features with names."""
     try:
@@ -369,7 +603,17 @@ def train_ranker(
     pipeline_version: str = FEATURE_SCHEMA_VERSION,
     model_version: str | None = None,
     allow_baseline: bool = True,
+    search_workers: int = 1,
+    threads_per_worker: int | None = None,
+    successive_halving: bool = False,
 ) -> dict[str, Any]:
+    """Train (or bootstrap) the ranker and register a ``ModeloProspeccao``.
+
+    ``search_workers > 1`` or ``successive_halving`` runs the hyperparameter search
+    on a process pool (see ``_parallel_search``); the default keeps the sequential
+    in-process search. Either way each candidate records ``wall_s`` and ``peak_rss_mb``
+    (peak RSS during that candidate's fit) in ``metrics["search_results"]``.
+    """
     rows = _load_training_rows(db, pipeline_version)
     model_version = model_version or f"{pipeline_version}-{datetime.now(UTC).strftime('%Y%m%d%H%M%S')}"
     schema_json = rows[0].feature_schema_json if rows else _json(
@@ -409,8 +653,10 @@ def train_ranker(
     metrics.update(
         {
             "rows": len(rows),
-            "groups": len(group_sizes),
-            "label_distribution": {str(label): y.count(label) for label in sorted(set(y))},
+            "groups": int(group_sizes.size),
+            "label_distribution": {
+                str(label): int(count) for label, count in zip(*np.unique(y, return_counts=True), strict=True)
+            },
         }
     )
 
@@ -423,9 +669,9 @@ def train_ranker(
 
     enough_for_ranker = (
         len(rows) >= 8
-        and len(group_sizes) >= 2
-        and any(size >= 2 for size in group_sizes)
-        and len(set(y)) >= 2
+        and group_sizes.size >= 2
+        and bool((group_sizes >= 2).any())
+        and np.unique(y).size >= 2
     )
 
     artifact_path: str | None = None
@@ -437,90 +683,113 @@ def train_ranker(
     if enough_for_ranker:
         try:
             import joblib
-            import numpy as np
 
             # --- qid-aware train / validation split ---
-            train_grouped, val_grouped = _stratified_qid_split(grouped)
-            x_train, y_train, train_group_sizes = _matrix(train_grouped)
-            x_val, y_val, val_group_sizes = _matrix(val_grouped)
-
+            # Slices of the full matrix (groups are in sorted qid order in both).
+            _, val_grouped = _stratified_qid_split(grouped)
+            val_groups_mask = np.fromiter((qid in val_grouped for qid in sorted(grouped)), dtype=bool)
             # --- Filter singleton groups from training (listwise ranking requires size >= 2) ---
-            valid_mask = np.array(
-                [size >= 2 for size in train_group_sizes for _ in range(size)]
-            )
-            x_train_filtered = [x_train[i] for i in range(len(x_train)) if valid_mask[i]]
-            y_train_filtered = [y_train[i] for i in range(len(y_train)) if valid_mask[i]]
-            train_group_sizes_filtered = [s for s in train_group_sizes if s >= 2]
-
-            x_train_np = np.asarray(x_train_filtered, dtype=float)
-            y_train_np = np.asarray(y_train_filtered, dtype=float)
-            x_val_np = np.asarray(x_val, dtype=float) if x_val else None
+            train_groups_mask = ~val_groups_mask & (group_sizes >= 2)
+            train_rows = _rows_of_groups(group_sizes, train_groups_mask)
+            val_rows = _rows_of_groups(group_sizes, val_groups_mask)
+
+            x_train_np = x[train_rows]
+            y_train_filtered = y[train_rows]
+            y_train_np = y_train_filtered.astype(np.float32)
+            train_group_sizes_filtered = group_sizes[train_groups_mask]
+            y_val = y[val_rows]
+            val_group_sizes = group_sizes[val_groups_mask]
+            x_val_np = x[val_rows] if val_group_sizes.size else None
 
             # --- Hyperparameter search ---
-            best_ranker = None
-            best_params: dict[str, Any] | None = None
-            best_val_ndcg = float("-inf")
-            search_results: list[dict[str, Any]] = []
-
-            for candidate in _ranker_param_candidates():
-                has_eval = x_val_np is not None and val_group_sizes
-                es_rounds = EARLY_STOPPING_ROUNDS if has_eval else None
-                ranker, es_mode = _create_xgb_ranker(
-                    candidate, early_stopping_rounds=es_rounds
-                )
-                eval_set = None
-                eval_group = None
-                if has_eval:
-                    eval_set = [
-                        (x_train_np, y_train_np),
-                        (x_val_np, np.asarray(y_val, dtype=float)),
-                    ]
-                    eval_group = [train_group_sizes_filtered, val_group_sizes]
-                _fit_xgb_ranker(
-                    ranker,
+            candidates = _ranker_param_candidates()
+            search_started = time.perf_counter()
+            if search_workers > 1 or successive_halving:
+                search_results = _parallel_search(
                     x_train_np,
                     y_train_np,
                     train_group_sizes_filtered,
-                    eval_set=eval_set,
-                    eval_group=eval_group,
-                    early_stopping_rounds=es_rounds,
-                    early_stop_mode=es_mode,
+                    x_val_np,
+                    y_val.astype(np.float32),
+                    val_group_sizes,
+                    candidates,
+                    workers=search_workers,
+                    threads_per_worker=threads_per_worker,
+                    successive_halving=successive_halving,
                 )
+            else:
+                search_results = []
+                for candidate in candidates:
+                    t_candidate = time.perf_counter()
+                    rss_measured = _reset_peak_rss()
+                    has_eval = x_val_np is not None
+                    es_rounds = EARLY_STOPPING_ROUNDS if has_eval else None
+                    if threads_per_worker:
+                        candidate = {**candidate, "n_jobs": threads_per_worker}
+                    ranker, es_mode = _create_xgb_ranker(
+                        candidate, early_stopping_rounds=es_rounds
+                    )
+                    eval_set = None
+                    eval_group = None
+                    if has_eval:
+                        eval_set = [
+                            (x_train_np, y_train_np),
+                            (x_val_np, y_val.astype(np.float32)),
+                        ]
+                        eval_group = [train_group_sizes_filtered, val_group_sizes]
+                    _fit_xgb_ranker(
+                        ranker,
+                        x_train_np,
+                        y_train_np,
+                        train_group_sizes_filtered,
+                        eval_set=eval_set,
+                        eval_group=eval_group,
+                        early_stopping_rounds=es_rounds,
+                        early_stop_mode=es_mode,
+                    )
+
+                    train_pred = ranker.predict(x_train_np)
+                    train_ndcg = _mean_ndcg_by_group(y_train_filtered, train_pred, train_group_sizes_filtered)
+                    val_ndcg = None
+                    if x_val_np is not None:
+                        val_pred = ranker.predict(x_val_np)
+                        val_ndcg = _mean_ndcg_by_group(y_val, val_pred, val_group_sizes)
+
+                    best_iteration = getattr(ranker, "best_iteration", None)
+                    search_results.append({
+                        "params": {k: v for k, v in candidate.items() if k != "monotone_constraints"},
+                        "train_ndcg_mean": train_ndcg,
+                        "val_ndcg_mean": val_ndcg,
+                        "best_iteration": int(best_iteration) if best_iteration is not None else None,
+                        "wall_s": round(time.perf_counter() - t_candidate, 3),
+                        "peak_rss_mb": _peak_rss_mb() if rss_measured else None,
+                    })
+            metrics["search_wall_s"] = round(time.perf_counter() - search_started, 3)
+            # Whole-run peak of this process (the pool workers report per candidate)
+            metrics["process_peak_rss_mb"] = _process_peak_rss_mb()
+            metrics["search_mode"] = {
+                "workers": search_workers,
+                "threads_per_worker": threads_per_worker,
+                "successive_halving": successive_halving,
+            }
 
-                train_pred = [float(v) for v in ranker.predict(x_train_np)]
-                train_ndcg = _mean_ndcg_by_group(y_train_filtered, train_pred, train_group_sizes_filtered)
-                val_ndcg = None
-                if x_val_np is not None and val_group_sizes:
-                    val_pred = [float(v) for v in ranker.predict(x_val_np)]
-                    val_ndcg = _mean_ndcg_by_group(y_val, val_pred, val_group_sizes)
-
-                result_entry = {
-                    "params": {k: v for k, v in candidate.items() if k != "monotone_constraints"},
-                    "train_ndcg_mean": train_ndcg,
-                    "val_ndcg_mean": val_ndcg,
-                }
-                search_results.append(result_entry)
-
-                metric = val_ndcg if val_ndcg is not None else (train_ndcg or float("-inf"))
-                if metric > best_val_ndcg:
-                    best_val_ndcg = metric
-                    best_ranker = ranker
-                    best_params = candidate
-
-            if best_ranker is None or best_params is None:
+            # Selection: best val NDCG (train NDCG without holdout); ties keep the earlier candidate.
+            finalists = [i for i, entry in enumerate(search_results) if entry.get("pruned_at_rung") is None]
+            if not finalists:
                 raise RuntimeError("Hyperparameter search produced no viable ranker")
-
-            val_ndcg_selected: float | None = None
-            if x_val_np is not None and val_group_sizes:
-                try:
-                    val_pred_sel = [float(v) for v in best_ranker.predict(x_val_np)]
-                    val_ndcg_selected = _mean_ndcg_by_group(y_val, val_pred_sel, val_group_sizes)
-                except Exception:
-                    val_ndcg_selected = None
+            best_index = max(finalists, key=lambda i: (_selection_metric(search_results[i]), -i))
+            best_val_ndcg = _selection_metric(search_results[best_index])
+            if best_val_ndcg == float("-inf"):
+                raise RuntimeError("Hyperparameter search produced no viable ranker")
+            best_params = candidates[best_index]
+            best_entry = search_results[best_index]
+            val_ndcg_selected: float | None = best_entry["val_ndcg_mean"]
 
             # --- Retrain winner on ALL data: tree count from CV winner only (no eval on val). ---
             final_params = dict(best_params)
-            bi = getattr(best_ranker, "best_iteration", None)
+            if threads_per_worker:
+                final_params["n_jobs"] = threads_per_worker
+            bi = best_entry.get("best_iteration")
             if bi is not None:
                 final_params["n_estimators"] = int(bi) + 1
             final_ranker, _final_es_mode = _create_xgb_ranker(
@@ -528,8 +797,8 @@ def train_ranker(
             )
             _fit_xgb_ranker(
                 final_ranker,
-                np.asarray(x, dtype=float),
-                np.asarray(y, dtype=float),
+                x,
+                y.astype(np.float32),
                 group_sizes,
                 eval_set=None,
                 eval_group=None,
@@ -537,7 +806,7 @@ def train_ranker(
                 early_stop_mode=None,
             )
 
-            full_pred = [float(v) for v in final_ranker.predict(np.asarray(x, dtype=float))]
+            full_pred = final_ranker.predict(x)
             full_ndcg = _mean_ndcg_by_group(y, full_pred, group_sizes)
 
             params = {k: v for k, v in best_params.items() if k != "monotone_constraints"}
@@ -551,13 +820,13 @@ def train_ranker(
 
             has_val = len(y_val) > 0
             metrics["validation_has_holdout"] = has_val
-            metrics["validation_groups"] = len(val_group_sizes)
+            metrics["validation_groups"] = int(val_group_sizes.size)
             metrics["validation_rows"] = len(y_val)
             metrics["validation_ndcg_mean"] = (
                 round(val_ndcg_selected, 4) if val_ndcg_selected is not None else None
             )
             if has_val and x_val_np is not None:
-                val_pred_for_k = [float(v) for v in final_ranker.predict(x_val_np)]
+                val_pred_for_k = final_ranker.predict(x_val_np)
                 for k_val in [1, 5, 10, 20]:
                     val_ndcg_k = _ndcg_at_k(y_val, val_pred_for_k, val_group_sizes, k_val)
                     metrics[f"validation_ndcg@{k_val}"] = val_ndcg_k
@@ -24,6 +24,7 @@ from rotas.api import (
     notificacoes,
     prospeccao,
     relatorios,
+    roteamento,
     sensores,
 )
 
@@ -35,6 +36,7 @@ api_bp.register_blueprint(coletas.coletas_bp)
 api_bp.register_blueprint(sensores.sensores_bp)
 api_bp.register_blueprint(notificacoes.notificacoes_bp)
 api_bp.register_blueprint(relatorios.relatorios_bp)
+api_bp.register_blueprint(roteamento.roteamento_bp)
 api_bp.register_blueprint(auxiliares.auxiliares_bp)
 api_bp.register_blueprint(nik.nik_bp)
 
@@ -17,6 +17,7 @@ from banco_dados.services.coletor_service import (
     resumo_operacional,
     validar_dados_coletor,
 )
+from banco_dados.telemetria_auth import obter_cache_credenciais
 from banco_dados.utils.erros import ErroNaoEncontrado, ErroValidacao, tratar_erro_api
 from banco_dados.utils.logger import obter_logger
 from banco_dados.utils.validacao import validar_paginacao
@@ -239,6 +240,7 @@ def atualizar_coletor_endpoint(coletor_id):
 
         # Commit inicial do registro antes da geocodificação
         db.commit()
+        obter_cache_credenciais().invalidar_coletor(coletor_id)
 
         # Geocodificação automática se necessário (APÓS commit)
         if not coordenadas_fornecidas and (localizacao_mudou or not coletor.latitude or not coletor.longitude):
@@ -278,6 +280,7 @@ def deletar_lixeira(coletor_id):
 
         db.delete(coletor)
         db.commit()
+        obter_cache_credenciais().invalidar_coletor(coletor_id)
 
         return jsonify({"mensagem": "Coletor deletada com sucesso"}), 200
     except Exception as e:
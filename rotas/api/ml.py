@@ -33,24 +33,34 @@ def predicao_coletor(coletor_id: int):
     GET /api/ml/predicao/<coletor_id>
     Query params:
       - dias_historico: int (default 7) — dias de série para retornar
+      - granularidade: 'bruta' | 'hora' | 'dia' (default: escolhida pela janela)
     """
-    from banco_dados.services.ml_predicao import (
-        obter_serie_historica,
-        predizer_enchimento_coletor,
-    )
+    from banco_dados.services.leituras_rollup import PASSO_MIN, obter_serie
+    from banco_dados.services.ml_predicao import predizer_enchimento_coletor
+
+    dias = request.args.get("dias_historico", 7, type=int)
+    granularidade = request.args.get("granularidade") or None
+    if granularidade is not None and granularidade not in PASSO_MIN:
+        return jsonify({
+            "ok": False,
+            "dados": None,
+            "erros": [{
+                "codigo": "PARAMETRO_INVALIDO",
+                "mensagem": f"granularidade deve ser uma de {sorted(PASSO_MIN)}",
+            }],
+        }), 400
 
     db = get_db()
     try:
         resultado = predizer_enchimento_coletor(db, coletor_id)
-
-        dias = request.args.get("dias_historico", 7, type=int)
-        serie = obter_serie_historica(db, coletor_id, dias=dias)
+        granularidade, serie = obter_serie(db, coletor_id, dias, granularidade)
 
         return jsonify({
             "ok": True,
             "dados": {
                 "predicao": resultado,
                 "serie_historica": serie,
+                "granularidade_serie": granularidade,
             },
             "erros": [],
         })
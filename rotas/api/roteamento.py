@@ -0,0 +1,99 @@
+"""
+Rotas de Roteamento - Dashboard-TRONIK
+======================================
+Otimização server-side da ordem de visita aos coletores (multi-parada) e
+matriz de distâncias em cache entre sede e coletores.
+"""
+
+from flask import Blueprint, request
+from flask_login import login_required
+
+from banco_dados.contratos import OtimizarRotaIn, parse_ou_erro
+from banco_dados.modelos import Coletor
+from banco_dados.services.distancias_coletores import obter_matriz_coletores
+from banco_dados.services.roteamento import MAX_PARADAS, otimizar_rota
+from banco_dados.utils.erros import ErroValidacao, resposta_ok, tratar_erro_api
+from banco_dados.utils.logger import obter_logger
+from rotas.api import decorators
+from rotas.api.decorators import escopo_parceiro_id, get_db
+
+logger = obter_logger(__name__)
+
+roteamento_bp = Blueprint('roteamento', __name__)
+
+
+@roteamento_bp.route('/rotas/otimizar', methods=['POST'])
+@login_required
+@decorators.rate_limit("30 per minute")
+def otimizar():
+    """Ordem de visita (vizinho mais próximo + 2-opt/Or-opt) sobre o grafo viário do DF.
+
+    POST /api/rotas/otimizar
+    Body (todos opcionais): coletor_ids, origem_lat/origem_lon (default: sede),
+    retornar_origem, nivel_minimo, parceiro_id.
+    """
+    db = get_db()
+    try:
+        payload = parse_ou_erro(OtimizarRotaIn, request.get_json(silent=True) or {})
+        origem = None
+        if payload.origem_lat is not None and payload.origem_lon is not None:
+            origem = (payload.origem_lat, payload.origem_lon)
+        resultado = otimizar_rota(
+            db,
+            coletor_ids=payload.coletor_ids,
+            origem=origem,
+            retornar=payload.retornar_origem,
+            nivel_minimo=payload.nivel_minimo,
+            parceiro_id=escopo_parceiro_id(payload.parceiro_id),
+        )
+        logger.info(
+            "Rota otimizada: %d paradas, %.1f km (%s) em %.0f ms",
+            len(resultado['paradas']), resultado['distancia_total_km'],
+            resultado['metrica'], resultado['tempo_calculo_ms']['total'],
+        )
+        return resposta_ok(resultado)
+    except Exception as e:
+        return tratar_erro_api(e)
+    finally:
+        db.close()
+
+
+@roteamento_bp.route('/rotas/matriz', methods=['GET'])
+@login_required
+@decorators.rate_limit("60 per minute")
+def matriz_distancias_coletores():
+    """Distâncias (km) entre sede e coletores, lidas da matriz em cache.
+
+    GET /api/rotas/matriz?coletor_ids=1,2,3
+    Sem ``coletor_ids``: todos os coletores com coordenadas (no escopo do usuário).
+    Linha/coluna 0 de ``km`` é a sede; as seguintes seguem ``coletor_ids``.
+    """
+    db = get_db()
+    try:
+        bruto = request.args.get('coletor_ids', '')
+        try:
+            pedidos = [int(x) for x in bruto.split(',') if x.strip()]
+        except ValueError as exc:
+            raise ErroValidacao("coletor_ids deve ser uma lista de inteiros separados por vírgula") from exc
+
+        matriz = obter_matriz_coletores(db)
+        q = db.query(Coletor.id)
+        parceiro_id = escopo_parceiro_id(request.args.get('parceiro_id', type=int))
+        if parceiro_id is not None:
+            q = q.filter(Coletor.parceiro_id == parceiro_id)
+        permitidos = {r[0] for r in q if r[0] in matriz}
+        ids = [i for i in (pedidos or sorted(permitidos)) if i in permitidos]
+        if len(ids) > MAX_PARADAS:
+            raise ErroValidacao(f"Máximo de {MAX_PARADAS} coletores por matriz (pedidos {len(ids)})")
+
+        return resposta_ok({
+            'coletor_ids': ids,
+            'ignorados': [i for i in pedidos if i not in permitidos],
+            'sede': {'latitude': float(matriz.lat[0]), 'longitude': float(matriz.lon[0])},
+            'metrica': matriz.metrica,
+            'km': [[round(v, 3) for v in linha] for linha in matriz.submatriz(ids).tolist()],
+        })
+    except Exception as e:
+        return tratar_erro_api(e)
+    finally:
+        db.close()
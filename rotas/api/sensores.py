@@ -5,9 +5,9 @@ Endpoints para operações CRUD de sensores.
 """
 
 import secrets
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_login import login_required
 from sqlalchemy.orm import joinedload
 
@@ -18,7 +18,11 @@ from banco_dados.serializers import (
     notificacao_para_dict,
     sensor_para_dict,
 )
-from banco_dados.telemetria_auth import validar_telemetria
+from banco_dados.telemetria_auth import (
+    CredencialSensor,
+    obter_cache_credenciais,
+    validar_credencial,
+)
 from banco_dados.utils import utc_now_naive
 from banco_dados.utils.cache import obter_cache
 from banco_dados.utils.erros import (
@@ -125,6 +129,7 @@ def criar_sensor():
         db.add(novo_sensor)
         db.commit()
         db.refresh(novo_sensor)
+        obter_cache_credenciais().invalidar(novo_sensor.id)
 
         # Carregar relacionamentos
         novo_sensor = db.query(Sensor).options(
@@ -181,6 +186,7 @@ def atualizar_sensor(sensor_id):
 
         db.commit()
         db.refresh(sensor)
+        obter_cache_credenciais().invalidar(sensor_id)
 
         # Carregar relacionamentos
         sensor = db.query(Sensor).options(
@@ -208,6 +214,7 @@ def deletar_sensor(sensor_id):
 
         db.delete(sensor)
         db.commit()
+        obter_cache_credenciais().invalidar(sensor_id)
 
         return jsonify({"mensagem": "Sensor deletado com sucesso"}), 200
     except Exception as e:
@@ -224,139 +231,224 @@ LIMIAR_BATERIA_BAIXA = 20.0 # % abaixo do qual vira alerta 'bateria_baixa'
 JANELA_DEDUP_HORAS = 24     # nao recriar a mesma notificacao dentro desse periodo
 
 
+def _momento_leitura(payload):
+    """Timestamp do device em UTC naive (coluna DateTime sem tz); utc_now se ausente."""
+    if payload.timestamp is None:
+        return utc_now_naive()
+    if payload.timestamp.tzinfo is not None:
+        return payload.timestamp.astimezone(UTC).replace(tzinfo=None)
+    return payload.timestamp
+
+
+def _verificar_credencial(credencial, payload):
+    """Dono + token a partir da credencial (cache ou recém-lida); levanta ErroAPI."""
+    if credencial.coletor_id != payload.coletor_id:
+        raise ErroValidacao(
+            "sensor_id nao pertence ao coletor_id informado",
+            {"detalhes": {"coletor_id": payload.coletor_id, "sensor_id": payload.sensor_id}},
+        )
+    validar_credencial(credencial, payload.api_key)
+
+
+def _linha_historico(payload, momento):
+    return {
+        "sensor_id": payload.sensor_id,
+        "coletor_id": payload.coletor_id,
+        "nivel": payload.nivel_preenchimento,
+        "bateria": payload.bateria,
+        "timestamp": momento,
+    }
+
+
+def _notificados_recentemente(db, coletor_ids, sensor_ids):
+    """(coletores com 'lixeira_cheia', sensores com 'bateria_baixa') na janela de dedup.
+
+    Uma query por tipo para o lote inteiro, em vez de uma por leitura.
+    """
+    from banco_dados.modelos import Notificacao
+
+    limite_tempo = utc_now_naive() - timedelta(hours=JANELA_DEDUP_HORAS)
+    cheios, bateria = set(), set()
+    if coletor_ids:
+        cheios = {
+            cid for (cid,) in db.query(Notificacao.coletor_id).filter(
+                Notificacao.coletor_id.in_(coletor_ids),
+                Notificacao.tipo == "lixeira_cheia",
+                Notificacao.criada_em >= limite_tempo,
+            ).distinct()
+        }
+    if sensor_ids:
+        bateria = {
+            sid for (sid,) in db.query(Notificacao.sensor_id).filter(
+                Notificacao.sensor_id.in_(sensor_ids),
+                Notificacao.tipo == "bateria_baixa",
+                Notificacao.criada_em >= limite_tempo,
+            ).distinct()
+        }
+    return cheios, bateria
+
+
+def _aplicar_nivel(db, coletor, nivel, ja_notificados):
+    """Atualiza nivel/status do coletor; devolve a notificacao criada (ou None)."""
+    from banco_dados.notificacoes import criar_notificacao
+
+    coletor.nivel_preenchimento = nivel
+    if nivel <= LIMIAR_NIVEL_CHEIO:
+        if coletor.status == "CHEIA":
+            coletor.status = "OK"
+        return None
+    if coletor.status != "QUEBRADA":
+        coletor.status = "CHEIA"
+    if coletor.id in ja_notificados:
+        return None
+    ja_notificados.add(coletor.id)
+    return criar_notificacao(
+        db=db,
+        tipo="lixeira_cheia",
+        titulo=f"Coletor #{coletor.id} - Nivel Alto",
+        mensagem=(
+            f"O coletor em {coletor.localizacao} esta com "
+            f"{coletor.nivel_preenchimento:.1f}% de preenchimento."
+        ),
+        coletor_id=coletor.id,
+        commit=False,
+        emitir=False,
+    )
+
+
+def _aplicar_bateria(db, sensor, coletor, bateria, momento, ja_notificados):
+    """Atualiza bateria/ultimo_ping do sensor; devolve a notificacao criada (ou None)."""
+    from banco_dados.notificacoes import criar_notificacao
+
+    sensor.bateria = bateria
+    sensor.ultimo_ping = momento
+    if bateria >= LIMIAR_BATERIA_BAIXA or sensor.id in ja_notificados:
+        return None
+    ja_notificados.add(sensor.id)
+    return criar_notificacao(
+        db=db,
+        tipo="bateria_baixa",
+        titulo=f"Sensor #{sensor.id} - Bateria Baixa",
+        mensagem=(
+            f"O sensor do coletor em {coletor.localizacao} esta com "
+            f"{sensor.bateria:.1f}% de bateria."
+        ),
+        sensor_id=sensor.id,
+        coletor_id=coletor.id,
+        commit=False,
+        emitir=False,
+    )
+
+
+def _publicar_telemetria(coletores, sensores, notificacoes):
+    """Invalida caches derivados e emite via WebSocket (chamar depois do commit)."""
+    # Dados derivados precisam refletir a leitura já no próximo GET/F5.
+    cache = obter_cache()
+    cache.invalidar("estatisticas")
+    for parceiro_id in {c.parceiro_id for c in coletores if c.parceiro_id is not None}:
+        cache.invalidar(f"estatisticas:{parceiro_id}")
+    cache.invalidar("preview:estatisticas_resumo")
+    cache.invalidar("preview:coletores_geojson")
+
+    # Emitir somente depois do commit: o cliente nunca recebe estado ainda
+    # não persistido e a telemetria passa a atualizar o dashboard em tempo real.
+    try:
+        from rotas.websocket import (
+            emitir_atualizacao_coletor,
+            emitir_atualizacao_sensor,
+            emitir_nova_notificacao,
+        )
+
+        emissoes = [
+            *[("coletor", emitir_atualizacao_coletor, coletor_para_dict, c) for c in coletores],
+            *[("sensor", emitir_atualizacao_sensor, sensor_para_dict, s) for s in sensores],
+            *[
+                ("notificacao", emitir_nova_notificacao, notificacao_para_dict, notificacao)
+                for notificacao in notificacoes
+            ],
+        ]
+    except Exception as emit_error:
+        logger.warning("Erro ao preparar emissoes da telemetria: %s", emit_error)
+        emissoes = []
+
+    for tipo_evento, emitir, serializar, objeto in emissoes:
+        try:
+            emitir(serializar(objeto))
+        except Exception as emit_error:
+            logger.warning(
+                "Erro ao emitir %s da telemetria via WebSocket: %s",
+                tipo_evento,
+                emit_error,
+            )
+
+
 @sensores_bp.route("/sensor/telemetria", methods=["POST"])
 @decorators.rate_limit("100 per minute")
 def receber_telemetria():
     """Recebe telemetria do ESP32 e persiste estado + notificacoes.
 
     - Valida o payload com `TelemetriaIn` (Pydantic v2) antes de tocar no DB.
-    - Atualiza nivel do Coletor e bateria/ultimo_ping do Sensor.
+    - Atualiza nivel do Coletor e bateria/ultimo_ping do Sensor e grava a
+      leitura em `leituras_sensor` + agregados hora/dia (series de `ml_predicao`).
     - Gera notificacoes (`lixeira_cheia`, `bateria_baixa`) com dedup por 24h.
     - Resposta tipada por `TelemetriaOut`.
-    """
-    from datetime import timedelta
 
+    Com a credencial do sensor em cache (``telemetria_auth.CacheCredenciais``),
+    token ou coletor errados são rejeitados sem consultar o banco. O estado
+    (nível, bateria, ``ultimo_ping``) sempre é lido e gravado no banco: com
+    vários workers, um estado guardado por processo ficaria desatualizado.
+    """
     from banco_dados.contratos import TelemetriaIn, TelemetriaOut, parse_ou_erro
-    from banco_dados.modelos import Coletor, Notificacao
-    from banco_dados.notificacoes import criar_notificacao
+    from banco_dados.modelos import Coletor, LeituraSensor
+    from banco_dados.services.leituras_rollup import acumular as acumular_rollups
 
     db = get_db()
     try:
         payload = parse_ou_erro(TelemetriaIn, request.get_json(silent=True))
 
+        credenciais = obter_cache_credenciais()
+        credencial = credenciais.obter(payload.sensor_id)
+        if credencial is not None:
+            _verificar_credencial(credencial, payload)
+
         coletor = db.query(Coletor).filter(Coletor.id == payload.coletor_id).first()
         sensor = db.query(Sensor).filter(Sensor.id == payload.sensor_id).first()
         if not coletor:
             raise ErroNaoEncontrado("Coletor", payload.coletor_id)
         if not sensor:
+            credenciais.invalidar(payload.sensor_id)
             raise ErroNaoEncontrado("Sensor", payload.sensor_id)
         if sensor.coletor_id != coletor.id:
+            credenciais.invalidar(payload.sensor_id)
             raise ErroValidacao(
                 "sensor_id nao pertence ao coletor_id informado",
                 {"detalhes": {"coletor_id": payload.coletor_id, "sensor_id": payload.sensor_id}},
             )
 
-        validar_telemetria(sensor, payload.api_key)
-
-        notificacoes = []
-        limite_tempo = utc_now_naive() - timedelta(hours=JANELA_DEDUP_HORAS)
-
-        coletor.nivel_preenchimento = payload.nivel_preenchimento
-        if payload.nivel_preenchimento > LIMIAR_NIVEL_CHEIO:
-            if coletor.status != "QUEBRADA":
-                coletor.status = "CHEIA"
-            ja_existe = (
-                db.query(Notificacao)
-                .filter(
-                    Notificacao.coletor_id == coletor.id,
-                    Notificacao.tipo == "lixeira_cheia",
-                    Notificacao.criada_em >= limite_tempo,
-                )
-                .first()
-            )
-            if not ja_existe:
-                notificacoes.append(criar_notificacao(
-                    db=db,
-                    tipo="lixeira_cheia",
-                    titulo=f"Coletor #{coletor.id} - Nivel Alto",
-                    mensagem=(
-                        f"O coletor em {coletor.localizacao} esta com "
-                        f"{coletor.nivel_preenchimento:.1f}% de preenchimento."
-                    ),
-                    coletor_id=coletor.id,
-                    commit=False,
-                    emitir=False,
-                ))
-        elif payload.nivel_preenchimento <= LIMIAR_NIVEL_CHEIO and coletor.status == "CHEIA":
-            coletor.status = "OK"
-
-        sensor.bateria = payload.bateria
-        sensor.ultimo_ping = payload.timestamp or utc_now_naive()
-        if payload.bateria < LIMIAR_BATERIA_BAIXA:
-            ja_existe = (
-                db.query(Notificacao)
-                .filter(
-                    Notificacao.sensor_id == sensor.id,
-                    Notificacao.tipo == "bateria_baixa",
-                    Notificacao.criada_em >= limite_tempo,
-                )
-                .first()
-            )
-            if not ja_existe:
-                notificacoes.append(criar_notificacao(
-                    db=db,
-                    tipo="bateria_baixa",
-                    titulo=f"Sensor #{sensor.id} - Bateria Baixa",
-                    mensagem=(
-                        f"O sensor do coletor em {coletor.localizacao} esta com "
-                        f"{sensor.bateria:.1f}% de bateria."
-                    ),
-                    sensor_id=sensor.id,
-                    coletor_id=coletor.id,
-                    commit=False,
-                    emitir=False,
-                ))
+        # Credencial recém-lida fica em cache mesmo se o token falhar: a próxima
+        # tentativa com token errado é rejeitada sem consultar o banco.
+        credencial = CredencialSensor.de_sensor(sensor, coletor.parceiro_id)
+        credenciais.definir(credencial)
+        validar_credencial(credencial, payload.api_key)
+
+        momento = _momento_leitura(payload)
+        cheios, bateria = _notificados_recentemente(
+            db,
+            [coletor.id] if payload.nivel_preenchimento > LIMIAR_NIVEL_CHEIO else [],
+            [sensor.id] if payload.bateria < LIMIAR_BATERIA_BAIXA else [],
+        )
+        notificacoes = [
+            n for n in (
+                _aplicar_nivel(db, coletor, payload.nivel_preenchimento, cheios),
+                _aplicar_bateria(db, sensor, coletor, payload.bateria, momento, bateria),
+            ) if n is not None
+        ]
+        linha = _linha_historico(payload, momento)
+        db.add(LeituraSensor(**linha))
+        acumular_rollups(db, [linha])
 
         db.commit()
-
-        # Dados derivados precisam refletir a leitura já no próximo GET/F5.
-        cache = obter_cache()
-        cache.invalidar("estatisticas")
-        if coletor.parceiro_id is not None:
-            cache.invalidar(f"estatisticas:{coletor.parceiro_id}")
-        cache.invalidar("preview:estatisticas_resumo")
-        cache.invalidar("preview:coletores_geojson")
-
-        # Emitir somente depois do commit: o cliente nunca recebe estado ainda
-        # não persistido e a telemetria passa a atualizar o dashboard em tempo real.
-        try:
-            from rotas.websocket import (
-                emitir_atualizacao_coletor,
-                emitir_atualizacao_sensor,
-                emitir_nova_notificacao,
-            )
-
-            emissoes = [
-                ("coletor", emitir_atualizacao_coletor, coletor_para_dict, coletor),
-                ("sensor", emitir_atualizacao_sensor, sensor_para_dict, sensor),
-                *[
-                    ("notificacao", emitir_nova_notificacao, notificacao_para_dict, notificacao)
-                    for notificacao in notificacoes
-                ],
-            ]
-        except Exception as emit_error:
-            logger.warning("Erro ao preparar emissoes da telemetria: %s", emit_error)
-            emissoes = []
-
-        for tipo_evento, emitir, serializar, objeto in emissoes:
-            try:
-                emitir(serializar(objeto))
-            except Exception as emit_error:
-                logger.warning(
-                    "Erro ao emitir %s da telemetria via WebSocket: %s",
-                    tipo_evento,
-                    emit_error,
-                )
+        _publicar_telemetria([coletor], [sensor], notificacoes)
 
         resposta = TelemetriaOut(
             mensagem="Telemetria registrada com sucesso",
@@ -375,3 +467,169 @@ def receber_telemetria():
         return tratar_erro_api(e)
     finally:
         db.close()
+
+
+@sensores_bp.route("/sensor/telemetria/lote", methods=["POST"])
+@decorators.rate_limit("60 per minute")
+def receber_telemetria_lote():
+    """Recebe um lote de leituras (gateway / firmware com buffer offline).
+
+    Body: ``{"leituras": [TelemetriaIn, ...]}`` (ou a lista crua), até
+    ``MAX_LEITURAS_LOTE`` itens. Diferenças para o endpoint unitário:
+
+    - cada item é validado e autenticado à parte; os inválidos voltam em
+      ``rejeitadas`` (com o índice) sem derrubar o lote;
+    - credenciais em cache rejeitam token/coletor errados sem consultar o banco;
+      os demais sensores e coletores são carregados com duas queries ``IN`` e o
+      dedup de notificações com uma query por tipo;
+    - todas as leituras aceitas vão para ``leituras_sensor`` pelo buffer
+      write-behind (``services.telemetria_buffer``), fora desta transação;
+    - Coletor/Sensor recebem só o estado mais recente de cada um (leituras mais
+      antigas que o ``ultimo_ping`` atual entram no histórico mas não no estado),
+      num único commit, com uma invalidação de cache e uma emissão por entidade.
+    """
+    from pydantic import ValidationError
+
+    from banco_dados.contratos import (
+        LeituraRejeitada,
+        TelemetriaIn,
+        TelemetriaLoteIn,
+        TelemetriaLoteOut,
+        parse_ou_erro,
+    )
+    from banco_dados.modelos import Coletor
+    from banco_dados.services.telemetria_buffer import obter_buffer
+    from banco_dados.utils.erros import ErroAPI
+
+    db = get_db()
+    try:
+        corpo = request.get_json(silent=True)
+        if isinstance(corpo, list):
+            corpo = {"leituras": corpo}
+        lote = parse_ou_erro(TelemetriaLoteIn, corpo)
+
+        rejeitadas = []
+        validas = []
+        for indice, bruto in enumerate(lote.leituras):
+            try:
+                validas.append((indice, TelemetriaIn.model_validate(bruto)))
+            except ValidationError as exc:
+                rejeitadas.append(LeituraRejeitada(
+                    indice=indice,
+                    motivo="Erros de validacao no payload",
+                    detalhes=[
+                        {"campo": ".".join(str(p) for p in err["loc"]), "mensagem": err["msg"]}
+                        for err in exc.errors()
+                    ],
+                ))
+
+        # Credenciais em cache rejeitam token/coletor errados antes das queries
+        credenciais = obter_cache_credenciais()
+        candidatas = []
+        for indice, payload in validas:
+            credencial = credenciais.obter(payload.sensor_id)
+            if credencial is not None:
+                try:
+                    _verificar_credencial(credencial, payload)
+                except ErroAPI as erro:
+                    rejeitadas.append(LeituraRejeitada(indice=indice, motivo=erro.mensagem))
+                    continue
+            candidatas.append((indice, payload))
+
+        sensores = {
+            s.id: s for s in db.query(Sensor).filter(
+                Sensor.id.in_({p.sensor_id for _, p in candidatas})
+            )
+        }
+        coletores = {
+            c.id: c for c in db.query(Coletor).filter(
+                Coletor.id.in_({p.coletor_id for _, p in candidatas})
+            )
+        }
+
+        lidas = {}  # sensor_id -> CredencialSensor recém-lida do banco
+        aceitas = []  # (momento, indice, payload)
+        for indice, payload in candidatas:
+            sensor = sensores.get(payload.sensor_id)
+            try:
+                if payload.coletor_id not in coletores:
+                    raise ErroNaoEncontrado("Coletor", payload.coletor_id)
+                if sensor is None:
+                    credenciais.invalidar(payload.sensor_id)
+                    raise ErroNaoEncontrado("Sensor", payload.sensor_id)
+                if sensor.coletor_id != payload.coletor_id:
+                    credenciais.invalidar(payload.sensor_id)
+                    raise ErroValidacao("sensor_id nao pertence ao coletor_id informado")
+                if sensor.id not in lidas:
+                    lidas[sensor.id] = CredencialSensor.de_sensor(sensor, coletores[sensor.coletor_id].parceiro_id)
+                    credenciais.definir(lidas[sensor.id])
+                validar_credencial(lidas[sensor.id], payload.api_key)
+            except ErroAPI as erro:
+                rejeitadas.append(LeituraRejeitada(indice=indice, motivo=erro.mensagem))
+                continue
+            aceitas.append((_momento_leitura(payload), indice, payload))
+
+        # Estado: a leitura mais recente (timestamp, depois ordem no lote) de cada
+        # sensor — e, por coletor, a mais recente entre os seus sensores.
+        ultima_sensor = {}
+        for momento, _, payload in sorted(aceitas, key=lambda a: a[:2]):
+            sensor = sensores[payload.sensor_id]
+            if sensor.ultimo_ping is None or momento >= sensor.ultimo_ping:
+                ultima_sensor[payload.sensor_id] = (momento, payload)
+        ultima_coletor = {}
+        for _, payload in sorted(ultima_sensor.values(), key=lambda a: a[0]):
+            ultima_coletor[payload.coletor_id] = payload
+
+        cheios, bateria = _notificados_recentemente(
+            db,
+            [cid for cid, p in ultima_coletor.items() if p.nivel_preenchimento > LIMIAR_NIVEL_CHEIO],
+            [sid for sid, (_, p) in ultima_sensor.items() if p.bateria < LIMIAR_BATERIA_BAIXA],
+        )
+        notificacoes = []
+        for coletor_id, payload in ultima_coletor.items():
+            notificacoes.append(_aplicar_nivel(db, coletores[coletor_id], payload.nivel_preenchimento, cheios))
+        for sensor_id, (momento, payload) in ultima_sensor.items():
+            notificacoes.append(_aplicar_bateria(
+                db, sensores[sensor_id], coletores[payload.coletor_id], payload.bateria, momento, bateria,
+            ))
+        notificacoes = [n for n in notificacoes if n is not None]
+
+        if ultima_sensor:
+            db.commit()
+            _publicar_telemetria(
+                [coletores[cid] for cid in ultima_coletor],
+                [sensores[sid] for sid in ultima_sensor],
+                notificacoes,
+            )
+
+        # Histórico só depois do commit: uma descarga por tamanho usa (e fecha)
+        # a sessão do pedido quando a fábrica é um scoped_session.
+        pendentes = obter_buffer().adicionar(
+            [_linha_historico(p, momento) for momento, _, p in aceitas],
+            current_app.config["DATABASE_SESSION"],
+        )
+
+        if rejeitadas:
+            logger.warning(
+                "Telemetria em lote: %d de %d leituras rejeitadas",
+                len(rejeitadas), len(lote.leituras),
+            )
+        resposta = TelemetriaLoteOut(
+            status="ok" if aceitas else "erro",
+            mensagem=f"{len(aceitas)} de {len(lote.leituras)} leituras registradas",
+            recebidas=len(lote.leituras),
+            aceitas=len(aceitas),
+            rejeitadas=sorted(rejeitadas, key=lambda r: r.indice),
+            coletores_atualizados=len(ultima_coletor),
+            sensores_atualizados=len(ultima_sensor),
+            notificacoes_criadas=len(notificacoes),
+            leituras_pendentes=pendentes,
+        )
+        return jsonify(resposta.model_dump(mode="json")), 200 if aceitas else 400
+
+    except Exception as e:
+        db.rollback()
+        logger.error("Erro em telemetria em lote: %s", e)
+        return tratar_erro_api(e)
+    finally:
+        db.close()
@@ -28,7 +28,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from banco_dados.modelos import Base, Coletor, LeituraSensor, Sensor
+from banco_dados.modelos import Base, Coletor, LeituraDiaria, LeituraHoraria, LeituraSensor, Sensor
+from banco_dados.services.leituras_rollup import reconstruir_rollups
 from banco_dados.utils import utc_now_naive
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -260,6 +261,13 @@ def gerar_dados_sinteticos(
 
             logger.info(f"    → {len(batch)} leituras geradas")
 
+        # Agregados hora/dia do período gerado (o endpoint mantém-nos incrementalmente;
+        # aqui as leituras entram por fora dele)
+        primeiro_dia = inicio.replace(hour=0, minute=0, second=0, microsecond=0)
+        db.query(LeituraHoraria).filter(LeituraHoraria.inicio >= primeiro_dia).delete(synchronize_session=False)
+        db.query(LeituraDiaria).filter(LeituraDiaria.inicio >= primeiro_dia).delete(synchronize_session=False)
+        reconstruir_rollups(db, primeiro_dia, agora + timedelta(days=1))
+
         db.commit()
 
         leituras_por_coletor = stats['leituras_geradas'] // max(stats['coletores'], 1)
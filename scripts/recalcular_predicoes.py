@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Recálculo em lote das predições de enchimento — TRONIK Recicla.
+
+Mesmo processamento do job agendado (``recalcular_predicoes_todos``), mas com o
+AutoETS distribuído num pool de processos. O pool fica fora do processo web: com
+spawn cada filho reimporta o ``__main__`` do pai, e sob ``python app.py`` isso
+subiria um agendador por worker. Para usar só este caminho (cron), desligue o
+job com ``ML_PREDICAO_ENABLED=false``.
+
+Uso:
+    python scripts/recalcular_predicoes.py [--workers 4] [--sem-autoets]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+
+# Adicionar raiz do projeto ao path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.services.ml_predicao import ML_PREDICAO_WORKERS, recalcular_predicoes_todos
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main(workers: int, usar_autoets: bool, database_url: str | None = None) -> int:
+    """Recalcula e grava as predições; devolve o código de saída."""
+    database_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///tronik.db')
+    engine = create_engine(database_url, echo=False)
+    db = sessionmaker(bind=engine)()
+    try:
+        stats = recalcular_predicoes_todos(db, usar_autoets=usar_autoets, workers=workers)
+    except Exception as e:
+        logger.error(f"Erro ao recalcular predições: {e}", exc_info=True)
+        return 1
+    finally:
+        db.close()
+    logger.info(f"✅ Predições recalculadas ({workers} processo(s)): {stats}")
+    return 1 if stats['falha'] else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalcular predições de enchimento em lote')
+    parser.add_argument('--workers', type=int, default=ML_PREDICAO_WORKERS,
+                        help=f'Processos AutoETS (default: ML_PREDICAO_WORKERS = {ML_PREDICAO_WORKERS})')
+    parser.add_argument('--sem-autoets', action='store_true', help='Só a regressão linear')
+    parser.add_argument('--db-url', type=str, default=None, help='Database URL (default: env DATABASE_URL)')
+    args = parser.parse_args()
+    sys.exit(main(args.workers, not args.sem_autoets, args.db_url))
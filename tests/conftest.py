@@ -60,6 +60,8 @@ def db_session(test_db):
         EmpresaCandidata,
         FeatureSnapshotProspeccao,
         FontePublicaRegistro,
+        LeituraDiaria,
+        LeituraHoraria,
         LeituraSensor,
         LocalCandidato,
         ModeloProspeccao,
@@ -105,6 +107,8 @@ def db_session(test_db):
 
         # Tier 7: Leitura Sensor, Predições e Scores TRONIK (dependem de Coletor/Sensor)
         session.query(LeituraSensor).delete()
+        session.query(LeituraHoraria).delete()
+        session.query(LeituraDiaria).delete()
         session.query(PredicaoEnchimento).delete()
         session.query(TronikScore).delete()
         session.query(Notificacao).delete()
@@ -148,6 +152,10 @@ def client(test_db, db_session, monkeypatch):
     from rotas.api._limiter import limiter as api_limiter
     api_limiter.enabled = False
 
+    # Ids de sensores se repetem entre testes (tabelas limpas a cada teste)
+    from banco_dados.telemetria_auth import obter_cache_credenciais
+    obter_cache_credenciais().invalidar()
+
     # Criar cliente de teste
     with app.test_client() as client, app.app_context():
         yield client
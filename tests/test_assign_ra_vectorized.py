@@ -0,0 +1,75 @@
+"""Vectorized RA assignment must match the per-point ``_point_in_ra`` loop."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import Base, EmpresaCandidata, LocalCandidato
+
+pytest.importorskip("shapely")
+
+from jobs.prospeccao.normalize_candidates import (  # noqa: E402
+    _load_ra_polygons,
+    _point_in_ra,
+    assign_ra,
+)
+
+
+def _square(x0: float, y0: float, size: float) -> dict:
+    ring = [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+    return {"type": "Polygon", "coordinates": [ring]}
+
+
+def _geojson(tmp_path):
+    features = [
+        {"type": "Feature", "properties": {"ra": "Plano Piloto"}, "geometry": _square(-48.0, -16.0, 0.2)},
+        # Overlaps the first square: first polygon in file order must win.
+        {"type": "Feature", "properties": {"NOME": "Cruzeiro"}, "geometry": _square(-47.9, -15.9, 0.2)},
+        {"type": "Feature", "properties": {"nm_ra": "Gama"}, "geometry": _square(-48.3, -16.3, 0.1)},
+    ]
+    path = tmp_path / "ras.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}), encoding="utf-8")
+    return path
+
+
+def test_assign_ra_vectorized_matches_point_loop(tmp_path):
+    geojson = _geojson(tmp_path)
+    polygons, _ = _load_ra_polygons(geojson)
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+
+    empresa = EmpresaCandidata(cnpj="11111111000191", razao_social="ALFA")
+    db.add(empresa)
+    db.flush()
+    coords = [
+        (-15.95, -47.95),  # Plano Piloto only
+        (-15.85, -47.85),  # overlap
+        (-15.75, -47.75),  # Cruzeiro only
+        (-16.25, -48.25),  # Gama
+        (-10.0, -40.0),  # outside
+    ]
+    for i, (lat, lon) in enumerate(coords):
+        db.add(LocalCandidato(empresa_id=empresa.id, latitude=lat, longitude=lon, endereco=f"E{i}"))
+    db.add(LocalCandidato(empresa_id=empresa.id, latitude=-15.95, longitude=-47.95, ra="Manual"))
+    db.commit()
+
+    stats = assign_ra(db, geojson, chunk_size=2)
+    db.commit()
+
+    expected = [_point_in_ra(lat, lon, polygons) for lat, lon in coords]
+    got = [
+        loc.ra
+        for loc in db.query(LocalCandidato).filter(LocalCandidato.endereco.isnot(None)).order_by(LocalCandidato.id)
+    ]
+    assert got == expected == ["Plano Piloto", "Plano Piloto", "Cruzeiro", "Gama", None]
+    assert stats["engine"] == "strtree"
+    assert stats["assigned"] == 4
+    assert stats["outside_df"] == 1
+    assert stats["points"] == 5
+    assert 0 < stats["polygons_per_point"] <= len(polygons)
+    assert db.query(LocalCandidato).filter_by(ra="Manual").count() == 1
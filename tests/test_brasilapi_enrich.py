@@ -0,0 +1,125 @@
+"""Brasil API enrichment against a local stub server: concurrency, 429 backoff, disk cache."""
+
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import Base, EmpresaCandidata
+from jobs.prospeccao import config
+from jobs.prospeccao.brasilapi_enrich import _TokenBucket, enrich_via_brasilapi
+
+_FOUND = {f"1100000000{i:04d}" for i in range(6)}
+_THROTTLED_ONCE = "11000000000003"
+_MISSING = "22000000000001"
+
+
+class _Stub(BaseHTTPRequestHandler):
+    hits: list[str] = []
+    throttled: set[str] = set()
+    lock = threading.Lock()
+
+    def do_GET(self):  # noqa: N802 - BaseHTTPRequestHandler API
+        cnpj = self.path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.hits.append(cnpj)
+            throttle = cnpj == _THROTTLED_ONCE and cnpj not in self.throttled
+            if throttle:
+                self.throttled.add(cnpj)
+        if throttle:
+            self._send(429, b"{}", {"Retry-After": "0"})
+        elif cnpj in _FOUND:
+            body = {
+                "cnpj": cnpj,
+                "email": f"contato{cnpj[-2:]}@empresa.com.br",
+                "ddd_telefone_1": "6133334444",
+                "cnaes_secundarios": [{"codigo": 3831901}],
+                "descricao_natureza_juridica": "Sociedade Empresária Limitada",
+            }
+            self._send(200, json.dumps(body).encode())
+        else:
+            self._send(404, b'{"message": "CNPJ not found"}')
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    _Stub.hits, _Stub.throttled = [], set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    monkeypatch.setattr(config, "BRASILAPI_BASE", f"http://127.0.0.1:{server.server_port}/api/cnpj/v1")
+    yield _Stub
+    server.shutdown()
+    server.server_close()
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    for i, cnpj in enumerate([*sorted(_FOUND), _MISSING, "123"]):
+        db.add(EmpresaCandidata(cnpj=cnpj, razao_social=f"Empresa {i}", telefone="61999990000" if i == 0 else None))
+    db.commit()
+    return db
+
+
+def test_concurrent_enrich_backoff_and_cache(stub_api, tmp_path):
+    db = _session()
+    result = enrich_via_brasilapi(db, rate_per_s=200, burst=4, workers=4, cache_dir=tmp_path)
+
+    assert result["candidatas"] == 8
+    assert result["cnpj_invalido"] == 1
+    assert result["consultadas"] == 7 and result["cache_hits"] == 0
+    assert result["nao_encontradas"] == 1 and result["erros"] == 0
+    assert result["rate_limited"] == 1
+    assert result["enriquecidas_email"] == 6
+    assert result["enriquecidas_telefone"] == 5  # first company already had a phone
+    assert stub_api.hits.count(_THROTTLED_ONCE) == 2
+    first = db.query(EmpresaCandidata).filter_by(cnpj=sorted(_FOUND)[0]).one()
+    assert first.telefone == "61999990000"
+    assert json.loads(first.cnae_secundarios_json) == ["3831901"]
+    assert first.natureza_juridica == "Sociedade Empresária Limitada"
+    assert len(list(tmp_path.rglob("*.json"))) == 7  # 404 cached as well
+
+    stub_api.hits.clear()
+    again = enrich_via_brasilapi(db, only_missing_contact=False, rate_per_s=200, workers=4, cache_dir=tmp_path)
+    assert stub_api.hits == []
+    assert again["cache_hits"] == 7 and again["consultadas"] == 0
+    assert again["nao_encontradas"] == 1
+
+    expired = enrich_via_brasilapi(
+        db, only_missing_contact=False, rate_per_s=200, workers=4, cache_dir=tmp_path, cache_ttl_days=1e-9
+    )
+    assert expired["consultadas"] == 7 and expired["cache_hits"] == 0
+
+
+def test_token_bucket_halves_rate_on_429_and_recovers():
+    bucket = _TokenBucket(4.0, burst=2)
+    bucket.throttled(0.0)
+    bucket.throttled(0.0)
+    assert bucket.rate == pytest.approx(1.0)
+    assert bucket.throttled_count == 2
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == pytest.approx(4.0)
+    for _ in range(10):
+        bucket.throttled(0.0)
+    assert bucket.rate == pytest.approx(0.5)  # floor = target / 8
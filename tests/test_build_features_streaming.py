@@ -0,0 +1,184 @@
+"""build_feature_snapshots: streaming parity with the in-memory path and float32 blob storage."""
+
+from __future__ import annotations
+
+import json
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import (
+    Base,
+    Coletor,
+    EmpresaCandidata,
+    FeatureSnapshotProspeccao,
+    LocalCandidato,
+)
+from jobs.prospeccao.build_features import (
+    _equal_frequency_ordinal_labels,
+    _equal_frequency_ordinal_labels_grouped,
+    _stream_qid_stats,
+    build_feature_snapshots,
+)
+from jobs.prospeccao.ranker_contract import (
+    FEATURE_NAMES,
+    FEATURE_SCHEMA_HASH,
+    cnae_ree_fit,
+    listwise_training_qid,
+    snapshot_feature_matrix,
+)
+from jobs.prospeccao.train_xgboost import _matrix
+
+_CNAES = ["4751201", "9511800", "8599604", "4711302", "6201501"]
+
+
+def _populated_session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    rng = random.Random(7)
+    for i in range(40):
+        empresa = EmpresaCandidata(
+            cnpj=f"{i:08d}000191",
+            razao_social=f"Empresa {i}",
+            cnae_principal=_CNAES[i % len(_CNAES)],
+            situacao_cadastral="ATIVA" if i % 4 else "BAIXADA",
+            porte="Microempresa" if i % 3 else "Demais",
+            email=f"c{i}@example.com" if i % 2 else None,
+            uf="DF",
+            municipio="Brasilia",
+            bairro=["Asa Sul", "Taguatinga", "Gama"][i % 3],
+        )
+        db.add(empresa)
+        db.flush()
+        for j in range(i % 3):
+            db.add(
+                LocalCandidato(
+                    empresa_id=empresa.id,
+                    endereco=f"Rua {j}",
+                    latitude=-15.80 - 0.01 * rng.randint(0, 2),
+                    longitude=-47.90,
+                    geocode_quality=0.9,
+                )
+            )
+    db.commit()
+    return db
+
+
+def _snapshots(db) -> list[tuple]:
+    return [
+        (s.empresa_id, s.local_id, s.qid, s.label_ordinal, s.features_blob, s.features_json)
+        for s in db.query(FeatureSnapshotProspeccao).order_by(
+            FeatureSnapshotProspeccao.empresa_id, FeatureSnapshotProspeccao.local_id
+        )
+    ]
+
+
+def test_grouped_labels_match_per_group_function():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 6, size=300)
+    scores = np.round(rng.random(300), 2)  # ties on purpose
+    got = _equal_frequency_ordinal_labels_grouped(groups, scores)
+    for g in np.unique(groups):
+        idx = np.flatnonzero(groups == g)
+        assert got[idx].tolist() == _equal_frequency_ordinal_labels(scores[idx].tolist())
+
+
+def test_streaming_matches_in_memory_build():
+    db_mem = _populated_session()
+    in_memory = build_feature_snapshots(db_mem, pipeline_version="t")
+    db_stream = _populated_session()
+    streamed = build_feature_snapshots(db_stream, pipeline_version="t", streaming=True, chunk_size=7)
+
+    assert _snapshots(db_stream) == _snapshots(db_mem)
+    # json.dumps: feature_stats may hold NaN (no coletores in this DB), and NaN != NaN.
+    streamed_common = {k: v for k, v in streamed.items() if k not in ("streaming", "chunk_size")}
+    assert json.dumps(streamed_common, sort_keys=True) == json.dumps(in_memory, sort_keys=True)
+    assert streamed["snapshots_criados"] == len(_snapshots(db_stream))
+
+    again = build_feature_snapshots(db_stream, pipeline_version="t", streaming=True, chunk_size=7)
+    assert again["snapshots_criados"] == 0
+    assert _snapshots(db_stream) == _snapshots(db_mem)
+
+
+def test_stream_qid_stats_sql_aggregate_matches_object_counts():
+    db = _populated_session()
+    expected: dict[str, dict[str, int]] = {}
+    for empresa in db.query(EmpresaCandidata).filter_by(situacao_cadastral="ATIVA"):
+        for local in empresa.locais or [None]:
+            entry = expected.setdefault(
+                listwise_training_qid(empresa, local), {"qid_total": 0, "qid_ree_compatible": 0}
+            )
+            entry["qid_total"] += 1
+            entry["qid_ree_compatible"] += cnae_ree_fit(empresa.cnae_principal) > 0
+
+    assert _stream_qid_stats(db, chunk_size=3, max_id=None) == expected
+
+
+def test_streaming_counts_ativa_qids_and_keeps_caller_objects():
+    db = _populated_session()
+    baixada = db.query(EmpresaCandidata).filter_by(situacao_cadastral="BAIXADA").first()
+    baixada.bairro = "Bairro so de baixadas"
+    coletor = Coletor(localizacao="fora das paginas")
+    db.add(coletor)
+    db.commit()
+
+    stats = build_feature_snapshots(db, pipeline_version="t", streaming=True, chunk_size=7)
+    assert stats["unique_qids"] == len(_stream_qid_stats(db, chunk_size=7, max_id=None))
+    assert stats["unique_qids"] == stats["qid_distribution"]["unique_qids"] - 1
+    assert coletor in db and baixada not in db  # only each page's own objects are expunged
+
+
+def test_streaming_respects_limit():
+    db_mem = _populated_session()
+    in_memory = build_feature_snapshots(db_mem, pipeline_version="t", limit=13)
+    db_stream = _populated_session()
+    streamed = build_feature_snapshots(db_stream, pipeline_version="t", limit=13, streaming=True, chunk_size=5)
+
+    assert streamed["empresas"] == in_memory["empresas"] == 13
+    assert _snapshots(db_stream) == _snapshots(db_mem)
+
+
+def test_build_features_blob_matches_json_export():
+    db_json = _populated_session()
+    build_feature_snapshots(db_json, pipeline_version="t", json_export=True)
+    db_blob = _populated_session()
+    stats = build_feature_snapshots(db_blob, pipeline_version="t")
+
+    def _load(db):
+        return db.query(FeatureSnapshotProspeccao).order_by(FeatureSnapshotProspeccao.id).all()
+
+    with_json, blob_only = _load(db_json), _load(db_blob)
+    assert stats["feature_schema_hash"] == FEATURE_SCHEMA_HASH
+    assert {s.features_json for s in blob_only} == {"{}"}
+    assert all(s.feature_schema_hash == FEATURE_SCHEMA_HASH for s in blob_only)
+
+    from_json = np.array(
+        [[json.loads(s.features_json)[n] for n in FEATURE_NAMES] for s in with_json], dtype=np.float32
+    )
+    np.testing.assert_array_equal(snapshot_feature_matrix(blob_only), from_json)
+
+    grouped = {"q": blob_only}
+    x, y, sizes = _matrix(grouped)
+    assert sizes.tolist() == [len(blob_only)]
+    assert x.dtype == np.float32 and x.flags.c_contiguous
+    np.testing.assert_array_equal(x, from_json)
+    assert y.tolist() == [s.label_ordinal for s in blob_only]
+    assert blob_only[0].to_dict()["features"].keys() == set(FEATURE_NAMES)
+
+
+def test_snapshot_features_decoded_without_jobs_package():
+    code = (
+        "import sys; from banco_dados.modelos import FeatureSnapshotProspeccao as S; "
+        "from banco_dados.utils.feature_blobs import codificar_features; "
+        "s = S(features_blob=codificar_features([0.5, 2.0]), features_json='{}', "
+        "feature_schema_json='[{\"name\": \"b\"}, {\"name\": \"a\"}]'); "
+        "assert s.features() == {'a': 2.0, 'b': 0.5}, s.features(); "
+        "assert not [m for m in sys.modules if m.startswith('jobs')]"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).resolve().parents[1])
@@ -0,0 +1,85 @@
+"""Memory-mapped CNEFE index must resolve keys exactly like the in-memory dict lookup."""
+
+from __future__ import annotations
+
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from jobs.prospeccao.cnefe_index import INDEX_DIRNAME, load_cnefe_index
+from jobs.prospeccao.cnefe_ingest import build_cnefe_lookup, geocode_address
+
+_HEADER = "latitude;longitude;cep;nom_seglogr;num_endereco;cod_municipio"
+
+
+def _write_cnefe(path: Path, lines: list[str]) -> None:
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(path.stem + ".csv", "\n".join([_HEADER, *lines]))
+
+
+def _cnefe_dir(tmp_path: Path) -> Path:
+    _write_cnefe(
+        tmp_path / "53_DF.zip",
+        [
+            "-15.7801;-47.9292;70040-902;Rua das Flores;10;5300108",
+            "-15.7802;-47.9293;70040902;RUA DAS FLORES;12;5300108",
+            "-15.7803;-47.9294;70040902;Rua das Flores;10;5300108",  # same key, last wins
+            "-15.8000;-47.9000;70297400;Quadra 3;;5300108",
+            "-15.9;-48.0;;;;5300108",  # no cep/logradouro -> dropped
+        ],
+    )
+    _write_cnefe(
+        tmp_path / "52_GO.zip",
+        [
+            "-16.2500;-47.9500;72800000;Av. Central;5;5212501",  # Luziânia (RIDE)
+            "-16.6800;-49.2500;74000000;Rua Goiania;1;5208707",  # Goiânia, outside RIDE
+            "-15.7900;-47.9100;70297400;Quadra 3;;5212501",  # overrides DF entry (update order)
+        ],
+    )
+    return tmp_path
+
+
+def test_index_matches_dict_lookup(tmp_path):
+    cnefe_dir = _cnefe_dir(tmp_path)
+    legacy = build_cnefe_lookup(cnefe_dir)
+    index = load_cnefe_index(cnefe_dir)
+
+    assert len(index) == len(legacy)
+    for key, (lat, lon, quality) in legacy.items():
+        hit = index.get(key)
+        assert hit is not None, key
+        assert hit[0] == pytest.approx(lat, abs=1e-5)
+        assert hit[1] == pytest.approx(lon, abs=1e-5)
+        assert hit[2] == quality
+    assert index.get(("74000000", "rua goiania", "1")) is None
+
+    for addr in [
+        ("70040-902", "Rua das Flores", "10"),
+        ("70040902", "Rua das Flores", "99"),
+        ("70297400", "Qualquer", ""),
+        ("99999999", "Nada", "1"),
+    ]:
+        old, new = geocode_address(legacy, *addr), geocode_address(index, *addr)
+        assert (old is None) == (new is None)
+        if old is not None:
+            assert new == pytest.approx(old, abs=1e-5)
+
+
+def test_index_is_persisted_and_memory_mapped(tmp_path):
+    cnefe_dir = _cnefe_dir(tmp_path)
+    built = load_cnefe_index(cnefe_dir)
+    reopened = load_cnefe_index(cnefe_dir)
+
+    assert reopened.meta["release_key"] == built.meta["release_key"]
+    assert isinstance(reopened.keys, np.memmap)
+    assert np.array_equal(reopened.keys, built.keys)
+
+    # A new CNEFE release (file changed) gets a fresh index directory.
+    _write_cnefe(cnefe_dir / "53_DF.zip", ["-15.1;-47.1;70000000;Rua Nova;1;5300108"])
+    fresh = load_cnefe_index(cnefe_dir)
+    assert fresh.meta["release_key"] != built.meta["release_key"]
+    assert fresh.get(("70000000", "rua nova", "1")) is not None
+    # ...and the previous release's arrays are deleted.
+    assert [p.name for p in (cnefe_dir / INDEX_DIRNAME).iterdir()] == [fresh.meta["release_key"]]
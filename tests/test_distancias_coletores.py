@@ -0,0 +1,113 @@
+"""Matriz de distâncias sede + coletores: cache por (id, lat, lon), recálculo incremental e uso no score."""
+
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import Base, Coletor, TronikScore
+from banco_dados.services import distancias_coletores, ml_score, roteamento
+from banco_dados.services.distancias_coletores import (
+    invalidar_matriz_coletores,
+    obter_matriz_coletores,
+)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(distancias_coletores, "MATRIZ_COLETORES_PATH", tmp_path / "matriz.npz")
+    monkeypatch.setattr(roteamento, "GRAFO_VIARIO_PATH", tmp_path / "sem_grafo.npz")
+    invalidar_matriz_coletores()
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    rng = np.random.default_rng(3)
+    for i in range(12):
+        session.add(Coletor(
+            localizacao=f"C{i}",
+            latitude=float(-15.80 + rng.random() * 0.1),
+            longitude=float(-47.90 + rng.random() * 0.1),
+            nivel_preenchimento=float(i * 9),
+        ))
+    session.add(Coletor(localizacao="sem coordenadas", nivel_preenchimento=90.0))
+    session.commit()
+    yield session
+    session.close()
+    invalidar_matriz_coletores()
+
+
+def _contar_chamadas(monkeypatch) -> list[tuple[int, int]]:
+    chamadas: list[tuple[int, int]] = []
+    real = roteamento.matriz_distancias
+
+    def espiao(lat, lon, grafo=None, **kwargs):
+        d, metrica = real(lat, lon, grafo, **kwargs)
+        chamadas.append(d.shape)
+        return d, metrica
+
+    monkeypatch.setattr(roteamento, "matriz_distancias", espiao)
+    return chamadas
+
+
+def test_matriz_reutilizada_e_recalculo_incremental(db, monkeypatch, tmp_path):
+    chamadas = _contar_chamadas(monkeypatch)
+    primeira = obter_matriz_coletores(db)
+    assert len(primeira.ids) == 12 and primeira.metrica == "haversine"
+    assert obter_matriz_coletores(db) is primeira
+    assert chamadas == [(13, 13)]
+
+    movido = db.query(Coletor).filter_by(localizacao="C4").one()
+    movido.latitude = -15.70
+    db.add(Coletor(localizacao="novo", latitude=-15.75, longitude=-47.85))
+    db.commit()
+    chamadas.clear()
+    segunda = obter_matriz_coletores(db)
+    assert segunda.chave != primeira.chave
+    assert chamadas == [(2, 14), (14, 2)]  # só as linhas/colunas do movido e do novo
+    np.testing.assert_allclose(segunda.km, roteamento.haversine_matriz(segunda.lat, segunda.lon))
+    assert segunda.km_sede()[movido.id] == pytest.approx(
+        ml_score.haversine(ml_score.SEDE_LAT, ml_score.SEDE_LNG, -15.70, movido.longitude)
+    )
+
+    invalidar_matriz_coletores()  # outro processo: lê do .npz sem recalcular
+    chamadas.clear()
+    do_disco = obter_matriz_coletores(db)
+    assert chamadas == [] and do_disco.chave == segunda.chave
+    np.testing.assert_array_equal(do_disco.km, segunda.km)
+
+
+
+def test_npz_corrompido_e_recalculado(db, tmp_path):
+    # Dois workers gravando juntos podiam publicar um zip intercalado
+    (tmp_path / "matriz.npz").write_bytes(b"PK\x03\x04 intercalado")
+    matriz = obter_matriz_coletores(db)
+    assert len(matriz.ids) == 12
+
+    invalidar_matriz_coletores()
+    assert obter_matriz_coletores(db).chave == matriz.chave
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["matriz.npz"]  # sem temporários
+
+def test_score_le_km_sede_e_cluster_da_matriz(db):
+    stats = ml_score.recalcular_scores_todos(db)
+    assert stats["sucesso"] == 13
+
+    coletores = db.query(Coletor).all()
+    for c in coletores:
+        features = json.loads(db.query(TronikScore).filter_by(coletor_id=c.id).one().features_json)
+        if c.latitude is None:
+            assert features["km_sede"] == 50.0 and features["coletores_proximos"] == 0
+            continue
+        assert features["km_sede"] == pytest.approx(
+            ml_score.haversine(ml_score.SEDE_LAT, ml_score.SEDE_LNG, c.latitude, c.longitude)
+        )
+        esperado = sum(
+            1 for o in coletores
+            if o.id != c.id and o.latitude is not None
+            and ml_score.haversine(c.latitude, c.longitude, o.latitude, o.longitude) <= 5.0
+            and o.nivel_preenchimento >= 60
+        )
+        assert features["coletores_proximos"] == esperado
@@ -3,16 +3,20 @@
 from __future__ import annotations
 
 import csv
+import random
 from pathlib import Path
 
 import pytest
 
+from jobs.prospeccao import enrichment_proxies
 from jobs.prospeccao.enrichment_proxies import (
     PROXY_KEYS,
     clear_proxy_caches,
     lookup_proxies,
+    lookup_proxies_batch,
     probe_enrichment_files,
 )
+from jobs.prospeccao.ranker_contract import haversine_km
 
 
 @pytest.fixture(autouse=True)
@@ -92,6 +96,80 @@ class TestInepCnesAggregates:
         assert 0.0 < result["cnes_health_proxy"] <= 1.0
 
 
+class TestLookupProxiesBatch:
+    def test_batch_matches_per_row_reference(self, tmp_path, monkeypatch):
+        rng = random.Random(11)
+        osm = tmp_path / "osm.csv"
+        _write_csv(
+            osm,
+            ["latitude", "longitude"],
+            [
+                {"latitude": f"{-15.8 + rng.uniform(-0.05, 0.05):.5f}", "longitude": f"{-47.9 + rng.uniform(-0.05, 0.05):.5f}"}
+                for _ in range(300)
+            ],
+        )
+        inep = tmp_path / "inep.csv"
+        _write_csv(
+            inep,
+            ["ra", "latitude", "longitude", "count"],
+            [
+                {"ra": "Taguatinga", "latitude": "-15.83", "longitude": "-48.05", "count": "12"},
+                {"ra": "", "latitude": "-15.81", "longitude": "-47.91", "count": "0.4"},
+            ],
+        )
+        cnes = tmp_path / "cnes.csv"
+        _write_csv(cnes, ["municipio", "unidades"], [{"municipio": "Brasilia", "unidades": "8"}])
+        monkeypatch.setenv("TRONIK_OSM_POI_PARQUET", str(osm))
+        monkeypatch.setenv("TRONIK_INEP_CENSO_PARQUET", str(inep))
+        monkeypatch.setenv("TRONIK_CNES_PARQUET", str(cnes))
+
+        rows = [
+            (
+                None if i % 7 == 0 else -15.8 + rng.uniform(-0.08, 0.08),
+                -47.9 + rng.uniform(-0.08, 0.08),
+                rng.choice([None, "Taguatinga", " taguatinga ", "Gama"]),
+                rng.choice([None, "Brasilia", "Goiania"]),
+            )
+            for i in range(200)
+        ]
+        lats, lons, ras, muns = (list(col) for col in zip(*rows, strict=True))
+        serial = lookup_proxies_batch(lats, lons, ras, muns)
+        threaded = lookup_proxies_batch(lats, lons, ras, muns, workers=3, chunk_size=16)
+
+        inep_index = enrichment_proxies._cache["inep"]
+        cnes_index = enrichment_proxies._cache["cnes"]
+        for i, (lat, lon, ra, mun) in enumerate(rows):
+            single = lookup_proxies(lat, lon, ra, mun)
+            has = lat is not None and lon is not None
+            # Brute-force haversine count as an independent reference for the BallTree.
+            expected_osm = (
+                enrichment_proxies._norm_density(
+                    sum(
+                        haversine_km(lat, lon, p_lat, p_lon) <= enrichment_proxies._RADIUS_KM
+                        for p_lat, p_lon in enrichment_proxies._cache["osm"].points
+                    ),
+                    enrichment_proxies._OSM_CAP,
+                )
+                if has
+                else 0.0
+            )
+            expected_inep = enrichment_proxies._aggregate_lookup(
+                inep_index, lat=lat, lon=lon, ra=ra, municipio=mun, cap=enrichment_proxies._INEP_CAP
+            )
+            expected_cnes = enrichment_proxies._aggregate_lookup(
+                cnes_index, lat=lat, lon=lon, ra=ra, municipio=mun, cap=enrichment_proxies._CNES_CAP
+            )
+            expected = [expected_osm, expected_inep, expected_cnes]
+            assert [single[k] for k in PROXY_KEYS] == pytest.approx(expected)
+            assert [serial[k][i] for k in PROXY_KEYS] == pytest.approx(expected)
+            assert [threaded[k][i] for k in PROXY_KEYS] == pytest.approx(expected)
+        assert serial["osm_poi_ree_density"].max() > 0
+
+    def test_empty_batch(self):
+        out = lookup_proxies_batch([], [], [], [])
+        assert all(len(out[k]) == 0 for k in PROXY_KEYS)
+
+
 class TestProbeEnrichmentFiles:
     def test_probe_reports_missing(self):
         status = probe_enrichment_files()
@@ -0,0 +1,56 @@
+"""Binary float32 feature snapshots must decode to the same matrix as features_json."""
+
+from __future__ import annotations
+
+import json
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from jobs.prospeccao.ranker_contract import (
+    FEATURE_NAMES,
+    FEATURE_SCHEMA_HASH,
+    decode_feature_blobs,
+    encode_feature_blob,
+    feature_dicts,
+    snapshot_feature_matrix,
+)
+
+
+def _features(seed: int) -> dict[str, float]:
+    rng = np.random.default_rng(seed)
+    return {name: float(v) for name, v in zip(FEATURE_NAMES, rng.random(len(FEATURE_NAMES)), strict=True)}
+
+
+def test_blob_round_trip_and_layout():
+    rows = [_features(i) for i in range(5)]
+    rows[0]["logistics_proximity_exp"] = math.nan
+    blobs = [encode_feature_blob(r) for r in rows]
+
+    assert all(len(b) == 4 * len(FEATURE_NAMES) for b in blobs)
+    assert np.frombuffer(blobs[1], dtype="<f4")[0] == np.float32(rows[1][FEATURE_NAMES[0]])
+    got = decode_feature_blobs(blobs)
+    expected = np.array([[r[n] for n in FEATURE_NAMES] for r in rows], dtype=np.float32)
+    np.testing.assert_array_equal(got, expected)
+    assert decode_feature_blobs([]).shape == (0, len(FEATURE_NAMES))
+    with pytest.raises(ValueError):
+        decode_feature_blobs([b"\x00" * 6])
+
+
+def test_snapshot_matrix_falls_back_to_json_for_legacy_rows():
+    rows = [_features(i) for i in range(3)]
+    snaps = [
+        SimpleNamespace(features_blob=encode_feature_blob(rows[0]), feature_schema_hash=FEATURE_SCHEMA_HASH,
+                        features_json="{}"),
+        SimpleNamespace(features_blob=None, feature_schema_hash=None, features_json=json.dumps(rows[1])),
+        SimpleNamespace(features_blob=b"stale", feature_schema_hash="old", features_json=json.dumps(rows[2])),
+    ]
+    got = snapshot_feature_matrix(snaps)
+    expected = np.array([[r[n] for n in FEATURE_NAMES] for r in rows], dtype=np.float32)
+    np.testing.assert_array_equal(got, expected)
+
+    dicts = feature_dicts(got)
+    assert list(dicts[0]) == sorted(FEATURE_NAMES)
+    assert dicts[1]["cnae_ree_fit"] == pytest.approx(rows[1]["cnae_ree_fit"], rel=1e-6)
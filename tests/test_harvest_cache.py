@@ -0,0 +1,203 @@
+"""Harvest cache: conditional GET, validator-based download skip and stage skip by input digest."""
+
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jobs.prospeccao import config, http_util
+from jobs.prospeccao.harvest_cache import HarvestCache
+from jobs.prospeccao.http_util import download_url_to_path
+
+
+class _Validators(BaseHTTPRequestHandler):
+    """``/etag.json`` honours If-None-Match; ``/plain.json`` has no validators; ``/file.zip`` has Last-Modified."""
+
+    bodies = {
+        "/etag.json": b'{"features": [1, 2, 3]}',
+        "/plain.json": b'{"count": 7}',
+        "/file.zip": b"PK" + b"\x00" * 2048,
+    }
+    requests: list[tuple[str, str, dict]] = []
+
+    def _reply(self, with_body: bool):
+        path = self.path.split("?", 1)[0]
+        self.requests.append((self.command, path, dict(self.headers)))
+        body = self.bodies[path]
+        etag = f'"{len(body)}-{body[-1]}"'
+        modified = "Wed, 01 Oct 2025 10:00:00 GMT"
+        if path == "/etag.json" and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if path == "/file.zip" and self.headers.get("If-Modified-Since") == modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if path == "/etag.json":
+            self.send_header("ETag", etag)
+        if path == "/file.zip":
+            self.send_header("Last-Modified", modified)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def do_GET(self):  # noqa: N802 - BaseHTTPRequestHandler API
+        self._reply(True)
+
+    def do_HEAD(self):  # noqa: N802 - BaseHTTPRequestHandler API
+        self._reply(False)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    _Validators.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Validators)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    monkeypatch.setattr(http_util, "_SESSION", None)
+    monkeypatch.setattr(config, "RAW_DIR", tmp_path / "raw")
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+    http_util._SESSION = None
+
+
+def test_get_json_conditional_and_content_hash(server):
+    cache = HarvestCache()
+    assert cache.get_json(f"{server}/etag.json") == {"features": [1, 2, 3]}
+    assert cache.get_json(f"{server}/plain.json", params={"pagina": 1}) == {"count": 7}
+    assert cache.counters == {"reused": 0, "fetched": 2, "stages_skipped": 0, "stages_run": 0}
+    cache.save()
+
+    again = HarvestCache()
+    assert again.get_json(f"{server}/etag.json") == {"features": [1, 2, 3]}
+    assert _Validators.requests[-1][2].get("If-None-Match")
+    assert again.get_json(f"{server}/plain.json", params={"pagina": 1}) == {"count": 7}
+    assert again.counters["reused"] == 2 and again.counters["fetched"] == 0
+    assert again.get_json(f"{server}/plain.json", params={"pagina": 2}) == {"count": 7}
+    assert again.counters["fetched"] == 1  # different params -> different key
+
+
+def test_download_skips_when_server_says_not_modified(server, tmp_path):
+    dest = tmp_path / "cnefe" / "file.zip"
+    cache = HarvestCache()
+    first = download_url_to_path(f"{server}/file.zip", dest, cache=cache)
+    assert not first.skipped and first.sha256
+    assert cache.data["files"][str(dest)]["sha256"] == first.sha256
+
+    _Validators.requests.clear()
+    second = download_url_to_path(f"{server}/file.zip", dest, cache=cache)
+    assert second.skipped and second.sha256 == first.sha256
+    assert [(m, p) for m, p, _ in _Validators.requests] == [("HEAD", "/file.zip")]
+    assert _Validators.requests[0][2]["If-Modified-Since"]
+
+    dest.write_bytes(b"corrupted")  # local copy no longer matches what was recorded
+    third = download_url_to_path(f"{server}/file.zip", dest, cache=cache)
+    assert not third.skipped and dest.read_bytes() == _Validators.bodies["/file.zip"]
+
+
+def test_run_stage_skips_until_inputs_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RAW_DIR", tmp_path / "raw")
+    source = tmp_path / "in.csv"
+    source.write_text("a,b\n1,2\n")
+    out = tmp_path / "out.parquet"
+    calls = []
+
+    def build():
+        calls.append(1)
+        out.write_text("built")
+        return {"rows": 1}
+
+    def params():
+        return {"outputs": [str(out)] if out.exists() else []}
+
+    cache = HarvestCache()
+    assert cache.run_stage("build_enrichment", [source], build, params=params) == {"rows": 1}
+    skipped = HarvestCache().run_stage("build_enrichment", [source], build, params=params)
+    assert skipped["skipped"] == "inputs_unchanged" and len(calls) == 1
+
+    out.unlink()
+    HarvestCache().run_stage("build_enrichment", [source], build, params=params)
+    assert len(calls) == 2
+
+    source.write_text("a,b\n1,3\n")
+    HarvestCache().run_stage("build_enrichment", [source], build, params=params)
+    assert len(calls) == 3
+
+
+def test_receita_and_cnefe_stages_rerun_when_outputs_are_gone(tmp_path, monkeypatch):
+    from banco_dados.modelos import EmpresaCandidata
+    from jobs.prospeccao import paths as pathutil
+    from jobs.prospeccao.cnefe_index import INDEX_DIRNAME, release_key
+    from jobs.prospeccao.db import session_scope
+    from jobs.prospeccao.harvest import run_stage_if_changed
+
+    monkeypatch.setattr(config, "RAW_DIR", tmp_path / "raw")
+    dirs = pathutil.ensure_raw_layout()
+    (dirs["receita"] / "Estabelecimentos0.zip").write_bytes(b"PK")
+    (dirs["cnefe"] / "DF.zip").write_bytes(b"PK")
+    calls = []
+
+    def parse():
+        calls.append("receita_parse")
+        with session_scope() as db:
+            db.add(EmpresaCandidata(cnpj=str(len(calls)), razao_social="x"))
+        return {}
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'a.db'}")
+    run_stage_if_changed("receita_parse", parse)
+    assert run_stage_if_changed("receita_parse", parse)["skipped"] == "inputs_unchanged"
+    # Same ZIPs, fresh database: empresa_candidata must be filled again
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'b.db'}")
+    run_stage_if_changed("receita_parse", parse)
+    assert calls == ["receita_parse"] * 2
+
+    index = dirs["cnefe"] / INDEX_DIRNAME / release_key(dirs["cnefe"])
+
+    def sync():
+        calls.append("cnefe")
+        index.mkdir(parents=True, exist_ok=True)
+        (index / "meta.json").write_text("{}")
+        return {}
+
+    run_stage_if_changed("cnefe", sync)
+    assert run_stage_if_changed("cnefe", sync)["skipped"] == "inputs_unchanged"
+    (index / "meta.json").unlink()
+    run_stage_if_changed("cnefe", sync)
+    assert calls.count("cnefe") == 2
+
+
+def test_run_harvest_reports_reused_stage(tmp_path, monkeypatch):
+    from jobs.prospeccao import build_enrichment_staging
+    from jobs.prospeccao.harvest import run_harvest
+
+    monkeypatch.setattr(config, "RAW_DIR", tmp_path / "raw")
+    osm = tmp_path / "osm"
+    osm.mkdir()
+    (osm / "pois.csv").write_text("lat,lon,category\n-15.8,-47.9,electronics\n")
+    monkeypatch.setenv("TRONIK_OSM_SOURCE_DIR", str(osm))
+    monkeypatch.setenv("TRONIK_INEP_SOURCE_DIR", str(tmp_path / "none"))
+    monkeypatch.setenv("TRONIK_CNES_SOURCE_DIR", str(tmp_path / "none"))
+    calls = []
+    monkeypatch.setattr(build_enrichment_staging, "build_all_enrichment", lambda: calls.append(1) or {"osm": {}})
+
+    first = run_harvest(["build_enrichment"])
+    assert first["reused"] == [] and first["cache"]["build_enrichment"] == {"stages_run": 1}
+    second = run_harvest(["build_enrichment"])
+    assert second["reused"] == ["build_enrichment"]
+    assert second["ok"]["build_enrichment"]["skipped"] == "inputs_unchanged"
+    assert second["cache"]["_total"]["stages_skipped"] == 1
+    assert len(calls) == 1
+    forced = run_harvest(["build_enrichment"], use_cache=False)
+    assert "cache" not in forced and len(calls) == 2
+    assert json.loads((tmp_path / "raw" / "_reports" / "last_harvest.json").read_text())["ok"]
@@ -0,0 +1,138 @@
+"""Download manager against a local Range-capable HTTP server: segments, resume, parallel URLs."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jobs.prospeccao import config, http_util
+from jobs.prospeccao.http_util import download_many, download_url_to_path
+
+_FILES = {
+    "/big.bin": bytes(range(256)) * 4096,  # 1 MiB
+    "/small.bin": b"tronik" * 1000,
+}
+
+
+class _RangeServer(BaseHTTPRequestHandler):
+    ranges: list[tuple[str, str | None]] = []
+    truncate_next: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def _body(self):
+        return _FILES.get(self.path)
+
+    def do_HEAD(self):  # noqa: N802 - BaseHTTPRequestHandler API
+        body = self._body()
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):  # noqa: N802 - BaseHTTPRequestHandler API
+        body = self._body()
+        if body is None:
+            self.send_error(404)
+            return
+        header = self.headers.get("Range")
+        with self.lock:
+            self.ranges.append((self.path, header))
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", header or "")
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(body) - 1
+            part = body[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        else:
+            part = body
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(part)))
+        self.end_headers()
+        with self.lock:
+            cut = self.truncate_next.pop(f"{self.path}@{match.group(1) if match else 0}", None)
+        self.wfile.write(part[:cut] if cut is not None else part)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def range_server(monkeypatch):
+    _RangeServer.ranges, _RangeServer.truncate_next = [], {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeServer)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    monkeypatch.setattr(http_util, "_SESSION", None)
+    monkeypatch.setattr(config, "HTTP_MAX_RETRIES", 0)
+    monkeypatch.setattr(config, "DOWNLOAD_SEGMENT_MIN_MB", 1)
+    yield f"http://127.0.0.1:{server.server_port}", _RangeServer
+    server.shutdown()
+    server.server_close()
+    http_util._SESSION = None
+
+
+def test_segmented_download_hashes_while_streaming(range_server, tmp_path):
+    base, stub = range_server
+    dest = tmp_path / "big.bin"
+    result = download_url_to_path(
+        f"{base}/big.bin", dest, segments=4, expected_sha256=hashlib.sha256(_FILES["/big.bin"]).hexdigest()
+    )
+
+    assert result.segments == 4 and not result.skipped
+    assert dest.read_bytes() == _FILES["/big.bin"]
+    assert result.sha256 == hashlib.sha256(_FILES["/big.bin"]).hexdigest()
+    assert not (tmp_path / "big.bin.part.json").exists()
+    assert sorted(r for _, r in stub.ranges) == [
+        "bytes=0-262143", "bytes=262144-524287", "bytes=524288-786431", "bytes=786432-1048575"
+    ]
+
+    with pytest.raises(ValueError, match="SHA-256"):
+        download_url_to_path(f"{base}/big.bin", tmp_path / "other.bin", segments=2, expected_sha256="0" * 64)
+
+
+def test_segmented_download_resumes_from_manifest(range_server, tmp_path):
+    base, stub = range_server
+    dest = tmp_path / "big.bin"
+    stub.truncate_next["/big.bin@524288"] = 1000  # third segment drops after 1000 bytes
+
+    with pytest.raises(Exception):  # noqa: B017 - truncated body surfaces as a requests/urllib3 error
+        download_url_to_path(f"{base}/big.bin", dest, segments=4, compute_hash=True)
+    manifest = json.loads((tmp_path / "big.bin.part.json").read_text())
+    assert manifest["segments"][2][2] <= 1000
+    assert sum(seg[2] == seg[1] - seg[0] + 1 for seg in manifest["segments"]) == 3
+
+    stub.ranges.clear()
+    result = download_url_to_path(f"{base}/big.bin", dest, segments=4, compute_hash=True)
+    assert [r for _, r in stub.ranges] == [f"bytes={524288 + manifest['segments'][2][2]}-786431"]
+    assert dest.read_bytes() == _FILES["/big.bin"]
+    assert result.sha256 == hashlib.sha256(_FILES["/big.bin"]).hexdigest()
+    assert not (tmp_path / "big.bin.part.json").exists()
+
+
+def test_download_many_runs_urls_in_parallel_and_reports_errors(range_server, tmp_path):
+    base, _ = range_server
+    jobs = [
+        (f"{base}/big.bin", tmp_path / "a" / "big.bin"),
+        (f"{base}/missing.bin", tmp_path / "missing.bin"),
+        (f"{base}/small.bin", tmp_path / "small.bin"),
+    ]
+    results = download_many(jobs, workers=3, compute_hash=True, segments=2)
+
+    assert [r.path for r in results] == [str(dest) for _, dest in jobs]
+    assert results[0].segments == 2 and results[0].error is None
+    assert results[1].error and results[1].bytes_written == 0
+    assert results[2].segments == 1  # below TRONIK_DOWNLOAD_SEGMENT_MIN_MB -> single stream
+    assert results[2].sha256 == hashlib.sha256(_FILES["/small.bin"]).hexdigest()
+
+    again = download_many(jobs[2:], compute_hash=True)
+    assert again[0].skipped and again[0].sha256 == results[2].sha256
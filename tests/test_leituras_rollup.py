@@ -0,0 +1,143 @@
+"""Rollups hora/dia de leituras_sensor: incremental = reconstrução, retenção e séries."""
+
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from banco_dados.modelos import LeituraDiaria, LeituraHoraria, LeituraSensor, Sensor
+from banco_dados.services import leituras_rollup
+from banco_dados.services.leituras_rollup import (
+    acumular,
+    compactar_leituras,
+    escolher_granularidade,
+    obter_serie,
+    reconstruir_rollups,
+    serie_niveis,
+    series_niveis_lote,
+)
+from banco_dados.utils import utc_now_naive
+
+
+def _rollups(db_session, tabela):
+    return {
+        (r.coletor_id, r.inicio): (
+            r.n_leituras, r.nivel_min, r.nivel_max, round(r.nivel_soma, 6), r.nivel_ultimo,
+            r.n_bateria, r.bateria_ultima, r.ultima_leitura_em,
+        )
+        for r in db_session.query(tabela)
+    }
+
+
+def _preparar(db_session, create_lixeira):
+    coletor = create_lixeira(nivel=10.0)
+    sensor = Sensor(coletor_id=coletor.id, bateria=90.0)
+    db_session.add(sensor)
+    db_session.commit()
+    return coletor.id, sensor.id
+
+
+def test_incremental_igual_a_reconstrucao_e_ultima_fora_de_ordem(db_session, create_lixeira):
+    coletor_id, sensor_id = _preparar(db_session, create_lixeira)
+    dia = (utc_now_naive() - timedelta(days=3)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def linha(minutos, nivel, bateria=80.0):
+        return {
+            "sensor_id": sensor_id, "coletor_id": coletor_id, "nivel": nivel,
+            "bateria": bateria, "timestamp": dia + timedelta(minutes=minutos),
+        }
+
+    lotes = [
+        [linha(10, 20.0), linha(50, 30.0), linha(130, 40.0)],
+        [linha(55, 25.0, None), linha(20, 99.0, 10.0)],  # 20min chega depois, mas não é a "última"
+        [linha(24 * 60 + 5, 50.0)],
+    ]
+    for lote in lotes:
+        db_session.add_all(LeituraSensor(**x) for x in lote)
+        acumular(db_session, lote)
+        db_session.commit()
+
+    hora0 = db_session.query(LeituraHoraria).filter_by(inicio=dia).one()
+    assert (hora0.n_leituras, hora0.nivel_min, hora0.nivel_max) == (4, 20.0, 99.0)
+    assert hora0.nivel_ultimo == 25.0 and hora0.bateria_ultima is None  # da leitura mais recente
+    assert hora0.n_bateria == 3 and hora0.nivel_medio == (20 + 30 + 99 + 25) / 4
+    assert db_session.query(LeituraDiaria).count() == 2
+
+    incremental = (_rollups(db_session, LeituraHoraria), _rollups(db_session, LeituraDiaria))
+    db_session.query(LeituraHoraria).update({"n_leituras": 0, "nivel_soma": 0})
+    assert reconstruir_rollups(db_session, dia, dia + timedelta(days=2)) == 6
+    db_session.commit()
+    assert (_rollups(db_session, LeituraHoraria), _rollups(db_session, LeituraDiaria)) == incremental
+
+
+def test_compactacao_apaga_brutas_e_serie_vem_dos_rollups(db_session, create_lixeira, monkeypatch):
+    coletor_id, sensor_id = _preparar(db_session, create_lixeira)
+    agora = utc_now_naive()
+    # 60 dias de leituras a cada 6h, gravadas sem rollup (base anterior aos agregados)
+    db_session.add_all(
+        LeituraSensor(
+            sensor_id=sensor_id, coletor_id=coletor_id, nivel=float(i % 100),
+            bateria=90.0, timestamp=agora - timedelta(hours=6 * i),
+        )
+        for i in range(1, 241)
+    )
+    db_session.commit()
+
+    granularidade, serie = obter_serie(db_session, coletor_id, 7)
+    assert granularidade == "bruta" and len(serie) == 27  # rollup vazio: cai para as brutas
+
+    hoje = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    corte = hoje - timedelta(days=10)
+    vencidas = db_session.query(LeituraSensor).filter(LeituraSensor.timestamp < corte).count()
+    stats = compactar_leituras(db_session, dias_brutos=10, dias_horarios=20)
+    assert stats["brutas_apagadas"] == vencidas and stats["horarias_apagadas"] > 0
+    # Primeira execução: preenche até ontem, não só o que vai ser apagado
+    total = db_session.query(func.sum(LeituraDiaria.n_leituras)).scalar()
+    assert total == stats["leituras_verificadas"] > vencidas
+    assert db_session.query(func.max(LeituraDiaria.inicio)).scalar() == hoje - timedelta(days=1)
+    assert db_session.query(LeituraSensor).filter(LeituraSensor.timestamp < corte).count() == 0
+    # Compactar de novo não duplica nada
+    assert compactar_leituras(db_session, dias_brutos=10, dias_horarios=20)["brutas_apagadas"] == 0
+    assert db_session.query(func.sum(LeituraDiaria.n_leituras)).scalar() == total
+
+    monkeypatch.setattr(leituras_rollup, "RETENCAO_BRUTA_DIAS", 10)
+    granularidade, serie = obter_serie(db_session, coletor_id, 45)
+    assert granularidade == "dia" and 44 <= len(serie) <= 46  # dias entre -45 e ontem
+    assert {"timestamp", "nivel", "nivel_min", "nivel_max", "n_leituras"} <= serie[0].keys()
+    granularidade, pontos = serie_niveis(db_session, coletor_id, 5, granularidade="dia")
+    assert granularidade == "dia" and pontos == sorted(pontos)
+
+
+def test_rollup_que_nao_cobre_a_janela_cai_para_as_brutas(db_session, create_lixeira):
+    coletor_id, sensor_id = _preparar(db_session, create_lixeira)
+    outro = create_lixeira(nivel=10.0).id
+    agora = utc_now_naive()
+
+    def linha(cid, horas, nivel):
+        return {
+            "sensor_id": sensor_id, "coletor_id": cid, "nivel": nivel,
+            "bateria": 90.0, "timestamp": agora - timedelta(hours=horas),
+        }
+
+    # Base anterior ao deploy (sem rollup) + leituras novas já acumuladas
+    db_session.add_all(LeituraSensor(**linha(coletor_id, 6 * i, 10.0 + i)) for i in range(4, 24))
+    novas = [linha(cid, h, 50.0) for cid in (coletor_id, outro) for h in (1, 2)]
+    db_session.add_all(LeituraSensor(**x) for x in novas)
+    acumular(db_session, novas)
+    db_session.commit()
+
+    granularidade, pontos = serie_niveis(db_session, coletor_id, 7)
+    assert granularidade == "bruta" and len(pontos) == 22
+    assert serie_niveis(db_session, outro, 7)[0] == "hora"
+
+    granularidades, coletor, timestamp, nivel = series_niveis_lote(db_session, [coletor_id, outro], 7)
+    assert granularidades == {coletor_id: "bruta", outro: "hora"}
+    assert (coletor == coletor_id).sum() == 22 and (coletor == outro).sum() >= 1
+    assert nivel[coletor == coletor_id].tolist() == [p.nivel for p in pontos]
+
+
+def test_escolher_granularidade():
+    assert escolher_granularidade(1) == "bruta"
+    assert escolher_granularidade(7) == "hora"
+    assert escolher_granularidade(14) == "hora"
+    assert escolher_granularidade(30) == "dia"
+    assert escolher_granularidade(7, max_pontos=1000) == "bruta"
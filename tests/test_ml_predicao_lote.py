@@ -0,0 +1,110 @@
+"""Predição de enchimento em lote: regressão vetorizada por segmento e upsert em massa."""
+
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from banco_dados.modelos import LeituraSensor, PredicaoEnchimento, Sensor
+from banco_dados.services import ml_predicao
+from banco_dados.services.leituras_rollup import acumular
+from banco_dados.services.ml_predicao import (
+    _ajustar_segmentos,
+    _autoets_em_paralelo,
+    predizer_enchimento_coletor,
+    recalcular_predicoes_todos,
+)
+from banco_dados.utils import utc_now_naive
+
+
+def test_ajuste_por_segmento_igual_ao_polyfit():
+    rng = np.random.default_rng(7)
+    tamanhos = [2, 5, 1, 40]
+    seg = np.repeat(np.arange(len(tamanhos)), tamanhos)
+    x = np.concatenate([np.sort(rng.uniform(0, 300, n)) for n in tamanhos])
+    y = rng.uniform(0, 100, len(x))
+
+    slope, intercept = _ajustar_segmentos(seg, x, y, len(tamanhos))
+    for i, n in enumerate(tamanhos):
+        if n < 2:
+            assert slope[i] == 0 and intercept[i] == pytest.approx(y[seg == i][0])
+            continue
+        esperado = np.polyfit(x[seg == i], y[seg == i], deg=1)
+        assert (slope[i], intercept[i]) == pytest.approx(tuple(esperado))
+
+
+def test_recalculo_em_lote_igual_ao_individual(db_session, create_lixeira, test_db):
+    agora = utc_now_naive()
+    coletores = [create_lixeira(nivel=10.0) for _ in range(4)]
+    subindo, caindo, uma_leitura, sem_dados = (c.id for c in coletores)
+    sensor = Sensor(coletor_id=subindo, bateria=90.0)
+    db_session.add(sensor)
+    db_session.commit()
+    sensor_id = sensor.id
+
+    def leituras(coletor_id, n, nivel):
+        return [
+            {"sensor_id": sensor_id, "coletor_id": coletor_id, "nivel": nivel(i), "bateria": 80.0,
+             "timestamp": agora - timedelta(minutes=15 * (n - i))}
+            for i in range(n)
+        ]
+
+    com_rollup = leituras(subindo, 300, lambda i: 5 + i * 0.2 + (i % 7))
+    db_session.add_all(LeituraSensor(**x) for x in com_rollup)
+    acumular(db_session, com_rollup)
+    # Só brutas (anteriores aos rollups) e uma única leitura
+    brutas = leituras(caindo, 30, lambda i: 80 - i) + leituras(uma_leitura, 1, lambda i: 50.0)
+    db_session.add_all(LeituraSensor(**x) for x in brutas)
+    db_session.add_all([
+        PredicaoEnchimento(coletor_id=subindo, modelo_usado="antigo"),
+        PredicaoEnchimento(coletor_id=sem_dados, modelo_usado="linear", horas_restantes=12.0),
+    ])
+    db_session.commit()
+
+    individuais = {
+        cid: predizer_enchimento_coletor(db_session, cid, usar_autoets=False) for cid in (subindo, caindo)
+    }
+    assert individuais[subindo]["granularidade"] == "hora" and individuais[caindo]["granularidade"] == "bruta"
+    assert individuais[subindo]["erro_medio"] is not None
+
+    consultas = []
+    contar = lambda conn, cursor, statement, *args: consultas.append(statement)  # noqa: E731
+    event.listen(test_db, "before_cursor_execute", contar)
+    try:
+        stats = recalcular_predicoes_todos(db_session, usar_autoets=False)
+    finally:
+        event.remove(test_db, "before_cursor_execute", contar)
+
+    assert stats == {"processados": 4, "sucesso": 2, "falha": 0, "insuficientes": 2, "autoets": 0}
+    # coletores, séries (rollup + cobertura pelas brutas + brutas), existentes, e UPDATE/INSERT
+    # por conjunto de colunas (com e sem previsão) — constante, não cresce com o número de coletores
+    assert len(consultas) <= 9
+
+    db_session.expire_all()
+    preds = {p.coletor_id: p for p in db_session.query(PredicaoEnchimento)}
+    assert len(preds) == 4 and db_session.query(PredicaoEnchimento).count() == 4
+    for cid, esperado in individuais.items():
+        pred = preds[cid]
+        assert pred.dados_suficientes and pred.modelo_usado == "linear"
+        assert pred.velocidade_enchimento == pytest.approx(esperado["velocidade_enchimento"])
+        for campo in ("horas_restantes", "erro_medio"):
+            valor, ref = getattr(pred, campo), esperado.get(campo)
+            assert (valor is None and ref is None) or valor == pytest.approx(ref, abs=0.1)
+        for campo in ("predicted_full_at", "confianca_lower", "confianca_upper"):
+            valor, ref = getattr(pred, campo), esperado.get(campo)
+            assert (valor is None and ref is None) or abs(valor - ref) < timedelta(seconds=1)
+
+    assert preds[caindo].predicted_full_at is None
+    assert not preds[uma_leitura].dados_suficientes
+    assert not preds[sem_dados].dados_suficientes and preds[sem_dados].horas_restantes == 12.0
+
+
+def test_autoets_sem_pool_por_padrao(monkeypatch):
+    def sem_pool(*args, **kwargs):
+        raise AssertionError("pool de processos dentro do processo web")
+
+    monkeypatch.setattr(ml_predicao, "ProcessPoolExecutor", sem_pool)
+    monkeypatch.setattr(ml_predicao, "_predizer_autoets_lote", lambda series, passo_min: dict.fromkeys(series, {}))
+    tarefas = [({cid: None}, 15) for cid in range(5)]
+    assert set(_autoets_em_paralelo(tarefas)) == set(range(5))
@@ -0,0 +1,115 @@
+"""TRONIK Score em lote: features agrupadas, BallTree no cluster bonus, modelo carregado uma vez."""
+
+from __future__ import annotations
+
+import json
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import Base, Coleta, Coletor, PredicaoEnchimento, TronikScore
+from banco_dados.services import distancias_coletores, ml_score, roteamento
+from banco_dados.services.distancias_coletores import MatrizColetores, invalidar_matriz_coletores
+from banco_dados.utils import utc_now_naive
+
+
+@pytest.fixture
+def engine_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(distancias_coletores, "MATRIZ_COLETORES_PATH", tmp_path / "matriz.npz")
+    monkeypatch.setattr(roteamento, "GRAFO_VIARIO_PATH", tmp_path / "sem_grafo.npz")
+    invalidar_matriz_coletores()
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    rng = np.random.default_rng(11)
+    agora = utc_now_naive()
+    for i in range(30):
+        session.add(Coletor(
+            localizacao=f"C{i}",
+            latitude=float(-15.80 + rng.random() * 0.08),
+            longitude=float(-47.90 + rng.random() * 0.08),
+            nivel_preenchimento=float(rng.integers(0, 100)),
+            ultima_coleta=agora - timedelta(days=int(rng.integers(0, 40))) if i % 3 else None,
+        ))
+    session.add(Coletor(localizacao="sem coordenadas", nivel_preenchimento=95.0))
+    session.flush()
+    for cid in (1, 2, 5):
+        session.add(PredicaoEnchimento(coletor_id=cid, velocidade_enchimento=0.4 * cid))
+        session.add_all(Coleta(coletor_id=cid, lucro_por_kg=float(v)) for v in (cid, cid + 2))
+    session.add(TronikScore(coletor_id=1, score=0.0, modelo_usado="antigo"))
+    session.commit()
+    yield engine, session
+    session.close()
+    invalidar_matriz_coletores()
+
+
+def test_contar_proximos_balltree_igual_a_mascara():
+    rng = np.random.default_rng(5)
+    n = 200
+    lat = np.concatenate([[-15.79], -15.80 + rng.random(n) * 0.3])
+    lon = np.concatenate([[-47.88], -47.90 + rng.random(n) * 0.3])
+    km = roteamento.haversine_matriz(lat, lon) * (1 + 0.3 * rng.random((n + 1, n + 1)))  # "viária"
+    matriz = MatrizColetores(
+        ids=np.arange(1, n + 1), lat=lat, lon=lon, km=km, metrica="viaria", fonte="teste", chave="x",
+    )
+    niveis = {cid: float(rng.integers(0, 100)) for cid in range(1, n + 1) if cid % 7}
+
+    nivel = np.array([niveis.get(cid, -1.0) for cid in range(1, n + 1)])
+    esperado = (matriz.vizinhos(5.0) & (nivel >= 60)[None, :]).sum(axis=1)
+    assert ml_score._contar_proximos(matriz, niveis) == dict(zip(range(1, n + 1), esperado.tolist(), strict=True))
+
+
+def test_recalculo_em_lote_igual_ao_individual(engine_db):
+    engine, db = engine_db
+    coletores = db.query(Coletor).order_by(Coletor.id).all()
+    individuais = {c.id: ml_score.calcular_score_coletor(db, c, coletores) for c in coletores}
+
+    consultas = []
+    contar = lambda conn, cursor, statement, *args: consultas.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        stats = ml_score.recalcular_scores_todos(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+
+    assert stats == {"processados": 31, "sucesso": 31, "falha": 0}
+    # coletores, matriz (chave + cálculo), predições, lucro, total de coletas, existentes, UPDATE, INSERT
+    assert len(consultas) <= 10
+
+    scores = db.query(TronikScore).all()
+    assert len(scores) == 31
+    for ts in scores:
+        esperado = individuais[ts.coletor_id]
+        assert ts.score == pytest.approx(esperado["score"]) and ts.modelo_usado == "heuristica"
+        features = json.loads(ts.features_json)
+        assert list(features) == list(esperado["features"])
+        assert features == pytest.approx(esperado["features"], abs=1e-3)
+    features = {ts.coletor_id: json.loads(ts.features_json) for ts in scores}
+    assert features[5]["velocidade"] == 2.0 and features[5]["lucro_medio"] == 6.0
+    assert features[31]["km_sede"] == 50.0 and features[31]["coletores_proximos"] == 0
+
+
+def test_modelo_xgboost_carregado_uma_vez(engine_db, monkeypatch):
+    _, db = engine_db
+    cargas = []
+
+    class Modelo:
+        def predict(self, x):
+            assert x.shape == (31, len(ml_score._XGBOOST_FEATURE_NAMES))
+            return x[:, 0] * 2  # nível × 2, limitado a 100
+
+    def carregar(model_path=ml_score.MODELO_XGBOOST_PATH):
+        cargas.append(model_path)
+        return Modelo()
+
+    monkeypatch.setattr(ml_score, "MIN_COLETAS_XGBOOST", 1)
+    monkeypatch.setattr(ml_score, "_carregar_modelo_xgboost", carregar)
+    assert ml_score.recalcular_scores_todos(db)["sucesso"] == 31
+    assert len(cargas) == 1
+
+    for ts in db.query(TronikScore).all():
+        nivel = db.get(Coletor, ts.coletor_id).nivel_preenchimento
+        assert ts.modelo_usado == "xgboost" and ts.score == min(100.0, nivel * 2)
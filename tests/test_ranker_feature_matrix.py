@@ -0,0 +1,89 @@
+"""build_feature_matrix (NumPy, columnar) must match build_feature_vector row by row."""
+
+from __future__ import annotations
+
+import json
+import random
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from jobs.prospeccao import ranker_contract
+from jobs.prospeccao.ranker_contract import (
+    FEATURE_NAMES,
+    build_feature_matrix,
+    build_feature_vector,
+    collect_feature_columns,
+)
+
+_NOW = datetime(2026, 6, 1, 12, 0, 0)
+
+
+def _random_rows(n: int, seed: int = 3):
+    rng = random.Random(seed)
+
+    def pick(*options):
+        return rng.choice(options)
+
+    rows = []
+    for _ in range(n):
+        empresa = SimpleNamespace(
+            cnae_principal=pick("4751-2/01", "9511800", "6201501", "1234567", "", None),
+            cnae_secundarios_json=pick(None, "", "not json", json.dumps(["9511800", "4651000"]), "[]"),
+            porte=pick("MEI", "Microempresa", "Empresa de Pequeno Porte", "Demais", "Grande", None, "??"),
+            situacao_cadastral=pick("ATIVA", "BAIXADA", "ativo", None),
+            email=pick(None, "", "a@gmail.com", "contato@empresa.com.br", "semarroba"),
+            telefone=pick(None, "", "6133", " 61 3333-0000 "),
+            bairro=pick(None, "Asa Sul"),
+            cep=pick(None, "70040-902"),
+            endereco_normalizado=pick(None, "", "SQN 100"),
+            natureza_juridica=pick(None, "2062"),
+            uf=pick("DF", " df ", "GO", None),
+            municipio_ibge=pick(None, 5221858, 5200100, 5300108),
+            data_abertura=pick(None, datetime(2010, 3, 4), datetime(2026, 5, 31, 23), datetime(2020, 1, 1, tzinfo=UTC)),
+        )
+        local = None
+        if rng.random() < 0.8:
+            local = SimpleNamespace(
+                latitude=pick(None, -15.8, -16.25, 0.0),
+                longitude=pick(None, -47.9, -48.1),
+                ra=pick(None, "", "Plano Piloto"),
+                cep=pick(None, "70040902"),
+                bairro=pick(None, "Centro"),
+                endereco=pick(None, "Rua 1"),
+                geocode_quality=pick(None, 0.5, 0.9),
+                categoria_operacional=pick(None, "varejo de informatica", "escola tecnica", "padaria"),
+                municipio_ibge=pick(None, 5215231),
+            )
+        neighborhood = pick(None, {}, {"qid_total": 12, "qid_ree_compatible": 5}, {"qid_total": 900, "qid_ree_compatible": 0})
+        proxies = pick(None, {"osm_poi_ree_density": 0.4, "cnes_health_proxy": 0.1})
+        rows.append((empresa, local, neighborhood, proxies))
+    return rows
+
+
+def test_feature_matrix_matches_scalar_vectors(monkeypatch):
+    monkeypatch.setattr(ranker_contract, "utc_now_naive", lambda: _NOW)
+    rows = _random_rows(400)
+    expected = np.array(
+        [
+            [build_feature_vector(e, loc, neighborhood=nb, enrichment_proxies=px)[name] for name in FEATURE_NAMES]
+            for e, loc, nb, px in rows
+        ],
+        dtype=np.float32,
+    )
+    got = build_feature_matrix(collect_feature_columns(rows), now=_NOW)
+
+    assert got.dtype == np.float32
+    assert got.shape == (len(rows), len(FEATURE_NAMES))
+    for j, name in enumerate(FEATURE_NAMES):
+        np.testing.assert_allclose(got[:, j], expected[:, j], rtol=1e-6, atol=1e-6, err_msg=name)
+
+
+def test_feature_matrix_empty_and_partial_columns():
+    assert build_feature_matrix({}).shape == (0, len(FEATURE_NAMES))
+    got = build_feature_matrix({"has_local": [False, False], "uf": ["DF", "GO"]}, now=_NOW)
+    assert got[:, FEATURE_NAMES.index("is_df_proper")].tolist() == [1.0, 0.0]
+    assert np.isnan(got[:, FEATURE_NAMES.index("logistics_proximity_exp")]).all()
+    assert got[:, FEATURE_NAMES.index("data_tier")] == pytest.approx([0.1, 0.1])
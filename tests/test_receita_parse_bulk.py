@@ -0,0 +1,243 @@
+"""receita_parse write paths (bulk, process pool, Parquet cache) must match the ORM path."""
+
+from __future__ import annotations
+
+import zipfile
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import Base, EmpresaCandidata, LocalCandidato
+from jobs.prospeccao.receita_parse import parse_estabelecimentos_to_db
+
+
+def _est_row(basico: str, ordem: str, dv: str, *, uf: str, muni: str, fantasia: str = "") -> str:
+    cols = [""] * 30
+    cols[0], cols[1], cols[2] = basico, ordem, dv
+    cols[4] = fantasia
+    cols[5] = "02"
+    cols[10] = "20150101"
+    cols[11] = "4751201"
+    cols[12] = "9511800,4751-2/01"
+    cols[13], cols[14], cols[15] = "RUA", "DAS FLORES", "10"
+    cols[17] = "CENTRO"
+    cols[18] = "70040902"
+    cols[19] = uf
+    cols[20] = muni
+    cols[21], cols[22] = "61", "33330000"
+    cols[27] = "Contato@Empresa.example"
+    return ";".join(cols)
+
+
+def _write_zip(path: Path, lines: list[str]) -> None:
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(path.stem + ".csv", "\n".join(lines).encode("latin-1"))
+
+
+def _receita_dir(tmp_path: Path) -> Path:
+    _write_zip(tmp_path / "Municipios.zip", ["9701;BRASILIA", "9371;LUZIANIA", "9999;GOIANIA"])
+    _write_zip(
+        tmp_path / "Empresas0.zip",
+        [
+            "11111111;ALFA INFORMATICA LTDA;2062;49;1000,00;01;",
+            "22222222;BETA ELETRONICOS;2062;49;5000,00;03;",
+        ],
+    )
+    _write_zip(
+        tmp_path / "Estabelecimentos0.zip",
+        [
+            _est_row("11111111", "0001", "91", uf="DF", muni="9701", fantasia="ALFA"),
+            _est_row("11111111", "0002", "72", uf="DF", muni="9701"),
+            _est_row("22222222", "0001", "10", uf="GO", muni="9371"),
+            _est_row("33333333", "0001", "00", uf="GO", muni="9999"),
+            _est_row("44444444", "0001", "00", uf="SP", muni="7107"),
+            _est_row("555", "1", "2", uf="DF", muni="9701"),
+        ],
+    )
+    return tmp_path
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _dump(db) -> tuple[list[tuple], list[tuple]]:
+    empresas = [
+        (
+            e.cnpj, e.razao_social, e.nome_fantasia, e.cnae_principal, e.cnae_secundarios_json,
+            e.porte, e.situacao_cadastral, e.data_abertura, e.cep, e.uf, e.municipio,
+            e.telefone, e.email, e.endereco_normalizado, e.origem,
+        )
+        for e in db.query(EmpresaCandidata).order_by(EmpresaCandidata.cnpj)
+    ]
+    locais = [
+        (loc.empresa.cnpj, loc.endereco, loc.bairro, loc.cep, loc.origem)
+        for loc in db.query(LocalCandidato).join(LocalCandidato.empresa).order_by(EmpresaCandidata.cnpj)
+    ]
+    return empresas, locais
+
+
+def test_bulk_matches_orm_rows_and_stats(tmp_path):
+    receita_dir = _receita_dir(tmp_path)
+    muni = {"9701": "BRASILIA", "9371": "Luziânia", "9999": "GOIANIA"}
+
+    db_orm = _session()
+    stats_orm = parse_estabelecimentos_to_db(
+        db_orm, receita_dir, municipios_lookup=muni, bulk=False, cache=False,
+    )
+    db_bulk = _session()
+    stats_bulk = parse_estabelecimentos_to_db(
+        db_bulk, receita_dir, municipios_lookup=muni, bulk=True, batch_size=2, cache=False,
+    )
+
+    assert stats_bulk == stats_orm
+    assert stats_bulk["empresas_created"] == 3
+    assert stats_bulk["rows_skipped_go_not_ride"] == 1
+    assert stats_bulk["rows_skipped_uf"] == 1
+    assert stats_bulk["rows_skipped_invalid_cnpj"] == 1
+    assert _dump(db_bulk) == _dump(db_orm)
+
+
+def test_bulk_rerun_updates_and_keeps_existing_fields(tmp_path):
+    receita_dir = _receita_dir(tmp_path)
+    muni = {"9701": "BRASILIA", "9371": "Luziânia"}
+    db = _session()
+    db.add(EmpresaCandidata(cnpj="11111111000272", razao_social="X", nome_fantasia="MANUAL"))
+    db.commit()
+
+    first = parse_estabelecimentos_to_db(db, receita_dir, municipios_lookup=muni)
+    second = parse_estabelecimentos_to_db(db, receita_dir, municipios_lookup=muni)
+
+    assert first["empresas_created"] == 2
+    assert first["empresas_updated"] == 1
+    assert second["empresas_created"] == 0
+    assert second["empresas_updated"] == 3
+    assert second["locais_created"] == 0
+    assert db.query(LocalCandidato).count() == 3
+    kept = db.query(EmpresaCandidata).filter_by(cnpj="11111111000272").one()
+    assert kept.nome_fantasia == "MANUAL"
+    assert kept.razao_social == "ALFA INFORMATICA LTDA"
+
+
+def test_parallel_zip_scan_matches_serial(tmp_path):
+    receita_dir = _receita_dir(tmp_path)
+    (receita_dir / "Estabelecimentos0.zip").rename(receita_dir / "Estabelecimentos3.zip")
+    _write_zip(
+        receita_dir / "Estabelecimentos1.zip",
+        [_est_row("22222222", "0002", "00", uf="DF", muni="9701", fantasia="BETA DF")],
+    )
+    muni = {"9701": "BRASILIA", "9371": "Luziânia", "9999": "GOIANIA"}
+
+    db_serial = _session()
+    serial = parse_estabelecimentos_to_db(db_serial, receita_dir, municipios_lookup=muni, cache=False)
+    db_parallel = _session()
+    parallel = parse_estabelecimentos_to_db(
+        db_parallel, receita_dir, municipios_lookup=muni, workers=2, cache=False,
+    )
+
+    assert parallel == serial
+    assert parallel["files_processed"] == 2
+    assert _dump(db_parallel) == _dump(db_serial)
+
+
+def test_parquet_cache_hit_replays_rows_and_stats(tmp_path):
+    pytest.importorskip("pyarrow")
+    receita_dir = _receita_dir(tmp_path)
+    muni = {"9701": "BRASILIA", "9371": "Luziânia", "9999": "GOIANIA"}
+
+    db_cold = _session()
+    cold = parse_estabelecimentos_to_db(db_cold, receita_dir, municipios_lookup=muni)
+    db_warm = _session()
+    warm = parse_estabelecimentos_to_db(db_warm, receita_dir, municipios_lookup=muni)
+
+    assert cold["cache"]["misses"] == ["Estabelecimentos0.zip"]
+    assert cold["cache"]["hits"] == []
+    assert warm["cache"]["hits"] == ["Estabelecimentos0.zip"]
+    assert warm["cache"]["misses"] == []
+    assert {k: v for k, v in warm.items() if k != "cache"} == {
+        k: v for k, v in cold.items() if k != "cache"
+    }
+    assert _dump(db_warm) == _dump(db_cold)
+
+    # Empresas change -> every partition is invalidated
+    _write_zip(receita_dir / "Empresas0.zip", ["11111111;ALFA RENOMEADA LTDA;2062;49;1000,00;01;"])
+    db_changed = _session()
+    changed = parse_estabelecimentos_to_db(db_changed, receita_dir, municipios_lookup=muni)
+    assert changed["cache"]["misses"] == ["Estabelecimentos0.zip"]
+    razoes = {e.razao_social for e in db_changed.query(EmpresaCandidata)}
+    assert "ALFA RENOMEADA LTDA" in razoes
+
+
+def test_rfb_enrich_reads_receita_parquet_cache(tmp_path):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("pandas")
+    from jobs.prospeccao.receita_cache import default_cache_dir
+    from jobs.prospeccao.rfb_estabelecimentos_enrich import enrich_from_rfb_dump
+
+    receita_dir = _receita_dir(tmp_path)
+    parse_estabelecimentos_to_db(_session(), receita_dir, municipios_lookup={"9701": "BRASILIA"})
+
+    db = _session()
+    db.add(EmpresaCandidata(cnpj="11111111000191", razao_social="ALFA"))
+    db.commit()
+    stats = enrich_from_rfb_dump(db, receita_cache_dir=default_cache_dir(receita_dir))
+
+    assert stats["rfb_rows_loaded"] == 2
+    assert stats["empresas_updated"] == 1
+    alfa = db.query(EmpresaCandidata).filter_by(cnpj="11111111000191").one()
+    assert alfa.cep == "70040902"
+    assert alfa.email == "contato@empresa.example"
+
+
+def test_rfb_enrich_csv_dump_fills_only_nulls(tmp_path):
+    pytest.importorskip("pandas")
+    from jobs.prospeccao.rfb_estabelecimentos_enrich import enrich_from_rfb_dump
+
+    bad_contact = _est_row("66666666", "0001", "01", uf="DF", muni="9701").split(";")
+    bad_contact[18], bad_contact[27] = "7004-09", "sem-arroba.example"
+    baixada = _est_row("77777777", "0001", "01", uf="DF", muni="9701").split(";")
+    baixada[5] = "08"
+    (tmp_path / "Estabelecimentos0.csv").write_text(
+        "\n".join([
+            _est_row("11111111", "0001", "91", uf="DF", muni="9701", fantasia="ALFA"),
+            _est_row("22222222", "0001", "10", uf="GO", muni="9371"),
+            ";".join(bad_contact),
+            ";".join(baixada),
+        ]),
+        encoding="latin-1",
+    )
+
+    db = _session()
+    alfa = EmpresaCandidata(cnpj="11111111000191", razao_social="ALFA", bairro="asa sul")
+    bad = EmpresaCandidata(cnpj="66666666000101", razao_social="SEIS")
+    db.add_all([alfa, bad, EmpresaCandidata(cnpj="22222222000110", razao_social="BETA"),
+                EmpresaCandidata(cnpj="77777777000101", razao_social="SETE")])
+    db.flush()
+    db.add_all([LocalCandidato(empresa_id=alfa.id, cep="70000000"), LocalCandidato(empresa_id=bad.id)])
+    db.commit()
+
+    preview = enrich_from_rfb_dump(db, dump_dir=tmp_path, dry_run=True, batch_size=1)
+    assert preview == {
+        "rfb_rows_loaded": 2, "empresas_matched": 2, "empresas_updated": 2, "locais_updated": 4, "batches": 2
+    }
+    assert db.query(EmpresaCandidata).filter_by(cnpj="11111111000191").one().cep is None
+
+    assert enrich_from_rfb_dump(db, dump_dir=tmp_path) == {**preview, "batches": 1}
+    db.expire_all()
+    alfa = db.query(EmpresaCandidata).filter_by(cnpj="11111111000191").one()
+    assert (alfa.bairro, alfa.cep, alfa.email) == ("asa sul", "70040902", "contato@empresa.example")
+    assert (alfa.endereco_normalizado, alfa.nome_fantasia, alfa.cnae_principal) == ("RUA DAS FLORES 10", "ALFA", "4751201")
+    bad = db.query(EmpresaCandidata).filter_by(cnpj="66666666000101").one()
+    assert bad.cep is None and bad.email is None and bad.bairro == "centro"
+    locais = {loc.empresa_id: loc for loc in db.query(LocalCandidato)}
+    assert (locais[alfa.id].cep, locais[alfa.id].bairro, locais[alfa.id].endereco) == (
+        "70000000", "centro", "RUA DAS FLORES 10"
+    )
+    assert locais[bad.id].cep is None and locais[bad.id].endereco == "RUA DAS FLORES 10"
+    assert db.query(EmpresaCandidata).filter_by(cnpj="77777777000101").one().cep is None
+
+    assert enrich_from_rfb_dump(db, dump_dir=tmp_path)["empresas_updated"] == 0
@@ -0,0 +1,136 @@
+"""Roteamento server-side: grafo CSR, matriz viária, 2-opt/Or-opt e POST /api/rotas/otimizar."""
+
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+import pytest
+
+from banco_dados.services import distancias_coletores, roteamento
+from banco_dados.services.roteamento import (
+    GrafoViario,
+    haversine_matriz,
+    matriz_distancias,
+    ordenar_paradas,
+)
+
+_PASSO = 0.01  # ~1.1 km entre nós da grelha
+
+
+@pytest.fixture(autouse=True)
+def _matriz_isolada(tmp_path, monkeypatch):
+    monkeypatch.setattr(distancias_coletores, "MATRIZ_COLETORES_PATH", tmp_path / "matriz.npz")
+    distancias_coletores.invalidar_matriz_coletores()
+    yield
+    distancias_coletores.invalidar_matriz_coletores()
+
+
+def _grelha(n: int = 6, lat0: float = -15.80, lon0: float = -47.90, *, mao_unica_linha: int | None = None):
+    """Grelha n×n de ruas de mão dupla; a linha ``mao_unica_linha`` só corre para leste."""
+    ids = np.arange(n * n).reshape(n, n)
+    lat = np.repeat(lat0 + np.arange(n) * _PASSO, n)
+    lon = np.tile(lon0 + np.arange(n) * _PASSO, n)
+    origem, destino = [], []
+    for r, c in itertools.product(range(n), range(n)):
+        if c + 1 < n:
+            origem.append(ids[r, c])
+            destino.append(ids[r, c + 1])
+            if r != mao_unica_linha:
+                origem.append(ids[r, c + 1])
+                destino.append(ids[r, c])
+        if r + 1 < n:
+            origem += [ids[r, c], ids[r + 1, c]]
+            destino += [ids[r + 1, c], ids[r, c]]
+    ilha_lat, ilha_lon = np.array([-16.5, -16.5]), np.array([-48.5, -48.49])
+    lat, lon = np.concatenate([lat, ilha_lat]), np.concatenate([lon, ilha_lon])
+    origem += [n * n]
+    destino += [n * n + 1]
+    return GrafoViario.de_arestas(lat, lon, np.array(origem), np.array(destino))
+
+
+def test_grafo_csr_maior_componente_e_mao_unica(tmp_path):
+    grafo = _grelha(mao_unica_linha=0)
+    assert grafo.n_nos == 36  # ilha de 2 nós descartada
+    assert grafo.indptr[-1] == grafo.n_arestas == 2 * 2 * 6 * 5 - 5
+
+    carregado = GrafoViario.carregar(grafo.salvar(tmp_path / "g.npz"))
+    np.testing.assert_array_equal(carregado.indptr, grafo.indptr)
+
+    # Na linha 0 (mão única para leste) voltar para oeste obriga a subir uma quadra
+    d = carregado.distancias(np.array([0, 5]))
+    np.testing.assert_allclose(carregado.distancias(np.array([0, 5, 6]), np.array([5, 0]))[:2], d[:, ::-1])
+    assert d[0, 1] == pytest.approx(5 * _PASSO * 111.19 * np.cos(np.radians(15.8)), rel=0.01)
+    assert d[1, 0] > d[0, 1] + 2 * _PASSO * 111
+
+
+def test_matriz_distancias_viaria_com_fallback_haversine():
+    grafo = _grelha()
+    lat = np.array([-15.80, -15.75, -15.10])
+    lon = np.array([-47.90, -47.85, -47.00])  # último ponto longe da malha
+    d, metrica = matriz_distancias(lat, lon, grafo)
+    h = haversine_matriz(lat, lon)
+    assert metrica == "viaria"
+    assert d[0, 1] >= h[0, 1] and d[0, 1] == pytest.approx(d[1, 0], rel=1e-6)
+    assert d[0, 2] == pytest.approx(h[0, 2] * roteamento.FATOR_DESVIO)
+    assert np.all(np.diag(d) == 0)
+
+    sem_grafo, metrica = matriz_distancias(lat, lon, None)
+    assert metrica == "haversine"
+    np.testing.assert_allclose(sem_grafo, h)
+
+
+def _custo(d, rota, retornar):
+    pernas = [d[a, b] for a, b in itertools.pairwise(rota)]
+    return sum(pernas) + (d[rota[-1], rota[0]] if retornar else 0.0)
+
+
+@pytest.mark.parametrize("retornar", [True, False])
+def test_ordenar_paradas_proximo_do_otimo(retornar):
+    rng = np.random.default_rng(7)
+    for _ in range(10):
+        lat, lon = -15.8 + rng.random(8) * 0.3, -47.9 + rng.random(8) * 0.3
+        d = haversine_matriz(lat, lon) * (1 + 0.2 * rng.random((8, 8)))  # vias de mão única
+        np.fill_diagonal(d, 0)
+
+        rota, stats = ordenar_paradas(d, retornar=retornar)
+        assert rota[0] == 0 and sorted(rota.tolist()) == list(range(8))
+        assert _custo(d, list(rota), retornar) == pytest.approx(stats["final_km"])
+        assert stats["final_km"] <= stats["inicial_km"] + 1e-9
+        otimo = min(_custo(d, (0, *p), retornar) for p in itertools.permutations(range(1, 8)))
+        assert stats["final_km"] <= otimo * 1.1
+
+
+def test_api_otimizar_rota(auth_client, create_lixeira, tmp_path, monkeypatch):
+    _grelha().salvar(tmp_path / "grafo.npz")
+    monkeypatch.setattr(roteamento, "GRAFO_VIARIO_PATH", tmp_path / "grafo.npz")
+
+    pontos = [(-15.80, -47.85), (-15.78, -47.87), (-15.76, -47.89), (-15.75, -47.86)]
+    coletores = [create_lixeira(localizacao=f"C{i}", lat=lat, lon=lon) for i, (lat, lon) in enumerate(pontos)]
+    sem_coord = create_lixeira(localizacao="sem", lat=None, lon=None)
+
+    r = auth_client.post("/api/rotas/otimizar", json={
+        "coletor_ids": [c.id for c in coletores] + [sem_coord.id, 999_999],
+        "origem_lat": -15.80, "origem_lon": -47.90,
+    })
+    assert r.status_code == 200, r.get_data(as_text=True)
+    dados = r.get_json()["dados"]
+    assert dados["metrica"] == "viaria"
+    assert sorted(dados["ordem_coletor_ids"]) == sorted(c.id for c in coletores)
+    assert dados["ignorados"] == [sem_coord.id, 999_999]
+    assert dados["paradas"][-1]["distancia_acumulada_km"] < dados["distancia_total_km"]  # volta à origem
+    assert dados["distancia_total_km"] <= dados["distancia_vizinho_mais_proximo_km"]
+
+    invalido = auth_client.post("/api/rotas/otimizar", json={"nivel_minimo": 150})
+    assert invalido.status_code == 400
+
+    da_sede = auth_client.post("/api/rotas/otimizar", json={"retornar_origem": False}).get_json()["dados"]
+    assert len(da_sede["paradas"]) == 4 and da_sede["ignorados"] == [sem_coord.id]
+    assert da_sede["paradas"][-1]["distancia_acumulada_km"] == da_sede["distancia_total_km"]
+
+    ids = [coletores[2].id, coletores[0].id]
+    matriz = auth_client.get(f"/api/rotas/matriz?coletor_ids={ids[0]},{ids[1]},{sem_coord.id}").get_json()["dados"]
+    assert matriz["coletor_ids"] == ids and matriz["ignorados"] == [sem_coord.id]
+    assert matriz["metrica"] == "viaria" and len(matriz["km"]) == 3
+    assert matriz["km"][1][2] > 0 and matriz["km"][0][0] == 0
+    assert auth_client.get("/api/rotas/matriz?coletor_ids=a,b").status_code == 400
@@ -2,7 +2,7 @@
 
 from sqlalchemy import create_engine, inspect, text
 
-from banco_dados.schema_compat import aplicar_compat_schema
+from banco_dados.schema_compat import aplicar_compat_schema, deduplicar_scores_prospeccao
 
 
 def test_aplicar_compat_schema_adds_parceiros_cnpj():
@@ -26,3 +26,58 @@ def test_aplicar_compat_schema_adds_parceiros_cnpj():
 
     cols = {c["name"] for c in inspect(engine).get_columns("parceiros")}
     assert "cnpj" in cols
+
+
+def test_aplicar_compat_schema_score_prospeccao_unique_key():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                CREATE TABLE score_prospeccao (
+                    id INTEGER PRIMARY KEY,
+                    snapshot_id INTEGER NOT NULL,
+                    modelo_id INTEGER NOT NULL,
+                    prioridade VARCHAR(20),
+                    score FLOAT
+                )
+                """
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO score_prospeccao (id, snapshot_id, modelo_id, prioridade, score) VALUES "
+                "(1, 10, 1, 'baixa', 0.1), (2, 10, 1, 'alta', 0.9), (3, 11, 1, 'media', 0.5)"
+            )
+        )
+
+    def _estado():
+        insp = inspect(engine)
+        unique = {i["name"]: i["unique"] for i in insp.get_indexes("score_prospeccao")}
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT id, prioridade FROM score_prospeccao ORDER BY id")).all()
+        return unique.get("uq_score_prospeccao_snapshot_modelo"), [tuple(r) for r in rows]
+
+    # Boot: nada é apagado, o índice fica pendente
+    aplicar_compat_schema(engine)
+    assert "features_hash" in {c["name"] for c in inspect(engine).get_columns("score_prospeccao")}
+    assert _estado() == (None, [(1, "baixa"), (2, "alta"), (3, "media")])
+
+    # Passo explícito de migração
+    assert deduplicar_scores_prospeccao(engine) == 1
+    assert _estado() == (1, [(2, "alta"), (3, "media")])
+
+
+def test_aplicar_compat_schema_cria_indice_unico_sem_duplicatas():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE score_prospeccao (id INTEGER PRIMARY KEY, snapshot_id INTEGER NOT NULL, "
+            "modelo_id INTEGER NOT NULL, prioridade VARCHAR(20), score FLOAT)"
+        ))
+        conn.execute(text("INSERT INTO score_prospeccao (id, snapshot_id, modelo_id) VALUES (1, 10, 1), (2, 11, 1)"))
+
+    aplicar_compat_schema(engine)
+
+    unique = {i["name"]: i["unique"] for i in inspect(engine).get_indexes("score_prospeccao")}
+    assert unique.get("uq_score_prospeccao_snapshot_modelo")
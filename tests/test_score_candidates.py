@@ -0,0 +1,217 @@
+"""score_candidates: one artifact load, whole-matrix predict, per-qid ranking, batched SHAP."""
+
+from __future__ import annotations
+
+import json
+import sys
+from collections import Counter
+from types import SimpleNamespace
+
+import joblib
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from banco_dados.modelos import Base, FeatureSnapshotProspeccao, ModeloProspeccao, ScoreProspeccao
+from banco_dados.schema_compat import deduplicar_scores_prospeccao
+from jobs.prospeccao import config
+from jobs.prospeccao.ranker_contract import (
+    FEATURE_NAMES,
+    FEATURE_SCHEMA_HASH,
+    encode_feature_blob,
+    feature_dicts,
+    feature_schema,
+    feature_vector_hash,
+    heuristic_score,
+)
+from jobs.prospeccao.score_candidates import _group_ranks, score_candidates
+
+
+class _LinearRanker:
+    """Picklable stand-in for XGBRanker: score = x @ w."""
+
+    def __init__(self, weights):
+        self.weights = np.asarray(weights, dtype=float)
+
+    def predict(self, x):
+        return np.asarray(x, dtype=float) @ self.weights
+
+
+def _session_with_snapshots(model: ModeloProspeccao, n_qids: int = 4, per_qid: int = 6):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(model)
+    rng = np.random.default_rng(11)
+    for q in range(n_qids):
+        for _ in range(per_qid):
+            row = np.round(rng.random(len(FEATURE_NAMES)), 1)  # ties on purpose
+            blob = encode_feature_blob(row)
+            db.add(FeatureSnapshotProspeccao(
+                pipeline_version=model.pipeline_version,
+                qid=f"q{q}",
+                features_json="{}",
+                feature_schema_json=json.dumps(feature_schema()),
+                features_blob=blob,
+                feature_schema_hash=FEATURE_SCHEMA_HASH,
+                features_hash=feature_vector_hash(blob),
+            ))
+    db.commit()
+    return db
+
+
+def _scores(db) -> list[tuple]:
+    return [
+        (s.snapshot_id, s.qid, s.ranking_contexto, s.score)
+        for s in db.query(ScoreProspeccao).order_by(ScoreProspeccao.snapshot_id)
+    ]
+
+
+def _expected_ranks(db, score_fn) -> dict[int, int]:
+    snaps = db.query(FeatureSnapshotProspeccao).order_by(FeatureSnapshotProspeccao.id).all()
+    by_qid: dict[str, list] = {}
+    for snap in snaps:
+        by_qid.setdefault(snap.qid, []).append(snap)
+    ranks = {}
+    for rows in by_qid.values():
+        scored = [(s, score_fn(s.features())) for s in rows]
+        for rank, (s, _) in enumerate(sorted(scored, key=lambda item: item[1], reverse=True), start=1):
+            ranks[s.id] = rank
+    return ranks
+
+
+def test_group_ranks_match_python_sort():
+    qids = ["a"] * 5 + ["b"] * 3 + ["c"]
+    scores = np.array([0.1, 0.5, 0.5, 0.2, 0.9, 3.0, 1.0, 3.0, 0.0])
+    order, starts, ranks = _group_ranks(qids, scores)
+    assert starts.tolist() == [0, 5, 8]
+    assert order.tolist() == [4, 1, 2, 3, 0, 5, 7, 6, 8]
+    assert ranks.tolist() == [5, 2, 3, 4, 1, 1, 3, 2, 1]
+
+
+def test_heuristic_model_ranks_per_qid():
+    model = ModeloProspeccao(
+        versao="h", algoritmo="heuristic_baseline", pipeline_version="pv", feature_schema_json="[]", ativo=True
+    )
+    db = _session_with_snapshots(model)
+    result = score_candidates(db)
+
+    expected = _expected_ranks(db, heuristic_score)
+    assert {sid: rank for sid, _, rank, _ in _scores(db)} == expected
+    assert result["grupos"] == 4
+    assert result["scores_criados"] == 24
+    assert result["shap_rows"] == 0
+    assert set(result["timings_s"]) == {"load_model", "load_snapshots", "decode_features", "predict", "shap", "write"}
+
+    again = score_candidates(db)
+    assert again["scores_criados"] == 0 and again["scores_atualizados"] == 24
+
+
+def test_ranker_loaded_once_and_shap_batched(tmp_path, monkeypatch):
+    weights = np.linspace(1.0, 0.1, len(FEATURE_NAMES))
+    features = list(reversed(FEATURE_NAMES))  # artifact order differs from FEATURE_NAMES
+    joblib.dump({"model": _LinearRanker(weights[::-1]), "features": features}, tmp_path / "ranker.joblib")
+    monkeypatch.setattr(config, "REPO_ROOT", tmp_path)
+
+    loads = []
+    real_load = joblib.load
+    monkeypatch.setattr(joblib, "load", lambda path: loads.append(path) or real_load(path))
+
+    shap_calls: list[int] = []
+
+    class _Explainer:
+        def __init__(self, ranker):
+            self.ranker = ranker
+
+        def shap_values(self, x):
+            shap_calls.append(len(x))
+            return x * self.ranker.weights
+
+    monkeypatch.setitem(sys.modules, "shap", SimpleNamespace(TreeExplainer=_Explainer))
+
+    model = ModeloProspeccao(
+        versao="x", algoritmo="xgboost_ranker", pipeline_version="pv", feature_schema_json="[]",
+        artefato_path="ranker.joblib", ativo=True,
+    )
+    db = _session_with_snapshots(model)
+    result = score_candidates(db, shap_batch_size=10)
+
+    assert len(loads) == 1
+    assert shap_calls == [10, 10, 4]
+    assert result["shap_rows"] == 24
+    ranks = _expected_ranks(db, lambda f: sum(f[n] * w for n, w in zip(FEATURE_NAMES, weights, strict=True)))
+    assert {sid: rank for sid, _, rank, _ in _scores(db)} == ranks
+
+    top = db.query(ScoreProspeccao).filter_by(ranking_contexto=1).first()
+    motivos = json.loads(top.motivos_json)
+    assert all("shap" in m for m in motivos)
+    snap = db.get(FeatureSnapshotProspeccao, top.snapshot_id)
+    row = feature_dicts(np.frombuffer(snap.features_blob, dtype="<f4").reshape(1, -1))[0]
+    best = max(FEATURE_NAMES, key=lambda n: abs(row[n] * weights[FEATURE_NAMES.index(n)]))
+    assert motivos[0]["feature"] == best
+
+    shap_calls.clear()
+    result = score_candidates(db, shap_top_n=2)
+    assert result["shap_rows"] == 8
+    assert shap_calls == [8]
+    third = db.query(ScoreProspeccao).filter_by(ranking_contexto=3).first()
+    assert all("shap" not in m for m in json.loads(third.motivos_json))
+
+
+def test_incremental_rescores_only_changed_qids():
+    model = ModeloProspeccao(
+        versao="h", algoritmo="heuristic_baseline", pipeline_version="pv", feature_schema_json="[]", ativo=True
+    )
+    db = _session_with_snapshots(model)
+    score_candidates(db)
+    before = {s.snapshot_id: s.calculado_em for s in db.query(ScoreProspeccao)}
+
+    unchanged = score_candidates(db, incremental=True)
+    assert unchanged["snapshots"] == 0
+    assert unchanged["qids_skipped"] == 4 and unchanged["rows_skipped"] == 24
+
+    changed = db.query(FeatureSnapshotProspeccao).filter_by(qid="q1").first()
+    blob = encode_feature_blob(np.ones(len(FEATURE_NAMES)))
+    changed.features_blob, changed.features_hash = blob, feature_vector_hash(blob)
+    moved = db.query(FeatureSnapshotProspeccao).filter_by(qid="q2").first()
+    moved.qid = "q3"
+    db.commit()
+
+    result = score_candidates(db, incremental=True)
+    assert result["incremental"] is True
+    assert result["qids_processed"] == 3
+    assert result["qids_skipped"] == 1 and result["rows_skipped"] == 6
+    assert result["scores_criados"] == 0 and result["scores_atualizados"] == 18
+
+    after = {s.snapshot_id: s for s in db.query(ScoreProspeccao)}
+    assert len(after) == 24
+    assert after[changed.id].ranking_contexto == 1  # all-ones vector wins its group
+    assert after[moved.id].qid == "q3"
+    untouched = [s for s in after.values() if s.qid == "q0"]
+    assert all(s.calculado_em == before[s.snapshot_id] for s in untouched)
+    assert _expected_ranks(db, heuristic_score) == {sid: s.ranking_contexto for sid, s in after.items()}
+    stored = Counter(s.prioridade for s in after.values())
+    assert result["prioridade_distribuicao"] == dict(stored)
+
+
+def test_duplicate_legacy_scores_fail_before_scoring():
+    model = ModeloProspeccao(
+        versao="h", algoritmo="heuristic_baseline", pipeline_version="pv", feature_schema_json="[]", ativo=True
+    )
+    db = _session_with_snapshots(model)
+    # Legacy table: duplicates kept schema_compat from creating the unique key
+    db.execute(text("DROP INDEX uq_score_prospeccao_snapshot_modelo"))
+    sid = db.query(FeatureSnapshotProspeccao.id).first()[0]
+    db.add_all(
+        ScoreProspeccao(snapshot_id=sid, modelo_id=model.id, qid="q0", score=s, ranking_contexto=1)
+        for s in (0.1, 0.2)
+    )
+    db.commit()
+
+    with pytest.raises(ValueError, match="dedupe-scores"):
+        score_candidates(db)
+    db.rollback()
+
+    assert deduplicar_scores_prospeccao(db.get_bind()) == 1
+    assert score_candidates(db)["scores_atualizados"] == 1
@@ -0,0 +1,105 @@
+"""Cache de credenciais da telemetria: LRU/TTL, rejeição sem banco e invalidação no CRUD."""
+
+import pytest
+from sqlalchemy import event
+
+from banco_dados import telemetria_auth
+from banco_dados.modelos import Coletor, Sensor
+from banco_dados.services import telemetria_buffer
+from banco_dados.services.telemetria_buffer import BufferLeituras
+from banco_dados.telemetria_auth import CacheCredenciais, CredencialSensor, obter_cache_credenciais
+
+
+@pytest.fixture
+def consultas(test_db):
+    """SQL executado no engine de teste, fora o carregamento do usuário logado."""
+    executadas = []
+
+    def contar(conn, cursor, statement, *args):
+        if "FROM usuarios" not in statement:
+            executadas.append(statement)
+
+    event.listen(test_db, "before_cursor_execute", contar)
+    yield executadas
+    event.remove(test_db, "before_cursor_execute", contar)
+
+
+def test_cache_limitado_e_com_ttl(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(telemetria_auth.time, "monotonic", lambda: agora[0])
+    cache = CacheCredenciais(max_itens=2, ttl_s=60)
+    for sid in (1, 2):
+        cache.definir(CredencialSensor(sensor_id=sid, coletor_id=10, parceiro_id=None, token_hash=None))
+
+    assert cache.obter(1) is not None  # 1 passa a ser o mais recente
+    cache.definir(CredencialSensor(sensor_id=3, coletor_id=10, parceiro_id=None, token_hash=None))
+    assert cache.obter(2) is None and len(cache) == 2
+
+    agora[0] += 61
+    assert cache.obter(1) is None and cache.obter(3) is None
+
+
+def test_token_errado_sem_banco_e_estado_sempre_do_banco(
+    client, auth_client, db_session, create_lixeira, consultas, monkeypatch
+):
+    monkeypatch.setattr(telemetria_buffer, "_BUFFER", BufferLeituras(max_leituras=1000, max_idade_s=0))
+    coletor, outro = create_lixeira(nivel=10.0), create_lixeira(nivel=10.0)
+    sensor = Sensor(coletor_id=coletor.id, bateria=90.0, api_token="token-do-sensor")
+    db_session.add(sensor)
+    db_session.commit()
+    sensor_id, coletor_id, outro_id, parceiro_id = sensor.id, coletor.id, outro.id, coletor.parceiro_id
+    leitura = {"sensor_id": sensor_id, "coletor_id": coletor_id, "nivel_preenchimento": 40, "bateria": 70}
+
+    def post(**extra):
+        consultas.clear()
+        return client.post("/api/sensor/telemetria", json={**leitura, **extra})
+
+    assert post(api_key="errado").status_code == 401 and consultas
+    assert post(api_key="errado").status_code == 401 and consultas == []
+    assert post(coletor_id=outro_id, api_key="token-do-sensor").status_code == 400 and consultas == []
+    cred = obter_cache_credenciais().obter(sensor_id)
+    assert cred.token_hash != "token-do-sensor" and cred.parceiro_id == parceiro_id
+
+    assert post(api_key="token-do-sensor").status_code == 200 and consultas
+
+    # Outro worker grava 90/CHEIA; a leitura de 40 que chega aqui volta a valer
+    db_session.get(Coletor, coletor_id).nivel_preenchimento = 90.0
+    db_session.commit()
+    r = post(api_key="token-do-sensor")
+    assert r.status_code == 200 and r.get_json()["nivel_preenchimento"] == 40
+    db_session.expire_all()
+    assert db_session.get(Coletor, coletor_id).nivel_preenchimento == 40
+
+    # CRUD invalida: o sensor muda de coletor e a credencial é relida do banco
+    assert auth_client.put(f"/api/sensor/{sensor_id}", json={"coletor_id": outro_id}).status_code == 200
+    assert obter_cache_credenciais().obter(sensor_id) is None
+    assert post(api_key="token-do-sensor").status_code == 400
+    assert post(coletor_id=outro_id, api_key="token-do-sensor").status_code == 200
+
+
+def test_crud_de_coletor_invalida_credenciais(
+    client, admin_client, db_session, create_lixeira, monkeypatch
+):
+    monkeypatch.setattr(telemetria_buffer, "_BUFFER", BufferLeituras(max_leituras=1000, max_idade_s=0))
+    coletor, outro = create_lixeira(nivel=10.0), create_lixeira(nivel=10.0)
+    sensor = Sensor(coletor_id=coletor.id, bateria=90.0)
+    db_session.add(sensor)
+    db_session.commit()
+    sensor_id, coletor_id = sensor.id, coletor.id
+    cache = obter_cache_credenciais()
+    cache.definir(CredencialSensor(sensor_id=999, coletor_id=outro.id, parceiro_id=None, token_hash=None))
+
+    def post():
+        return client.post("/api/sensor/telemetria", json={
+            "sensor_id": sensor_id, "coletor_id": coletor_id, "nivel_preenchimento": 40, "bateria": 70,
+        })
+
+    assert post().status_code == 200 and cache.obter(sensor_id) is not None
+    assert admin_client.put(f"/api/coletor/{coletor_id}", json={"status": "inativo"}).status_code == 200
+    assert cache.obter(sensor_id) is None and cache.obter(999) is not None
+
+    # Coletor sem histórico (o DELETE não apaga leituras_sensor)
+    sem_historico = create_lixeira(nivel=10.0).id
+    cache.definir(CredencialSensor(sensor_id=998, coletor_id=sem_historico, parceiro_id=None, token_hash=None))
+    assert admin_client.delete(f"/api/coletor/{sem_historico}").status_code == 200
+    assert cache.obter(998) is None and cache.obter(999) is not None
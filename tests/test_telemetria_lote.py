@@ -0,0 +1,154 @@
+"""Telemetria em lote: validação por item, estado mais recente e buffer write-behind."""
+
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from banco_dados.modelos import Coletor, LeituraSensor, Notificacao, Sensor
+from banco_dados.services import telemetria_buffer
+from banco_dados.services.telemetria_buffer import BufferLeituras
+from banco_dados.utils import utc_now_naive
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    """Buffer isolado, sem timer (descarga só por tamanho ou explícita)."""
+    buf = BufferLeituras(max_leituras=1000, max_idade_s=0)
+    monkeypatch.setattr(telemetria_buffer, "_BUFFER", buf)
+    return buf
+
+
+def _sensor(db_session, coletor, **kwargs):
+    sensor = Sensor(coletor_id=coletor.id, bateria=90.0, **kwargs)
+    db_session.add(sensor)
+    db_session.commit()
+    return sensor
+
+
+def test_lote_colapsa_estado_e_grava_historico_via_buffer(
+    client, db_session, create_lixeira, buffer, monkeypatch
+):
+    c1, c2 = create_lixeira(nivel=10.0), create_lixeira(nivel=10.0)
+    s1, s2 = _sensor(db_session, c1), _sensor(db_session, c2)
+    outro = _sensor(db_session, c2)
+    base = utc_now_naive() + timedelta(minutes=1)
+
+    eventos = []
+    monkeypatch.setattr(
+        "rotas.websocket.emitir_atualizacao_coletor",
+        lambda data, evento="coletor_atualizado": eventos.append(("coletor", data["id"])),
+    )
+    monkeypatch.setattr(
+        "rotas.websocket.emitir_atualizacao_sensor",
+        lambda data, evento="sensor_atualizado": eventos.append(("sensor", data["id"])),
+    )
+    monkeypatch.setattr(
+        "rotas.websocket.emitir_nova_notificacao",
+        lambda data: eventos.append(("notificacao", data["tipo"])),
+    )
+
+    def leitura(sensor, coletor, nivel, bateria, minutos):
+        return {
+            "sensor_id": sensor.id, "coletor_id": coletor.id,
+            "nivel_preenchimento": nivel, "bateria": bateria,
+            "timestamp": (base + timedelta(minutes=minutos)).isoformat() + "Z",
+        }
+
+    leituras = [
+        leitura(s1, c1, 95, 50, 10),   # mais recente de c1 (fora de ordem no lote)
+        leitura(s1, c1, 30, 60, 0),
+        leitura(s1, c1, 90, 15, 5),
+        leitura(s2, c2, 40, 10, 0),
+        {"sensor_id": s2.id, "coletor_id": c2.id, "nivel_preenchimento": 140, "bateria": 50},
+        leitura(outro, c1, 20, 80, 1),  # sensor de outro coletor
+        leitura(s2, c2, 85, 12, 3),
+    ]
+    r = client.post("/api/sensor/telemetria/lote", json={"leituras": leituras})
+
+    assert r.status_code == 200, r.get_data(as_text=True)
+    dados = r.get_json()
+    assert (dados["recebidas"], dados["aceitas"]) == (7, 5)
+    assert [x["indice"] for x in dados["rejeitadas"]] == [4, 5]
+    assert dados["rejeitadas"][0]["detalhes"][0]["campo"] == "nivel_preenchimento"
+    assert dados["coletores_atualizados"] == 2 and dados["sensores_atualizados"] == 2
+    assert dados["notificacoes_criadas"] == 3  # cheia c1, cheia c2, bateria s2
+    assert dados["leituras_pendentes"] == 5
+
+    db_session.expire_all()
+    assert db_session.get(Coletor, c1.id).nivel_preenchimento == 95
+    assert db_session.get(Coletor, c1.id).status == "CHEIA"
+    assert db_session.get(Coletor, c2.id).nivel_preenchimento == 85
+    assert db_session.get(Sensor, s1.id).bateria == 50
+    assert db_session.get(Sensor, s1.id).ultimo_ping == base + timedelta(minutes=10)
+    assert [e for e, _ in eventos] == ["coletor"] * 2 + ["sensor"] * 2 + ["notificacao"] * 3
+
+    assert db_session.query(LeituraSensor).count() == 0  # ainda no buffer
+    assert buffer.descarregar() == 5
+    niveis = [
+        n for (n,) in db_session.query(LeituraSensor.nivel)
+        .filter(LeituraSensor.coletor_id == c1.id)
+        .order_by(LeituraSensor.timestamp)
+    ]
+    assert niveis == [30, 90, 95]
+
+    # Segundo lote: dedup de 24h no lote inteiro; leitura antiga só entra no histórico
+    r = client.post("/api/sensor/telemetria/lote", json=[
+        leitura(s1, c1, 99, 5, 20),
+        leitura(s2, c2, 10, 90, -60),
+    ])
+    dados = r.get_json()
+    assert dados["aceitas"] == 2 and dados["sensores_atualizados"] == 1
+    assert dados["notificacoes_criadas"] == 1  # só bateria_baixa de s1
+    assert db_session.query(Notificacao).count() == 4
+    db_session.expire_all()
+    assert db_session.get(Coletor, c2.id).nivel_preenchimento == 85
+
+
+def test_lote_invalido_e_descarga_por_tamanho(client, db_session, create_lixeira, buffer, monkeypatch):
+    assert client.post("/api/sensor/telemetria/lote", json={"leituras": []}).status_code == 400
+    assert client.post("/api/sensor/telemetria/lote", json={}).status_code == 400
+
+    coletor = create_lixeira(nivel=10.0)
+    sensor = _sensor(db_session, coletor, api_token="segredo-do-sensor")
+    item = {"sensor_id": sensor.id, "coletor_id": coletor.id, "nivel_preenchimento": 40, "bateria": 70}
+
+    r = client.post("/api/sensor/telemetria/lote", json=[item])
+    assert r.status_code == 400
+    assert r.get_json()["rejeitadas"][0]["motivo"].startswith("api_key obrigatoria")
+
+    buffer.max_leituras = 3
+    r = client.post("/api/sensor/telemetria/lote", json=[{**item, "api_key": "segredo-do-sensor"}] * 4)
+    assert r.status_code == 200
+    assert r.get_json()["leituras_pendentes"] == 0
+    assert db_session.query(LeituraSensor).count() == 4
+
+
+def test_buffer_descarta_leitura_recusada_sem_travar_a_fila(db_session, create_lixeira):
+    coletor = create_lixeira(nivel=10.0)
+    sensor = _sensor(db_session, coletor)
+    linha = {"sensor_id": sensor.id, "coletor_id": coletor.id, "nivel": 50.0, "bateria": 80.0}
+    buf = BufferLeituras(max_leituras=100, max_idade_s=0)
+
+    buf.adicionar([linha, {"sensor_id": sensor.id}, {**linha, "nivel": 60.0}], lambda: db_session)  # nivel NOT NULL
+    assert buf.descarregar() == 2 and len(buf) == 0
+    assert (buf.gravadas, buf.descartadas) == (2, 1)
+    assert db_session.query(LeituraSensor).count() == 2
+
+
+def test_buffer_reenfileira_quando_banco_indisponivel(db_session, create_lixeira, monkeypatch):
+    coletor = create_lixeira(nivel=10.0)
+    sensor = _sensor(db_session, coletor)
+    linha = {"sensor_id": sensor.id, "coletor_id": coletor.id, "nivel": 50.0, "bateria": 80.0}
+    buf = BufferLeituras(max_leituras=100, max_idade_s=0)
+
+    def fora_do_ar(db, linhas):
+        raise OperationalError("INSERT", {}, Exception("conexão recusada"))
+
+    monkeypatch.setattr(telemetria_buffer, "acumular", fora_do_ar)
+    buf.adicionar([linha, {**linha, "nivel": 60.0}], lambda: db_session)
+    assert buf.descarregar() == 0 and len(buf) == 2 and buf.descartadas == 0
+
+    monkeypatch.undo()
+    assert buf.descarregar() == 2
+    assert buf.gravadas == 2 and db_session.query(LeituraSensor).count() == 2
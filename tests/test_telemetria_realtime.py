@@ -1,6 +1,6 @@
 """Regressoes do caminho telemetria -> banco/cache/WebSocket."""
 
-from banco_dados.modelos import Notificacao, Sensor
+from banco_dados.modelos import LeituraSensor, Notificacao, Sensor
 from banco_dados.utils.cache import obter_cache
 
 
@@ -62,6 +62,7 @@ def test_telemetria_invalida_cache_e_emite_apos_persistir(
     assert eventos[0][1]["nivel_preenchimento"] == 96
     assert eventos[1][1]["bateria"] == 10
     assert db_session.query(Notificacao).count() == 2
+    assert db_session.query(LeituraSensor).filter_by(sensor_id=sensor.id, nivel=96).count() == 1
     assert cache.obter("estatisticas") is None
     assert cache.obter(f"estatisticas:{coletor.parceiro_id}") is None
     assert cache.obter("preview:estatisticas_resumo") is None
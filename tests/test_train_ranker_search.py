@@ -0,0 +1,132 @@
+"""Parallel / successive-halving hyperparameter search for train_ranker."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+pytest.importorskip("xgboost")
+
+from banco_dados.modelos import Base, FeatureSnapshotProspeccao  # noqa: E402
+from jobs.prospeccao import config, train_xgboost  # noqa: E402
+from jobs.prospeccao.ranker_contract import FEATURE_NAMES, FEATURE_SCHEMA_HASH, encode_feature_blob  # noqa: E402
+from jobs.prospeccao.train_xgboost import (  # noqa: E402
+    _halving_fractions,
+    _parallel_search,
+    _peak_rss_mb,
+    _ranker_param_candidates,
+    _reset_peak_rss,
+    train_ranker,
+)
+
+
+def _small_candidates() -> list[dict]:
+    return [{**c, "n_estimators": 12 + 3 * i} for i, c in enumerate(_ranker_param_candidates()[:4])]
+
+
+def _synthetic(n_groups: int = 16, size: int = 8, seed: int = 5):
+    rng = np.random.default_rng(seed)
+    x = rng.random((n_groups * size, len(FEATURE_NAMES))).astype(np.float32)
+    y = np.clip((x[:, 0] * 4).astype(int), 0, 3)
+    return x, y, [size] * n_groups
+
+
+def test_halving_fractions():
+    assert _halving_fractions(1) == [1.0]
+    assert _halving_fractions(8) == pytest.approx([1 / 3, 1.0])
+    assert _halving_fractions(9) == pytest.approx([1 / 9, 1 / 3, 1.0])
+
+
+def test_peak_rss_is_reset_between_candidates():
+    if not _reset_peak_rss() or _peak_rss_mb() is None:
+        pytest.skip("per-candidate peak RSS needs /proc/self/clear_refs")
+    big = np.ones(96 * 1024 * 1024 // 8)  # ~96 MB, touched
+    peak_big = _peak_rss_mb()
+    del big
+    assert _reset_peak_rss()
+    # A later, small candidate must not inherit the earlier peak
+    assert _peak_rss_mb() < peak_big - 64
+
+
+def test_parallel_search_with_successive_halving():
+    x, y, groups = _synthetic()
+    candidates = _small_candidates()
+    entries = _parallel_search(
+        x[:96], y[:96], groups[:12], x[96:], y[96:], groups[12:],
+        candidates, workers=2, threads_per_worker=1, successive_halving=True,
+    )
+
+    assert len(entries) == len(candidates)
+    finalists = [e for e in entries if e["pruned_at_rung"] is None]
+    pruned = [e for e in entries if e["pruned_at_rung"] == 0]
+    assert len(finalists) == 1 and len(pruned) == 3
+    assert len(finalists[0]["rungs"]) == 2
+    assert finalists[0]["rounds"] == finalists[0]["params"]["n_estimators"]
+    assert all(len(e["rungs"]) == 1 and e["rounds"] < e["params"]["n_estimators"] for e in pruned)
+    for entry in entries:
+        assert entry["val_ndcg_mean"] is not None
+        assert entry["wall_s"] > 0
+        assert entry["peak_rss_mb"] is None or entry["peak_rss_mb"] > 0
+    # Kept the best rung-0 candidate.
+    best_rung0 = max(entries, key=lambda e: e["rungs"][0]["val_ndcg_mean"])
+    assert best_rung0 is finalists[0]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_train_ranker_search_records_costs(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(config, "REPO_ROOT", tmp_path)
+    monkeypatch.setattr(train_xgboost, "MODEL_DIR", tmp_path / "models")
+    monkeypatch.setattr(train_xgboost, "_ranker_param_candidates", _small_candidates)
+
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    x, y, groups = _synthetic()
+    for i, (row, label) in enumerate(zip(x, y, strict=True)):
+        db.add(FeatureSnapshotProspeccao(
+            empresa_id=i,
+            pipeline_version="pv",
+            qid=f"g{i // groups[0]:02d}",
+            label_ordinal=int(label),
+            features_json="{}",
+            feature_schema_json="[]",
+            features_blob=encode_feature_blob(row),
+            feature_schema_hash=FEATURE_SCHEMA_HASH,
+        ))
+    db.commit()
+
+    result = train_ranker(db, pipeline_version="pv", allow_baseline=False, search_workers=workers, threads_per_worker=1)
+    metrics = result["metrics"]
+
+    assert result["algoritmo"] == "xgboost_ranker"
+    assert metrics["search_mode"]["workers"] == workers
+    assert metrics["search_wall_s"] > 0
+    assert len(metrics["search_results"]) == 4
+    assert all(r["wall_s"] > 0 and r.get("pruned_at_rung") is None for r in metrics["search_results"])
+    assert metrics["validation_ndcg_mean"] is not None
+
+
+def test_vectorized_ndcg_matches_sklearn():
+    from sklearn.metrics import ndcg_score
+
+    from jobs.prospeccao.train_xgboost import _ndcg_at_k, _ndcg_per_group
+
+    rng = np.random.default_rng(3)
+    sizes = rng.integers(1, 30, size=60)
+    n = int(sizes.sum())
+    y_true = rng.integers(0, 4, size=n)
+    y_true[: sizes[0]] = 0  # all-irrelevant group
+    y_score = np.round(rng.random(n), 1)  # plenty of ties
+    for k in (1, 5, 20):
+        expected, cursor = [], 0
+        for size in sizes:
+            if size >= 2:
+                expected.append(ndcg_score(
+                    [y_true[cursor:cursor + size]], [y_score[cursor:cursor + size]], k=min(k, size)
+                ))
+            cursor += size
+        np.testing.assert_allclose(_ndcg_per_group(y_true, y_score, sizes, k), expected, atol=1e-12)
+        assert _ndcg_at_k(y_true, y_score, sizes, k) == round(float(np.mean(expected)), 4)
+    assert _ndcg_at_k([1], [0.5], [1], 5) is None